@@ -0,0 +1 @@
+# Benchmark suite: synthetic scenario generator and timing harness
@@ -0,0 +1,234 @@
+"""
+Benchmark suite for the simulation engine.
+
+Generates synthetic scenarios at multiples of the test scenario's size and times each stage of a
+run (load, module initialization, per-module yearly steps, result collection, serialization,
+plotting and reporting). Results are emitted as JSON and compared against a stored baseline.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks --scales 1,10,100,1000 --output bench_results.json
+    python -m benchmarks.run_benchmarks --scales 1,10 --fail-on-regression
+    python -m benchmarks.run_benchmarks --update-baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, Any, List
+
+os.environ.setdefault("MPLBACKEND", "Agg")  # Plots are only timed, never shown
+
+import yaml
+
+from benchmarks.synthetic_scenario import generate_scaled_scenario, scaled_entity_counts
+from main import transform_yearly_results_to_trajectories
+from semiconductor_simulation.analysis.runner import default_modules
+from semiconductor_simulation.core.simulation_manager import SimulationManager
+from semiconductor_simulation.utils.plotter import plot_attribute_over_time, plot_attribute_comparison_over_time
+from semiconductor_simulation.utils.report_generator import generate_html_report
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_SCALES = [1, 10, 100, 1000]
+# Number of models drawn in the comparison plot; plotting every model at 1000x is not meaningful.
+MAX_PLOTTED_MODELS = 10
+
+
+def benchmark_scale(scale: int, num_years: int, seed: int, work_dir: str) -> Dict[str, Any]:
+    """Runs one full simulation pipeline at the given scale and returns per-stage timings in seconds."""
+    phases: Dict[str, float] = {}
+    scenario = generate_scaled_scenario(scale, num_years=num_years, seed=seed)
+    scenario_name = f"bench_{scale}x"
+    scenario_path = os.path.join(work_dir, f"{scenario_name}.yaml")
+    with open(scenario_path, "w") as f:
+        yaml.safe_dump(scenario, f, sort_keys=False)
+
+    sim_manager = SimulationManager(scenario_name=scenario_name)
+
+    started = time.perf_counter()
+    sim_manager.load_scenario_data(scenario_path)
+    phases["load"] = time.perf_counter() - started
+
+    for module in default_modules():
+        sim_manager.register_module(module)
+    started = time.perf_counter()
+    sim_manager.initialize_modules()
+    phases["initialize_modules"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = sim_manager.run_simulation()
+    phases["run_simulation"] = time.perf_counter() - started
+    module_steps = {key: value for key, value in sim_manager.step_timings.items() if key != "_collect_results"}
+    phases["collect_results"] = sim_manager.step_timings.get("_collect_results", 0.0)
+
+    started = time.perf_counter()
+    trajectories = transform_yearly_results_to_trajectories(results)
+    with open(os.path.join(work_dir, f"{scenario_name}_yearly_results.yaml"), "w") as f:
+        yaml.dump(results, f, indent=4, sort_keys=False)
+    with open(os.path.join(work_dir, f"{scenario_name}_trajectories.yaml"), "w") as f:
+        yaml.dump(trajectories, f, indent=4, sort_keys=False)
+    phases["serialization"] = time.perf_counter() - started
+
+    # The plotter writes into a relative 'results/' directory, so plotting runs inside work_dir.
+    previous_cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        region_ids = list(trajectories.get("regions", {}).keys())[:MAX_PLOTTED_MODELS]
+        plot_filenames = []
+        started = time.perf_counter()
+        if region_ids:
+            comparison_path = plot_attribute_comparison_over_time(results, "regions", region_ids, "gdp", scenario_name=scenario_name)
+            single_path = plot_attribute_over_time(results, "regions", region_ids[0], "semiconductor_engineer_count", scenario_name=scenario_name)
+            plot_filenames = [os.path.basename(p) for p in (comparison_path, single_path) if p]
+        phases["plotting"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        generate_html_report(
+            simulation_results={
+                "scenario_name": scenario_name,
+                "simulation_start_year": sim_manager.start_year,
+                "simulation_end_year": sim_manager.end_year,
+                "global_parameters": sim_manager.global_parameters,
+                "model_trajectories": trajectories,
+            },
+            scenario_name=scenario_name,
+            start_year=sim_manager.start_year,
+            end_year=sim_manager.end_year,
+            output_dir="results",
+            timestamp="bench",
+            plot_filenames=plot_filenames,
+        )
+        phases["reporting"] = time.perf_counter() - started
+    finally:
+        os.chdir(previous_cwd)
+
+    return {
+        "entity_counts": scaled_entity_counts(scale),
+        "years": sim_manager.end_year - sim_manager.start_year + 1,
+        "phases": phases,
+        "module_steps": module_steps,
+    }
+
+
+def run_benchmarks(scales: List[int], num_years: int = 16, repeat: int = 1, seed: int = 0, verbose: bool = False) -> Dict[str, Any]:
+    """
+    Benchmarks every scale `repeat` times and keeps the fastest timing of each stage,
+    which is the least noisy estimator for wall-clock benchmarks.
+    """
+    report: Dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "num_years": num_years,
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "scales": {},
+    }
+    for scale in scales:
+        best: Dict[str, Any] = {}
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory(prefix="semisim_bench_") as work_dir:
+                # The engine prints progress for every module and year; keep it out of the benchmark output.
+                sink = sys.stdout if verbose else io.StringIO()
+                with contextlib.redirect_stdout(sink):
+                    run = benchmark_scale(scale, num_years, seed, work_dir)
+            if not best:
+                best = run
+                continue
+            for section in ("phases", "module_steps"):
+                for key, value in run[section].items():
+                    best[section][key] = min(best[section].get(key, value), value)
+        report["scales"][f"{scale}x"] = best
+        print(f"Benchmarked {scale}x: " + ", ".join(f"{k}={v:.4f}s" for k, v in best["phases"].items()))
+    return report
+
+
+def _flatten_timings(report: Dict[str, Any]) -> Dict[str, float]:
+    flat = {}
+    for scale_key, scale_data in report.get("scales", {}).items():
+        for section in ("phases", "module_steps"):
+            for key, value in scale_data.get(section, {}).items():
+                flat[f"{scale_key}.{section}.{key}"] = value
+    return flat
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.25, min_delta_seconds: float = 0.05) -> Dict[str, Any]:
+    """
+    Compares timings with a baseline report. A timing is a regression when it is more than
+    `tolerance` (relative) slower AND more than `min_delta_seconds` slower in absolute terms,
+    so that sub-millisecond jitter on the small scales doesn't trigger failures.
+    """
+    current = _flatten_timings(report)
+    reference = _flatten_timings(baseline)
+    comparison = {"tolerance": tolerance, "min_delta_seconds": min_delta_seconds, "entries": {}, "regressions": []}
+    for key, value in current.items():
+        if key not in reference:
+            continue
+        base_value = reference[key]
+        ratio = value / base_value if base_value > 0 else None
+        is_regression = value - base_value > min_delta_seconds and (ratio is None or ratio > 1 + tolerance)
+        comparison["entries"][key] = {"baseline": base_value, "current": value, "ratio": ratio, "regression": is_regression}
+        if is_regression:
+            comparison["regressions"].append(key)
+    return comparison
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the semiconductor simulation engine at configurable scale.")
+    parser.add_argument("--scales", type=str, default=",".join(str(s) for s in DEFAULT_SCALES),
+                        help="Comma-separated multiples of the test scenario size, e.g. '1,10,100,1000'.")
+    parser.add_argument("--years", type=int, default=16, help="Number of simulated years (default: 16, i.e. 2025-2040).")
+    parser.add_argument("--repeat", type=int, default=1, help="Repetitions per scale; the fastest timing is kept.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic scenario generator.")
+    parser.add_argument("--output", type=str, default=None, help="Path of the JSON results file.")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE_PATH, help="Baseline JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown before flagging a regression.")
+    parser.add_argument("--min-delta", type=float, default=0.05,
+                        help="Allowed absolute slowdown in seconds; smaller differences are scheduling jitter.")
+    parser.add_argument("--update-baseline", action="store_true", help="Overwrite the baseline with this run's results.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if any regression is found.")
+    parser.add_argument("--verbose", action="store_true", help="Show the simulation's own progress output.")
+    args = parser.parse_args(argv)
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    report = run_benchmarks(scales, num_years=args.years, repeat=args.repeat, seed=args.seed, verbose=args.verbose)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["comparison"] = compare_to_baseline(report, baseline, tolerance=args.tolerance, min_delta_seconds=args.min_delta)
+        for key in report["comparison"]["regressions"]:
+            entry = report["comparison"]["entries"][key]
+            print(f"REGRESSION {key}: {entry['baseline']:.4f}s -> {entry['current']:.4f}s")
+        if not report["comparison"]["regressions"]:
+            print(f"No regressions against baseline {args.baseline}")
+    else:
+        print(f"Baseline {args.baseline} not found, skipping comparison.")
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        print(f"Benchmark results saved to {args.output}")
+    else:
+        print(output)
+
+    if args.fail_on_regression and report.get("comparison", {}).get("regressions"):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
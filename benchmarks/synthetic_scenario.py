@@ -0,0 +1,196 @@
+import random
+from typing import Dict, Any, List
+
+# Entity counts of config/scenarios/test_scenario.yaml, i.e. what "1x" scale means.
+BASE_ENTITY_COUNTS = {
+    "regions": 3,
+    "companies": 2,
+    "technology_nodes": 3,
+    "end_markets": 2,
+    "policies": 2,
+}
+
+# Feature sizes cycled through when generating node ids; larger scales get suffixed variants.
+NODE_FEATURE_SIZES_NM = [2, 3, 5, 7, 10, 12, 14, 16, 20, 22, 28, 40, 45, 55, 65, 90, 130, 180, 250, 350]
+
+COMPANY_TYPES = ["Foundry", "IDM", "Fabless", "EquipmentSupplier", "OSAT", "Consultancy", "MaterialsSupplier"]
+TALENT_LEVELS = ["low", "medium", "high", "shortage"]
+POLICY_TYPES = ["InvestmentIncentive", "ExportControl", "TradeTariff", "R&DGrant", "TalentDevelopment"]
+
+
+def scaled_entity_counts(scale: int) -> Dict[str, int]:
+    """Returns entity counts for a given multiple of the test scenario's size."""
+    return {key: count * scale for key, count in BASE_ENTITY_COUNTS.items()}
+
+
+def generate_synthetic_scenario(
+    num_regions: int = 3,
+    num_companies: int = 2,
+    num_tech_nodes: int = 3,
+    num_end_markets: int = 2,
+    num_policies: int = 2,
+    num_years: int = 16,
+    start_year: int = 2025,
+    seed: int = 0,
+    scenario_name: str = "Synthetic Benchmark Scenario",
+) -> Dict[str, Any]:
+    """
+    Generates a scenario dictionary with the same layout as config/scenarios/test_scenario.yaml,
+    but with arbitrary numbers of each entity. The output is deterministic for a given seed.
+    Besides the attributes used in the test scenario, entities carry the KWPM-based attributes
+    read by the modules (fab_capacity_kwpm_by_node, base_demand_wafer_starts_kwpm, ...),
+    so that the modules have real work to do at every scale.
+    """
+    rng = random.Random(seed)
+
+    node_ids: List[str] = []
+    node_sizes: List[int] = []
+    for i in range(num_tech_nodes):
+        size = NODE_FEATURE_SIZES_NM[i % len(NODE_FEATURE_SIZES_NM)]
+        variant = i // len(NODE_FEATURE_SIZES_NM)
+        node_ids.append(f"N{size}" if variant == 0 else f"N{size}_{variant}")
+        node_sizes.append(size)
+
+    region_ids = [f"R{i:04d}" for i in range(num_regions)]
+    company_ids = [f"C{i:05d}" for i in range(num_companies)]
+
+    def pick_nodes(k: int) -> List[str]:
+        return rng.sample(node_ids, min(k, len(node_ids))) if node_ids else []
+
+    regions = []
+    for region_id in region_ids:
+        regions.append({
+            "model_id": region_id,
+            "name": f"Region {region_id}",
+            "initial_attributes": {
+                "gdp": rng.uniform(0.5e12, 25e12),
+                "political_stability": round(rng.uniform(0.4, 0.95), 3),
+                "semiconductor_investment_focus": round(rng.uniform(0.2, 0.95), 3),
+                "research_funding": rng.uniform(1e9, 100e9),
+                "water_availability": round(rng.uniform(0.3, 0.9), 3),
+                "power_stability": round(rng.uniform(0.5, 0.99), 3),
+                "labor_cost": rng.randint(20000, 180000),
+                "environmental_regulations": round(rng.uniform(0.3, 0.9), 3),
+                "existing_fab_count": rng.randint(0, 60),
+                "semiconductor_engineer_count": rng.randint(1000, 200000),
+                "talent_availability": rng.choice(TALENT_LEVELS),
+                "talent_notes": "Synthetic region.",
+                "latitude": round(rng.uniform(-40.0, 60.0), 4),
+                "longitude": round(rng.uniform(-125.0, 145.0), 4),
+                "capacity_by_node": {node: round(rng.uniform(1, 50), 2) for node in pick_nodes(2)},
+            }
+        })
+
+    companies = []
+    for company_id in company_ids:
+        company_type = rng.choice(COMPANY_TYPES)
+        attributes: Dict[str, Any] = {
+            "company_type": company_type,
+            "region_id": rng.choice(region_ids) if region_ids else None,
+            "specialization": "Synthetic",
+            "market_share": round(rng.uniform(0.001, 0.2), 4),
+            "rd_intensity": round(rng.uniform(0.02, 0.25), 3),
+            "capex": rng.uniform(0.1e9, 30e9),
+            "revenue": rng.uniform(0.5e9, 150e9),
+            "global_strategy_score": round(rng.uniform(0.2, 0.9), 3),
+            "agility_score": round(rng.uniform(0.2, 0.9), 3),
+            "supply_chain_resilience": round(rng.uniform(0.2, 0.9), 3),
+            "current_node_id": rng.choice(node_ids) if node_ids else None,
+        }
+        if company_type in ("Foundry", "IDM"):
+            attributes["fab_capacity_kwpm_by_node"] = {node: round(rng.uniform(5, 150), 2) for node in pick_nodes(3)}
+        if company_type == "Consultancy":
+            attributes["geopolitical_expertise_score"] = rng.randint(1, 5)
+            attributes["technical_semiconductor_knowledge_score"] = rng.randint(1, 5)
+            attributes["consultant_count"] = rng.randint(10, 5000)
+        companies.append({"model_id": company_id, "name": f"Company {company_id}", "initial_attributes": attributes})
+
+    technology_nodes = []
+    for node_id, size in zip(node_ids, node_sizes):
+        leading_edge = size <= 7
+        price = rng.uniform(12000, 20000) if leading_edge else rng.uniform(1500, 9000)
+        technology_nodes.append({
+            "model_id": node_id,
+            "name": f"{node_id} Node",
+            "initial_attributes": {
+                "maturity_level": round(rng.uniform(0.6, 1.0), 3),
+                "cost_per_wafer": round(price * 0.8, 2),
+                "development_risk": round(rng.uniform(0.02, 0.3), 3),
+                "maturity_trl": rng.randint(5, 9),
+                "average_price_per_wafer_usd": round(price, 2),
+                "feature_size_nm": size,
+                "price_elasticity_of_demand": round(rng.uniform(0.5, 2.0), 3),
+            }
+        })
+
+    end_markets = []
+    for i in range(num_end_markets):
+        demand_nodes = pick_nodes(4)
+        end_markets.append({
+            "model_id": f"EM{i:04d}",
+            "name": f"End Market {i}",
+            "initial_attributes": {
+                "size": rng.uniform(10e9, 700e9),
+                "growth_rate": round(rng.uniform(0.0, 0.15), 3),
+                "chip_demand_factor": {node: round(1.0 / len(demand_nodes), 3) for node in demand_nodes},
+                "base_demand_wafer_starts_kwpm": {node: round(rng.uniform(1, 80), 2) for node in demand_nodes},
+                "annual_growth_rate_kwpm": {node: round(rng.uniform(-0.02, 0.2), 3) for node in demand_nodes},
+            }
+        })
+
+    end_year = start_year + max(num_years, 1) - 1
+    policies = []
+    for i in range(num_policies):
+        policy_start = rng.randint(start_year, end_year)
+        target_is_region = rng.random() < 0.5 or not company_ids
+        target_pool = region_ids if target_is_region else company_ids
+        policies.append({
+            "model_id": f"P{i:04d}",
+            "name": f"Policy {i}",
+            "initial_attributes": {
+                "policy_type": rng.choice(POLICY_TYPES),
+                "issuing_region_id": rng.choice(region_ids) if region_ids else None,
+                "target_entity_type": "REGION" if target_is_region else "COMPANY",
+                "target_entity_ids": rng.sample(target_pool, min(2, len(target_pool))),
+                "start_year": policy_start,
+                "end_year": min(end_year, policy_start + rng.randint(1, 6)),
+                "value_impact": rng.uniform(0.5e9, 20e9),
+                "conditions": "Synthetic policy.",
+                "current_status": "active",
+            }
+        })
+
+    return {
+        "scenario_name": scenario_name,
+        "start_year": start_year,
+        "end_year": end_year,
+        "global_parameters": {
+            "inflation_rate": 0.02,
+            "trade_tension_factor": 0.1,
+            "node_substitution_elasticity": 0.3,
+            "rd_effectiveness_factor": 0.05,
+            "talent_growth_rate": 0.02,
+        },
+        "models_initial_state": {
+            "regions": regions,
+            "companies": companies,
+            "technology_nodes": technology_nodes,
+            "end_markets": end_markets,
+            "policies": policies,
+        },
+    }
+
+
+def generate_scaled_scenario(scale: int, num_years: int = 16, seed: int = 0) -> Dict[str, Any]:
+    """Generates a synthetic scenario with `scale` times the entity counts of the test scenario."""
+    counts = scaled_entity_counts(scale)
+    return generate_synthetic_scenario(
+        num_regions=counts["regions"],
+        num_companies=counts["companies"],
+        num_tech_nodes=counts["technology_nodes"],
+        num_end_markets=counts["end_markets"],
+        num_policies=counts["policies"],
+        num_years=num_years,
+        seed=seed,
+        scenario_name=f"Synthetic Benchmark Scenario {scale}x",
+    )
@@ -9,7 +9,8 @@ from semiconductor_simulation.core.simulation_manager import SimulationManager
 from semiconductor_simulation.models import RegionModel, CompanyModel, TechnologyNodeModel, EndMarketModel, PolicyModel
 from semiconductor_simulation.modules import (
     GeopoliticalModule, CapacityDemandModule, TechEvolutionModule,
-    IndustryStructureModule, ConsultingMarketModule, NationalEcosystemModule
+    IndustryStructureModule, ConsultingMarketModule, NationalEcosystemModule,
+    IndustryEventsModule, GeopoliticalShockModule
 )
 from semiconductor_simulation.utils.data_loader import load_yaml_data
 from semiconductor_simulation.utils.plotter import plot_attribute_over_time, plot_attribute_comparison_over_time
@@ -236,9 +237,11 @@ def main(scenario_name_arg: str):
         return
 
     sim_manager.register_module(GeopoliticalModule("GeoPol"))
+    sim_manager.register_module(GeopoliticalShockModule("Shocks"))
     sim_manager.register_module(CapacityDemandModule("CapDemand"))
     sim_manager.register_module(TechEvolutionModule("TechEvo"))
     sim_manager.register_module(IndustryStructureModule("IndStruct"))
+    sim_manager.register_module(IndustryEventsModule("IndEvents"))
     print("All modules registered.")
 
     sim_manager.initialize_modules()
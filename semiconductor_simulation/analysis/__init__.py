@@ -0,0 +1,15 @@
+# Batch-run analysis tools built on top of SimulationManager
+from .runner import run_scenario, run_batch, apply_overrides, extract_metric, extract_trajectory, default_modules
+from .sensitivity import SensitivityAnalyzer, saltelli_design, sobol_indices, morris_design, morris_effects
+from .surrogate import ScenarioSurrogate, PolynomialChaosSurrogate
+from .ensemble import EnsembleSimulation, run_ensemble, ENSEMBLE_PARAMETERS
+from .scenario_tree import ScenarioTree, ScenarioPath
+from .tail_risk import TailRiskEstimator, TailRiskEstimate
+
+__all__ = [
+    'run_scenario', 'run_batch', 'apply_overrides', 'extract_metric', 'extract_trajectory', 'default_modules',
+    'SensitivityAnalyzer', 'saltelli_design', 'sobol_indices', 'morris_design', 'morris_effects',
+    'ScenarioSurrogate', 'PolynomialChaosSurrogate',
+    'EnsembleSimulation', 'run_ensemble', 'ENSEMBLE_PARAMETERS',
+    'ScenarioTree', 'ScenarioPath', 'TailRiskEstimator', 'TailRiskEstimate'
+]
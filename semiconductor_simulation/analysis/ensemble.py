@@ -0,0 +1,296 @@
+import contextlib
+import io
+from typing import Dict, List, Any, Optional, Sequence
+
+import numpy as np
+
+from semiconductor_simulation.core.simulation_manager import SimulationManager
+from semiconductor_simulation.analysis.runner import apply_overrides, parse_metric
+from semiconductor_simulation.engines.fab_pipeline import (
+    FabPipeline, DEFAULT_RAMP_PROFILE, capacity_matrix, node_target_matrix, fab_investment
+)
+from semiconductor_simulation.engines.demand_projection import DemandProjectionEngine, market_drivers
+from semiconductor_simulation.engines.learning_curve import (
+    LearningCurveEngine, learning_curve_inputs, accumulate_output, rd_trl_increase, advance_trl
+)
+from semiconductor_simulation.engines.node_index import InvertedNodeIndex, company_rd_spend
+from semiconductor_simulation.engines.price_solver import (
+    ClearingPriceSolver, adjacency_by_feature_size, node_reference_prices, node_feature_sizes, node_cost_floors,
+    price_bounds
+)
+from semiconductor_simulation.modules.capacity_demand_module import CapacityDemandModule
+
+# Global parameters that may differ between replicas (with their defaults), plus two ensemble
+# demand factors: 'demand_scale' multiplies all end-market demand and 'demand_growth_shift' adds
+# compound growth on top of every market's own growth.
+ENSEMBLE_PARAMETERS = {
+    'default_price_elasticity_of_demand': 1.0,
+    'node_substitution_elasticity': 0.3,
+    'price_adjustment_speed': 1.0,
+    'price_floor_multiple': 0.3,
+    'price_ceiling_multiple': 5.0,
+    'capacity_investment_response': 0.5,
+    'fab_construction_lag_years': 3,
+    'fab_cost_billion_usd_per_kwpm': 0.2,
+    'default_production_history_years': 5,
+    'rd_effectiveness_factor': 0.1,
+    'rd_trl_elasticity': 0.5,
+    'commercialization_trl_threshold': 8,
+    'default_learning_rate': 0.15,
+    'default_defect_learning_rate': 0.3,
+    'default_initial_yield': 0.8,
+    'adoption_midpoint_offset_years': 3.0,
+    'adoption_steepness': 0.8,
+    'demand_scale': 1.0,
+    'demand_growth_shift': 0.0,
+}
+
+# LearningCurveEngine argument -> (node attribute, global parameter supplying its default)
+_CURVE_DEFAULTS = {
+    'learning_rate': ('learning_rate', 'default_learning_rate'),
+    'defect_learning_rate': ('defect_learning_rate', 'default_defect_learning_rate'),
+    'base_yield': ('yield_rate', 'default_initial_yield'),
+    'adoption_midpoint_offset': ('adoption_midpoint_offset_years', 'adoption_midpoint_offset_years'),
+    'adoption_steepness': ('adoption_steepness', 'adoption_steepness'),
+}
+
+NODE_COLUMNS = ('average_price_per_wafer_usd', 'clearing_demand_kwpm', 'supply_demand_gap_kwpm', 'wafer_output_kwpm',
+                'cumulative_wafer_output_kwpm_years', 'capacity_under_construction_kwpm', 'maturity_trl',
+                'year_commercialized', 'cost_per_wafer', 'yield_rate', 'manufacturing_cost_index', 'adoption_rate')
+COMPANY_COLUMNS = ('capex_committed_billion_usd', 'fab_capacity_kwpm')
+
+
+class EnsembleSimulation:
+    """
+    Runs R replicas of a scenario in one process, with a leading replica axis on every numeric
+    state array. Each year one vectorized step updates all replicas of the capacity/demand,
+    pricing and technology (TRL, learning curve) state with the engine steps that
+    CapacityDemandModule and TechEvolutionModule use:
+        demand          (R, markets, nodes) from one DemandProjectionEngine tensor
+        capacity        (R, companies, nodes), fab projects in one FabPipeline(batch_shape=(R,))
+        prices          (R, tech nodes), cleared by one batched ClearingPriceSolver call
+        TRL and curves  (R, tech nodes), one batched LearningCurveEngine
+    Replicas differ in the ENSEMBLE_PARAMETERS given per replica; everything else comes from the
+    scenario. A replica run with the scenario's own parameters reproduces a scalar run of
+    [CapacityDemandModule, TechEvolutionModule] for the columns in NODE_COLUMNS (except
+    fab_capacity_kwpm, a total per company). Capacity allocation to end markets and the other
+    modules (geopolitics, industry structure, events, ...) are not part of ensemble mode; use
+    run_batch for ensembles that need them.
+    """
+    def __init__(self, scenario_data: Dict[str, Any], replica_parameters: Optional[Dict[str, Sequence[float]]] = None,
+                 n_replicas: Optional[int] = None, overrides: Optional[Dict[str, Any]] = None):
+        replica_parameters = dict(replica_parameters or {})
+        unknown = [name for name in replica_parameters if name not in ENSEMBLE_PARAMETERS]
+        if unknown:
+            raise ValueError(f"Parameters {unknown} cannot vary across replicas; supported: {sorted(ENSEMBLE_PARAMETERS)}")
+        lengths = {len(np.atleast_1d(values)) for values in replica_parameters.values()}
+        if n_replicas is None:
+            n_replicas = max(lengths) if lengths else 1
+        if lengths - {1, n_replicas}:
+            raise ValueError(f"Replica parameters must have one value or n_replicas={n_replicas} values each")
+        self.n_replicas = int(n_replicas)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            manager = SimulationManager(scenario_name="ensemble_run")
+            manager.load_scenario_from_dict(apply_overrides(scenario_data, overrides))
+        self.start_year, self.end_year = manager.start_year, manager.end_year
+        self.global_params = dict(manager.global_parameters)
+        # The node axis (declared nodes plus any node holding capacity or demand) is the one CapacityDemandModule uses
+        layout = CapacityDemandModule("CapDemand")
+        layout.initialize(manager.models, self.global_params)
+        self.node_ids = layout.node_ids
+        self.tech_nodes = list(layout.tech_nodes)
+        self.companies = list(layout.companies)
+        self.end_markets = list(layout.end_markets)
+        self.node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.tech_columns = np.array([self.node_index[node.model_id] for node in self.tech_nodes], dtype=np.int64)
+        self.company_ids = [c.model_id for c in self.companies]
+
+        self.params = {name: np.broadcast_to(np.asarray(replica_parameters.get(name, self.global_params.get(name, default)),
+                                                        dtype=float).reshape(-1), (self.n_replicas,))
+                       for name, default in ENSEMBLE_PARAMETERS.items()}
+        self.years = np.arange(self.start_year, self.end_year + 1)
+        self.trajectories: Dict[str, np.ndarray] = {}
+
+    def _param(self, name: str) -> np.ndarray:
+        """(R, 1) column of a replica parameter, broadcasting against (R, nodes) state."""
+        return self.params[name][:, np.newaxis]
+
+    def _node_values(self, attribute_name: str, param_name: str, truthy: bool = False) -> np.ndarray:
+        """(R, tech nodes) node attribute, falling back to the replica's value of a global parameter."""
+        values = [node.get_attribute(attribute_name) for node in self.tech_nodes]
+        known = np.array([bool(v) if truthy else v is not None for v in values], dtype=bool)
+        column = np.array([float(v) if k else np.nan for v, k in zip(values, known)])
+        return np.where(known, column, self._param(param_name))
+
+    def _node_axis_values(self, attribute_name: str, param_name: str) -> np.ndarray:
+        """(R, all nodes) node attribute ('or' default semantics) on the full node axis."""
+        values = self._param(param_name) * np.ones((1, len(self.node_ids)))
+        for node, column in zip(self.tech_nodes, self.tech_columns):
+            value = node.get_attribute(attribute_name)
+            if value:
+                values[:, column] = float(value)
+        return values
+
+    def _initial_state(self):
+        R, T = self.n_replicas, len(self.tech_nodes)
+        node_attr = lambda name: np.array([np.nan if node.get_attribute(name) is None else float(node.get_attribute(name))
+                                           for node in self.tech_nodes])
+        self.capacity = np.broadcast_to(capacity_matrix(self.companies, 'fab_capacity_kwpm_by_node', self.node_index),
+                                        (R, len(self.companies), len(self.node_ids))).copy()
+        self.capex_committed = np.broadcast_to(np.array([float(c.get_attribute('capex_committed_billion_usd') or 0.0)
+                                                         for c in self.companies]), (R, len(self.companies))).copy()
+        self.investing = np.array([c.get_attribute('company_type') in ["Foundry", "IDM"] for c in self.companies], dtype=bool)
+        self.targets = node_target_matrix(self.companies, self.node_index)
+
+        self.pipeline = FabPipeline(self.company_ids, self.node_ids, batch_shape=(R,), start_period=self.start_year)
+        self.lags = np.rint(self._node_axis_values('construction_lag_years', 'fab_construction_lag_years')).astype(np.int64)
+        self.cost_per_kwpm = self._node_axis_values('fab_cost_billion_usd_per_kwpm', 'fab_cost_billion_usd_per_kwpm')
+
+        sizes = node_feature_sizes(self.tech_nodes)
+        size_of = dict(zip([node.model_id for node in self.tech_nodes], sizes))
+        self.demand_engine = DemandProjectionEngine([m.model_id for m in self.end_markets], self.node_ids, self.start_year,
+                                                    self.end_year, [size_of.get(node_id) for node_id in self.node_ids])
+        self.demand_engine.set_drivers(np.arange(len(self.end_markets)), *market_drivers(
+            self.end_markets, self.node_index, self.global_params.get('default_node_migration_rate', 0.0)))
+
+        self.reference_prices = node_reference_prices(self.tech_nodes)
+        self.cost_floors = node_cost_floors(self.tech_nodes, self.reference_prices)
+        elasticity = np.abs(self._node_values('price_elasticity_of_demand', 'default_price_elasticity_of_demand'))
+        self.price_solver = ClearingPriceSolver(elasticity, adjacency_by_feature_size(sizes), self.params['node_substitution_elasticity'])
+        self.log_price_ratio = np.zeros((R, T))
+        self.price = np.broadcast_to(node_attr('average_price_per_wafer_usd'), (R, T)).copy()
+        self.cost = np.broadcast_to(node_attr('cost_per_wafer'), (R, T)).copy()
+        self.cumulative = np.broadcast_to(node_attr('cumulative_wafer_output_kwpm_years'), (R, T)).copy()
+        self.maturity = np.broadcast_to(node_attr('maturity_trl'), (R, T)).copy()
+        self.year_commercialized = np.broadcast_to(node_attr('year_commercialized'), (R, T)).copy()
+        self.threshold = self._node_values('commercialization_trl_threshold', 'commercialization_trl_threshold', truthy=True)
+        self.curves = {name: np.broadcast_to(node_attr(name), (R, T)).copy()
+                       for name in ('yield_rate', 'manufacturing_cost_index', 'adoption_rate')}
+
+        # R&D spend per node (companies are fixed in ensemble mode)
+        index = InvertedNodeIndex([node.model_id for node in self.tech_nodes])
+        index.refresh(self.companies)
+        spend = company_rd_spend(self.companies)
+        self.node_rd_spend = index.node_sum(spend)[:T] if spend.size else np.zeros(T)
+
+        inputs = learning_curve_inputs(self.tech_nodes, self.global_params)
+        for argument, (attribute_name, param_name) in _CURVE_DEFAULTS.items():
+            inputs[argument] = self._node_values(attribute_name, param_name)
+        self.learning_curve = LearningCurveEngine(**inputs)
+
+    def run(self) -> Dict[str, np.ndarray]:
+        """
+        Simulates every year for all replicas. Returns (and keeps in self.trajectories) one array
+        per column: 'technology_nodes.<attribute>' of shape (R, years, tech nodes) and
+        'companies.<attribute>' of shape (R, years, companies).
+        """
+        self._initial_state()
+        records = {name: [] for name in [f"technology_nodes.{c}" for c in NODE_COLUMNS] + [f"companies.{c}" for c in COMPANY_COLUMNS]}
+        for year in self.years:
+            node_values = self._step(int(year))
+            for name in NODE_COLUMNS:
+                records[f"technology_nodes.{name}"].append(node_values[name])
+            records["companies.capex_committed_billion_usd"].append(self.capex_committed.copy())
+            records["companies.fab_capacity_kwpm"].append(self.capacity.sum(axis=-1))
+        self.trajectories = {name: np.stack(values, axis=1) for name, values in records.items()}
+        return self.trajectories
+
+    def _step(self, year: int) -> Dict[str, np.ndarray]:
+        """One year of CapacityDemandModule then TechEvolutionModule, for all replicas at once."""
+        # --- Capacity: fab projects completing this year ---
+        builders, released = self.pipeline.release(year)
+        self.capacity[:, builders] += released
+
+        # --- Demand per node and supply per node ---
+        growth = np.power(1.0 + self.params['demand_growth_shift'], year - self.start_year) * self.params['demand_scale']
+        node_demand = growth[:, np.newaxis] * self.demand_engine.demand(year).sum(axis=0)  # (R, N)
+        node_supply = np.where(self.investing[np.newaxis, :, np.newaxis], self.capacity, 0.0).sum(axis=1)  # (R, N)
+
+        # --- Market-clearing prices ---
+        values = self._clear_prices(year, node_demand[:, self.tech_columns], node_supply[:, self.tech_columns])
+
+        # --- Fab projects for uncovered shortages ---
+        self._schedule_fab_projects(year, node_demand, node_supply)
+        values['capacity_under_construction_kwpm'] = self.pipeline.in_flight_by_node()[:, self.tech_columns]
+
+        # --- Technology evolution: TRL, commercialization, learning and adoption curves ---
+        increase = rd_trl_increase(self.node_rd_spend, self._param('rd_effectiveness_factor'), self._param('rd_trl_elasticity'))
+        self.maturity, self.year_commercialized = advance_trl(self.maturity, increase, self.threshold,
+                                                              self.year_commercialized, year)
+
+        curves = self.learning_curve.advance(year, self.year_commercialized, self.cumulative)
+        self.cost = np.where(np.isfinite(curves['cost_per_wafer']), curves['cost_per_wafer'], self.cost)
+        for name in self.curves:
+            self.curves[name] = np.where(np.isfinite(curves[name]), curves[name], self.curves[name])
+
+        values.update({'maturity_trl': self.maturity.copy(), 'year_commercialized': self.year_commercialized.copy(),
+                       'cost_per_wafer': self.cost.copy(), 'average_price_per_wafer_usd': self.price.copy(),
+                       'cumulative_wafer_output_kwpm_years': self.cumulative.copy()})
+        values.update({name: curve.copy() for name, curve in self.curves.items()})
+        return values
+
+    def _clear_prices(self, year: int, demand: np.ndarray, capacity: np.ndarray) -> Dict[str, np.ndarray]:
+        """CapacityDemandModule._clear_prices and _record_output on (R, tech nodes) arrays."""
+        reference = self.reference_prices
+        lower, upper = price_bounds(self.cost_floors, self._param('price_floor_multiple'), self._param('price_ceiling_multiple'))
+        self.log_price_ratio, demand_at_price = self.price_solver.adjust(demand, capacity, lower, upper, self.log_price_ratio,
+                                                                         self._param('price_adjustment_speed'))
+        prices = reference * np.exp(self.log_price_ratio)
+        self.price = np.where(np.isfinite(prices), prices, self.price)
+
+        output = np.minimum(capacity, demand_at_price)
+        self.cumulative = accumulate_output(self.cumulative, output, self.year_commercialized, year,
+                                            self._param('default_production_history_years'))
+        return {'clearing_demand_kwpm': demand_at_price, 'supply_demand_gap_kwpm': capacity - demand_at_price,
+                'wafer_output_kwpm': output}
+
+    def _schedule_fab_projects(self, year: int, demand: np.ndarray, supply: np.ndarray):
+        """CapacityDemandModule._schedule_fab_projects on (R, nodes) arrays; projects carry their replica index."""
+        if not self.investing.any() or not self.node_ids:
+            return
+        shortage = np.maximum(demand - supply - self.pipeline.in_flight_by_node(), 0.0)
+        if not shortage.any():
+            return
+        new_capacity = fab_investment(self.capacity, self.investing, self.targets,
+                                      self._param('capacity_investment_response') * shortage)
+
+        replica_idx, company_idx, node_idx = np.nonzero(new_capacity > 0)
+        capacity = new_capacity[replica_idx, company_idx, node_idx]
+        cost = capacity * self.cost_per_kwpm[replica_idx, node_idx]
+        self.pipeline.schedule(company_idx, node_idx, capacity, year, self.lags[replica_idx, node_idx],
+                               self.global_params.get('fab_ramp_profile', DEFAULT_RAMP_PROFILE), cost_billion_usd=cost,
+                               batch_idx=(replica_idx,))
+        np.add.at(self.capex_committed, (replica_idx, company_idx), cost)
+
+    def trajectory(self, metric: str) -> np.ndarray:
+        """
+        (R, years) values of a 'category.model_id.attribute' metric (model_id '*' sums over the
+        category, ignoring missing values), the counterpart of runner.extract_trajectory.
+        """
+        category, model_id, attribute, _ = parse_metric(metric)
+        values = self.trajectories.get(f"{category}.{attribute}")
+        if values is None:
+            raise KeyError(f"Ensemble mode does not track '{category}.{attribute}'; available: {sorted(self.trajectories)}")
+        ids = [node.model_id for node in self.tech_nodes] if category == 'technology_nodes' else self.company_ids
+        if model_id == '*':
+            return np.where(np.isnan(values).all(axis=-1), np.nan, np.nansum(values, axis=-1))
+        return values[..., ids.index(model_id)]
+
+    def metric(self, metric: str) -> np.ndarray:
+        """(R,) values of a 'category.model_id.attribute[@year]' metric (final year by default)."""
+        year = parse_metric(metric)[3]
+        column = -1 if year is None else int(year - self.start_year)
+        return self.trajectory(metric)[:, column]
+
+
+def run_ensemble(scenario_data: Dict[str, Any], replica_parameters: Dict[str, Sequence[float]],
+                 metrics: Sequence[str], overrides: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    """
+    Vectorized counterpart of run_batch: one replica per row of replica_parameters
+    ({parameter: values}), simulated together by EnsembleSimulation. Returns an array of shape
+    (n_replicas, len(metrics)).
+    """
+    ensemble = EnsembleSimulation(scenario_data, replica_parameters, overrides=overrides)
+    ensemble.run()
+    return np.stack([ensemble.metric(metric) for metric in metrics], axis=1)
@@ -0,0 +1,229 @@
+import contextlib
+import copy
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Callable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from semiconductor_simulation.core.simulation_manager import SimulationManager
+from semiconductor_simulation.core.base_module import BaseModule
+from semiconductor_simulation.core.shared_state import SharedScenarioState
+from semiconductor_simulation.modules import (
+    GeopoliticalModule, CapacityDemandModule, TechEvolutionModule,
+    IndustryStructureModule, ConsultingMarketModule, NationalEcosystemModule,
+    IndustryEventsModule, GeopoliticalShockModule
+)
+
+
+def default_modules() -> List[BaseModule]:
+    """The module set used for batch runs (sweeps, sensitivity analysis, surrogates)."""
+    return [
+        GeopoliticalModule("GeoPol"),
+        GeopoliticalShockModule("Shocks"),
+        CapacityDemandModule("CapDemand"),
+        TechEvolutionModule("TechEvo"),
+        IndustryStructureModule("IndStruct"),
+        ConsultingMarketModule("Consult"),
+        NationalEcosystemModule("NatEco"),
+        IndustryEventsModule("IndEvents"),
+    ]
+
+
+def _resolve_child(container: Any, key: str, path: str) -> Any:
+    if isinstance(container, dict):
+        if key not in container:
+            container[key] = {}
+        return container[key]
+    if isinstance(container, list):
+        for item in container:
+            if isinstance(item, dict) and item.get('model_id') == key:
+                return item
+    raise KeyError(f"Cannot resolve '{key}' in override path '{path}'")
+
+
+def set_by_path(scenario_data: Dict[str, Any], path: str, value: Any):
+    """
+    Sets a value in a scenario dictionary using a dotted path. Inside model lists, path segments
+    select models by model_id, e.g.:
+        'global_parameters.node_substitution_elasticity'
+        'models_initial_state.policies.PolicyUSA1.initial_attributes.value_impact'
+    """
+    keys = path.split('.')
+    container = scenario_data
+    for key in keys[:-1]:
+        container = _resolve_child(container, key, path)
+    if not isinstance(container, dict):
+        raise KeyError(f"Override path '{path}' does not end in a mapping")
+    container[keys[-1]] = value
+
+
+def get_by_path(scenario_data: Dict[str, Any], path: str, default: Any = None) -> Any:
+    """Reads a value from a scenario dictionary using the same dotted paths as set_by_path."""
+    container: Any = scenario_data
+    for key in path.split('.'):
+        if isinstance(container, dict):
+            if key not in container:
+                return default
+            container = container[key]
+        elif isinstance(container, list):
+            matches = [item for item in container if isinstance(item, dict) and item.get('model_id') == key]
+            if not matches:
+                return default
+            container = matches[0]
+        else:
+            return default
+    return container
+
+
+def apply_overrides(scenario_data: Dict[str, Any], overrides: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Returns a deep copy of the scenario with the given {dotted_path: value} overrides applied."""
+    modified = copy.deepcopy(scenario_data)
+    for path, value in (overrides or {}).items():
+        set_by_path(modified, path, value)
+    return modified
+
+
+def run_scenario(
+    scenario_data: Dict[str, Any],
+    overrides: Optional[Dict[str, Any]] = None,
+    scenario_name: str = "analysis_run",
+    module_factory: Callable[[], List[BaseModule]] = default_modules,
+    quiet: bool = True,
+    step_cache_path: Optional[str] = None,
+    shared_state: Optional[SharedScenarioState] = None,
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Runs a single in-memory simulation (no YAML parsing, plotting or reporting) and returns
+    the yearly results. The engine's per-year progress output is suppressed when quiet=True.
+    With step_cache_path, memoizable module steps are shared through an on-disk step cache.
+    With shared_state, the initial state is attached from shared memory and scenario_data is
+    not used.
+    """
+    sink = io.StringIO() if quiet else None
+    with contextlib.redirect_stdout(sink) if quiet else contextlib.nullcontext():
+        sim_manager = SimulationManager(scenario_name=scenario_name)
+        if shared_state is not None:
+            sim_manager.load_scenario_from_shared(shared_state, overrides)
+        else:
+            sim_manager.load_scenario_from_dict(apply_overrides(scenario_data, overrides))
+        for module in module_factory():
+            sim_manager.register_module(module)
+        sim_manager.initialize_modules()
+        if step_cache_path:
+            sim_manager.enable_step_memoization(step_cache_path)
+        return sim_manager.run_simulation() or {}
+
+
+def parse_metric(metric: str) -> Tuple[str, str, str, Optional[int]]:
+    """
+    Parses an output metric of the form 'category.model_id.attribute[@year]'.
+    model_id may be '*' to sum the attribute over all models of the category.
+    Without '@year' the final simulated year is used.
+    """
+    year = None
+    if '@' in metric:
+        metric, year_str = metric.rsplit('@', 1)
+        year = int(year_str)
+    parts = metric.split('.')
+    if len(parts) != 3:
+        raise ValueError(f"Metric '{metric}' must have the form 'category.model_id.attribute[@year]'")
+    return parts[0], parts[1], parts[2], year
+
+
+def extract_metric(results: Dict[int, Dict[str, Any]], metric: str) -> float:
+    """Extracts a scalar output metric from yearly results; missing or non-numeric values give NaN."""
+    category, model_id, attribute, year = parse_metric(metric)
+    if not results:
+        return float('nan')
+    if year is None:
+        year = max(results.keys())
+    total = 0.0
+    found = False
+    for state in results.get(year, {}).get(category, []):
+        if model_id != '*' and state.get('model_id') != model_id:
+            continue
+        try:
+            total += float(state.get(attribute))
+            found = True
+        except (TypeError, ValueError):
+            continue
+    return total if found else float('nan')
+
+
+def extract_trajectory(results: Dict[int, Dict[str, Any]], metric: str) -> np.ndarray:
+    """Extracts a metric for every simulated year (the '@year' suffix, if any, is ignored)."""
+    base_metric = metric.rsplit('@', 1)[0]
+    return np.array([extract_metric(results, f"{base_metric}@{year}") for year in sorted(results.keys())])
+
+
+# Shared states this worker process has attached to, by block name (attached once per process)
+_ATTACHED_STATES: Dict[str, SharedScenarioState] = {}
+
+
+def _evaluate_point(task: Tuple[Dict[str, Any], Dict[str, Any], Sequence[str], Optional[str]]) -> List[float]:
+    scenario_data, overrides, metrics, step_cache_path = task
+    shared_state = None
+    if 'shared_state' in scenario_data:
+        handle = scenario_data['shared_state']
+        if handle['name'] not in _ATTACHED_STATES:
+            _ATTACHED_STATES[handle['name']] = SharedScenarioState.attach(handle)
+        shared_state = _ATTACHED_STATES[handle['name']]
+    results = run_scenario(scenario_data, overrides, step_cache_path=step_cache_path, shared_state=shared_state)
+    return [extract_metric(results, metric) for metric in metrics]
+
+
+def _override_key(overrides: Dict[str, Any]) -> Tuple:
+    return tuple(sorted((path, repr(value)) for path, value in overrides.items()))
+
+
+def run_batch(
+    scenario_data: Dict[str, Any],
+    override_sets: Sequence[Dict[str, Any]],
+    metrics: Sequence[str],
+    max_workers: Optional[int] = None,
+    chunksize: int = 4,
+    step_cache_path: Optional[str] = None,
+    shared_state: bool = False,
+) -> np.ndarray:
+    """
+    Evaluates many override sets of the same scenario and returns an array of shape
+    (len(override_sets), len(metrics)). Identical override sets are simulated only once, and the
+    remaining runs are distributed over a process pool (max_workers=1 runs in-process).
+    Passing step_cache_path lets runs reuse identical module steps computed by other runs.
+    With shared_state, pool workers attach to the scenario's initial state in shared memory
+    (core.shared_state) instead of each receiving a pickled copy of the scenario: worker startup
+    is faster and lighter, attribute reads during the run somewhat slower.
+    """
+    unique_index: Dict[Tuple, int] = {}
+    unique_overrides: List[Dict[str, Any]] = []
+    positions = np.empty(len(override_sets), dtype=np.int64)
+    for i, overrides in enumerate(override_sets):
+        key = _override_key(overrides)
+        if key not in unique_index:
+            unique_index[key] = len(unique_overrides)
+            unique_overrides.append(overrides)
+        positions[i] = unique_index[key]
+
+    tasks = [(scenario_data, overrides, list(metrics), step_cache_path) for overrides in unique_overrides]
+    if max_workers == 1 or len(tasks) <= 1:
+        rows = [_evaluate_point(task) for task in tasks]
+    else:
+        workers = max_workers or os.cpu_count() or 1
+        published = None
+        if shared_state:
+            try:
+                published = SharedScenarioState.publish(scenario_data)
+            except OSError as e:
+                print(f"Warning: shared memory unavailable ({e}); sending the scenario to each worker instead.")
+        if published is not None:
+            tasks = [({'shared_state': published.handle()}, overrides, metrics, cache) for _, overrides, metrics, cache in tasks]
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                rows = list(executor.map(_evaluate_point, tasks, chunksize=max(1, chunksize)))
+        finally:
+            if published is not None:
+                published.unlink()
+    unique_values = np.asarray(rows, dtype=float).reshape(len(tasks), len(metrics))
+    return unique_values[positions]
@@ -0,0 +1,141 @@
+import contextlib
+import io
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+import numpy as np
+
+from semiconductor_simulation.core.simulation_manager import SimulationManager
+from semiconductor_simulation.core.base_module import BaseModule
+from semiconductor_simulation.modules.geopolitical_shock_module import GeopoliticalShockModule
+from semiconductor_simulation.analysis.runner import apply_overrides, default_modules, extract_metric
+
+
+class ScenarioPath:
+    """One leaf of a scenario tree: the shocks along the path, its probability and its yearly results."""
+    __slots__ = ('events', 'probability', 'results')
+
+    def __init__(self, events: List[Tuple[int, str]], probability: float, results: Dict[int, Dict[str, Any]]):
+        self.events = events  # (year, shock_id) of every shock that struck, in order
+        self.probability = probability
+        self.results = results
+
+    def metric(self, metric: str) -> float:
+        return extract_metric(self.results, metric)
+
+    def __repr__(self):
+        return f"ScenarioPath(events={self.events}, probability={self.probability:.4g})"
+
+
+class ScenarioTree:
+    """
+    Enumerates the futures of a scenario with geopolitical shocks ('geopolitical_shocks', see
+    GeopoliticalShockModule) as a scenario tree instead of sampling them with Monte Carlo.
+
+    The simulation runs year by year. In every year where shocks can strike, each live path
+    branches into the possible outcomes (every combination of the eligible shocks striking or
+    not). Branches are forks of the path's simulation (SimulationManager.fork()), so all branches
+    share the years before the branch point and only the years after it are simulated per branch.
+    Paths whose probability falls below min_path_probability are pruned, and at most max_paths
+    paths are kept alive (the most probable ones); the probability mass of pruned paths is
+    reported as pruned_probability.
+
+    Rare shocks make independent Monte Carlo expensive: most replicas see no shock at all, and
+    each replica re-simulates the full horizon. A shock with a yearly strike probability of 2%
+    over 16 years gives 17 paths (one per strike year, plus no strike) at the cost of about nine
+    full runs, with exact path probabilities.
+    """
+    def __init__(
+        self,
+        scenario_data: Dict[str, Any],
+        overrides: Optional[Dict[str, Any]] = None,
+        module_factory: Callable[[], List[BaseModule]] = default_modules,
+        min_path_probability: float = 1e-4,
+        max_paths: int = 256,
+        scenario_name: str = "scenario_tree",
+        quiet: bool = True,
+    ):
+        self.scenario_data = apply_overrides(scenario_data, overrides)
+        self.module_factory = module_factory
+        self.min_path_probability = float(min_path_probability)
+        self.max_paths = int(max_paths)
+        self.scenario_name = scenario_name
+        self.quiet = quiet
+        self.paths: List[ScenarioPath] = []
+        self.pruned_probability = 0.0
+        self.years_simulated = 0  # Simulated path-years, the cost measure (a full run is end - start + 1)
+
+    def build(self) -> List[ScenarioPath]:
+        """Simulates the tree and returns its leaves (also kept in self.paths)."""
+        sink = io.StringIO() if self.quiet else None
+        with contextlib.redirect_stdout(sink) if self.quiet else contextlib.nullcontext():
+            root = SimulationManager(scenario_name=self.scenario_name)
+            root.load_scenario_from_dict(self.scenario_data)
+            for module in self.module_factory():
+                root.register_module(module)
+            root.initialize_modules()
+            if _shock_module(root) is None:
+                raise ValueError("ScenarioTree needs a GeopoliticalShockModule among the registered modules")
+
+            self.pruned_probability = 0.0
+            self.years_simulated = 0
+            live: List[Tuple[SimulationManager, List[Tuple[int, str]], float]] = [(root, [], 1.0)]
+            for year in range(root.start_year, root.end_year + 1):
+                # Candidate children of every live path: (parent index, outcomes, path probability)
+                candidates = []
+                for index, (manager, _, probability) in enumerate(live):
+                    for outcomes, outcome_probability in _outcomes(_shock_module(manager).eligible_shocks(year)):
+                        candidates.append((index, outcomes, probability * outcome_probability))
+                kept = [c for c in candidates if c[2] >= self.min_path_probability]
+                if len(kept) > self.max_paths:
+                    kept.sort(key=lambda c: c[2], reverse=True)
+                    kept = kept[:self.max_paths]
+                self.pruned_probability += sum(c[2] for c in candidates) - sum(c[2] for c in kept)
+
+                next_live = []
+                continued = set()
+                # Fork before any child runs the year; a parent's first child continues the parent itself
+                branches = []
+                for index, outcomes, probability in kept:
+                    manager, events, _ = live[index]
+                    if index in continued:
+                        manager = manager.fork()
+                    continued.add(index)
+                    branches.append((manager, events, outcomes, probability))
+                for manager, events, outcomes, probability in branches:
+                    _shock_module(manager).force_outcomes(year, outcomes)
+                    manager.run_year(year)
+                    self.years_simulated += 1
+                    struck = [(year, shock_id) for shock_id, strikes in outcomes.items() if strikes]
+                    next_live.append((manager, events + struck, probability))
+                live = next_live
+
+            self.paths = [ScenarioPath(events, probability, manager.results) for manager, events, probability in live]
+        return self.paths
+
+    def covered_probability(self) -> float:
+        """Probability mass of the paths kept (1 - pruned_probability)."""
+        return float(sum(path.probability for path in self.paths))
+
+    def distribution(self, metric: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(values, probabilities) of a metric over the paths, probabilities renormalized to the kept mass."""
+        values = np.array([path.metric(metric) for path in self.paths])
+        probabilities = np.array([path.probability for path in self.paths])
+        return values, probabilities / probabilities.sum()
+
+    def expected(self, metric: str) -> float:
+        """Probability-weighted mean of a metric over the kept paths."""
+        values, probabilities = self.distribution(metric)
+        return float(np.dot(values, probabilities))
+
+
+def _shock_module(manager: SimulationManager) -> Optional[GeopoliticalShockModule]:
+    return next((m for m in manager.modules if isinstance(m, GeopoliticalShockModule)), None)
+
+
+def _outcomes(eligible: List[Tuple[str, float]]) -> List[Tuple[Dict[str, bool], float]]:
+    """Every strike/no-strike combination of the eligible shocks with its probability."""
+    outcomes: List[Tuple[Dict[str, bool], float]] = [({}, 1.0)]
+    for shock_id, probability in eligible:
+        outcomes = [({**chosen, shock_id: strikes}, p * (probability if strikes else 1.0 - probability))
+                    for chosen, p in outcomes for strikes in (True, False)]
+    return outcomes
@@ -0,0 +1,210 @@
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from semiconductor_simulation.analysis.runner import run_batch
+
+try:
+    from scipy.stats import qmc
+except ImportError:  # scipy is optional; plain pseudo-random sampling is used instead
+    qmc = None
+
+
+def unit_samples(n: int, dims: int, seed: int) -> np.ndarray:
+    """Draws n points in [0, 1)^dims, using a scrambled Sobol sequence when scipy is available."""
+    if qmc is not None:
+        sampler = qmc.Sobol(d=dims, scramble=True, seed=seed)
+        return sampler.random(n)
+    return np.random.default_rng(seed).random((n, dims))
+
+
+def _scale(unit: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    return bounds[:, 0] + unit * (bounds[:, 1] - bounds[:, 0])
+
+
+def saltelli_design(bounds: np.ndarray, n: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Builds the Saltelli (2010) design for k parameters: base matrices A and B of shape (n, k), and
+    AB of shape (k, n, k) where AB[i] is A with column i taken from B. Evaluating A and B once
+    and sharing them across all k AB_i matrices gives the n * (k + 2) evaluation budget.
+    """
+    bounds = np.asarray(bounds, dtype=float)
+    k = bounds.shape[0]
+    unit = unit_samples(n, 2 * k, seed)
+    a = _scale(unit[:, :k], bounds)
+    b = _scale(unit[:, k:], bounds)
+    ab = np.repeat(a[np.newaxis, :, :], k, axis=0)
+    columns = np.arange(k)
+    ab[columns, :, columns] = b[:, columns].T
+    return a, b, ab
+
+
+def sobol_indices(y_a: np.ndarray, y_b: np.ndarray, y_ab: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized first-order (Saltelli 2010) and total-order (Jansen) Sobol estimators.
+    y_a, y_b: (..., n, m); y_ab: (k, ..., n, m). Returns S1 and ST with shape (k, ..., m).
+    Leading '...' axes allow many bootstrap resamples to be estimated in one call.
+    """
+    variance = np.var(np.concatenate([y_a, y_b], axis=-2), axis=-2)
+    variance = np.where(variance > 0, variance, np.nan)
+    first_order = np.mean(y_b * (y_ab - y_a), axis=-2) / variance
+    total_order = 0.5 * np.mean((y_a - y_ab) ** 2, axis=-2) / variance
+    return first_order, total_order
+
+
+def _bootstrap_ci(estimator, arrays: Sequence[np.ndarray], sample_axis_sizes: int, n_bootstrap: int,
+                  confidence: float, seed: int, chunk: int = 64) -> Tuple[np.ndarray, ...]:
+    """
+    Percentile bootstrap over sample rows. Resamples are processed in chunks so that memory
+    stays bounded while every chunk is still estimated in a single vectorized call.
+    """
+    rng = np.random.default_rng(seed)
+    collected: List[Tuple[np.ndarray, ...]] = []
+    for start in range(0, n_bootstrap, chunk):
+        size = min(chunk, n_bootstrap - start)
+        idx = rng.integers(0, sample_axis_sizes, size=(size, sample_axis_sizes))
+        collected.append(estimator(idx, *arrays))
+    alpha = (1.0 - confidence) / 2.0
+    intervals = []
+    for position in range(len(collected[0])):
+        # Estimator outputs have the bootstrap axis right after the parameter axis: (k, boot, m)
+        stacked = np.concatenate([c[position] for c in collected], axis=1)
+        low, high = np.nanquantile(stacked, [alpha, 1.0 - alpha], axis=1)
+        intervals.append(np.stack([low, high], axis=-1))
+    return tuple(intervals)
+
+
+def morris_design(bounds: np.ndarray, r: int, levels: int = 4, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Generates r Morris (1991) trajectories of k+1 points each, all trajectories at once.
+    Returns points of shape (r, k+1, k) in parameter units, the index of the parameter changed at
+    each step (r, k), and the signed step in unit space (r, k).
+    """
+    bounds = np.asarray(bounds, dtype=float)
+    k = bounds.shape[0]
+    rng = np.random.default_rng(seed)
+    delta = levels / (2.0 * (levels - 1))
+    grid = np.arange(levels) / (levels - 1)
+    base = rng.choice(grid[grid <= 1 - delta + 1e-12], size=(r, k))
+    order = np.argsort(rng.random((r, k)), axis=1)
+    signs = rng.choice([-1.0, 1.0], size=(r, k))
+    # Start from the end of the range where the first move in each direction stays inside [0, 1]
+    start = np.where(signs > 0, base, base + delta)
+    steps = np.zeros((r, k + 1, k))
+    rows = np.arange(r)[:, np.newaxis]
+    steps[rows, np.arange(1, k + 1)[np.newaxis, :], order] = signs[rows, order] * delta
+    unit_points = start[:, np.newaxis, :] + np.cumsum(steps, axis=1)
+    signed_steps = signs[rows, order] * delta
+    return _scale(unit_points, bounds), order, signed_steps
+
+
+def morris_effects(y: np.ndarray, order: np.ndarray, signed_steps: np.ndarray, k: int) -> np.ndarray:
+    """
+    Elementary effects from trajectory outputs y of shape (r, k+1, m).
+    Returns effects of shape (r, k, m) in unit-scaled parameter space.
+    """
+    differences = np.diff(y, axis=1) / signed_steps[:, :, np.newaxis]
+    effects = np.empty_like(differences)
+    rows = np.arange(y.shape[0])[:, np.newaxis]
+    effects[rows, order] = differences
+    return effects
+
+
+def _morris_statistics(effects: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    mu = np.nanmean(effects, axis=-3)
+    mu_star = np.nanmean(np.abs(effects), axis=-3)
+    sigma = np.nanstd(effects, axis=-3, ddof=1) if effects.shape[-3] > 1 else np.zeros_like(mu)
+    return mu, mu_star, sigma
+
+
+class SensitivityAnalyzer:
+    """
+    Global sensitivity analysis of scenario outputs with respect to scenario inputs
+    (typically global_parameters, but any override path accepted by analysis.runner works).
+
+    parameters: {override_path: (low, high)}, e.g.
+        {'global_parameters.node_substitution_elasticity': (0.0, 1.0)}
+    metrics: output metrics 'category.model_id.attribute[@year]', e.g.
+        ['technology_nodes.N3.average_price_per_wafer_usd', 'regions.*.semiconductor_engineer_count@2035']
+    step_cache_path: optional on-disk step cache shared by the sweep's runs (see analysis.runner.run_batch).
+    """
+    def __init__(self, scenario_data: Dict[str, Any], parameters: Dict[str, Tuple[float, float]],
+                 metrics: Sequence[str], max_workers: Optional[int] = None, step_cache_path: Optional[str] = None):
+        self.scenario_data = scenario_data
+        self.parameter_names = list(parameters.keys())
+        self.bounds = np.array([parameters[name] for name in self.parameter_names], dtype=float)
+        self.metrics = list(metrics)
+        self.max_workers = max_workers
+        self.step_cache_path = step_cache_path
+
+    def _evaluate(self, points: np.ndarray) -> np.ndarray:
+        flat = points.reshape(-1, len(self.parameter_names))
+        override_sets = [dict(zip(self.parameter_names, map(float, row))) for row in flat]
+        values = run_batch(self.scenario_data, override_sets, self.metrics, max_workers=self.max_workers,
+                           step_cache_path=self.step_cache_path)
+        return values.reshape(points.shape[:-1] + (len(self.metrics),))
+
+    def run_sobol(self, n: int = 256, seed: int = 0, n_bootstrap: int = 200, confidence: float = 0.95) -> Dict[str, Any]:
+        """
+        Runs n * (k + 2) simulations and returns first-order ('S1') and total ('ST') Sobol indices
+        with bootstrap confidence intervals, keyed by metric and parameter.
+        """
+        a, b, ab = saltelli_design(self.bounds, n, seed=seed)
+        k = len(self.parameter_names)
+        # One batch for all design matrices, so the process pool stays busy across A, B and AB_i.
+        y = self._evaluate(np.concatenate([a[np.newaxis], b[np.newaxis], ab], axis=0))
+        y_a, y_b, y_ab = y[0], y[1], y[2:]
+        first_order, total_order = sobol_indices(y_a, y_b, y_ab)
+
+        def bootstrap_estimator(idx, ya, yb, yab):
+            return sobol_indices(ya[idx], yb[idx], yab[:, idx])
+
+        s1_ci, st_ci = _bootstrap_ci(bootstrap_estimator, (y_a, y_b, y_ab), n, n_bootstrap, confidence, seed + 1)
+        return {
+            'method': 'sobol',
+            'num_runs': n * (k + 2),
+            'confidence': confidence,
+            'indices': {
+                metric: {
+                    name: {
+                        'S1': float(first_order[i, j]), 'S1_conf': s1_ci[i, j].tolist(),
+                        'ST': float(total_order[i, j]), 'ST_conf': st_ci[i, j].tolist(),
+                    }
+                    for i, name in enumerate(self.parameter_names)
+                }
+                for j, metric in enumerate(self.metrics)
+            },
+        }
+
+    def run_morris(self, r: int = 20, levels: int = 4, seed: int = 0, n_bootstrap: int = 200, confidence: float = 0.95) -> Dict[str, Any]:
+        """
+        Runs the Morris elementary-effects screening with r trajectories (r * (k + 1) simulations).
+        Returns mu, mu_star (with bootstrap confidence interval) and sigma per metric and parameter.
+        Effects are expressed per unit of the normalized [0, 1] parameter range.
+        """
+        k = len(self.parameter_names)
+        points, order, signed_steps = morris_design(self.bounds, r, levels=levels, seed=seed)
+        y = self._evaluate(points)
+        effects = morris_effects(y, order, signed_steps, k)
+        mu, mu_star, sigma = _morris_statistics(effects)
+
+        def bootstrap_estimator(idx, eff):
+            # eff[idx]: (boot, r, k, m) -> statistics (boot, k, m) -> (k, boot, m)
+            return (np.moveaxis(_morris_statistics(eff[idx])[1], 0, 1),)
+
+        (mu_star_ci,) = _bootstrap_ci(bootstrap_estimator, (effects,), r, n_bootstrap, confidence, seed + 1)
+        return {
+            'method': 'morris',
+            'num_runs': r * (k + 1),
+            'confidence': confidence,
+            'indices': {
+                metric: {
+                    name: {
+                        'mu': float(mu[i, j]), 'mu_star': float(mu_star[i, j]),
+                        'mu_star_conf': mu_star_ci[i, j].tolist(), 'sigma': float(sigma[i, j]),
+                    }
+                    for i, name in enumerate(self.parameter_names)
+                }
+                for j, metric in enumerate(self.metrics)
+            },
+        }
@@ -0,0 +1,200 @@
+import json
+import time
+from itertools import combinations_with_replacement
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from semiconductor_simulation.analysis.runner import run_batch, run_scenario, extract_trajectory, get_by_path
+from semiconductor_simulation.analysis.sensitivity import unit_samples
+
+
+def _legendre_1d(z: np.ndarray, degree: int) -> np.ndarray:
+    """Legendre polynomials P_0..P_degree evaluated at z, stacked on a new last axis."""
+    values = [np.ones_like(z), z]
+    for n in range(1, degree):
+        values.append(((2 * n + 1) * z * values[n] - n * values[n - 1]) / (n + 1))
+    return np.stack(values[:degree + 1], axis=-1)
+
+
+def total_degree_multi_indices(dims: int, degree: int) -> np.ndarray:
+    """All multi-indices alpha with sum(alpha) <= degree, as an array of shape (n_terms, dims)."""
+    indices = [np.zeros(dims, dtype=np.int64)]
+    for total in range(1, degree + 1):
+        for combo in combinations_with_replacement(range(dims), total):
+            alpha = np.zeros(dims, dtype=np.int64)
+            np.add.at(alpha, list(combo), 1)
+            indices.append(alpha)
+    return np.array(indices)
+
+
+class PolynomialChaosSurrogate:
+    """
+    Pure NumPy polynomial chaos emulator: a total-degree Legendre expansion over inputs scaled to
+    [-1, 1], fitted to all outputs at once by (lightly regularized) least squares.
+    Error estimates come from closed-form leave-one-out residuals, and per-query prediction
+    uncertainty from the regression covariance.
+    """
+    def __init__(self, bounds: np.ndarray, degree: int = 2, ridge: float = 1e-8):
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.degree = degree
+        self.ridge = ridge
+        self.multi_indices = total_degree_multi_indices(self.bounds.shape[0], degree)
+        self.coefficients: Optional[np.ndarray] = None
+        self.gram_inverse: Optional[np.ndarray] = None
+        self.residual_variance: Optional[np.ndarray] = None
+        self.loo_rmse: Optional[np.ndarray] = None
+        self.output_scale: Optional[np.ndarray] = None
+        self.training_min: Optional[np.ndarray] = None
+        self.training_max: Optional[np.ndarray] = None
+
+    def _design(self, x: np.ndarray) -> np.ndarray:
+        low, high = self.bounds[:, 0], self.bounds[:, 1]
+        span = np.where(high > low, high - low, 1.0)
+        z = 2.0 * (np.asarray(x, dtype=float) - low) / span - 1.0
+        per_dim = _legendre_1d(z, self.degree)  # (n, k, degree + 1)
+        dims = np.arange(self.bounds.shape[0])
+        return np.prod(per_dim[:, dims, self.multi_indices], axis=-1)  # (n, n_terms)
+
+    def fit(self, x: np.ndarray, y: np.ndarray) -> 'PolynomialChaosSurrogate':
+        x = np.atleast_2d(np.asarray(x, dtype=float))
+        y = np.asarray(y, dtype=float).reshape(x.shape[0], -1)
+        phi = self._design(x)
+        n, p = phi.shape
+        if n <= p:
+            raise ValueError(f"Need more training runs ({n}) than polynomial terms ({p}); add runs or lower the degree")
+        gram = phi.T @ phi + self.ridge * np.eye(p)
+        self.gram_inverse = np.linalg.inv(gram)
+        self.coefficients = self.gram_inverse @ (phi.T @ y)
+        residuals = y - phi @ self.coefficients
+        leverage = np.einsum('ij,jk,ik->i', phi, self.gram_inverse, phi)
+        loo_residuals = residuals / np.clip(1.0 - leverage, 1e-12, None)[:, np.newaxis]
+        self.loo_rmse = np.sqrt(np.mean(loo_residuals ** 2, axis=0))
+        self.residual_variance = np.sum(residuals ** 2, axis=0) / max(n - p, 1)
+        self.output_scale = np.maximum(np.abs(np.mean(y, axis=0)), np.std(y, axis=0))
+        self.training_min = x.min(axis=0)
+        self.training_max = x.max(axis=0)
+        return self
+
+    def predict(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (mean, standard deviation) with shape (n_queries, n_outputs)."""
+        if self.coefficients is None:
+            raise RuntimeError("Surrogate has not been fitted")
+        phi = self._design(np.atleast_2d(x))
+        mean = phi @ self.coefficients
+        leverage = np.einsum('ij,jk,ik->i', phi, self.gram_inverse, phi)
+        std = np.sqrt(self.residual_variance[np.newaxis, :] * (1.0 + leverage[:, np.newaxis]))
+        return mean, std
+
+    def in_envelope(self, x: np.ndarray, tolerance: float = 0.0) -> np.ndarray:
+        """True for query points inside the (optionally widened) bounding box of the training inputs."""
+        x = np.atleast_2d(np.asarray(x, dtype=float))
+        margin = tolerance * (self.training_max - self.training_min)
+        return np.all((x >= self.training_min - margin) & (x <= self.training_max + margin), axis=1)
+
+
+class ScenarioSurrogate:
+    """
+    Emulates key output trajectories of a scenario as a function of selected scenario inputs,
+    for interactive what-if queries.
+
+    parameters: {override_path: (low, high)} defining the training envelope, e.g.
+        {'models_initial_state.policies.PolicyUSA1.initial_attributes.value_impact': (2.5e9, 15e9)}
+    metrics: 'category.model_id.attribute' metrics whose full yearly trajectory is emulated.
+    step_cache_path: optional on-disk step cache shared by the training runs (see analysis.runner.run_batch).
+
+    Queries outside the training envelope, on untrained parameters, or with a relative error
+    estimate above max_relative_error fall back to a real simulation.
+    """
+    def __init__(self, scenario_data: Dict[str, Any], parameters: Dict[str, Tuple[float, float]],
+                 metrics: Sequence[str], degree: int = 2, max_workers: Optional[int] = None,
+                 step_cache_path: Optional[str] = None):
+        self.scenario_data = scenario_data
+        self.parameter_names = list(parameters.keys())
+        self.bounds = np.array([parameters[name] for name in self.parameter_names], dtype=float)
+        self.metrics = [metric.rsplit('@', 1)[0] for metric in metrics]
+        self.years = list(range(scenario_data.get('start_year', 2025), scenario_data.get('end_year', 2040) + 1))
+        self.max_workers = max_workers
+        self.step_cache_path = step_cache_path
+        self.model = PolynomialChaosSurrogate(self.bounds, degree=degree)
+
+    def _expanded_metrics(self) -> List[str]:
+        return [f"{metric}@{year}" for metric in self.metrics for year in self.years]
+
+    def train(self, n_runs: int = 64, seed: int = 0) -> Dict[str, Any]:
+        """Runs an ensemble of n_runs simulations over the parameter box and fits the emulator."""
+        unit = unit_samples(n_runs, len(self.parameter_names), seed)
+        x = self.bounds[:, 0] + unit * (self.bounds[:, 1] - self.bounds[:, 0])
+        override_sets = [dict(zip(self.parameter_names, map(float, row))) for row in x]
+        y = run_batch(self.scenario_data, override_sets, self._expanded_metrics(), max_workers=self.max_workers,
+                      step_cache_path=self.step_cache_path)
+        # Metrics missing from the results (NaN) are emulated as constant zero rather than poisoning the fit
+        self.model.fit(x, np.nan_to_num(y))
+        return {'num_runs': n_runs, 'loo_relative_error': self._relative(self.model.loo_rmse).reshape(len(self.metrics), -1).max(axis=1).tolist()}
+
+    def _relative(self, error: np.ndarray) -> np.ndarray:
+        return error / np.where(self.model.output_scale > 0, self.model.output_scale, 1.0)
+
+    def _as_trajectories(self, flat: np.ndarray) -> Dict[str, List[float]]:
+        per_metric = flat.reshape(len(self.metrics), len(self.years))
+        return {metric: per_metric[i].tolist() for i, metric in enumerate(self.metrics)}
+
+    def query(self, overrides: Dict[str, Any], max_relative_error: float = 0.05,
+              envelope_tolerance: float = 0.0, allow_fallback: bool = True) -> Dict[str, Any]:
+        """
+        Answers a what-if query given as {override_path: value}. Trained parameters not given in
+        the query keep their scenario value. Returns trajectories per metric, a per-point standard
+        deviation, and 'source' = 'surrogate' or 'simulation'.
+        """
+        started = time.perf_counter()
+        reason = None
+        unknown = [path for path in overrides if path not in self.parameter_names]
+        x = np.array([[float(overrides.get(name, get_by_path(self.scenario_data, name, np.nan)))
+                       for name in self.parameter_names]])
+        if unknown:
+            reason = f"parameters not in surrogate: {unknown}"
+        elif np.isnan(x).any() or not self.model.in_envelope(x, envelope_tolerance)[0]:
+            reason = "query outside training envelope"
+        else:
+            mean, std = self.model.predict(x)
+            error = float(np.max(self._relative(np.maximum(std[0], self.model.loo_rmse))))
+            if error <= max_relative_error or not allow_fallback:
+                return {
+                    'source': 'surrogate', 'years': self.years,
+                    'trajectories': self._as_trajectories(mean[0]),
+                    'std': self._as_trajectories(std[0]),
+                    'relative_error_estimate': error,
+                    'elapsed_seconds': time.perf_counter() - started,
+                }
+            reason = f"estimated relative error {error:.3f} above {max_relative_error}"
+
+        if not allow_fallback:
+            raise ValueError(f"Surrogate cannot answer query: {reason}")
+        results = run_scenario(self.scenario_data, overrides)
+        return {
+            'source': 'simulation', 'fallback_reason': reason, 'years': sorted(results.keys()),
+            'trajectories': {metric: extract_trajectory(results, metric).tolist() for metric in self.metrics},
+            'std': None,
+            'elapsed_seconds': time.perf_counter() - started,
+        }
+
+    def save(self, path: str):
+        """Stores the fitted emulator as a .npz file (the scenario itself is not stored)."""
+        meta = {'parameter_names': self.parameter_names, 'metrics': self.metrics, 'years': self.years, 'degree': self.model.degree}
+        np.savez(path, meta=json.dumps(meta), bounds=self.bounds, coefficients=self.model.coefficients,
+                 gram_inverse=self.model.gram_inverse, residual_variance=self.model.residual_variance,
+                 loo_rmse=self.model.loo_rmse, output_scale=self.model.output_scale,
+                 training_min=self.model.training_min, training_max=self.model.training_max)
+
+    @classmethod
+    def load(cls, path: str, scenario_data: Dict[str, Any], max_workers: Optional[int] = None,
+             step_cache_path: Optional[str] = None) -> 'ScenarioSurrogate':
+        data = np.load(path)
+        meta = json.loads(str(data['meta']))
+        parameters = dict(zip(meta['parameter_names'], map(tuple, data['bounds'])))
+        surrogate = cls(scenario_data, parameters, meta['metrics'], degree=meta['degree'], max_workers=max_workers,
+                        step_cache_path=step_cache_path)
+        surrogate.years = meta['years']
+        for name in ('coefficients', 'gram_inverse', 'residual_variance', 'loo_rmse', 'output_scale', 'training_min', 'training_max'):
+            setattr(surrogate.model, name, data[name])
+        return surrogate
@@ -0,0 +1,226 @@
+import contextlib
+import io
+import math
+from typing import Dict, List, Any, Callable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from semiconductor_simulation.core.simulation_manager import SimulationManager
+from semiconductor_simulation.core.base_module import BaseModule
+from semiconductor_simulation.modules.geopolitical_shock_module import GeopoliticalShockModule
+from semiconductor_simulation.analysis.runner import apply_overrides, default_modules, extract_metric, parse_metric
+
+
+class TailRiskEstimate:
+    """
+    Estimated probability of a rare event with its standard error, plus weighted samples of
+    outcome metrics from the runs in which the event occurred (the conditional distribution).
+    """
+    __slots__ = ('method', 'probability', 'standard_error', 'n_samples', 'n_hits', 'run_equivalents',
+                 'outcomes', 'weights')
+
+    def __init__(self, method: str, probability: float, standard_error: float, n_samples: int, n_hits: int,
+                 run_equivalents: float, outcomes: Dict[str, np.ndarray], weights: np.ndarray):
+        self.method = method
+        self.probability = probability
+        self.standard_error = standard_error
+        self.n_samples = n_samples  # Independent samples (runs, or root runs for splitting)
+        self.n_hits = n_hits  # Runs (or particles) in which the event occurred
+        self.run_equivalents = run_equivalents  # Simulated years / years of one full run
+        self.outcomes = outcomes  # {metric: values for each hit}
+        self.weights = weights  # Weight of each hit
+
+    @property
+    def relative_error(self) -> float:
+        return self.standard_error / self.probability if self.probability > 0 else float('inf')
+
+    def conditional_mean(self, metric: str) -> float:
+        """Mean of an outcome metric given that the event occurs."""
+        if not self.weights.size:
+            return float('nan')
+        return float(np.dot(self.outcomes[metric], self.weights) / self.weights.sum())
+
+    def conditional_quantile(self, metric: str, q: float) -> float:
+        """Weighted q-quantile of an outcome metric given that the event occurs."""
+        if not self.weights.size:
+            return float('nan')
+        order = np.argsort(self.outcomes[metric])
+        cumulative = np.cumsum(self.weights[order]) / self.weights.sum()
+        return float(self.outcomes[metric][order][min(np.searchsorted(cumulative, q), order.size - 1)])
+
+    def __repr__(self):
+        return (f"TailRiskEstimate({self.method}: p={self.probability:.3g} +/- {self.standard_error:.2g}, "
+                f"{self.n_hits} hits, {self.run_equivalents:.1f} run equivalents)")
+
+
+class TailRiskEstimator:
+    """
+    Probability of a rare event, e.g. a node's shortfall exceeding X kwpm in any year, and the
+    outcome distribution given the event, with far fewer runs than plain Monte Carlo.
+
+    The event is 'event_metric' ('category.model_id.attribute', '*' sums over models, '@year'
+    restricts it to one year) reaching 'threshold' in any simulated year: at or above it, or at
+    or below it with below=True. For a shortfall, use
+    'technology_nodes.N3.supply_demand_gap_kwpm' with threshold=-X and below=True.
+
+    - monte_carlo(n_runs): independent runs, one random_replica each (the baseline).
+    - importance_sampling(n_runs, hazard_multipliers): shocks strike more often under the
+      proposal (GeopoliticalShockModule.set_proposal); each run is weighted by its likelihood
+      ratio, so the estimate stays unbiased.
+    - multilevel_splitting(n_roots, levels, split_factor): runs stepped year by year; when a run
+      first reaches an intermediate level it is forked (SimulationManager.fork()) into
+      split_factor runs with independent random streams and weight / split_factor each, so the
+      effort concentrates on the runs heading for the event. It can be combined with a proposal.
+
+    Importance sampling pays off when a few rare shocks drive the event; the proposal should make
+    them likely in the years where they lead to the event (year-dependent multipliers). Splitting
+    pays off when randomness accumulates over the years (frequent shocks, stochastic industry
+    events), so that runs close to the threshold are more likely to cross it.
+
+    Standard errors come from the independent samples (runs, or root runs with all their
+    descendants). run_equivalents counts simulated years in full runs, to compare the methods.
+    """
+    def __init__(
+        self,
+        scenario_data: Dict[str, Any],
+        event_metric: str,
+        threshold: float,
+        below: bool = False,
+        overrides: Optional[Dict[str, Any]] = None,
+        outcome_metrics: Sequence[str] = (),
+        module_factory: Callable[[], List[BaseModule]] = default_modules,
+        scenario_name: str = "tail_risk",
+        quiet: bool = True,
+    ):
+        parse_metric(event_metric)  # Validates the metric
+        self.scenario_data = apply_overrides(scenario_data, overrides)
+        self.event_metric, _, year = event_metric.partition('@')
+        self.event_year = int(year) if year else None
+        self.threshold = float(threshold)
+        self.sign = -1.0 if below else 1.0  # Scores are sign * value, so the event is score >= sign * threshold
+        self.outcome_metrics = list(outcome_metrics)
+        self.module_factory = module_factory
+        self.scenario_name = scenario_name
+        self.quiet = quiet
+        self._root: Optional[SimulationManager] = None
+        self._next_replica = 0
+        self._years_simulated = 0
+
+    def monte_carlo(self, n_runs: int) -> TailRiskEstimate:
+        """Plain Monte Carlo estimate from n_runs independent runs."""
+        return self._weighted_runs('monte_carlo', n_runs, None)
+
+    def importance_sampling(self, n_runs: int, hazard_multipliers: Dict[str, Any]) -> TailRiskEstimate:
+        """
+        Estimate from n_runs runs with shock hazard rates scaled by {shock_id: multiplier} or
+        {shock_id: {year: multiplier}} (see GeopoliticalShockModule.set_proposal).
+        """
+        return self._weighted_runs('importance_sampling', n_runs, hazard_multipliers)
+
+    def multilevel_splitting(self, n_roots: int, levels: Sequence[float], split_factor: int = 4,
+                             hazard_multipliers: Optional[Dict[str, Any]] = None,
+                             max_runs_per_root: int = 512) -> TailRiskEstimate:
+        """
+        Estimate from n_roots root runs, split at each of the intermediate 'levels' of the event
+        metric (between its typical values and the threshold). A root stops splitting once it has
+        max_runs_per_root descendants; the weights keep the estimate unbiased either way.
+        """
+        scores = sorted(self.sign * float(level) for level in levels if self.sign * float(level) < self.sign * self.threshold)
+        with self._output():
+            self._start()
+            per_root = np.zeros(n_roots)
+            hits: List[Tuple[float, List[float]]] = []
+            for r in range(n_roots):
+                # (manager, splitting weight, next level index, best score so far)
+                runs = [(self._new_run(self._root, hazard_multipliers), 1.0, 0, -math.inf)]
+                for year in range(self._root.start_year, self._root.end_year + 1):
+                    next_runs = []
+                    for manager, weight, level, best in runs:
+                        manager.run_year(year)
+                        self._years_simulated += 1
+                        best = max(best, self._score(manager.results, year))
+                        if best >= self.sign * self.threshold:
+                            # The event occurred: finish the run only if outcomes are needed afterwards
+                            if self.outcome_metrics and year < manager.end_year:
+                                next_runs.append((manager, weight, len(scores), math.inf))
+                            else:
+                                hits.append(self._hit(weight, manager))
+                                per_root[r] += hits[-1][0]
+                            continue
+                        while level < len(scores) and best >= scores[level]:
+                            level += 1
+                            if len(runs) + len(next_runs) < max_runs_per_root:
+                                weight /= split_factor
+                                for _ in range(split_factor - 1):
+                                    next_runs.append((self._new_run(manager, None), weight, level, best))
+                        next_runs.append((manager, weight, level, best))
+                    runs = next_runs
+            return self._estimate('multilevel_splitting', per_root, hits)
+
+    def _weighted_runs(self, method: str, n_runs: int, hazard_multipliers: Optional[Dict[str, Any]]) -> TailRiskEstimate:
+        with self._output():
+            self._start()
+            per_run = np.zeros(n_runs)
+            hits: List[Tuple[float, List[float]]] = []
+            for i in range(n_runs):
+                manager = self._new_run(self._root, hazard_multipliers)
+                for year in range(manager.start_year, manager.end_year + 1):
+                    manager.run_year(year)
+                self._years_simulated += manager.end_year - manager.start_year + 1
+                if self._occurred(manager.results):
+                    hits.append(self._hit(1.0, manager))
+                    per_run[i] = hits[-1][0]
+            return self._estimate(method, per_run, hits)
+
+    def _output(self):
+        return contextlib.redirect_stdout(io.StringIO()) if self.quiet else contextlib.nullcontext()
+
+    def _start(self):
+        """Loads and initializes the scenario once; every run is a fork of this initial state."""
+        if self._root is None:
+            self._root = SimulationManager(scenario_name=self.scenario_name)
+            self._root.load_scenario_from_dict(self.scenario_data)
+            for module in self.module_factory():
+                self._root.register_module(module)
+            self._root.initialize_modules()
+        self._years_simulated = 0
+
+    def _new_run(self, parent: SimulationManager, hazard_multipliers: Optional[Dict[str, Any]]) -> SimulationManager:
+        """A fork of parent that continues with its own random_replica (and proposal, if given)."""
+        manager = parent.fork()
+        manager.random_streams = parent.random_streams.for_replica(self._next_replica)
+        self._next_replica += 1
+        if hazard_multipliers:
+            shock_module = _shock_module(manager)
+            if shock_module is None:
+                raise ValueError("Importance sampling needs a GeopoliticalShockModule among the registered modules")
+            shock_module.set_proposal(hazard_multipliers)
+        return manager
+
+    def _score(self, results: Dict[int, Dict[str, Any]], year: int) -> float:
+        if self.event_year is not None and year != self.event_year:
+            return -math.inf
+        value = extract_metric(results, f"{self.event_metric}@{year}")
+        return -math.inf if math.isnan(value) else self.sign * value
+
+    def _occurred(self, results: Dict[int, Dict[str, Any]]) -> bool:
+        return any(self._score(results, year) >= self.sign * self.threshold for year in results)
+
+    def _hit(self, weight: float, manager: SimulationManager) -> Tuple[float, List[float]]:
+        """(importance weight, outcome metric values) of a run in which the event occurred."""
+        shock_module = _shock_module(manager)
+        if shock_module is not None:
+            weight *= math.exp(shock_module.log_likelihood_ratio)
+        return weight, [extract_metric(manager.results, metric) for metric in self.outcome_metrics]
+
+    def _estimate(self, method: str, samples: np.ndarray, hits: List[Tuple[float, List[float]]]) -> TailRiskEstimate:
+        n = samples.size
+        standard_error = float(samples.std(ddof=1) / math.sqrt(n)) if n > 1 else float('nan')
+        outcomes = {metric: np.array([values[k] for _, values in hits]) for k, metric in enumerate(self.outcome_metrics)}
+        horizon = self._root.end_year - self._root.start_year + 1
+        return TailRiskEstimate(method, float(samples.mean()) if n else float('nan'), standard_error, n, len(hits),
+                                self._years_simulated / horizon, outcomes, np.array([weight for weight, _ in hits]))
+
+
+def _shock_module(manager: SimulationManager) -> Optional[GeopoliticalShockModule]:
+    return next((m for m in manager.modules if isinstance(m, GeopoliticalShockModule)), None)
@@ -1,6 +1,9 @@
 # Core simulation components
 from .base_model import BaseModel
 from .base_module import BaseModule
+from .entity_store import EntityStore, VacantSlot
+from .random_streams import RandomStreams
+from .shared_state import SharedScenarioState
 from .simulation_manager import SimulationManager
 
-__all__ = ['BaseModel', 'BaseModule', 'SimulationManager'] 
\ No newline at end of file
+__all__ = ['BaseModel', 'BaseModule', 'EntityStore', 'VacantSlot', 'RandomStreams', 'SharedScenarioState', 'SimulationManager'] 
\ No newline at end of file
@@ -1,15 +1,37 @@
+import copy
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Set, Tuple
 from semiconductor_simulation.core.base_model import BaseModel
+from semiconductor_simulation.core.step_cache import StepCache, stable_hash
 
 class BaseModule(ABC):
     """
     Abstract base class for all simulation modules.
     Each module encapsulates a specific part of the simulation logic.
     """
+    # --- Opt-in memoization of execute_year_step ---
+    # A module may declare the state it reads, as {model_category: [attribute names]} ('*' for all
+    # attributes) plus the global parameters it reads. When memoization is enabled and the module is
+    # deterministic given that state, a step whose inputs hash to a known key is not executed; the
+    # stored state delta is applied instead. SimulationManager.rerun() uses the same declarations to
+    # tell which modules a scenario edit can affect; a module without memo_inputs counts as reading
+    # everything.
+    memo_inputs: Dict[str, List[str]] = {}
+    memo_params: List[str] = []
+    # Categories the module writes to; the stored delta covers these and the input categories.
+    memo_outputs: List[str] = []
+    memoizable: bool = False
+    # --- Context bus channels (see core.context_bus) ---
+    # Channels the module publishes to and reads from context['bus']. SimulationManager declares
+    # them and warns when a module reads a channel that is published later in the year.
+    publishes: List[str] = []
+    subscribes: List[str] = []
+
     def __init__(self, module_id: str, name: str):
         self.module_id = module_id
         self.name = name
+        self.step_cache: Optional[StepCache] = None
+        self.code_version: str = ""
 
     @abstractmethod
     def initialize(self, models: Dict[str, List[BaseModel]], global_params: Dict[str, Any]):
@@ -27,5 +49,108 @@ class BaseModule(ABC):
         """
         pass
 
+    def enable_memoization(self, step_cache: StepCache, code_version: str = ""):
+        """Turns on step memoization for this module (ignored unless the module is memoizable)."""
+        self.step_cache = step_cache if self.memoizable else None
+        self.code_version = code_version
+
+    def get_memo_state(self) -> Any:
+        """Internal (non-model) state that influences or results from a step; None for stateless modules."""
+        return None
+
+    def set_memo_state(self, state: Any):
+        """Restores internal state produced by a memoized step."""
+        pass
+
+    def reads_any(self, changed: Set[Tuple[str, str]]) -> bool:
+        """
+        Whether the year step may read any of the changed inputs, given as (model category,
+        attribute name; '*' for any attribute), ('global_parameters', name) or ('bus', channel).
+        """
+        if not self.memo_inputs:
+            return bool(changed)
+        for category, name in changed:
+            if category == 'global_parameters':
+                if name in self.memo_params:
+                    return True
+            elif category == 'bus':
+                if name in self.subscribes:
+                    return True
+            else:
+                attribute_names = self.memo_inputs.get(category)
+                if attribute_names is not None and (name == '*' or '*' in attribute_names or name in attribute_names):
+                    return True
+        return False
+
+    def run_year_step(self, current_year: int, context: Dict[str, Any]):
+        """
+        Entry point used by SimulationManager: executes the year step, going through the step
+        cache when memoization is enabled for this module.
+        """
+        if self.step_cache is None:
+            self.execute_year_step(current_year, context)
+            return
+
+        models = context.get('models', {})
+        bus = context.get('bus')
+        key = self._memo_key(current_year, models, context.get('global_parameters', {}), bus)
+        delta = self.step_cache.get(key)
+        if delta is not None:
+            self._apply_delta(delta, models, current_year)
+            if bus is not None:
+                for name, (values, labels) in delta.get('channels', {}).items():
+                    bus.publish(name, current_year, values, labels)
+            return
+
+        categories = set(self.memo_inputs) | set(self.memo_outputs)
+        before = {category: [copy.deepcopy(m.attributes) for m in models.get(category, [])] for category in categories}
+        self.execute_year_step(current_year, context)
+        delta = self._compute_delta(before, models)
+        if bus is not None:
+            delta['channels'] = bus.published_in(current_year, self.publishes)
+        self.step_cache.put(key, delta)
+
+    def _memo_key(self, current_year: int, models: Dict[str, List[BaseModel]], global_params: Dict[str, Any],
+                  bus: Any = None) -> str:
+        inputs = {}
+        for category, attribute_names in self.memo_inputs.items():
+            if '*' in attribute_names:
+                inputs[category] = [(m.model_id, m.attributes) for m in models.get(category, [])]
+            else:
+                inputs[category] = [(m.model_id, {a: m.attributes.get(a) for a in attribute_names})
+                                    for m in models.get(category, [])]
+        # Output-only categories still contribute their model ids, since deltas are applied by position.
+        layout = {category: [m.model_id for m in models.get(category, [])] for category in self.memo_outputs}
+        return stable_hash({
+            'module': f"{type(self).__module__}.{type(self).__qualname__}",
+            'module_id': self.module_id,
+            'code_version': self.code_version,
+            'year': current_year,
+            'inputs': inputs,
+            'layout': layout,
+            'params': {p: global_params.get(p) for p in self.memo_params},
+            'internal_state': self.get_memo_state(),
+            'channels': {name: None if bus is None or bus.get(name) is None else bus.get(name).tolist()
+                         for name in self.subscribes},
+        })
+
+    def _compute_delta(self, before: Dict[str, List[Dict[str, Any]]], models: Dict[str, List[BaseModel]]) -> Dict[str, Any]:
+        changes: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        for category, snapshots in before.items():
+            for position, (model, old_attributes) in enumerate(zip(models.get(category, []), snapshots)):
+                changed = {k: copy.deepcopy(v) for k, v in model.attributes.items()
+                           if k not in old_attributes or old_attributes[k] != v}
+                if changed:
+                    changes.setdefault(category, {})[position] = changed
+        return {'changes': changes, 'internal_state': copy.deepcopy(self.get_memo_state())}
+
+    def _apply_delta(self, delta: Dict[str, Any], models: Dict[str, List[BaseModel]], current_year: int):
+        for category, per_model in delta['changes'].items():
+            model_list = list(models.get(category, []))
+            for position, changed in per_model.items():
+                for attribute_name, value in changed.items():
+                    model_list[position].set_attribute(attribute_name, copy.deepcopy(value), current_year)
+        self.set_memo_state(delta['internal_state'])
+
     def __repr__(self):
-        return f"{self.__class__.__name__}(id='{self.module_id}', name='{self.name}')" 
\ No newline at end of file
+        return f"{self.__class__.__name__}(id='{self.module_id}', name='{self.name}')"
@@ -0,0 +1,115 @@
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class Channel:
+    """
+    A named, typed array signal with one version per period. Publishing stores the array itself
+    (no copy; it is only converted if its dtype differs) and readers get read-only views of it.
+    Publishers hand over a new array every period and do not modify it afterwards.
+    """
+    __slots__ = ('name', 'dtype', 'labels', 'label_index', 'publisher', 'description', 'versions', 'version')
+
+    def __init__(self, name: str, dtype: Any = np.float64, labels: Optional[Sequence[str]] = None,
+                 publisher: Optional[str] = None, description: str = ""):
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.labels: Optional[List[str]] = None
+        self.label_index: Dict[str, int] = {}
+        self.publisher = publisher
+        self.description = description
+        self.versions: Dict[int, np.ndarray] = {}
+        self.version: Optional[int] = None  # Latest period published
+        if labels is not None:
+            self.set_labels(labels)
+
+    def set_labels(self, labels: Sequence[str]):
+        """Names for the entries along the first axis (e.g. node ids)."""
+        self.labels = list(labels)
+        self.label_index = {label: i for i, label in enumerate(self.labels)}
+
+    def publish(self, period: int, values: Any):
+        array = np.asarray(values, dtype=self.dtype)
+        if self.labels is not None and (array.ndim == 0 or array.shape[0] != len(self.labels)):
+            raise ValueError(f"Channel '{self.name}' has {len(self.labels)} labels but got shape {array.shape}")
+        view = array.view()
+        view.flags.writeable = False
+        self.versions[period] = view
+        if self.version is None or period >= self.version:
+            self.version = period
+
+
+class ContextBus:
+    """
+    Typed channels through which modules share array-valued aggregates within and across years,
+    e.g. per-node supply, demand and prices, instead of recomputing them from the model lists or
+    mutating model attributes to pass them on. SimulationManager owns one bus per run and passes
+    it to modules as context['bus'].
+
+    Modules declare the channels they publish and read (BaseModule.publishes / .subscribes);
+    SimulationManager declares them when modules are initialized and warns about reads of channels
+    no module publishes, or that are published later in the year (the reader then sees the
+    previous year's version). Lookups are dictionary accesses: get() returns the latest version
+    (or the one of a given period), value() one labelled entry.
+    """
+    def __init__(self):
+        self.channels: Dict[str, Channel] = {}
+
+    def declare(self, name: str, dtype: Any = np.float64, labels: Optional[Sequence[str]] = None,
+                publisher: Optional[str] = None, description: str = "") -> Channel:
+        """Creates the channel, or returns it if it exists (filling in a missing publisher)."""
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = self.channels[name] = Channel(name, dtype, labels, publisher, description)
+        elif publisher is not None and channel.publisher is None:
+            channel.publisher = publisher
+        return channel
+
+    def publish(self, name: str, period: int, values: Any, labels: Optional[Sequence[str]] = None):
+        """Publishes the period's version of a channel (declared on first use)."""
+        channel = self.declare(name)
+        if labels is not None and labels != channel.labels:
+            channel.set_labels(labels)
+        channel.publish(period, values)
+
+    def get(self, name: str, period: Optional[int] = None) -> Optional[np.ndarray]:
+        """Latest version of the channel, or its version for the period (None if there is none)."""
+        channel = self.channels.get(name)
+        if channel is None or channel.version is None:
+            return None
+        return channel.versions.get(channel.version if period is None else period)
+
+    def version(self, name: str) -> Optional[int]:
+        """Period of the channel's latest version (None before it is first published)."""
+        channel = self.channels.get(name)
+        return None if channel is None else channel.version
+
+    def labels(self, name: str) -> Optional[List[str]]:
+        channel = self.channels.get(name)
+        return None if channel is None else channel.labels
+
+    def value(self, name: str, label: str, period: Optional[int] = None, default: Any = None) -> Any:
+        """The entry of a labelled channel for one label."""
+        values = self.get(name, period)
+        index = self.channels[name].label_index.get(label) if values is not None else None
+        return default if index is None else values[index]
+
+    def published_in(self, period: int, names: Sequence[str]) -> Dict[str, Tuple[np.ndarray, Optional[List[str]]]]:
+        """{name: (values, labels)} of the channels among names that have a version for the period."""
+        published = {}
+        for name in names:
+            channel = self.channels.get(name)
+            if channel is not None and period in channel.versions:
+                published[name] = (channel.versions[period], channel.labels)
+        return published
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> 'ContextBus':
+        # Published versions are read-only, so copies (e.g. SimulationManager.fork()) share them
+        bus = ContextBus()
+        for name, channel in self.channels.items():
+            copied = bus.declare(name, channel.dtype, channel.labels, channel.publisher, channel.description)
+            copied.versions = dict(channel.versions)
+            copied.version = channel.version
+        memo[id(self)] = bus
+        return bus
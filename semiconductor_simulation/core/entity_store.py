@@ -0,0 +1,91 @@
+from typing import Dict, List, Any, Iterator, Optional, Sequence, Tuple
+from semiconductor_simulation.core.base_model import BaseModel
+
+
+class VacantSlot(BaseModel):
+    """
+    Placeholder occupying a freed slot of an EntityStore. It has no attributes (so every
+    get_attribute() is None and modules treat it as an empty entity), is never updated and is
+    left out of the yearly results.
+    """
+    def __init__(self, slot: int):
+        super().__init__(f"__vacant_{slot}", "Vacant slot", {})
+
+    def update_state(self, current_year: int, context: Dict[str, Any]):
+        pass
+
+
+class EntityStore(list):
+    """
+    Slot-based container for the models of one category, used by SimulationManager so that
+    entities can be created and removed mid-run.
+
+    It is a list, so modules keep indexing models by position. Positions are stable slots:
+    removing an entity puts a VacantSlot in its place and its slot on a free list, and adding
+    an entity reuses a free slot (or appends). Both are O(1). No other model moves, so per-row
+    engine state in the modules (pipelines, indices, share arrays) stays valid.
+
+    Every add/remove bumps `generation` and is logged. Modules that keep per-row state compare the
+    generation with the one they last saw and replay changes_since() to update only the
+    affected rows. Removed models keep their history and are kept in `retired`.
+    """
+    def __init__(self, models: Sequence[BaseModel] = ()):
+        super().__init__(models)
+        self.free_slots: List[int] = []
+        self.slot_of: Dict[str, int] = {model.model_id: slot for slot, model in enumerate(self)}
+        self.retired: List[BaseModel] = []
+        self.generation = 0
+        self.events: List[Dict[str, Any]] = []
+
+    def add(self, model: BaseModel, year: Optional[int] = None) -> int:
+        """Places a new model in a free slot (or a new one) and returns the slot."""
+        if model.model_id in self.slot_of:
+            raise ValueError(f"Model id '{model.model_id}' is already in use")
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self[slot] = model
+        else:
+            slot = len(self)
+            self.append(model)
+        self.slot_of[model.model_id] = slot
+        self._log('add', slot, model.model_id, year)
+        return slot
+
+    def remove(self, model_id: str, year: Optional[int] = None, successor_id: Optional[str] = None) -> BaseModel:
+        """
+        Retires a model and frees its slot. successor_id names the entity that absorbs it (e.g.
+        the acquirer in a merger), so modules can carry its per-row state over.
+        """
+        slot = self.slot_of.pop(model_id)
+        model = self[slot]
+        self[slot] = VacantSlot(slot)
+        self.free_slots.append(slot)
+        self.retired.append(model)
+        self._log('remove', slot, model_id, year, successor_slot=self.slot_of.get(successor_id) if successor_id else None)
+        return model
+
+    def _log(self, kind: str, slot: int, model_id: str, year: Optional[int], successor_slot: Optional[int] = None):
+        self.generation += 1
+        self.events.append({'generation': self.generation, 'kind': kind, 'slot': slot, 'model_id': model_id,
+                            'year': year, 'successor_slot': successor_slot})
+
+    def is_active(self, slot: int) -> bool:
+        return not isinstance(self[slot], VacantSlot)
+
+    def active(self) -> Iterator[Tuple[int, BaseModel]]:
+        """(slot, model) for occupied slots."""
+        return ((slot, model) for slot, model in enumerate(self) if not isinstance(model, VacantSlot))
+
+    def changes_since(self, generation: int) -> List[Dict[str, Any]]:
+        """Logged add/remove events after the given generation, oldest first."""
+        if generation >= self.generation:
+            return []
+        # Generations are consecutive, so the events after `generation` are the last ones
+        return self.events[len(self.events) - (self.generation - generation):]
+
+
+def store_changes(models: Sequence[BaseModel], generation: int) -> Tuple[int, List[Dict[str, Any]]]:
+    """(current generation, changes since `generation`) of a model list; plain lists never change."""
+    if isinstance(models, EntityStore):
+        return models.generation, models.changes_since(generation)
+    return generation, []
@@ -0,0 +1,112 @@
+import hashlib
+from typing import Dict, Any, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Philox4x32-10 constants (Salmon et al., "Parallel random numbers: as easy as 1, 2, 3")
+_PHILOX_M = (np.uint64(0xD2511F53), np.uint64(0xCD9E8D57))
+_PHILOX_W = (np.uint64(0x9E3779B9), np.uint64(0xBB67AE85))
+_PHILOX_ROUNDS = 10
+_MASK32 = np.uint64(0xFFFFFFFF)
+_NO_YEAR = 0xFFFFFFFF  # stands in for year=None in stream keys
+
+Entity = Union[str, int, None]
+
+
+def stable_id(value: Entity) -> int:
+    """64-bit id of an entity or module name that is the same in every process and session."""
+    if value is None:
+        return 0
+    return int.from_bytes(hashlib.blake2b(repr(value).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def philox4x32(counter: np.ndarray, key: Tuple[int, int]) -> np.ndarray:
+    """
+    Philox4x32-10 block function, vectorized: counter (..., 4) uint32 words -> (..., 4) random
+    uint32 words for the (2-word) key. Counter-based: any block is computed directly from its
+    counter, without generating the ones before it.
+    """
+    c = [np.asarray(counter[..., i], dtype=np.uint64) for i in range(4)]
+    k0, k1 = np.uint64(key[0]), np.uint64(key[1])
+    for _ in range(_PHILOX_ROUNDS):
+        p0 = _PHILOX_M[0] * c[0]
+        p1 = _PHILOX_M[1] * c[2]
+        c = [(p1 >> np.uint64(32)) ^ c[1] ^ k0, p1 & _MASK32, (p0 >> np.uint64(32)) ^ c[3] ^ k1, p0 & _MASK32]
+        k0 = (k0 + _PHILOX_W[0]) & _MASK32
+        k1 = (k1 + _PHILOX_W[1]) & _MASK32
+    return np.stack(c, axis=-1).astype(np.uint32)
+
+
+class RandomStreams:
+    """
+    Central source of randomness: independent, reproducible streams keyed by
+    (replica, module_id, entity, year) and derived from one root seed. The draws a key gets do
+    not depend on which other keys were drawn, in what order, in which process or how many
+    workers a sweep uses, so re-running a subset of replicas (or of entities) reproduces their
+    draws bit for bit.
+
+    - generator() returns a NumPy Generator over Philox, keyed by a SeedSequence of the root
+      seed, replica, module, year and entity, for arbitrary distributions.
+    - uniform() / normal() draw for a whole entity column at once with the counter-based
+      Philox4x32-10 block function: the key comes from (seed, replica, module, year) and each
+      entity's stable id is its counter, so row i depends only on entity i.
+    """
+    def __init__(self, seed: int = 0, replica: int = 0):
+        self.seed = int(seed)
+        self.replica = int(replica)
+        self._keys: Dict[Tuple[str, int, int], Tuple[int, int]] = {}
+        self._entity_ids: Dict[Entity, int] = {}
+
+    def for_replica(self, replica: int) -> 'RandomStreams':
+        """The same streams for another replica (ensembles, sweeps)."""
+        return RandomStreams(self.seed, replica)
+
+    def _seed_sequence(self, module_id: str, year: Optional[int], entity: Entity = None) -> np.random.SeedSequence:
+        module = stable_id(module_id)
+        entity_id = stable_id(entity)
+        return np.random.SeedSequence([self.seed, self.replica, module & 0xFFFFFFFF, module >> 32,
+                                       _NO_YEAR if year is None else int(year) & 0xFFFFFFFF,
+                                       entity_id & 0xFFFFFFFF, entity_id >> 32])
+
+    def generator(self, module_id: str, entity: Entity = None, year: Optional[int] = None) -> np.random.Generator:
+        """An independent Generator for one (module, entity, year) of this replica."""
+        return np.random.Generator(np.random.Philox(self._seed_sequence(module_id, year, entity)))
+
+    def _column_key(self, module_id: str, year: Optional[int]) -> Tuple[int, int]:
+        cache_key = (module_id, -1 if year is None else int(year), self.replica)
+        key = self._keys.get(cache_key)
+        if key is None:
+            words = self._seed_sequence(module_id, year).generate_state(2, np.uint32)
+            key = self._keys[cache_key] = (int(words[0]), int(words[1]))
+        return key
+
+    def _bits(self, module_id: str, entities: Sequence[Entity], year: Optional[int], n_blocks: int) -> np.ndarray:
+        """(n_entities, n_blocks, 4) random uint32 words: counter = (entity id, block index)."""
+        ids = np.empty(len(entities), dtype=np.uint64)
+        for i, entity in enumerate(entities):
+            entity_id = self._entity_ids.get(entity)
+            if entity_id is None:
+                entity_id = self._entity_ids[entity] = stable_id(entity)
+            ids[i] = entity_id
+        counter = np.zeros((ids.size, n_blocks, 4), dtype=np.uint64)
+        counter[..., 0] = (ids & _MASK32)[:, np.newaxis]
+        counter[..., 1] = (ids >> np.uint64(32))[:, np.newaxis]
+        counter[..., 2] = np.arange(n_blocks, dtype=np.uint64)[np.newaxis, :]
+        return philox4x32(counter, self._column_key(module_id, year))
+
+    def uniform(self, module_id: str, entities: Sequence[Entity], year: Optional[int] = None, size: int = 1) -> np.ndarray:
+        """(n_entities, size) uniform draws in [0, 1) with 53-bit resolution, one row per entity."""
+        n_blocks = -(-int(size) // 2)  # a block (4 words) gives two doubles
+        words = self._bits(module_id, entities, year, n_blocks).astype(np.uint64).reshape(len(entities), -1, 2)
+        mantissa = ((words[..., 0] >> np.uint64(5)) << np.uint64(26)) | (words[..., 1] >> np.uint64(6))
+        return (mantissa.astype(np.float64) * (1.0 / 9007199254740992.0))[:, :int(size)]
+
+    def normal(self, module_id: str, entities: Sequence[Entity], year: Optional[int] = None, size: int = 1) -> np.ndarray:
+        """(n_entities, size) standard normal draws (Box-Muller on uniform() pairs)."""
+        u = self.uniform(module_id, entities, year, 2 * -(-int(size) // 2)).reshape(len(entities), -1, 2)
+        radius = np.sqrt(-2.0 * np.log1p(-u[..., 0]))  # 1 - u is in (0, 1]
+        angle = 2.0 * np.pi * u[..., 1]
+        return np.stack([radius * np.cos(angle), radius * np.sin(angle)], axis=-1).reshape(len(entities), -1)[:, :int(size)]
+
+    def get_state(self) -> Dict[str, Any]:
+        return {'seed': self.seed, 'replica': self.replica}
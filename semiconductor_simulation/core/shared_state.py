@@ -0,0 +1,317 @@
+import copy
+import pickle
+from collections.abc import MutableMapping
+from multiprocessing import shared_memory
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+import numpy as np
+
+from semiconductor_simulation.core.base_model import BaseModel
+from semiconductor_simulation.core.entity_store import EntityStore
+
+# Python scalar types kept as shared numeric columns (an attribute is a column only if all its
+# values in a category have the same one of these types); everything else is an object attribute.
+COLUMN_DTYPES = {bool: np.bool_, int: np.int64, float: np.float64}
+_ALIGNMENT = 8
+_PREFIX = 16  # header offset and size
+_MISSING = object()
+_NO_VALUES: Dict[str, Any] = {}  # shared empty overlay, never written to
+_NO_KEYS: frozenset = frozenset()
+
+
+class SharedAttributes(MutableMapping):
+    """
+    Attribute mapping of one model backed by its row of the shared state. Numeric attributes are
+    read from the shared columns (no per-model copy); object attributes (dicts, lists, strings)
+    are unpickled from the model's own slice on first use. Writes and deletions go to a private
+    overlay, so a worker only ever owns the values it changed (copy-on-write per attribute).
+    Deep copies and pickles are plain dicts.
+    """
+    __slots__ = ('_state', '_category', '_row', '_columns', '_object_keys', '_overlay', '_deleted', '_objects')
+
+    def __init__(self, state: 'SharedScenarioState', category: str, row: int, overlay: Optional[Dict[str, Any]] = None):
+        self._state = state
+        self._category = category
+        self._row = row
+        self._columns = state.views[category]
+        self._object_keys = state.object_keys(category, row)
+        # Created on the first write / delete, so unmodified models carry no per-model containers
+        self._overlay: Dict[str, Any] = overlay or _NO_VALUES
+        self._deleted: frozenset = _NO_KEYS
+        self._objects: Optional[Dict[str, Any]] = None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in self._overlay:
+            return self._overlay[key]
+        if key in self._deleted:
+            return default
+        column = self._columns.get(key)
+        if column is not None:
+            return column[0][self._row] if column[1][self._row] else default
+        if key in self._object_keys:
+            if self._objects is None:
+                self._objects = self._state.row_objects(self._category, self._row)
+            return self._objects[key]
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __setitem__(self, key: str, value: Any):
+        if self._overlay is _NO_VALUES:
+            self._overlay = {}
+        self._overlay[key] = value
+        if key in self._deleted:
+            self._deleted = self._deleted - {key}
+
+    def __delitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        if key in self._overlay:
+            del self._overlay[key]
+        self._deleted = self._deleted | {key}
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """All (attribute, value) pairs in one pass (used every year to collect results)."""
+        pairs = []
+        for key in self._state.attribute_order(self._category):
+            if key not in self._overlay:
+                value = self.get(key, _MISSING)
+                if value is not _MISSING:
+                    pairs.append((key, value))
+        pairs.extend(self._overlay.items())
+        return pairs
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([key for key, _ in self.items()])
+
+    def __len__(self) -> int:
+        return len(self.items())
+
+    def owned(self) -> Dict[str, Any]:
+        """The attributes this process has written (its copy-on-write overlay)."""
+        return dict(self._overlay)
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> Dict[str, Any]:
+        return {key: copy.deepcopy(value, memo) for key, value in self.items()}
+
+    def __reduce__(self):
+        return dict, (self.items(),)
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+
+class SharedScenarioState:
+    """
+    A scenario's initial state published once into one shared memory block, so that worker
+    processes attach to it instead of re-parsing YAML or unpickling model objects.
+
+    Layout of the block: [header offset and size][numeric columns][object slices][pickled header].
+    The header holds the global parameters, top-level scenario settings and, per model category,
+    the model class, ids, names, attribute order and the offsets of the columns and slices.
+    Numeric attributes become one column per attribute (NumPy dtype from COLUMN_DTYPES plus a
+    presence mask), which workers map zero-copy. Object attributes are pickled per model, so
+    building the models of a worker (build_models) costs O(ids) regardless of attribute content;
+    objects are unpickled when a model first reads them.
+
+    The publishing process owns the block and must unlink() it when the runs are done (or use
+    the state as a context manager). handle() is the small picklable reference passed to workers.
+    """
+    def __init__(self, block: shared_memory.SharedMemory, header: Dict[str, Any], owner: bool):
+        self.block = block
+        self.header = header
+        self.owner = owner
+        self.columns: Dict[str, Dict[str, Tuple[np.ndarray, np.ndarray]]] = {}
+        # The same columns as typed memoryviews: indexing one returns a Python scalar directly
+        self.views: Dict[str, Dict[str, Tuple[memoryview, memoryview]]] = {}
+        for category, layout in header['categories'].items():
+            self.columns[category], self.views[category] = {}, {}
+            n = len(layout['ids'])
+            for name, (dtype, offset, present_offset) in layout['columns'].items():
+                dtype = np.dtype(dtype)
+                values = np.ndarray((n,), dtype=dtype, buffer=block.buf, offset=offset)
+                present = np.ndarray((n,), dtype=np.bool_, buffer=block.buf, offset=present_offset)
+                values.flags.writeable = present.flags.writeable = False
+                self.columns[category][name] = (values, present)
+                self.views[category][name] = (block.buf[offset:offset + n * dtype.itemsize].toreadonly().cast(dtype.char),
+                                              block.buf[present_offset:present_offset + n].toreadonly().cast('?'))
+
+    @classmethod
+    def publish(cls, scenario_data: Dict[str, Any], name: Optional[str] = None) -> 'SharedScenarioState':
+        """Lays the scenario out as columns and object slices in a new shared memory block."""
+        chunks: List[Tuple[int, bytes]] = []
+        offset = _PREFIX
+
+        def reserve(data: bytes) -> int:
+            nonlocal offset
+            start = offset
+            chunks.append((start, data))
+            offset += -(-len(data) // _ALIGNMENT) * _ALIGNMENT
+            return start
+
+        categories = {}
+        for category, configs in (scenario_data.get('models_initial_state') or {}).items():
+            configs = [c for c in configs if c.get('model_id') and c.get('name')]
+            attribute_sets = [c.get('initial_attributes') or {} for c in configs]
+            order = list(dict.fromkeys(key for attributes in attribute_sets for key in attributes))
+            layout = {'ids': [c['model_id'] for c in configs], 'names': [c['name'] for c in configs],
+                      'order': order, 'columns': {}, 'objects': [], 'object_keys': [], 'object_key_index': []}
+            for key in order:
+                values = [attributes[key] for attributes in attribute_sets if key in attributes]
+                kinds = {type(value) for value in values}
+                if len(kinds) != 1 or next(iter(kinds)) not in COLUMN_DTYPES:
+                    continue
+                dtype = np.dtype(COLUMN_DTYPES[next(iter(kinds))])
+                column = np.zeros(len(configs), dtype=dtype)
+                present = np.array([key in attributes for attributes in attribute_sets], dtype=np.bool_)
+                column[present] = values
+                layout['columns'][key] = (dtype.str, reserve(column.tobytes()), reserve(present.tobytes()))
+            key_sets: Dict[Tuple[str, ...], int] = {}
+            for attributes in attribute_sets:
+                objects = {key: value for key, value in attributes.items() if key not in layout['columns']}
+                blob = pickle.dumps(objects, protocol=pickle.HIGHEST_PROTOCOL) if objects else b''
+                layout['objects'].append((reserve(blob), len(blob)))
+                # Rows share few distinct key sets; presence checks never unpickle a row
+                layout['object_key_index'].append(key_sets.setdefault(tuple(objects), len(key_sets)))
+            layout['object_keys'] = [frozenset(keys) for keys in key_sets]
+            layout['object_key_index'] = np.array(layout['object_key_index'], dtype=np.int32)
+            categories[category] = layout
+
+        settings = {key: value for key, value in scenario_data.items() if key != 'models_initial_state'}
+        header = pickle.dumps({'settings': settings, 'categories': categories}, protocol=pickle.HIGHEST_PROTOCOL)
+        header_start = offset
+        block = shared_memory.SharedMemory(name=name, create=True, size=header_start + len(header))
+        block.buf[:_PREFIX] = header_start.to_bytes(8, 'little') + len(header).to_bytes(8, 'little')
+        for start, data in chunks:
+            block.buf[start:start + len(data)] = data
+        block.buf[header_start:header_start + len(header)] = header
+        return cls(block, pickle.loads(header), owner=True)
+
+    @classmethod
+    def attach(cls, handle: Dict[str, Any]) -> 'SharedScenarioState':
+        """Maps a block published by another process (see handle()); nothing is copied but the header."""
+        try:
+            # The publisher owns (and unlinks) the block, so attaching processes do not track it
+            block = shared_memory.SharedMemory(name=handle['name'], track=False)
+        except TypeError:  # Python < 3.13: pool workers share the publisher's resource tracker
+            block = shared_memory.SharedMemory(name=handle['name'])
+        header_start = int.from_bytes(bytes(block.buf[:8]), 'little')
+        size = int.from_bytes(bytes(block.buf[8:_PREFIX]), 'little')
+        return cls(block, pickle.loads(bytes(block.buf[header_start:header_start + size])), owner=False)
+
+    def handle(self) -> Dict[str, Any]:
+        return {'name': self.block.name, 'size': self.block.size}
+
+    @property
+    def settings(self) -> Dict[str, Any]:
+        """Top-level scenario settings (start_year, end_year, global_parameters, ...)."""
+        return self.header['settings']
+
+    def attribute_order(self, category: str) -> List[str]:
+        return self.header['categories'][category]['order']
+
+    def column(self, category: str, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Read-only (values, present) arrays of a numeric attribute, shared across processes."""
+        return self.columns[category][key]
+
+    def object_keys(self, category: str, row: int) -> frozenset:
+        layout = self.header['categories'][category]
+        return layout['object_keys'][layout['object_key_index'][row]]
+
+    def row_objects(self, category: str, row: int) -> Dict[str, Any]:
+        start, size = self.header['categories'][category]['objects'][row]
+        return pickle.loads(bytes(self.block.buf[start:start + size])) if size else {}
+
+    def build_models(self, class_map: Dict[str, type]) -> Dict[str, EntityStore]:
+        """
+        Model objects for every category (class_map: category -> model class) whose attributes are
+        SharedAttributes rows. Constructors only see which attributes a row has, so the defaults
+        they fill in for missing ones become the row's first overlay values.
+        """
+        models: Dict[str, EntityStore] = {}
+        for category, layout in self.header['categories'].items():
+            model_class = class_map.get(category)
+            if model_class is None:
+                print(f"Warning: No model class found for shared category '{category}'. Skipping.")
+                continue
+            # Constructors only look at which attributes are present, so run one per distinct
+            # presence pattern (a prototype) and clone it for the rows sharing that pattern
+            pattern_of = np.asarray(layout['object_key_index'], dtype=np.int64)
+            for _, present in self.columns[category].values():
+                # Fold one presence column at a time into the pattern id, renumbering to keep it small
+                _, pattern_of = np.unique(pattern_of * 2 + present, return_inverse=True)
+            _, first_rows = np.unique(pattern_of, return_index=True)
+            prototypes = []
+            for row in first_rows:
+                row = int(row)
+                attributes = SharedAttributes(self, category, row)
+                prototype = model_class(layout['ids'][row], layout['names'][row], **dict.fromkeys(attributes))
+                defaults = {key: value for key, value in prototype.attributes.items() if key not in attributes}
+                prototypes.append((prototype.__dict__, defaults))
+            instances: List[BaseModel] = []
+            for row, (model_id, name) in enumerate(zip(layout['ids'], layout['names'])):
+                state, defaults = prototypes[pattern_of[row]]
+                model = model_class.__new__(model_class)
+                model.__dict__.update(state)
+                model.model_id, model.name, model.history = model_id, name, {}
+                model.attributes = SharedAttributes(self, category, row, copy.deepcopy(defaults) if defaults else None)
+                instances.append(model)
+            models[category] = EntityStore(instances)
+        return models
+
+    def close(self):
+        for views in self.views.values():
+            for values, present in views.values():
+                values.release()
+                present.release()
+        self.columns, self.views = {}, {}
+        self.block.close()
+
+    def unlink(self):
+        """Closes the block and, in the publishing process, frees it."""
+        self.close()
+        if self.owner:
+            self.block.unlink()
+
+    def __enter__(self) -> 'SharedScenarioState':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.unlink()
+
+
+def apply_override(settings: Dict[str, Any], models: Dict[str, EntityStore], path: str, value: Any):
+    """
+    Applies a dotted override path (see analysis.runner.set_by_path) to shared-state models and
+    settings: 'models_initial_state.<category>.<model_id>.initial_attributes.<attribute>[.<key>...]'
+    writes the model's overlay (nested keys on a copy of the attribute), other paths set settings.
+    """
+    keys = path.split('.')
+    if keys[0] == 'models_initial_state':
+        if len(keys) < 5 or keys[3] != 'initial_attributes':
+            raise KeyError(f"Override path '{path}' must address models_initial_state.<category>.<model_id>.initial_attributes.<attribute>")
+        store = models.get(keys[1])
+        if store is None or keys[2] not in store.slot_of:
+            raise KeyError(f"Cannot resolve '{keys[2]}' in override path '{path}'")
+        model = store[store.slot_of[keys[2]]]
+        if len(keys) == 5:
+            model.attributes[keys[4]] = value
+            return
+        root = copy.deepcopy(model.attributes.get(keys[4]))
+        root = root if isinstance(root, dict) else {}
+        model.attributes[keys[4]] = root
+        container, keys = root, keys[5:]
+    else:
+        container = settings
+    for key in keys[:-1]:
+        container = container.setdefault(key, {})
+        if not isinstance(container, dict):
+            raise KeyError(f"Override path '{path}' does not end in a mapping")
+    container[keys[-1]] = value
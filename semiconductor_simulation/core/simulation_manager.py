@@ -1,7 +1,18 @@
-from typing import List, Dict, Any
+import copy
+import io
+import pickle
+import time
+from typing import List, Dict, Any, Optional, Set, Tuple
+import numpy as np
 from semiconductor_simulation.core.base_module import BaseModule
 from semiconductor_simulation.core.base_model import BaseModel
+from semiconductor_simulation.core.entity_store import EntityStore, VacantSlot
+from semiconductor_simulation.core.shared_state import SharedScenarioState, apply_override
+from semiconductor_simulation.core.random_streams import RandomStreams
+from semiconductor_simulation.core.context_bus import ContextBus
+from semiconductor_simulation.core.step_cache import StepCache
 from semiconductor_simulation.utils.data_loader import load_yaml_data
+from semiconductor_simulation.utils.versioning import code_version
 
 # Import all available models for instantiation
 from semiconductor_simulation.models import RegionModel, CompanyModel, TechnologyNodeModel, EndMarketModel, PolicyModel
@@ -15,6 +26,90 @@ MODEL_CLASS_MAP = {
     # Add other models here as they are created, e.g. PolicyModel
 }
 
+
+def model_class_for(model_type_key: str):
+    """Model class for a 'models_initial_state' key (None if there is none)."""
+    # Default heuristic for class name guessing
+    class_name_guess = model_type_key.capitalize()[:-1] + "Model"
+
+    # Specific overrides based on the model_type_key from YAML
+    if model_type_key == "regions":
+        class_name_guess = "RegionModel"
+    elif model_type_key == "companies":
+        class_name_guess = "CompanyModel"
+    elif model_type_key == "technology_nodes":
+        class_name_guess = "TechnologyNodeModel"
+    elif model_type_key == "end_markets":
+        class_name_guess = "EndMarketModel"
+    elif model_type_key == "policies":
+        class_name_guess = "PolicyModel"
+    # Add other specific mappings here if heuristic fails for new model types
+    return MODEL_CLASS_MAP.get(class_name_guess)
+
+def _get_path(data: Any, keys: List[str]) -> Any:
+    """Value at a dotted override path (split into keys) of scenario data; None if it is missing."""
+    for key in keys:
+        if isinstance(data, dict):
+            data = data.get(key)
+        elif isinstance(data, list):
+            data = next((item for item in data if isinstance(item, dict) and item.get('model_id') == key), None)
+        else:
+            return None
+    return data
+
+
+def _set_path(data: Dict[str, Any], keys: List[str], value: Any):
+    """Sets the value at a dotted override path of scenario data (model lists are matched by model_id)."""
+    for key in keys[:-1]:
+        if isinstance(data, list):
+            data = next((item for item in data if isinstance(item, dict) and item.get('model_id') == key), None)
+            if data is None:
+                raise KeyError(f"No model '{key}' for override path '{'.'.join(keys)}'")
+        else:
+            data = data.setdefault(key, {})
+    data[keys[-1]] = value
+
+
+def _same_value(a: Any, b: Any) -> bool:
+    """Whether two recorded attribute values are equal (values that do not compare with == are compared pickled)."""
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return pickle.dumps(a, protocol=pickle.HIGHEST_PROTOCOL) == pickle.dumps(b, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class _ModelRefPickler(pickle.Pickler):
+    """Pickles module state with references to the run's models (see SimulationManager._model_refs) instead of copies."""
+    def __init__(self, file: Any, refs: Dict[int, Tuple]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.refs = refs
+
+    def persistent_id(self, obj: Any) -> Optional[Tuple]:
+        return self.refs.get(id(obj))
+
+
+class _ModelRefUnpickler(pickle.Unpickler):
+    """Resolves the model references written by _ModelRefPickler against the given models."""
+    def __init__(self, file: Any, models: Dict[str, List[BaseModel]]):
+        super().__init__(file)
+        self.models = models
+
+    def persistent_load(self, ref: Tuple) -> Any:
+        if ref[0] == 'models':
+            return self.models
+        models = self.models[ref[1]]
+        if ref[0] == 'store':
+            return models
+        slot = getattr(models, 'slot_of', {}).get(ref[2])
+        if slot is not None:
+            return models[slot]
+        # Retired models, or models of a plain list
+        for model in reversed(list(models) + list(getattr(models, 'retired', []))):
+            if model.model_id == ref[2]:
+                return model
+        raise pickle.UnpicklingError(f"No model '{ref[2]}' in '{ref[1]}'")
+
+
 class SimulationManager:
     """
     Orchestrates the entire simulation process, managing models, modules, time, and scenarios.
@@ -32,45 +127,81 @@ class SimulationManager:
         self.results: Dict[int, Dict[str, Any]] = {} 
         self.global_parameters: Dict[str, Any] = {}
         self.scenario_data: Dict[str, Any] = {}
+        # Reproducible random streams for stochastic modules ('random_seed', 'random_replica')
+        self.random_streams = RandomStreams()
+        # Array-valued signals modules publish for each other (context['bus'])
+        self.context_bus = ContextBus()
+        # Context passed to every module step; created once per run and updated in place each year
+        self.yearly_context: Optional[Dict[str, Any]] = None
+        # State snapshots at the start of simulated years (models, context bus and random streams; state of each module), by year; None unless enable_checkpoints()
+        self.checkpoints: Optional[Dict[int, Tuple[bytes, List[bytes]]]] = None
+        self.checkpoint_every = 1
+        # What each module step wrote, by year and module position (kept with the checkpoints, for rerun())
+        self.step_log: Optional[Dict[int, Dict[int, bytes]]] = None
+        # Model edits rerun() applied in a resumed year, as {path: (value, year)}; older checkpoints lack them
+        self.resumed_edits: Dict[str, Tuple[Any, int]] = {}
+        # {year: {module_id: 'executed' or 'restored'}} for the years the last rerun() re-simulated
+        self.rerun_plan: Dict[int, Dict[str, str]] = {}
+        self._rerun_state: Optional[Dict[str, Any]] = None
+        # Accumulated wall-clock seconds per module_id (plus '_collect_results'), used by benchmarks/
+        self.step_timings: Dict[str, float] = {}
 
     def load_scenario_data(self, scenario_file_path: str):
         """Loads scenario data directly from a specific file path."""
         print(f"Loading scenario data from: {scenario_file_path}")
-        self.scenario_data = load_yaml_data(scenario_file_path)
+        self.load_scenario_from_dict(load_yaml_data(scenario_file_path))
+
+    def load_scenario_from_dict(self, scenario_data: Dict[str, Any]):
+        """Loads scenario data from an already parsed scenario dictionary (e.g. generated or modified in memory)."""
+        self.scenario_data = scenario_data
         self.start_year = self.scenario_data.get('start_year', 2025)
         self.end_year = self.scenario_data.get('end_year', 2040)
         self.current_year = self.start_year
         self.global_parameters = self.scenario_data.get('global_parameters', {})
+        self.random_streams = self._random_streams()
         self._initialize_models(self.scenario_data.get('models_initial_state', {}))
         print(f"Scenario '{self.scenario_name}' loaded. Simulating from {self.start_year} to {self.end_year}.")
 
+    def publish_shared_state(self, name: Optional[str] = None) -> SharedScenarioState:
+        """
+        Publishes the loaded scenario's initial state into shared memory (see core.shared_state),
+        for worker processes to attach to with load_scenario_from_shared(). The caller owns the
+        returned state and unlinks it when the workers are done.
+        """
+        return SharedScenarioState.publish(self.scenario_data, name=name)
+
+    def load_scenario_from_shared(self, state: SharedScenarioState, overrides: Optional[Dict[str, Any]] = None):
+        """
+        Loads a scenario published with publish_shared_state(). Models read their initial
+        attributes from the shared block and only keep the ones they change; overrides are
+        {dotted_path: value} as in analysis.apply_overrides.
+        """
+        settings = copy.deepcopy(state.settings)
+        self.models = state.build_models({category: model_class_for(category) for category in state.header['categories']})
+        for path, value in (overrides or {}).items():
+            apply_override(settings, self.models, path, value)
+        self.scenario_data = settings
+        self.start_year = settings.get('start_year', 2025)
+        self.end_year = settings.get('end_year', 2040)
+        self.current_year = self.start_year
+        self.global_parameters = settings.get('global_parameters', {})
+        self.random_streams = self._random_streams()
+        print(f"Scenario '{self.scenario_name}' attached from shared state. Simulating from {self.start_year} to {self.end_year}.")
+
+    def _random_streams(self) -> RandomStreams:
+        return RandomStreams(int(self.global_parameters.get('random_seed', 0)), int(self.global_parameters.get('random_replica', 0)))
+
     def _initialize_models(self, models_config: Dict[str, List[Dict[str, Any]]]):
         """Initializes models based on the configuration data."""
         self.models = {}
         for model_type_key, model_list_config in models_config.items():
-            # Default heuristic for class name guessing
-            class_name_guess = model_type_key.capitalize()[:-1] + "Model"
-
-            # Specific overrides based on the model_type_key from YAML
-            if model_type_key == "regions":
-                class_name_guess = "RegionModel"
-            elif model_type_key == "companies":
-                class_name_guess = "CompanyModel"
-            elif model_type_key == "technology_nodes":
-                class_name_guess = "TechnologyNodeModel"
-            elif model_type_key == "end_markets":
-                class_name_guess = "EndMarketModel"
-            elif model_type_key == "policies":
-                class_name_guess = "PolicyModel"
-            # Add other specific mappings here if heuristic fails for new model types
-
-            model_class = MODEL_CLASS_MAP.get(class_name_guess)
+            model_class = model_class_for(model_type_key)
             
             if not model_class:
-                print(f"Warning: No model class found for config key '{model_type_key}' (guessed '{class_name_guess}'). Skipping.")
+                print(f"Warning: No model class found for config key '{model_type_key}'. Skipping.")
                 continue
 
-            self.models[model_type_key] = []
+            instances: List[BaseModel] = []
             for model_data in model_list_config:
                 try:
                     # All models now expect model_id, name, and **initial_attributes.
@@ -92,7 +223,7 @@ class SimulationManager:
                         name=name,
                         **initial_attrs
                     )
-                    self.models[model_type_key].append(instance)
+                    instances.append(instance)
                 except KeyError as e:
                     print(f"Error initializing model {model_data.get('name', '?')}: Missing key {e} in model_data or initial_attributes.")
                 except TypeError as e:
@@ -100,6 +231,8 @@ class SimulationManager:
                 except Exception as e:
                     print(f"General error initializing model {model_data.get('name', '?')}: {e}")
             
+            # Slot-based store so that modules (e.g. IndustryEventsModule) can add and retire entities mid-run
+            self.models[model_type_key] = EntityStore(instances)
             print(f"Initialized {len(self.models[model_type_key])} models of type {model_class.__name__} under key '{model_type_key}'")
 
     def register_module(self, module: BaseModule):
@@ -114,8 +247,38 @@ class SimulationManager:
             return
         for module in self.modules:
             module.initialize(self.models, self.global_parameters)
+        self._declare_channels()
         print("All modules initialized.")
 
+    def _declare_channels(self):
+        """Declares the modules' context bus channels and checks that readers run after publishers."""
+        self.context_bus = ContextBus()
+        self.yearly_context = None
+        position = {}
+        for i, module in enumerate(self.modules):
+            for name in module.publishes:
+                self.context_bus.declare(name, publisher=module.module_id)
+                position.setdefault(name, i)
+        for i, module in enumerate(self.modules):
+            for name in module.subscribes:
+                if name not in position:
+                    print(f"Warning: {module.name} reads context bus channel '{name}', which no registered module publishes.")
+                elif position[name] >= i:
+                    print(f"Warning: {module.name} reads context bus channel '{name}' before it is published each year; it will see the previous year's values.")
+
+    def enable_step_memoization(self, cache_path: str, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Memoizes the year steps of modules that declare themselves memoizable, in a bounded on-disk
+        cache that can be shared by all runs of a sweep (including runs in other processes).
+        """
+        step_cache = StepCache(cache_path, max_bytes=max_bytes)
+        version = code_version()
+        for module in self.modules:
+            module.enable_memoization(step_cache, version)
+        memoized = [module.name for module in self.modules if module.step_cache is not None]
+        print(f"Step memoization enabled for: {', '.join(memoized) if memoized else 'no modules'}")
+        return step_cache
+
     def run_simulation(self):
         """
         Runs the simulation from start_year to end_year.
@@ -126,32 +289,388 @@ class SimulationManager:
             
         print(f"Starting simulation for scenario '{self.scenario_name}' from {self.start_year} to {self.end_year}")
         for year in range(self.start_year, self.end_year + 1):
-            self.current_year = year
-            print(f"--- Simulating Year: {self.current_year} ---")
-            
-            yearly_context = {
-                'current_year': self.current_year,
+            self.run_year(year)
+        
+        print("Simulation completed.")
+        return self.results
+
+    def run_year(self, year: int):
+        """
+        Runs every module for one year and collects the year's results. run_simulation() calls it
+        for each year in turn; callers stepping through years themselves (e.g. to fork()) do the same.
+        """
+        self.current_year = year
+        if self.checkpoints is not None and (year - self.start_year) % self.checkpoint_every == 0:
+            self.checkpoints[year] = self._snapshot()
+        print(f"--- Simulating Year: {self.current_year} ---")
+        
+        if self.yearly_context is None:
+            self.yearly_context = {
+                'start_year': self.start_year,
+                'end_year': self.end_year,
                 'models': self.models,
                 'global_parameters': self.global_parameters,
-                'previous_results': self.results.get(year -1, {}),
+                'random_streams': self.random_streams,
+                'bus': self.context_bus,
                 'all_results': self.results # Access to all historical results
             }
-            
-            for module in self.modules:
-                module.execute_year_step(self.current_year, yearly_context)
-            
-            self._collect_yearly_results()
-            print(f"--- Completed Year: {self.current_year} ---")
+        yearly_context = self.yearly_context
+        yearly_context['current_year'] = self.current_year
+        yearly_context['previous_results'] = self.results.get(year - 1, {})
         
-        print("Simulation completed.")
+        for position, module in enumerate(self.modules):
+            step_started = time.perf_counter()
+            if self.step_log is None:
+                module.run_year_step(self.current_year, yearly_context)
+            else:
+                self._run_logged_step(position, module, yearly_context)
+            self._record_timing(module.module_id, step_started)
+        
+        collect_started = time.perf_counter()
+        self._collect_yearly_results()
+        self._record_timing('_collect_results', collect_started)
+        if self.checkpoints is not None and year == self.end_year:
+            # The state after the last year, from which rerun() restores that year's module state
+            self.checkpoints[year + 1] = self._snapshot()
+        print(f"--- Completed Year: {self.current_year} ---")
+
+    def fork(self) -> 'SimulationManager':
+        """
+        An independent copy of the simulation as it stands, to continue it along another path
+        (see analysis.ScenarioTree). Models and module state are copied. The results of the years
+        already simulated are shared with this manager rather than copied, as are the scenario
+        data and step caches, since none of them change after the fork.
+        """
+        memo = {id(self.results): {}, id(self.scenario_data): self.scenario_data,
+                id(self.global_parameters): self.global_parameters}
+        for module in self.modules:
+            if module.step_cache is not None:
+                memo[id(module.step_cache)] = module.step_cache
+        branch = copy.deepcopy(self, memo)
+        branch.results = dict(self.results)
+        branch.yearly_context = None  # Rebuilt around the branch's own results and random streams
+        return branch
+
+    def enable_checkpoints(self, every: int = 1):
+        """
+        Keeps a snapshot of the models, module state, context bus and random streams at the start of
+        every 'every'-th simulated year (and after the last one), plus a log of the attributes,
+        channels and context entries each module step wrote, so that rerun() can resume at (or
+        shortly before) the first year an edit affects and restore the steps of modules whose
+        inputs it did not change. Taking a snapshot costs about as much as simulating a year, so
+        large scenarios that are edited rarely may prefer every=2 or more, at the cost of restoring
+        fewer steps (a step is only restored from the snapshot of the following year).
+        """
+        self.checkpoints = {}
+        self.checkpoint_every = max(int(every), 1)
+        self.step_log = {}
+
+    def first_affected_year(self, path: str, value: Any) -> int:
+        """
+        The first year a scenario edit ({dotted_path: value}, as in analysis.apply_overrides) can
+        change; end_year + 1 if the value is unchanged. Policies only act from their 'start_year'
+        (for an edit of start_year itself, the earlier of the old and new one), scripted
+        'industry_events' from the year of the first changed event. Everything else, including
+        the initial state of other models and global parameters, counts from the start year.
+        """
+        keys = path.split('.')
+        if _get_path(self.scenario_data, keys) == value:
+            return self.end_year + 1
+        if keys == ['global_parameters', 'industry_events']:
+            old = {repr(event): event for event in self.global_parameters.get('industry_events', []) or []}
+            new = {repr(event): event for event in value or []}
+            changed = [event for key, event in list(old.items()) + list(new.items()) if key not in old or key not in new]
+            years = [int(event.get('year', self.start_year)) for event in changed]
+            return max(min(years), self.start_year) if years else self.end_year + 1
+        if keys[:2] == ['models_initial_state', 'policies'] and self._edit_inputs(path) is not None:
+            old_start = _get_path(self.scenario_data, keys[:4] + ['start_year'])
+            new_start = value if keys[4:] == ['start_year'] else old_start
+            if old_start is None or new_start is None:
+                return self.start_year
+            return max(min(int(old_start), int(new_start)), self.start_year)
+        return self.start_year
+
+    def affected_modules(self, path: str) -> List[str]:
+        """
+        module_ids of the modules that read what a scenario edit changes, according to their
+        declared memo_inputs, memo_params and subscribes (see BaseModule.reads_any). Modules reading
+        what those modules write are affected in turn; rerun() follows that year by year.
+        """
+        changed = self._edit_inputs(path)
+        return [module.module_id for module in self.modules if changed is None or module.reads_any(changed)]
+
+    def _edit_inputs(self, path: str) -> Optional[Set[Tuple[str, str]]]:
+        """
+        The module inputs (as in BaseModule.reads_any) an edit changes: a global parameter, or an
+        attribute of the models of a category. None for edits of anything else, e.g. the simulated
+        years or which models exist, which need the whole scenario re-simulated.
+        """
+        keys = path.split('.')
+        if keys[0] == 'global_parameters' and len(keys) >= 2:
+            return {('global_parameters', keys[1])}
+        if (keys[0] == 'models_initial_state' and len(keys) >= 5 and keys[3] == 'initial_attributes'
+                and isinstance(_get_path(self.scenario_data, keys[:3]), dict)):
+            return {(keys[1], keys[4])}
+        return None
+
+    def rerun(self, edits: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+        """
+        Applies {dotted_path: value} edits to the scenario and re-simulates only from the first
+        year they affect (first_affected_year()), resuming from that year's checkpoint and keeping
+        the results of the years before it. Model attribute edits are also written into those
+        years' results. Edits affecting the start year reload the scenario and re-initialize the
+        modules. Needs enable_checkpoints() before the run.
+
+        Within the re-simulated years, a module step only executes when the module reads something
+        that changed (affected_modules()), counting the edits and whatever executed steps wrote
+        differently from the logged run; otherwise its logged writes are replayed and its state is
+        restored from the next year's checkpoint. Edits other than global parameters and model
+        attributes (e.g. adding models or changing the simulated years) re-simulate everything.
+        rerun_plan records which steps executed. With step memoization enabled as well, executed
+        steps of memoizable modules may still come from the step cache.
+        """
+        first_year = min([self.first_affected_year(path, value) for path, value in edits.items()] + [self.end_year + 1])
+        for path, value in edits.items():
+            _set_path(self.scenario_data, path.split('.'), value)
+        self.rerun_plan = {}
+        if first_year > self.end_year:
+            return self.results
+
+        edit_inputs = {path: self._edit_inputs(path) for path in edits}
+        changed: Set[Tuple[str, str]] = set()
+        for inputs in edit_inputs.values():
+            changed |= inputs or set()
+        recorded = None
+        resume_year = max([year for year in (self.checkpoints or {}) if year <= first_year], default=self.start_year)
+        if None in edit_inputs.values():
+            self._reload_scenario()
+            self.checkpoints = {} if self.checkpoints is not None else None
+            self.step_log = {} if self.step_log is not None else None
+            first_year = self.start_year
+        elif resume_year > self.start_year:
+            first_year = resume_year
+            recorded = (dict(self.checkpoints), self.step_log)
+            self._restore(first_year)
+            # Edits from earlier resumed reruns are missing from checkpoints older than their year
+            for path, (value, year) in list(self.resumed_edits.items()):
+                if year > first_year and path not in edits:
+                    apply_override({}, self.models, path, value)
+                    self.resumed_edits[path] = (value, first_year)
+            for path, value in edits.items():
+                keys = path.split('.')
+                if keys[0] == 'models_initial_state':
+                    apply_override({}, self.models, path, value)
+                    self._patch_results(keys[1], keys[2], keys[4], first_year)
+                    self.resumed_edits[path] = (value, first_year)
+        else:
+            first_year = self.start_year
+            recorded = (dict(self.checkpoints or {}), self.step_log)
+            self._reload_scenario()
+            if self.checkpoints is not None:
+                self.checkpoints = {}
+        if recorded is not None and self.step_log is not None:
+            self.step_log = {year: steps for year, steps in self.step_log.items() if year < first_year}
+            self._rerun_state = {'checkpoints': recorded[0], 'steps': recorded[1], 'changed': changed, 'dirty': set()}
+
+        print(f"Re-simulating scenario '{self.scenario_name}' from {first_year} to {self.end_year}")
+        try:
+            for year in range(first_year, self.end_year + 1):
+                self.run_year(year)
+        finally:
+            self._rerun_state = None
+        if recorded is not None and self.step_log is not None:
+            steps = [state for plan in self.rerun_plan.values() for state in plan.values()]
+            print(f"Executed {steps.count('executed')} of {len(steps)} module steps; restored the others from checkpoints")
         return self.results
 
+    def _reload_scenario(self):
+        """Rebuilds the models from the (edited) scenario data and re-initializes the modules, for rerun()."""
+        self.start_year = self.scenario_data.get('start_year', 2025)
+        self.end_year = self.scenario_data.get('end_year', 2040)
+        self.global_parameters = self.scenario_data.get('global_parameters', {})
+        self.random_streams = self._random_streams()
+        self._initialize_models(self.scenario_data.get('models_initial_state', {}))
+        self.initialize_modules()
+        self.results = {}
+        self.resumed_edits = {}
+
+    def _run_logged_step(self, position: int, module: BaseModule, context: Dict[str, Any]):
+        """
+        Runs a module step and logs what it wrote. During rerun(), a step whose inputs did not
+        change is restored from the log and the next year's checkpoint instead.
+        """
+        year = self.current_year
+        rerun = self._rerun_state
+        record = following = None
+        if rerun is not None:
+            record = rerun['steps'].get(year, {}).get(position)
+            following = rerun['checkpoints'].get(year + 1)
+            plan = self.rerun_plan.setdefault(year, {})
+            if (record is not None and following is not None and position not in rerun['dirty']
+                    and not module.reads_any(rerun['changed'])):
+                step = self._load_refs(record)
+                if not step['events']:  # Steps that added or removed entities always execute
+                    self._replay_step(step)
+                    self._set_module_state(module, self._load_refs(following[1][position]))
+                    self.step_log.setdefault(year, {})[position] = record
+                    plan[module.module_id] = 'restored'
+                    return
+            plan[module.module_id] = 'executed'
+
+        before = [(category, model, dict(model.history.get(year, {})))
+                  for category, models in self.models.items() for model in models]
+        generations = {category: getattr(models, 'generation', 0) for category, models in self.models.items()}
+        context_before = dict(context)
+        module.run_year_step(year, context)
+
+        writes: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        seen = set()
+        for category, model, old in before:
+            seen.add(id(model))
+            written = {name: value for name, value in model.history.get(year, {}).items() if name not in old or old[name] is not value}
+            if written:
+                writes.setdefault(category, {})[model.model_id] = written
+        for category, models in self.models.items():
+            for model in models:
+                if id(model) not in seen and model.history.get(year):
+                    writes.setdefault(category, {})[model.model_id] = dict(model.history[year])
+        step = {
+            'writes': writes,
+            'channels': self.context_bus.published_in(year, module.publishes),
+            'context': {key: value for key, value in context.items() if key not in context_before or context_before[key] is not value},
+            'events': {category: [(event['kind'], event['model_id'], event['successor_slot'])
+                                  for event in models.changes_since(generations[category])]
+                       for category, models in self.models.items()
+                       if isinstance(models, EntityStore) and models.generation != generations[category]},
+        }
+        refs = self._model_refs()
+        self.step_log.setdefault(year, {})[position] = self._dump_refs(step, refs)
+        if rerun is not None:
+            self._compare_step(position, module, step, record, following, refs)
+
+    def _replay_step(self, step: Dict[str, Any]):
+        """Applies a logged step's attribute writes, channel versions and context entries."""
+        year = self.current_year
+        for category, by_model in step['writes'].items():
+            models = self.models.get(category, [])
+            slot_of = getattr(models, 'slot_of', None) or {model.model_id: slot for slot, model in enumerate(models)}
+            for model_id, written in by_model.items():
+                if model_id in slot_of:
+                    for name, value in written.items():
+                        models[slot_of[model_id]].set_attribute(name, value, year)
+        for name, (values, labels) in step['channels'].items():
+            self.context_bus.publish(name, year, values, labels)
+        self.yearly_context.update(step['context'])
+
+    def _compare_step(self, position: int, module: BaseModule, step: Dict[str, Any], record: Optional[bytes],
+                      following: Optional[Tuple[bytes, List[bytes]]], refs: Dict[int, Tuple]):
+        """
+        Adds what an executed step wrote differently from the logged run to the changed inputs,
+        and marks the module dirty (always executed) while its state differs from the logged run's.
+        """
+        rerun = self._rerun_state
+        changed = rerun['changed']
+        old = self._load_refs(record) if record is not None else {'writes': {}, 'channels': {}, 'events': {}}
+        if record is None:
+            for category, by_model in step['writes'].items():
+                changed.add((category, '*'))
+        for category in set(step['writes']) | set(old['writes']):
+            new_writes, old_writes = step['writes'].get(category, {}), old['writes'].get(category, {})
+            for model_id in set(new_writes) | set(old_writes):
+                new_values, old_values = new_writes.get(model_id, {}), old_writes.get(model_id, {})
+                for name in set(new_values) | set(old_values):
+                    if (category, name) not in changed and (name not in new_values or name not in old_values
+                                                            or not _same_value(new_values[name], old_values[name])):
+                        changed.add((category, name))
+        for name in set(step['channels']) | set(old['channels']):
+            new_channel, old_channel = step['channels'].get(name), old['channels'].get(name)
+            if (record is None or new_channel is None or old_channel is None or new_channel[1] != old_channel[1]
+                    or not np.array_equal(new_channel[0], old_channel[0])):
+                changed.add(('bus', name))
+        if step['events'] != old['events']:
+            for category in set(step['events']) | set(old['events']):
+                changed.add((category, '*'))
+        if following is not None and self._dump_refs(self._module_state(module), refs) == following[1][position]:
+            rerun['dirty'].discard(position)
+        else:
+            rerun['dirty'].add(position)
+
+    def _model_refs(self) -> Dict[int, Tuple]:
+        """
+        {id(object): reference} for the model dictionary, the model lists and every model, active or
+        retired. Models are referred to by model_id, since a module's state after its step may refer
+        to a model that a later module retires in the same year.
+        """
+        refs = {id(self.models): ('models',)}
+        for category, models in self.models.items():
+            refs[id(models)] = ('store', category)
+            for model in list(models) + list(getattr(models, 'retired', [])):
+                if not isinstance(model, VacantSlot):
+                    refs[id(model)] = ('model', category, model.model_id)
+        return refs
+
+    def _dump_refs(self, obj: Any, refs: Optional[Dict[int, Tuple]] = None) -> bytes:
+        buffer = io.BytesIO()
+        _ModelRefPickler(buffer, refs if refs is not None else self._model_refs()).dump(obj)
+        return buffer.getvalue()
+
+    def _load_refs(self, blob: bytes) -> Any:
+        return _ModelRefUnpickler(io.BytesIO(blob), self.models).load()
+
+    @staticmethod
+    def _module_state(module: BaseModule) -> Dict[str, Any]:
+        # Step caches are shared by all states rather than stored with each snapshot
+        return {name: value for name, value in vars(module).items() if name != 'step_cache'}
+
+    @staticmethod
+    def _set_module_state(module: BaseModule, state: Dict[str, Any]):
+        step_cache = module.step_cache
+        module.__dict__.clear()
+        module.__dict__.update(state)
+        module.step_cache = step_cache
+
+    def _snapshot(self) -> Tuple[bytes, List[bytes]]:
+        # Module state is pickled per module, referring to the models, so that a single module can be restored
+        refs = self._model_refs()
+        return (pickle.dumps((self.models, self.context_bus, self.random_streams), protocol=pickle.HIGHEST_PROTOCOL),
+                [self._dump_refs(self._module_state(module), refs) for module in self.modules])
+
+    def _restore(self, year: int):
+        """Returns to the state at the start of the year; later results and checkpoints are dropped."""
+        shared, module_states = self.checkpoints[year]
+        self.models, self.context_bus, self.random_streams = pickle.loads(shared)
+        for module, state in zip(self.modules, module_states):
+            self._set_module_state(module, self._load_refs(state))
+        self.yearly_context = None
+        self.results = {y: state for y, state in self.results.items() if y < year}
+        self.checkpoints = {y: blob for y, blob in self.checkpoints.items() if y <= year}
+
+    def _patch_results(self, category: str, model_id: str, attribute_name: str, before_year: int):
+        """Writes a model's (edited) attribute into the results of the years before before_year."""
+        model = next((m for m in self.models.get(category, []) if m.model_id == model_id), None)
+        if model is None:
+            return
+        value = model.attributes.get(attribute_name)
+        value = str(value) if isinstance(value, (list, dict)) else value
+        for year, year_results in list(self.results.items()):
+            if year >= before_year:
+                continue
+            # Results of earlier years may be shared with forks, so they are replaced rather than modified
+            states = [{**state, attribute_name: value} if state.get('model_id') == model_id else state
+                      for state in year_results.get(category, [])]
+            self.results[year] = {**year_results, category: states}
+
+    def _record_timing(self, key: str, started: float):
+        self.step_timings[key] = self.step_timings.get(key, 0.0) + (time.perf_counter() - started)
+
     def _collect_yearly_results(self):
         """Collects and stores results for the current year from models."""
         current_year_results = {}
         for model_category, model_list in self.models.items():
             category_results = []
             for model_instance in model_list:
+                if isinstance(model_instance, VacantSlot):
+                    continue  # Freed slot: the entity it held was retired
                 # Make sure all attributes are serializable for potential output to JSON/YAML
                 serializable_attributes = {k: str(v) if isinstance(v, (list, dict)) else v 
                                            for k, v in model_instance.attributes.items()}
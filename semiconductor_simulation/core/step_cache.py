@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import time
+from collections.abc import Mapping
+from typing import Any, Optional
+
+
+def _json_default(value: Any) -> Any:
+    # Arrays (e.g. engine state) are hashed by content; their repr() is truncated for large arrays.
+    if hasattr(value, 'tobytes') and hasattr(value, 'dtype'):
+        return {'__array__': hashlib.sha256(value.tobytes()).hexdigest(),
+                'dtype': str(value.dtype), 'shape': list(getattr(value, 'shape', ()))}
+    if isinstance(value, Mapping):  # e.g. shared-state attributes hash like the equivalent dict
+        return dict(value)
+    return repr(value)
+
+
+def stable_hash(data: Any) -> str:
+    """
+    Deterministic hash of (nested) plain data: dict key order does not matter, and the result is
+    identical across processes and Python sessions (unlike the built-in hash()).
+    """
+    payload = json.dumps(data, sort_keys=True, default=_json_default, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StepCache:
+    """
+    Bounded on-disk store for memoized module steps, shared by all processes of a sweep.
+    Entries are pickled state deltas in a SQLite file; once the total stored size exceeds
+    max_bytes, the least recently used entries are evicted.
+    """
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # Opened lazily, so that a StepCache can be pickled to worker processes before first use.
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS steps (key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_access REAL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS steps_lru ON steps (last_access)")
+        return self._connection
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        return state
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self.connection.execute("SELECT value FROM steps WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.connection.execute("UPDATE steps SET last_access = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key: str, value: Any):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO steps (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, blob, len(blob), time.time()),
+        )
+        self._evict()
+
+    def _evict(self):
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM steps").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        stale_keys = []
+        for key, size in self.connection.execute("SELECT key, size FROM steps ORDER BY last_access ASC"):
+            stale_keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self.connection.executemany("DELETE FROM steps WHERE key = ?", stale_keys)
+
+    def clear(self):
+        self.connection.execute("DELETE FROM steps")
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
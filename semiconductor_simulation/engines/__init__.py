@@ -0,0 +1,44 @@
+# Vectorized (NumPy) engines used by the simulation modules
+from .fab_pipeline import (
+    FabPipeline, capacity_matrix, add_capacity_to_models, ramp_increments, node_target_matrix, fab_investment
+)
+from .price_solver import ClearingPriceSolver, adjacency_by_feature_size
+from .allocation import CapacityAllocator, proportional_allocation
+from .demand_projection import DemandProjectionEngine
+from .learning_curve import LearningCurveEngine, accumulate_output, rd_trl_increase, advance_trl
+from .node_index import InvertedNodeIndex
+from .market_share import MarketShareEngine
+from .talent_flow import TalentMigrationEngine, migration_candidates
+from .cluster_score import ClusterScoreEngine
+from .investment_incentive import InvestmentIncentiveEngine, incentive_programs
+from .consulting_match import ConsultingMatchEngine, ConsultingAuction, candidate_edges
+from .client_need_index import ClientNeedIndex
+
+__all__ = [
+    'FabPipeline',
+    'capacity_matrix',
+    'add_capacity_to_models',
+    'ramp_increments',
+    'node_target_matrix',
+    'fab_investment',
+    'ClearingPriceSolver',
+    'adjacency_by_feature_size',
+    'CapacityAllocator',
+    'proportional_allocation',
+    'DemandProjectionEngine',
+    'LearningCurveEngine',
+    'accumulate_output',
+    'rd_trl_increase',
+    'advance_trl',
+    'InvertedNodeIndex',
+    'MarketShareEngine',
+    'TalentMigrationEngine',
+    'migration_candidates',
+    'ClusterScoreEngine',
+    'InvestmentIncentiveEngine',
+    'incentive_programs',
+    'ConsultingMatchEngine',
+    'ConsultingAuction',
+    'candidate_edges',
+    'ClientNeedIndex'
+]
@@ -0,0 +1,280 @@
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from scipy import sparse
+    from scipy.optimize import linprog
+except ImportError:  # scipy is optional; shortages are then rationed in closed form
+    sparse = None
+    linprog = None
+
+from semiconductor_simulation.core.step_cache import stable_hash
+
+
+def proportional_allocation(supply: np.ndarray, demand: np.ndarray, allowed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Closed-form allocation for all nodes at once. supply: (N, C) capacity per node and supplier,
+    demand: (N, M) per node and market, allowed: (C, M) supplier-market eligibility.
+    Each market's demand is spread over its eligible suppliers in proportion to their capacity;
+    suppliers that end up overbooked are scaled back to their capacity. Returns the served
+    totals (per supplier (N, C), per market (N, M)); the (N, C, M) allocation is never formed,
+    both totals are matrix products with allowed.
+    When no supplier is overbooked every market is served in full, which is the exact answer.
+    """
+    eligible_capacity = supply @ allowed  # (N, M)
+    share = np.minimum(np.divide(demand, eligible_capacity, out=np.zeros_like(demand), where=eligible_capacity > 0), 1.0)
+    load = supply * (share @ allowed.T)  # (N, C), before scaling back
+    scale = np.minimum(np.divide(supply, load, out=np.ones_like(supply), where=load > supply), 1.0)
+    return load * scale, share * ((supply * scale) @ allowed)
+
+
+class CapacityAllocator:
+    """
+    Assigns supplier capacity by node to market demand.
+
+    Nodes where the proportional allocation serves every market are settled in closed form.
+    Nodes with a shortage (overall, or created by regional restrictions) are solved as a sparse LP
+    with HiGHS, maximizing priority-weighted fulfilment. Volumes under long-term agreements (LTAs)
+    carry an extra weight, so they are served before spot demand. A small max-min fairness term per
+    priority tier breaks ties between equal-priority markets. Markets with the same eligible
+    suppliers and priority (and suppliers with the same eligible markets) that have no LTA are
+    merged into one LP row/column and share its allocation in proportion to demand (capacity).
+    Regional restrictions produce few distinct patterns, so the LP stays small with thousands of
+    markets. All shortage nodes share one block-diagonal LP. Solutions are reused while a node's inputs are unchanged from an earlier
+    year. Without scipy, shortages are rationed tier by tier in closed form instead.
+    """
+    def __init__(self, allowed: np.ndarray, priority: np.ndarray,
+                 lta: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None,
+                 lta_weight: float = 10.0, fairness_weight: float = 1e-3, use_lp: bool = True,
+                 max_cached_solutions: int = 256):
+        self.allowed = np.asarray(allowed, dtype=float)  # (C, M)
+        self.priority = np.asarray(priority, dtype=float)  # (M,)
+        # LTAs as coordinate arrays (supplier, market, node, kwpm)
+        empty = np.zeros(0, dtype=np.int64)
+        self.lta = lta if lta is not None else (empty, empty, empty, np.zeros(0))
+        self.lta_weight = lta_weight
+        self.fairness_weight = fairness_weight
+        self.use_lp = use_lp and linprog is not None
+        self.tiers = np.unique(self.priority)
+        self._build_classes()
+        self.max_cached_solutions = max_cached_solutions
+        self._solutions: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.lp_solves = 0
+        self.lp_reuses = 0
+
+    def allocate(self, supply: np.ndarray, demand: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        supply: (N, C), demand: (N, M). Returns the served totals per supplier (N, C) and per
+        market (N, M); shortage nodes are solved one at a time, so at most one node's (C, M)
+        allocation exists at once.
+        """
+        supply = np.maximum(np.asarray(supply, dtype=float), 0.0)
+        demand = np.maximum(np.asarray(demand, dtype=float), 0.0)
+        supplier_served, market_served = proportional_allocation(supply, demand, self.allowed)
+        short_nodes = np.nonzero(np.any(market_served < demand * (1 - 1e-9) - 1e-12, axis=1)
+                                 & (supply.sum(axis=1) > 0))[0]
+        if short_nodes.size == 0:
+            return supplier_served, market_served
+
+        if not self.use_lp:
+            for n in short_nodes:
+                supplier_served[n], market_served[n] = self._tiered_rationing(n, supply[n], demand[n])
+            return supplier_served, market_served
+
+        pending = []
+        for n in short_nodes:
+            key = self._node_key(n, supply[n], demand[n])
+            if key in self._solutions:
+                supplier_served[n], market_served[n] = self._solutions[key]
+                self.lp_reuses += 1
+            else:
+                pending.append((n, key))
+        if pending:
+            solved = self._solve_lp([n for n, _ in pending], supply, demand)
+            if len(self._solutions) > self.max_cached_solutions:
+                self._solutions.clear()
+            for (n, key), node_served in zip(pending, solved):
+                supplier_served[n], market_served[n] = node_served
+                self._solutions[key] = node_served
+        return supplier_served, market_served
+
+    def _build_classes(self):
+        """
+        Groups markets (and suppliers) that are interchangeable in the LP: same eligibility pattern
+        (and priority), no LTA. Each group becomes a single LP row/column.
+        """
+        def group(keys: List[Any]) -> np.ndarray:
+            index: Dict[Any, int] = {}
+            return np.array([index.setdefault(key, len(index)) for key in keys], dtype=np.int64)
+
+        supplier_has_lta = np.zeros(self.allowed.shape[0], dtype=bool)
+        supplier_has_lta[self.lta[0]] = True
+        market_has_lta = np.zeros(self.allowed.shape[1], dtype=bool)
+        market_has_lta[self.lta[1]] = True
+        self.class_of_supplier = group([('lta', c) if supplier_has_lta[c] else self.allowed[c].tobytes()
+                                        for c in range(self.allowed.shape[0])])
+        self.class_of_market = group([('lta', m) if market_has_lta[m] else (self.allowed[:, m].tobytes(), self.priority[m])
+                                      for m in range(self.allowed.shape[1])])
+        first_supplier = np.unique(self.class_of_supplier, return_index=True)[1]
+        first_market = np.unique(self.class_of_market, return_index=True)[1]
+        self.class_allowed = self.allowed[np.ix_(first_supplier, first_market)]  # (supplier classes, market classes)
+        self.class_priority = self.priority[first_market]
+
+    def _node_key(self, n: int, supply: np.ndarray, demand: np.ndarray) -> str:
+        lta_mask = self.lta[2] == n
+        return stable_hash({'node': int(n), 'supply': supply, 'demand': demand, 'lta': self.lta[3][lta_mask]})
+
+    def _node_lta(self, n: int) -> np.ndarray:
+        lta = np.zeros(self.allowed.shape)
+        mask = self.lta[2] == n
+        np.add.at(lta, (self.lta[0][mask], self.lta[1][mask]), self.lta[3][mask])
+        return lta * self.allowed
+
+    def _tiered_rationing(self, n: int, supply: np.ndarray, demand: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        LTA volumes first, then priority tiers from highest to lowest, each served proportionally.
+        Returns the node's served totals (per supplier (C,), per market (M,)).
+        """
+        lta = np.minimum(self._node_lta(n), demand[np.newaxis, :])
+        remaining = supply.copy()
+        served = np.zeros(demand.shape)
+        requests = [lta.sum(axis=0)] + [np.where(self.priority == tier, demand, 0.0) for tier in self.tiers[::-1]]
+        for i, request in enumerate(requests):
+            request = np.minimum(request, demand - served)
+            allowed = (lta > 0).astype(float) if i == 0 else self.allowed
+            step_suppliers, step_markets = proportional_allocation(remaining[np.newaxis, :], request[np.newaxis, :], allowed)
+            served += step_markets[0]
+            remaining = np.maximum(remaining - step_suppliers[0], 0.0)
+        return supply - remaining, served
+
+    def _solve_lp(self, nodes: List[int], supply: np.ndarray, demand: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray]]:
+        n_supplier_classes, n_market_classes = self.class_allowed.shape
+        tier_of_class = np.searchsorted(self.tiers, self.class_priority)
+        class_supply = np.stack([np.bincount(self.class_of_supplier, weights=supply[n], minlength=n_supplier_classes) for n in nodes])
+        class_demand = np.stack([np.bincount(self.class_of_market, weights=demand[n], minlength=n_market_classes) for n in nodes])
+        objective, bounds_hi, rows, cols, values, b_ub = [], [], [], [], [], []
+        layouts = []
+        n_vars = 0
+        n_rows = 0
+        for i, n in enumerate(nodes):
+            node_supply, node_demand = class_supply[i], class_demand[i]
+            pair_s, pair_k = np.nonzero((self.class_allowed > 0) & (node_supply[:, np.newaxis] > 0) & (node_demand[np.newaxis, :] > 0))
+            n_pairs = pair_s.size
+            if n_pairs == 0:
+                layouts.append(None)
+                continue
+            # Suppliers and markets with LTAs are classes of their own, so LTA volumes map onto class
+            # pairs directly; only those pairs get an LTA variable.
+            class_lta = np.zeros(self.class_allowed.shape)
+            lta_mask = self.lta[2] == n
+            np.add.at(class_lta, (self.class_of_supplier[self.lta[0][lta_mask]], self.class_of_market[self.lta[1][lta_mask]]),
+                      self.lta[3][lta_mask])
+            lta = np.minimum(class_lta[pair_s, pair_k], node_demand[pair_k])
+            lta_pairs = np.nonzero(lta > 0)[0]
+            spot = n_vars + np.arange(n_pairs)
+            committed = n_vars + n_pairs + np.arange(lta_pairs.size)
+            tier_vars = n_vars + n_pairs + lta_pairs.size + np.arange(self.tiers.size)
+            layouts.append((pair_s, pair_k, spot, lta_pairs, committed))
+
+            weights = self.class_priority[pair_k]
+            tier_demand = np.bincount(tier_of_class, weights=node_demand, minlength=self.tiers.size)
+            objective.extend([-weights, -(weights[lta_pairs] + self.lta_weight), -self.fairness_weight * self.tiers * tier_demand])
+            bounds_hi.extend([np.full(n_pairs, np.inf), lta[lta_pairs], np.full(self.tiers.size, 1.0)])
+
+            # Supplier capacity rows, then market demand rows (spot and LTA volumes both count)
+            served_classes = np.unique(pair_k)
+            fairness_row = np.searchsorted(served_classes, pair_k)
+            supplier_rows = n_rows + pair_s
+            market_rows = n_rows + n_supplier_classes + pair_k
+            fairness_rows = n_rows + n_supplier_classes + n_market_classes + fairness_row
+            for var, members in ((spot, slice(None)), (committed, lta_pairs)):
+                rows.extend([supplier_rows[members], market_rows[members], fairness_rows[members]])
+                cols.extend([var, var, var])
+                values.extend([np.ones(var.size), np.ones(var.size), -np.ones(var.size)])
+            # Fairness rows: t_tier * demand_k - served_k <= 0 for market classes with an eligible supplier
+            rows.append(n_rows + n_supplier_classes + n_market_classes + np.arange(served_classes.size))
+            cols.append(tier_vars[tier_of_class[served_classes]])
+            values.append(node_demand[served_classes])
+            b_ub.extend([node_supply, node_demand, np.zeros(served_classes.size)])
+            n_rows += n_supplier_classes + n_market_classes + served_classes.size
+            n_vars = tier_vars[-1] + 1
+
+        results = [(np.zeros(self.allowed.shape[0]), np.zeros(self.allowed.shape[1])) for _ in nodes]
+        if n_vars == 0:
+            return results
+        a_ub = sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                                 shape=(n_rows, n_vars))
+        solution = linprog(np.concatenate(objective), A_ub=a_ub, b_ub=np.concatenate(b_ub),
+                           bounds=np.column_stack([np.zeros(n_vars), np.concatenate(bounds_hi)]), method='highs')
+        self.lp_solves += 1
+        if not solution.success:
+            print(f"Warning: capacity allocation LP failed ({solution.message}); rationing in closed form.")
+            return [self._tiered_rationing(n, supply[n], demand[n]) for n in nodes]
+        x = solution.x
+        for i, (n, layout) in enumerate(zip(nodes, layouts)):
+            if layout is None:
+                continue
+            pair_s, pair_k, spot, lta_pairs, committed = layout
+            by_class = np.zeros(self.class_allowed.shape)
+            by_class[pair_s, pair_k] = x[spot]
+            by_class[pair_s[lta_pairs], pair_k[lta_pairs]] += x[committed]
+            # Split class totals over member suppliers by capacity and member markets by demand
+            supplier_total = class_supply[i][self.class_of_supplier]
+            market_total = class_demand[i][self.class_of_market]
+            supplier_share = np.divide(supply[n], supplier_total, out=np.zeros(supply.shape[1]), where=supplier_total > 0)
+            market_share = np.divide(demand[n], market_total, out=np.zeros(demand.shape[1]), where=market_total > 0)
+            supplier_class_served = by_class @ np.bincount(self.class_of_market, weights=market_share, minlength=n_market_classes)
+            market_class_served = by_class.T @ np.bincount(self.class_of_supplier, weights=supplier_share, minlength=n_supplier_classes)
+            results[i] = (supplier_class_served[self.class_of_supplier] * supplier_share,
+                          market_class_served[self.class_of_market] * market_share)
+        return results
+
+
+# End-market attributes read by allocation_inputs (suppliers contribute their 'region_id')
+MARKET_ALLOCATION_ATTRIBUTES = ('allocation_priority', 'allowed_supplier_regions', 'restricted_supplier_regions',
+                                'long_term_agreements')
+
+
+def allocation_signature(companies: Sequence[Any], end_markets: Sequence[Any]) -> str:
+    """Cheap fingerprint of everything allocation_inputs reads, used to detect mid-run changes."""
+    return repr([[company.model_id, company.get_attribute('region_id')] for company in companies] +
+                [[market.get_attribute(name) for name in MARKET_ALLOCATION_ATTRIBUTES] for market in end_markets])
+
+
+def allocation_inputs(companies: Sequence[Any], end_markets: Sequence[Any], node_index: Dict[str, int]):
+    """
+    Builds the allocator's static inputs from model attributes:
+    - end market 'allocation_priority' (default 1.0),
+    - end market 'allowed_supplier_regions' / 'restricted_supplier_regions' (lists of region ids),
+      matched against the company 'region_id',
+    - end market 'long_term_agreements': {company_id: {node_id: kwpm}}.
+    """
+    company_index = {company.model_id: i for i, company in enumerate(companies)}
+    regions = [company.get_attribute('region_id') for company in companies]
+    allowed = np.ones((len(companies), len(end_markets)))
+    priority = np.ones(len(end_markets))
+    lta_c: List[int] = []
+    lta_m: List[int] = []
+    lta_n: List[int] = []
+    lta_q: List[float] = []
+    for m, market in enumerate(end_markets):
+        priority[m] = float(market.get_attribute('allocation_priority') or 1.0)
+        allowed_regions = market.get_attribute('allowed_supplier_regions')
+        restricted_regions = market.get_attribute('restricted_supplier_regions') or []
+        for c, region in enumerate(regions):
+            if (allowed_regions is not None and region not in allowed_regions) or region in restricted_regions:
+                allowed[c, m] = 0.0
+        agreements = market.get_attribute('long_term_agreements') or {}
+        for company_id, volumes in agreements.items():
+            if company_id not in company_index or not isinstance(volumes, dict):
+                continue
+            for node_id, kwpm in volumes.items():
+                if node_id in node_index:
+                    lta_c.append(company_index[company_id])
+                    lta_m.append(m)
+                    lta_n.append(node_index[node_id])
+                    lta_q.append(float(kwpm))
+    lta = (np.array(lta_c, dtype=np.int64), np.array(lta_m, dtype=np.int64),
+           np.array(lta_n, dtype=np.int64), np.array(lta_q, dtype=float))
+    return allowed, priority, lta
@@ -0,0 +1,224 @@
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from semiconductor_simulation.core.entity_store import store_changes
+from semiconductor_simulation.engines.consulting_match import NEED_DIMENSIONS
+from semiconductor_simulation.engines.market_share import group_sum
+from semiconductor_simulation.engines.node_index import company_node_targets
+
+# Company attributes the per-company rows are read from; a company is re-read only when its
+# history shows a change to one of them (or it entered or left the company store)
+ROW_ATTRIBUTES = frozenset({'company_type', 'region_id', 'revenue', 'supply_chain_resilience', 'cost_pressure',
+                            'rd_intensity', 'fab_capacity_kwpm_by_node', 'current_node_id', 'node_roadmap'})
+
+# Global parameters (and defaults) scaling how far each segment signal shifts the need:
+# shift = 1 + weight * signal
+NEED_SHIFT_WEIGHT_PARAMS = {
+    'supply_security': ('client_need_weight_supply_security', 2.0),
+    'cost': ('client_need_weight_cost', 1.0),
+    'geopolitics': ('client_need_weight_geopolitics', 1.0),
+    'technology': ('client_need_weight_technology', 2.0),
+}
+
+# R&D intensity at which a client's own technology need is 1
+FULL_TECHNOLOGY_NEED_RD_INTENSITY = 0.2
+
+
+class ClientNeedIndex:
+    """
+    Per-segment client need vectors for the consulting market, aggregated each year from the
+    outputs of the other modules. Client segments are company types (consultancies excluded).
+
+    Each company has a row with its segment, region, revenue, own need inputs, fab capacity by
+    node and target nodes. A segment's exposure to a node is the revenue of its companies spread
+    over their capacity mix (or their target nodes, for companies without capacity). Per node,
+    the year's signals are
+        supply_security  unmet share of quoted demand ('node_demand_kwpm' vs 'node_capacity_kwpm')
+        cost             rise of the wafer price over last year ('node_price_usd'), at most 1
+        geopolitics      capacity-weighted political risk of the regions producing the node
+        technology       rise of the node's 'adoption_rate' over last year (from 0 when it is
+                         commercialized during the run)
+    (bus channels, or the nodes' attributes without a bus). A segment's signal is the
+    exposure-weighted mean, one matrix product for all segments; its need shift is
+    1 + weight * signal (NEED_SHIFT_WEIGHT_PARAMS).
+
+    The index is meant to live in the yearly context (context['client_need_index']). update()
+    re-reads only the rows of companies whose relevant attributes changed since the last
+    update, according to their history, plus entered and retired ones; the reductions over the
+    rows are recomputed in full, so an index rebuilt from scratch (e.g. after a fork) gives the
+    same result.
+    """
+    def __init__(self, companies: Sequence[Any], regions: Sequence[Any], tech_nodes: Sequence[Any]):
+        self.companies = companies
+        self.regions = regions
+        self.tech_nodes = tech_nodes
+        self.node_ids = [node.model_id for node in tech_nodes]
+        self.node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.region_index = {region.model_id: i for i, region in enumerate(regions)}
+        self.segments: List[str] = []
+        self.segment_index: Dict[str, int] = {}
+        n, n_nodes = len(companies), len(self.node_ids)
+        self.segment = np.full(n, -1, dtype=np.int64)  # -1: consultancy, vacant slot or no company_type
+        self.region = np.full(n, -1, dtype=np.int64)
+        self.revenue = np.zeros(n)
+        self.own_needs = np.full((n, len(NEED_DIMENSIONS)), 0.5)  # Geopolitics is filled in from the region each year
+        self.capacity = np.zeros((n, n_nodes))
+        self.targets = np.zeros((n, n_nodes))  # Equal weights over the target nodes
+        self.generation = getattr(companies, 'generation', 0)
+        self.synced_year: Optional[int] = None
+        self.rows_refreshed = 0  # Rows re-read by the last update()
+        self.signals = np.zeros((0, len(NEED_DIMENSIONS)))  # Segment x need dimension, from the last update()
+        self.shift = np.ones((0, len(NEED_DIMENSIONS)))
+        self.region_risk = np.zeros(len(regions))
+
+    def update(self, current_year: int, bus: Any = None, global_params: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Refreshes stale rows and recomputes the segment signals; returns the need shifts (segments x dimensions)."""
+        global_params = global_params or {}
+        stale = self._stale_rows(current_year)
+        for row in stale:
+            self._read_row(row)
+        self.rows_refreshed = len(stale)
+        self.synced_year = current_year
+
+        tension = float(global_params.get('trade_tension_factor', 0.0) or 0.0)
+        stability = np.array([float(0.5 if r.get_attribute('political_stability') is None else r.get_attribute('political_stability'))
+                              for r in self.regions])
+        self.region_risk = np.clip(1.0 - stability + tension, 0.0, 1.0)
+
+        node_signals = np.zeros((len(self.node_ids), len(NEED_DIMENSIONS)))
+        node_signals[:, 0], node_signals[:, 1], node_signals[:, 3] = self._node_signals(current_year, bus)
+        # Political risk where each node is produced, weighted by capacity
+        located = self.region >= 0
+        produced = group_sum(self.capacity[located].T, self.region[located], len(self.regions))
+        produced_total = produced.sum(axis=1)
+        node_signals[:, 2] = np.divide(produced @ self.region_risk, produced_total, out=np.zeros(len(self.node_ids)),
+                                       where=produced_total > 0)
+
+        clients = self.segment >= 0
+        exposure = self._exposure(clients)
+        segment_exposure = group_sum(exposure.T, self.segment[clients], len(self.segments)).T
+        total = segment_exposure.sum(axis=1, keepdims=True)
+        self.signals = np.divide(segment_exposure @ node_signals, total, out=np.zeros((len(self.segments), len(NEED_DIMENSIONS))),
+                                 where=total > 0)
+        weights = np.array([float(global_params.get(name, default)) for name, default in
+                            (NEED_SHIFT_WEIGHT_PARAMS[dimension] for dimension in NEED_DIMENSIONS)])
+        self.shift = 1.0 + weights * self.signals
+        return self.shift
+
+    def need_shift(self) -> Dict[str, Dict[str, float]]:
+        """{segment: {need dimension: shift}} from the last update()."""
+        return {segment: {dimension: float(self.shift[s, d]) for d, dimension in enumerate(NEED_DIMENSIONS)}
+                for s, segment in enumerate(self.segments)}
+
+    def client_rows(self) -> np.ndarray:
+        """Rows (company positions) of the clients, i.e. companies with a segment."""
+        return np.nonzero(self.segment >= 0)[0]
+
+    def client_needs(self, rows: np.ndarray) -> np.ndarray:
+        """Needs (len(rows), dimensions) of the given clients: their own needs scaled by their segment's shift."""
+        needs = self.own_needs[rows].copy()
+        region = self.region[rows]
+        needs[:, 2] = np.where(region >= 0, self.region_risk[np.maximum(region, 0)], needs[:, 2])
+        return np.clip(needs, 0.0, 1.0) * self.shift[self.segment[rows]]
+
+    def _stale_rows(self, current_year: int) -> List[int]:
+        n = len(self.companies)
+        if n > self.segment.size:
+            grow = n - self.segment.size
+            self.segment = np.r_[self.segment, np.full(grow, -1, dtype=np.int64)]
+            self.region = np.r_[self.region, np.full(grow, -1, dtype=np.int64)]
+            self.revenue = np.r_[self.revenue, np.zeros(grow)]
+            self.own_needs = np.r_[self.own_needs, np.full((grow, len(NEED_DIMENSIONS)), 0.5)]
+            self.capacity = np.r_[self.capacity, np.zeros((grow, len(self.node_ids)))]
+            self.targets = np.r_[self.targets, np.zeros((grow, len(self.node_ids)))]
+        if self.synced_year is None:
+            return list(range(n))
+        generation, changes = store_changes(self.companies, self.generation)
+        self.generation = generation
+        stale = {change['slot'] for change in changes}
+        # Attributes may also have changed after the last update in its year (by later modules)
+        years = range(self.synced_year, current_year + 1)
+        for row, company in enumerate(self.companies):
+            history = company.history
+            if any(year in history and not ROW_ATTRIBUTES.isdisjoint(history[year]) for year in years):
+                stale.add(row)
+        return sorted(stale)
+
+    def _read_row(self, row: int):
+        company = self.companies[row]
+        company_type = company.get_attribute('company_type')
+        if company_type is None or company_type == "Consultancy":
+            self.segment[row] = -1
+        else:
+            if company_type not in self.segment_index:
+                self.segment_index[company_type] = len(self.segments)
+                self.segments.append(company_type)
+            self.segment[row] = self.segment_index[company_type]
+        self.region[row] = self.region_index.get(company.get_attribute('region_id'), -1)
+        self.revenue[row] = float(company.get_attribute('revenue') or 0.0)
+        resilience = company.get_attribute('supply_chain_resilience')
+        cost_pressure = company.get_attribute('cost_pressure')
+        rd_intensity = company.get_attribute('rd_intensity')
+        self.own_needs[row] = (1.0 - float(0.5 if resilience is None else resilience),
+                               float(0.5 if cost_pressure is None else cost_pressure),
+                               0.5,
+                               0.5 if rd_intensity is None else float(rd_intensity) / FULL_TECHNOLOGY_NEED_RD_INTENSITY)
+        self.capacity[row] = 0.0
+        fab_capacity = company.get_attribute('fab_capacity_kwpm_by_node')
+        if isinstance(fab_capacity, dict):
+            for node_id, kwpm in fab_capacity.items():
+                if node_id in self.node_index:
+                    self.capacity[row, self.node_index[node_id]] = max(float(kwpm or 0.0), 0.0)
+        self.targets[row] = 0.0
+        targets = [self.node_index[node_id] for node_id in company_node_targets(company) if node_id in self.node_index]
+        if targets:
+            self.targets[row, targets] = 1.0 / len(targets)
+
+    def _exposure(self, rows: np.ndarray) -> np.ndarray:
+        """Revenue of the rows spread over their capacity mix, or over their target nodes without capacity."""
+        capacity = self.capacity[rows]
+        capacity_total = capacity.sum(axis=1, keepdims=True)
+        mix = np.where(capacity_total > 0, capacity / np.where(capacity_total > 0, capacity_total, 1.0), self.targets[rows])
+        return mix * self.revenue[rows, np.newaxis]
+
+    def _node_signals(self, current_year: int, bus: Any) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Per node: unmet share of demand, price rise over last year and adoption rise over last year."""
+        n_nodes = len(self.node_ids)
+        demand = self._channel(bus, 'node_demand_kwpm', current_year)
+        capacity = self._channel(bus, 'node_capacity_kwpm', current_year)
+        price = self._channel(bus, 'node_price_usd', current_year)
+        last_price = self._channel(bus, 'node_price_usd', current_year - 1)
+        if demand is None or capacity is None:
+            # Without a bus: the clearing demand and gap the nodes report
+            demand = np.array([float(node.get_attribute('clearing_demand_kwpm') or 0.0) for node in self.tech_nodes])
+            capacity = demand + np.array([float(node.get_attribute('supply_demand_gap_kwpm') or 0.0) for node in self.tech_nodes])
+        if price is None or last_price is None:
+            price = np.array([_value(node, 'average_price_per_wafer_usd', current_year) for node in self.tech_nodes])
+            last_price = np.array([_value(node, 'average_price_per_wafer_usd', current_year - 1) for node in self.tech_nodes])
+        shortage = np.divide(np.maximum(demand - capacity, 0.0), demand, out=np.zeros(n_nodes), where=demand > 0)
+        price_rise = np.divide(np.maximum(price - last_price, 0.0), last_price, out=np.zeros(n_nodes),
+                               where=np.isfinite(price) & np.isfinite(last_price) & (last_price > 0))
+        adoption = np.array([_value(node, 'adoption_rate', current_year) for node in self.tech_nodes])
+        # A node simulated last year without an adoption rate was not commercialized yet
+        last_adoption = np.array([_value(node, 'adoption_rate', current_year - 1, 0.0 if current_year - 1 in node.history else None)
+                                  for node in self.tech_nodes])
+        adoption_rise = np.where(np.isfinite(adoption) & np.isfinite(last_adoption), np.maximum(adoption - last_adoption, 0.0), 0.0)
+        return shortage, np.minimum(price_rise, 1.0), adoption_rise
+
+    def _channel(self, bus: Any, name: str, period: int) -> Optional[np.ndarray]:
+        """A node channel's version for the period, in this index's node order (None if unpublished)."""
+        values = bus.get(name, period) if bus is not None else None
+        if values is None:
+            return None
+        result = np.zeros(len(self.node_ids))
+        for j, node_id in enumerate(bus.labels(name) or []):
+            if node_id in self.node_index:
+                result[self.node_index[node_id]] = values[j]
+        return result
+
+
+def _value(model: Any, attribute_name: str, year: int, default: Optional[float] = None) -> float:
+    """The attribute as recorded for the year (default, or NaN, if it was not set that year)."""
+    value = model.history.get(year, {}).get(attribute_name, default)
+    return float('nan') if value is None else float(value)
@@ -0,0 +1,152 @@
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy is optional; neighbourhoods are then found by chunked brute force
+    cKDTree = None
+
+from semiconductor_simulation.engines.talent_flow import EARTH_RADIUS_KM, haversine_km
+
+# Agglomeration features, in column order, with the global parameters (and defaults) weighting them
+CLUSTER_FEATURES = ('presence', 'rd_billion_usd', 'capacity_kwpm')
+CLUSTER_WEIGHT_PARAMS = {
+    'presence': ('cluster_weight_presence', 1.0),
+    'rd_billion_usd': ('cluster_weight_rd', 1.0),
+    'capacity_kwpm': ('cluster_weight_capacity', 1.0),
+}
+
+
+def unit_vectors(latitude: np.ndarray, longitude: np.ndarray) -> np.ndarray:
+    """(n, 3) points on the unit sphere; Euclidean (chord) distance between them is monotone in great-circle distance."""
+    lat, lon = np.radians(np.asarray(latitude, dtype=float)), np.radians(np.asarray(longitude, dtype=float))
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+class ClusterScoreEngine:
+    """
+    Distance-decayed agglomeration around a fixed set of scoring points (region centres).
+
+    Sites (companies, facilities, regional fabs) carry a feature vector (CLUSTER_FEATURES) and a
+    location. Each site contributes weight * exp(-distance / decay_km) to every scoring point
+    within radius_km. The site -> point pairs and kernels are found once per site with a KD-tree
+    over the points (3-D unit vectors, so the great-circle radius is a chord radius) and cached.
+    After that:
+    - a site whose features change (a fab opens) adds kernel * change to its pairs' points;
+    - only new or moved sites are queried again;
+    - removed sites subtract their cached contribution.
+    The neighbourhood is never rebuilt as a whole.
+    """
+    def __init__(self, latitude: Sequence[float], longitude: Sequence[float], radius_km: float = 500.0,
+                 decay_km: float = 200.0, n_features: int = len(CLUSTER_FEATURES)):
+        self.latitude = np.asarray(latitude, dtype=float)
+        self.longitude = np.asarray(longitude, dtype=float)
+        self.radius_km = float(radius_km)
+        self.decay_km = float(decay_km)
+        self.n_features = int(n_features)
+        self.points = unit_vectors(self.latitude, self.longitude)
+        self.tree = cKDTree(self.points) if cKDTree is not None and self.points.size else None
+        self.agglomeration = np.zeros((len(self.latitude), self.n_features))
+
+        self.site_row: Dict[str, int] = {}
+        self.site_location = np.zeros((0, 2))
+        self.site_weights = np.zeros((0, self.n_features))
+        self.pair_site = np.zeros(0, dtype=np.int64)
+        self.pair_point = np.zeros(0, dtype=np.int64)
+        self.pair_kernel = np.zeros(0)
+        self.sites_queried = 0
+
+    def _neighbourhoods(self, rows: np.ndarray, latitude: np.ndarray, longitude: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(site row, point, kernel) pairs for sites at the given coordinates."""
+        if self.tree is not None:
+            chord = 2.0 * np.sin(min(self.radius_km / (2.0 * EARTH_RADIUS_KM), np.pi / 2))
+            pairs = cKDTree(unit_vectors(latitude, longitude)).sparse_distance_matrix(self.tree, chord, output_type='ndarray')
+            site, point = pairs['i'].astype(np.int64), pairs['j'].astype(np.int64)
+            distance = 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(pairs['v'] / 2.0, 0.0, 1.0))
+        else:
+            sites, points, distances = [], [], []
+            for start in range(0, len(rows), 256):
+                chunk = slice(start, start + 256)
+                d = haversine_km(latitude[chunk, np.newaxis], longitude[chunk, np.newaxis],
+                                 self.latitude[np.newaxis, :], self.longitude[np.newaxis, :])
+                s, p = np.nonzero(d <= self.radius_km)
+                sites.append(s + start)
+                points.append(p)
+                distances.append(d[s, p])
+            site, point, distance = (np.concatenate(x) if x else np.zeros(0) for x in (sites, points, distances))
+            site, point = site.astype(np.int64), point.astype(np.int64)
+        return rows[site], point, np.exp(-distance / self.decay_km)
+
+    def _contribution(self, mask: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Per-point sum of kernel * weights[site] over the pairs selected by mask: (n_points, n_features)."""
+        site, point, kernel = self.pair_site[mask], self.pair_point[mask], self.pair_kernel[mask]
+        return np.stack([np.bincount(point, weights=kernel * weights[site, f], minlength=len(self.latitude))
+                         for f in range(self.n_features)], axis=-1)
+
+    def update(self, site_ids: Sequence[str], latitude: Sequence[float], longitude: Sequence[float],
+               weights: np.ndarray) -> np.ndarray:
+        """
+        Sets the current sites (ids, locations and (n_sites, n_features) weights) and returns the
+        agglomeration per scoring point. Sites missing from site_ids are removed.
+        """
+        latitude = np.asarray(latitude, dtype=float)
+        longitude = np.asarray(longitude, dtype=float)
+        weights = np.asarray(weights, dtype=float).reshape(len(site_ids), self.n_features)
+
+        # Removed sites: take their contribution out and zero their weights
+        present = set(site_ids)
+        gone = np.array([row for site_id, row in self.site_row.items() if site_id not in present], dtype=np.int64)
+        for site_id in [site_id for site_id in self.site_row if site_id not in present]:
+            del self.site_row[site_id]
+
+        rows = np.empty(len(site_ids), dtype=np.int64)
+        for i, site_id in enumerate(site_ids):
+            row = self.site_row.get(site_id)
+            if row is None:
+                row = self.site_row[site_id] = len(self.site_location) + int((rows[:i] >= len(self.site_location)).sum())
+            rows[i] = row
+        n_rows = max(len(self.site_location), int(rows.max()) + 1 if rows.size else 0)
+        grow = n_rows - len(self.site_location)
+        if grow > 0:
+            self.site_location = np.vstack([self.site_location, np.full((grow, 2), np.nan)])
+            self.site_weights = np.vstack([self.site_weights, np.zeros((grow, self.n_features))])
+
+        new_weights = self.site_weights.copy()
+        new_weights[gone] = 0.0
+        new_weights[rows] = weights
+        location = np.stack([latitude, longitude], axis=-1)
+        moved = rows[~np.all(self.site_location[rows] == location, axis=1)]
+        relocate = np.concatenate([moved, gone])
+
+        if relocate.size:
+            # Sites that left or moved: remove their old pairs with their old weights
+            old_pairs = np.isin(self.pair_site, relocate)
+            self.agglomeration -= self._contribution(old_pairs, self.site_weights)
+            self.pair_site, self.pair_point, self.pair_kernel = (x[~old_pairs] for x in (self.pair_site, self.pair_point, self.pair_kernel))
+            self.site_weights[relocate] = 0.0
+            self.site_location[gone] = np.nan
+        # Weight changes of sites that stayed put
+        delta = new_weights - self.site_weights
+        changed = np.nonzero(np.any(delta != 0, axis=1))[0]
+        if changed.size:
+            self.agglomeration += self._contribution(np.isin(self.pair_site, changed), delta)
+        self.site_weights = new_weights
+
+        if moved.size:
+            order = np.isin(rows, moved)
+            site, point, kernel = self._neighbourhoods(rows[order], latitude[order], longitude[order])
+            self.pair_site = np.concatenate([self.pair_site, site])
+            self.pair_point = np.concatenate([self.pair_point, point])
+            self.pair_kernel = np.concatenate([self.pair_kernel, kernel])
+            self.site_location[rows[order]] = location[order]
+            self.agglomeration += self._contribution(np.isin(self.pair_site, moved), self.site_weights)
+            self.sites_queried += int(moved.size)
+        return self.agglomeration.copy()
+
+    def scores(self, feature_weights: Sequence[float]) -> np.ndarray:
+        """Cluster strength in [0, 1]: weighted mean of each feature relative to the strongest point."""
+        peak = self.agglomeration.max(axis=0) if self.agglomeration.size else np.zeros(self.n_features)
+        relative = np.divide(self.agglomeration, peak, out=np.zeros_like(self.agglomeration), where=peak > 0)
+        weight = np.asarray(feature_weights, dtype=float)
+        return relative @ weight / weight.sum() if weight.sum() > 0 else np.zeros(len(self.latitude))
@@ -0,0 +1,287 @@
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Client needs, in column order, and the consultancy capability scores (1-5) that serve each one;
+# the first attribute a consultancy has is used
+NEED_DIMENSIONS = ('supply_security', 'cost', 'geopolitics', 'technology')
+CAPABILITY_ATTRIBUTES = {
+    'supply_security': ('supply_chain_expertise_score', 'technical_semiconductor_knowledge_score'),
+    'cost': ('cost_optimization_score', 'technical_semiconductor_knowledge_score'),
+    'geopolitics': ('geopolitical_expertise_score',),
+    'technology': ('technical_semiconductor_knowledge_score',),
+}
+CAPABILITY_SCALE = 5.0
+DEFAULT_CAPABILITY_SCORE = 2.5
+
+# Global parameters (and defaults) of the consulting market
+CONSULTING_MARKET_PARAMS = {
+    'fee': ('consulting_fee_usd', 250000.0),  # Price of a consultant-year at an affinity of 0.5
+    'reserve_ratio': ('consulting_reserve_price_ratio', 0.5),  # Lowest price as a share of the fee
+    'spend_share': ('consulting_spend_share', 0.0005),  # Share of revenue spent on consulting at average needs
+    'price_memory': ('consulting_price_memory', 0.95),  # Share of last year's price the auction starts from
+    'candidates': ('consulting_candidates_per_client', 20),
+    'region_bonus': ('consulting_home_region_bonus', 0.1),
+    'epsilon': ('consulting_auction_epsilon', 0.02),  # Minimum bid increment as a share of the fee
+    'max_rounds': ('consulting_auction_max_rounds', 1000),
+    'max_expansions': ('consulting_max_graph_expansions', 200),  # Safety cap, warns when hit
+}
+
+
+def consulting_market_params(global_params: Dict[str, Any]) -> Dict[str, float]:
+    """CONSULTING_MARKET_PARAMS read from the global parameters."""
+    return {key: float(global_params.get(name, default)) for key, (name, default) in CONSULTING_MARKET_PARAMS.items()}
+
+
+def consultancy_capabilities(consultancies: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """(capabilities (n_consultancies, len(NEED_DIMENSIONS)) in [0, 1], capacity in consultant-years ('consultant_count'))."""
+    capabilities = np.empty((len(consultancies), len(NEED_DIMENSIONS)))
+    for j, consultancy in enumerate(consultancies):
+        for k, dimension in enumerate(NEED_DIMENSIONS):
+            score = next((consultancy.get_attribute(name) for name in CAPABILITY_ATTRIBUTES[dimension]
+                          if consultancy.get_attribute(name) is not None), DEFAULT_CAPABILITY_SCORE)
+            capabilities[j, k] = float(score) / CAPABILITY_SCALE
+    capacity = np.array([float(consultancy.get_attribute('consultant_count') or 0.0) for consultancy in consultancies])
+    return np.clip(capabilities, 0.0, 1.0), capacity
+
+
+def candidate_edges(needs: np.ndarray, capabilities: np.ndarray, client_region: np.ndarray, consultancy_region: np.ndarray,
+                    n_candidates: int = 20, region_bonus: float = 0.1, rows: Optional[np.ndarray] = None,
+                    penalty: Optional[np.ndarray] = None, size: Optional[np.ndarray] = None, spare: Optional[np.ndarray] = None,
+                    chunk_size: int = 2048) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sparse client-consultancy graph: (client, consultancy, affinity) arrays with each client's
+    n_candidates best consultancies by affinity, the need-weighted mean of the consultancy's
+    capabilities plus region_bonus for a consultancy in the client's region (integer region
+    codes, -1 for none). Dense affinities are only formed chunk_size clients of one region at a
+    time, so the region bonus is one row vector per chunk.
+
+    Consultancies are ranked by affinity - penalty[j] (e.g. their price / (2 * fee)); with size
+    and spare only consultancies with spare[j] >= size[i] are candidates, and rows restricts the
+    graph to some clients. The fourth array holds, per row, the rank of the best consultancy
+    left out (-inf if there is none), which bounds what the client can get outside the graph.
+    """
+    rows = np.arange(needs.shape[0]) if rows is None else np.asarray(rows, dtype=np.int64)
+    n_consultancies = capabilities.shape[0]
+    k = min(int(n_candidates), n_consultancies)
+    if rows.size == 0 or k == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.full(rows.size, -np.inf)
+    weights = needs / np.maximum(needs.sum(axis=1, keepdims=True), 1e-12)
+    by_region = np.argsort(client_region[rows], kind='stable')
+    sorted_rows = rows[by_region]
+    region_bounds = np.flatnonzero(np.r_[True, np.diff(client_region[sorted_rows]) != 0, True])
+    chunks = [sorted_rows[start:min(start + chunk_size, end)]
+              for begin, end in zip(region_bounds[:-1], region_bounds[1:]) for start in range(begin, end, chunk_size)]
+    clients, consultancies, affinities, left_out = [], [], [], []
+    for chunk in chunks:
+        affinity = weights[chunk] @ capabilities.T
+        region = client_region[chunk[0]]
+        if region >= 0 and region_bonus:
+            affinity += region_bonus * (consultancy_region == region)
+        rank = affinity if penalty is None else affinity - penalty
+        if size is not None and spare is not None:
+            rank = np.where(spare[np.newaxis, :] >= size[chunk, np.newaxis], rank, -np.inf)
+        if k < n_consultancies:
+            # Ascending partition: the k best are last, the best left out just before them
+            partition = np.argpartition(rank, n_consultancies - k - 1, axis=1)
+            best = partition[:, n_consultancies - k:]
+            left_out.append(np.take_along_axis(rank, partition[:, n_consultancies - k - 1:n_consultancies - k], axis=1).ravel())
+        else:
+            best = np.broadcast_to(np.arange(k), (chunk.size, k))
+            left_out.append(np.full(chunk.size, -np.inf))
+        feasible = np.isfinite(np.take_along_axis(rank, best, axis=1)).ravel()
+        clients.append(np.repeat(chunk, k)[feasible])
+        consultancies.append(best.ravel()[feasible])
+        affinities.append(np.take_along_axis(affinity, best, axis=1).ravel()[feasible])
+    next_rank = np.empty(rows.size)
+    next_rank[by_region] = np.concatenate(left_out)  # In the order of rows as given
+    return np.concatenate(clients), np.concatenate(consultancies), np.concatenate(affinities), next_rank
+
+
+class ConsultingAuction:
+    """
+    Assigns clients to consultancies with an auction on a sparse bipartite graph.
+
+    Each client buys one engagement of size[i] consultant-years from one consultancy and values
+    consultant-years of consultancy j at value[e] per edge e = (i, j); consultancy j sells at
+    most capacity[j] consultant-years at a price per consultant-year that starts at reserve[j].
+    Every round, all unassigned clients bid at once (Jacobi auction) on their best edge by net
+    value (value - price): the price plus the margin over their second-best option plus
+    epsilon. The second-best option may also be the client's outside option outside[i], the net
+    value it can get off the graph (0, not engaging, by default); clients whose best edge is
+    worth less than that stop bidding. Each consultancy that received bids
+    keeps its highest bids per consultant-year that fit its capacity and rejects the rest; a
+    consultancy that rejected any bid raises its price to the lowest bid it kept.
+
+    A round costs O(edges of the bidders + engagements held by the consultancies bid on): best
+    and second-best edges are segment reductions over the client-sorted edges, and capacity is
+    a cumulative sum over the bids sorted by consultancy. Prices only rise, by at least epsilon
+    per contested round, so the auction ends after at most about (value range / epsilon) rounds
+    per client. solve() can resume from an earlier assignment, bids and prices, e.g. after edges
+    were added. Every engaged client pays its consultancy's final price.
+    """
+    def __init__(self, epsilon: float = 1.0, max_rounds: int = 1000):
+        self.epsilon = float(epsilon)
+        self.max_rounds = int(max_rounds)
+        self.rounds = 0  # Rounds the last solve() took
+        self.bids = np.zeros(0)  # Standing bid per consultant-year of each client after the last solve()
+
+    def solve(self, client: np.ndarray, consultancy: np.ndarray, value: np.ndarray, size: np.ndarray,
+              capacity: np.ndarray, reserve: np.ndarray, assignment: Optional[np.ndarray] = None,
+              bids: Optional[np.ndarray] = None, prices: Optional[np.ndarray] = None,
+              outside: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(consultancy of each client, -1 if unassigned; final price per consultancy)."""
+        n_clients = size.size
+        # Edges a client cannot use (the engagement exceeds the consultancy's capacity) are dropped
+        usable = (size[client] > 0) & (size[client] <= capacity[consultancy])
+        order = np.argsort(client[usable], kind='stable')
+        client, consultancy, value = client[usable][order], consultancy[usable][order], value[usable][order]
+        bounds = np.searchsorted(client, np.arange(n_clients + 1))
+
+        assignment = np.full(n_clients, -1, dtype=np.int64) if assignment is None else assignment.copy()
+        bids = np.zeros(n_clients) if bids is None else bids.copy()
+        prices = np.asarray(reserve if prices is None else prices, dtype=float).copy()
+        outside = np.zeros(n_clients) if outside is None else np.maximum(outside, 0.0)
+        active = np.diff(bounds) > 0
+        self.rounds = 0
+        while self.rounds < self.max_rounds:
+            bidders = np.nonzero(active & (assignment < 0))[0]
+            if not bidders.size:
+                break
+            self.rounds += 1
+            edges = _edges_of(bidders, bounds)
+            net = value[edges] - prices[consultancy[edges]]
+            # Best edge (the first one, on ties) and second-best net value per bidder
+            counts = bounds[bidders + 1] - bounds[bidders]
+            segments = np.cumsum(counts) - counts
+            best_net = np.maximum.reduceat(net, segments)
+            candidates = np.flatnonzero(net == np.repeat(best_net, counts))
+            best = candidates[np.searchsorted(candidates, segments)]
+            net[best] = -np.inf
+            second_net = np.maximum.reduceat(net, segments)
+            bidding = best_net >= outside[bidders]
+            active[bidders[~bidding]] = False
+            bidders, best, best_net, second_net = bidders[bidding], best[bidding], best_net[bidding], second_net[bidding]
+            if not bidders.size:
+                break
+            target = consultancy[edges[best]]
+            bids[bidders] = prices[target] + best_net - np.maximum(second_net, outside[bidders]) + self.epsilon
+            assignment[bidders] = target
+
+            # Consultancies bid on keep the best bids (per consultant-year) that fit their capacity
+            touched = np.zeros(capacity.size, dtype=bool)
+            touched[target] = True
+            pool = np.nonzero((assignment >= 0) & touched[np.maximum(assignment, 0)])[0]
+            pool = pool[np.lexsort((-bids[pool], assignment[pool]))]
+            pool_target = assignment[pool]
+            firsts = np.flatnonzero(np.r_[True, pool_target[1:] != pool_target[:-1]])
+            group_sizes = np.diff(np.r_[firsts, pool.size])
+            used = np.cumsum(size[pool])
+            used -= np.repeat(used[firsts] - size[pool][firsts], group_sizes)
+            kept = used <= capacity[pool_target]
+            assignment[pool[~kept]] = -1
+            # The best bid always fits, so every group keeps a non-empty prefix
+            kept_counts = np.add.reduceat(kept.astype(np.int64), firsts)
+            contested = kept_counts < group_sizes
+            lowest_kept = pool[firsts[contested] + kept_counts[contested] - 1]
+            prices[pool_target[firsts[contested]]] = np.maximum(prices[pool_target[firsts[contested]]], bids[lowest_kept])
+        self.bids = bids
+        return assignment, prices
+
+
+class ConsultingMatchEngine:
+    """
+    Yearly matching of client companies to consultancies (see ConsultingAuction).
+
+    A client values a consultant-year of a consultancy at 2 * fee * affinity (candidate_edges()),
+    so fee is the price at an affinity of 0.5; consultancies sell from reserve_ratio * fee.
+    Each client starts with edges to its n_candidates best-fitting consultancies, and its best
+    consultancy left out at the reserve price as outside option. Clients whose edges are priced
+    below their outside option stop bidding and get n_candidates new edges, ranked by value
+    minus current price among the consultancies with room for them, and the auction resumes
+    from its current state. This repeats until no waiting client has a new edge worth more than
+    its price; max_expansions only caps runaway cases. The graph thus stays sparse without
+    confining clients to the few firms everyone rates best, and crowded firms do not have to be
+    bid up to their value before their bidders look elsewhere.
+    """
+    def __init__(self, fee: float = 250000.0, reserve_ratio: float = 0.5, candidates: int = 20, region_bonus: float = 0.1,
+                 epsilon: float = 0.02, max_rounds: int = 1000, max_expansions: int = 200):
+        self.fee = float(fee)
+        self.reserve_ratio = float(reserve_ratio)
+        self.candidates = int(candidates)
+        self.region_bonus = float(region_bonus)
+        self.max_expansions = int(max_expansions)
+        self.auction = ConsultingAuction(float(epsilon) * self.fee, int(max_rounds))
+        self.rounds = 0  # Auction rounds and graph expansions of the last match()
+        self.expansions = 0
+
+    def match(self, needs: np.ndarray, capabilities: np.ndarray, client_region: np.ndarray, consultancy_region: np.ndarray,
+              size: np.ndarray, capacity: np.ndarray, prices: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (consultancy of each client, -1 if unassigned; price per consultant-year of each
+        consultancy). Prices start from the given ones (at least the reserve price), e.g. last
+        year's, which saves most auction rounds when the market changes little.
+        """
+        reserve = np.full(capacity.size, self.reserve_ratio * self.fee)
+        start = reserve if prices is None else np.maximum(prices, reserve)
+        client, consultancy, affinity, left_out = candidate_edges(needs, capabilities, client_region, consultancy_region,
+                                                                  self.candidates, self.region_bonus, penalty=start / (2.0 * self.fee))
+        outside = 2.0 * self.fee * left_out
+        assignment, prices = self.auction.solve(client, consultancy, 2.0 * self.fee * affinity, size, capacity, reserve,
+                                                prices=start, outside=outside)
+        self.rounds, self.expansions = self.auction.rounds, 0
+        while True:
+            waiting = np.flatnonzero((assignment < 0) & (size > 0))
+            if not waiting.size:
+                break
+            engaged = assignment >= 0
+            spare = capacity - np.bincount(assignment[engaged], weights=size[engaged], minlength=capacity.size)
+            new_client, new_consultancy, new_affinity, left_out = candidate_edges(
+                needs, capabilities, client_region, consultancy_region, self.candidates, self.region_bonus,
+                rows=waiting, penalty=prices / (2.0 * self.fee), size=size, spare=spare)
+            worthwhile = 2.0 * self.fee * new_affinity > prices[new_consultancy]
+            if not worthwhile.any():
+                break
+            if self.expansions >= self.max_expansions:
+                print(f"Warning: consulting match stopped after {self.expansions} graph expansions with "
+                      f"{np.unique(new_client[worthwhile]).size} unmatched clients still having worthwhile consultancies; "
+                      f"raise consulting_max_graph_expansions.")
+                break
+            outside[waiting] = 2.0 * self.fee * left_out
+            keys, first = np.unique(np.r_[client * capacity.size + consultancy,
+                                          new_client[worthwhile] * capacity.size + new_consultancy[worthwhile]], return_index=True)
+            client, consultancy = np.divmod(keys, capacity.size)
+            affinity = np.r_[affinity, new_affinity[worthwhile]][first]
+            assignment, prices = self.auction.solve(client, consultancy, 2.0 * self.fee * affinity, size, capacity,
+                                                    reserve, assignment, self.auction.bids, prices, outside)
+            self.rounds += self.auction.rounds
+            self.expansions += 1
+        if (assignment < 0).any() and outside.any():
+            # Outside options may be stale (prices rose) or never realized: settle for the graph as it is
+            assignment, prices = self.auction.solve(client, consultancy, 2.0 * self.fee * affinity, size, capacity,
+                                                    reserve, assignment, self.auction.bids, prices)
+            self.rounds += self.auction.rounds
+        return assignment, prices
+
+
+def _edges_of(rows: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """Positions of the edges of the given clients in the client-sorted edge arrays."""
+    starts, counts = bounds[rows], bounds[rows + 1] - bounds[rows]
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def market_outcome(assignment: np.ndarray, prices: np.ndarray, size: np.ndarray, capacity: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-consultancy revenue, engaged consultant-years, utilization, client count and revenue share."""
+    n_consultancies = capacity.size
+    engaged = assignment >= 0
+    consultant_years = np.bincount(assignment[engaged], weights=size[engaged], minlength=n_consultancies)
+    revenue = consultant_years * prices
+    total = revenue.sum()
+    return {
+        'revenue': revenue,
+        'consultant_years': consultant_years,
+        'utilization': np.divide(consultant_years, capacity, out=np.zeros(n_consultancies), where=capacity > 0),
+        'clients': np.bincount(assignment[engaged], minlength=n_consultancies),
+        'market_share': revenue / total if total > 0 else np.zeros(n_consultancies),
+    }
@@ -0,0 +1,205 @@
+from typing import Dict, List, Any, Optional, Sequence
+
+import numpy as np
+
+# End-market attributes that drive the projection; a change to any of them mid-run triggers a
+# recompute of that market's remaining years.
+DRIVER_ATTRIBUTES = (
+    'base_demand_wafer_starts_kwpm', 'total_wafer_demand_kwpm', 'node_demand_split_percentage',
+    'annual_growth_rate_kwpm', 'annual_growth_rate', 'node_migration_rate',
+    'adoption_saturation_multiple', 'adoption_midpoint_year', 'adoption_steepness',
+)
+
+
+def _binomial_coefficients(n_max: int, k_max: int) -> np.ndarray:
+    """Pascal's triangle C[n, k] for 0 <= n <= n_max, 0 <= k <= k_max (as floats)."""
+    table = np.zeros((n_max + 1, k_max + 1))
+    table[:, 0] = 1.0
+    for n in range(1, n_max + 1):
+        table[n, 1:] = table[n - 1, 1:] + table[n - 1, :-1]
+    return table
+
+
+class DemandProjectionEngine:
+    """
+    Precomputes end-market wafer demand for every market, node and year as one tensor of shape
+    (n_markets, n_nodes, n_years). Starting from an anchor year (the first year, or the year of
+    the last driver change), each market's demand follows
+
+        compound growth      level[n] * (1 + g[n]) ** tau
+        S-curve adoption     x (1 + (S - 1) * L(year)) / (1 + (S - 1) * L(anchor)),
+                             L = logistic(steepness * (year - midpoint))
+        node migration       each year a share r of a node's demand moves to the next more
+                             advanced node (next smaller feature size), compounding along the
+                             chain; the most advanced node keeps what reaches it.
+
+    After k years, the share that has moved k steps along the chain is Binomial(tau, r).
+    So migration is a sum over chain offsets, and every year is computed at once, with no loop
+    over years. update_drivers() re-anchors the given markets at a year and recomputes only
+    their rows from that year on.
+    """
+    def __init__(self, market_ids: Sequence[str], node_ids: Sequence[str], start_year: int, end_year: int,
+                 feature_sizes: Optional[Sequence[Optional[float]]] = None):
+        self.market_ids = list(market_ids)
+        self.node_ids = list(node_ids)
+        self.market_index = {market_id: i for i, market_id in enumerate(self.market_ids)}
+        self.node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.start_year = start_year
+        self.years = np.arange(start_year, end_year + 1)
+        n_markets, n_nodes, n_years = len(self.market_ids), len(self.node_ids), self.years.size
+
+        # Migration chain: sized nodes from largest (oldest) to smallest (most advanced)
+        sizes = list(feature_sizes) if feature_sizes is not None else [None] * n_nodes
+        self.chain = np.array(sorted((i for i in range(n_nodes) if sizes[i] is not None), key=lambda i: -sizes[i]),
+                              dtype=np.int64)
+        self._binomial = _binomial_coefficients(max(n_years - 1, 0), max(self.chain.size - 1, 0))
+
+        self.anchor_level = np.zeros((n_markets, n_nodes))
+        self.anchor_year = np.full(n_markets, start_year, dtype=np.int64)
+        self.growth = np.zeros((n_markets, n_nodes))
+        self.migration_rate = np.zeros(n_markets)
+        self.saturation = np.ones(n_markets)
+        self.midpoint = np.full(n_markets, float(start_year))
+        self.steepness = np.zeros(n_markets)
+        self.tensor = np.zeros((n_markets, n_nodes, n_years))
+        self.recomputed_cells = 0
+
+    def set_drivers(self, markets: np.ndarray, base: np.ndarray, growth: np.ndarray, migration_rate: np.ndarray,
+                    saturation: np.ndarray, midpoint: np.ndarray, steepness: np.ndarray):
+        """Sets drivers for the given market rows (anchored at the start year) and projects them."""
+        markets = np.asarray(markets, dtype=np.int64)
+        self.anchor_level[markets] = base
+        self.anchor_year[markets] = self.start_year
+        self._assign(markets, growth, migration_rate, saturation, midpoint, steepness)
+        self.project(markets, self.start_year)
+
+    def update_drivers(self, markets: np.ndarray, from_year: int, growth: np.ndarray, migration_rate: np.ndarray,
+                       saturation: np.ndarray, midpoint: np.ndarray, steepness: np.ndarray,
+                       level: Optional[np.ndarray] = None):
+        """
+        Changes drivers of the given markets from `from_year` on. The projection is re-anchored at the
+        demand already projected for that year (or at `level`, e.g. after a demand shock), so years
+        before from_year are untouched.
+        """
+        markets = np.asarray(markets, dtype=np.int64)
+        column = int(np.clip(from_year - self.start_year, 0, self.years.size - 1))
+        self.anchor_level[markets] = self.tensor[markets, :, column] if level is None else level
+        self.anchor_year[markets] = from_year
+        self._assign(markets, growth, migration_rate, saturation, midpoint, steepness)
+        self.project(markets, from_year)
+
+    def _assign(self, markets, growth, migration_rate, saturation, midpoint, steepness):
+        self.growth[markets] = growth
+        self.migration_rate[markets] = np.clip(migration_rate, 0.0, 1.0)
+        self.saturation[markets] = saturation
+        self.midpoint[markets] = midpoint
+        self.steepness[markets] = steepness
+
+    def _logistic(self, markets: np.ndarray, years: np.ndarray) -> np.ndarray:
+        return 1.0 / (1.0 + np.exp(-self.steepness[markets, np.newaxis] * (years - self.midpoint[markets, np.newaxis])))
+
+    def project(self, markets: Optional[np.ndarray] = None, from_year: Optional[int] = None):
+        """Recomputes the tensor slice [markets, :, from_year:] (everything by default)."""
+        markets = np.arange(len(self.market_ids)) if markets is None else np.asarray(markets, dtype=np.int64)
+        first = 0 if from_year is None else int(np.clip(from_year - self.start_year, 0, self.years.size))
+        if markets.size == 0 or first >= self.years.size:
+            return
+        years = self.years[first:]
+        tau = np.maximum(years[np.newaxis, :] - self.anchor_year[markets, np.newaxis], 0)  # (m, y)
+
+        # Compound growth (m, n, y) and S-curve adoption multiplier (m, 1, y)
+        level = self.anchor_level[markets, :, np.newaxis] * np.power(1.0 + self.growth[markets, :, np.newaxis], tau[:, np.newaxis, :])
+        extra = self.saturation[markets, np.newaxis] - 1.0
+        adoption = (1.0 + extra * self._logistic(markets, years)) / \
+                   (1.0 + extra * self._logistic(markets, self.anchor_year[markets, np.newaxis].astype(float)))
+        level *= adoption[:, np.newaxis, :]
+
+        if self.chain.size > 1 and np.any(self.migration_rate[markets] > 0):
+            level = self._migrate(level, tau, self.migration_rate[markets])
+        self.tensor[markets, :, first:] = level
+        self.recomputed_cells += level.size
+
+    def _migrate(self, level: np.ndarray, tau: np.ndarray, rate: np.ndarray) -> np.ndarray:
+        chain = self.chain
+        length = chain.size
+        steps = np.arange(length)
+        r = rate[:, np.newaxis, np.newaxis]  # (m, 1, 1)
+        t = tau[:, np.newaxis, :]  # (m, 1, y)
+        # P(moved exactly k steps after tau years), k = 0..length-1: (m, k, y)
+        pmf = self._binomial[tau][:, :, :length].transpose(0, 2, 1) * np.power(r, steps[np.newaxis, :, np.newaxis]) \
+            * np.power(1.0 - r, np.maximum(t - steps[np.newaxis, :, np.newaxis], 0)) * (steps[np.newaxis, :, np.newaxis] <= t)
+        tail = 1.0 - np.cumsum(pmf, axis=1) + pmf  # P(moved at least k steps)
+
+        on_chain = level[:, chain, :]  # (m, length, y), oldest first
+        moved = np.zeros_like(on_chain)
+        for k in range(length):
+            # Demand from chain position q lands on q + k; the last (most advanced) node absorbs the rest
+            if k < length - 1:
+                moved[:, k:length - 1, :] += on_chain[:, :length - 1 - k, :] * pmf[:, k:k + 1, :]
+            moved[:, length - 1, :] += on_chain[:, length - 1 - k, :] * tail[:, k, :]
+        result = level.copy()
+        result[:, chain, :] = moved
+        return result
+
+    def demand(self, year: int) -> np.ndarray:
+        """Projected demand (n_markets, n_nodes) for a simulated year."""
+        column = int(np.clip(year - self.start_year, 0, self.years.size - 1))
+        return self.tensor[:, :, column]
+
+    def market_demand(self, market_id: str, year: int) -> Dict[str, float]:
+        """One market's projected demand for a year as {node_id: kwpm} (nodes with demand only)."""
+        row = self.demand(year)[self.market_index[market_id]]
+        return {self.node_ids[n]: float(row[n]) for n in np.nonzero(row)[0]}
+
+    def get_state(self) -> Dict[str, Any]:
+        return {name: getattr(self, name).copy() for name in
+                ('anchor_level', 'anchor_year', 'growth', 'migration_rate', 'saturation', 'midpoint', 'steepness', 'tensor')}
+
+    def set_state(self, state: Dict[str, Any]):
+        for name, value in state.items():
+            setattr(self, name, value.copy())
+
+
+def market_drivers(end_markets: Sequence[Any], node_index: Dict[str, int], default_migration_rate: float = 0.0):
+    """
+    Reads projection drivers from end-market attributes into arrays:
+    base demand per node ('base_demand_wafer_starts_kwpm', or 'total_wafer_demand_kwpm' split by
+    'node_demand_split_percentage'), growth per node ('annual_growth_rate_kwpm', falling back to
+    the market's 'annual_growth_rate'), 'node_migration_rate' and the adoption S-curve
+    ('adoption_saturation_multiple', 'adoption_midpoint_year', 'adoption_steepness').
+    """
+    n_markets, n_nodes = len(end_markets), len(node_index)
+    base = np.zeros((n_markets, n_nodes))
+    growth = np.zeros((n_markets, n_nodes))
+    migration = np.full(n_markets, float(default_migration_rate))
+    saturation = np.ones(n_markets)
+    midpoint = np.zeros(n_markets)
+    steepness = np.zeros(n_markets)
+    for m, market in enumerate(end_markets):
+        demand = market.get_attribute('base_demand_wafer_starts_kwpm')
+        if not isinstance(demand, dict):
+            total = market.get_attribute('total_wafer_demand_kwpm')
+            split = market.get_attribute('node_demand_split_percentage')
+            demand = {node_id: float(total) * float(pct) / 100.0 for node_id, pct in split.items()} \
+                if total is not None and isinstance(split, dict) else {}
+        for node_id, value in demand.items():
+            if node_id in node_index:
+                base[m, node_index[node_id]] = float(value)
+        market_rate = float(market.get_attribute('annual_growth_rate') or 0.0)
+        growth[m, :] = market_rate
+        node_rates = market.get_attribute('annual_growth_rate_kwpm')
+        if isinstance(node_rates, dict):
+            for node_id, rate in node_rates.items():
+                if node_id in node_index:
+                    growth[m, node_index[node_id]] = float(rate)
+        if market.get_attribute('node_migration_rate') is not None:
+            migration[m] = float(market.get_attribute('node_migration_rate'))
+        saturation[m] = float(market.get_attribute('adoption_saturation_multiple') or 1.0)
+        midpoint[m] = float(market.get_attribute('adoption_midpoint_year') or 0.0)
+        steepness[m] = float(market.get_attribute('adoption_steepness') or 0.0)
+    return base, growth, migration, saturation, midpoint, steepness
+
+
+def driver_signature(market: Any) -> str:
+    """Cheap fingerprint of a market's driver attributes, used to detect mid-run changes."""
+    return repr([market.get_attribute(name) for name in DRIVER_ATTRIBUTES])
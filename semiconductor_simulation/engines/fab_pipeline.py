@@ -0,0 +1,233 @@
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .node_index import company_node_targets
+
+DEFAULT_RAMP_PROFILE = (0.3, 0.7, 1.0)
+
+
+def ramp_increments(ramp_profile: Sequence[float]) -> np.ndarray:
+    """
+    Converts a cumulative ramp curve (fraction of nameplate capacity available in the first,
+    second, ... year after completion) into per-year capacity increments.
+    """
+    cumulative = np.clip(np.asarray(ramp_profile, dtype=float), 0.0, 1.0)
+    if cumulative.size == 0 or cumulative[-1] < 1.0:
+        cumulative = np.append(cumulative, 1.0)
+    return np.diff(cumulative, prepend=0.0)
+
+
+class FabPipeline:
+    """
+    Array-backed pipeline of fab construction projects.
+
+    Capacity that will come online is held in a ring buffer of shape
+    batch_shape + (horizon, n_rows, n_nodes), indexed by completion period modulo horizon.
+    Only entities that have ever had a project get a row (entity_row maps entity positions to
+    rows, row_entity back), so the buffer scales with the builders, not with every entity.
+    Scheduling a batch of projects scatters their ramped capacity into the buffer in one
+    vectorized call, and releasing a period returns (and clears) a single slot, so no
+    per-project Python objects exist regardless of how many projects are in flight.
+
+    Entities are whatever owns capacity (companies, regions); batch_shape adds leading axes,
+    e.g. (n_replicas,) for ensembles.
+    """
+    def __init__(self, entity_ids: Sequence[str], node_ids: Sequence[str], horizon: int = 16,
+                 batch_shape: Tuple[int, ...] = (), start_period: int = 0):
+        self.entity_ids = list(entity_ids)
+        self.node_ids = list(node_ids)
+        self.entity_index = {entity_id: i for i, entity_id in enumerate(self.entity_ids)}
+        self.node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.batch_shape = tuple(batch_shape)
+        self.horizon = max(int(horizon), 1)
+        self.entity_row = np.full(len(self.entity_ids), -1, dtype=np.int64)  # -1: no row yet
+        self.row_entity = np.zeros(0, dtype=np.int64)
+        self.ring = np.zeros(self.batch_shape + (self.horizon, 0, len(self.node_ids)))
+        self.committed_capex = np.zeros(self.batch_shape + (len(self.node_ids),))
+        self.next_period = start_period  # first period that has not been released yet
+        self.projects_scheduled = 0
+
+    def ensure_nodes(self, node_ids: Sequence[str]):
+        """Appends node columns for node ids that were not known when the pipeline was created."""
+        new_ids = [node_id for node_id in dict.fromkeys(node_ids) if node_id not in self.node_index]
+        if not new_ids:
+            return
+        for node_id in new_ids:
+            self.node_index[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+        padding = [(0, 0)] * (self.ring.ndim - 1) + [(0, len(new_ids))]
+        self.ring = np.pad(self.ring, padding)
+        self.committed_capex = np.pad(self.committed_capex, padding[-self.committed_capex.ndim:])
+
+    def set_entities(self, entity_ids: Sequence[str]):
+        """Renames entities (e.g. after slot reuse) and extends the row map for a longer entity list."""
+        added = len(entity_ids) - len(self.entity_ids)
+        if added > 0:
+            self.entity_row = np.r_[self.entity_row, np.full(added, -1, dtype=np.int64)]
+        self.entity_ids = list(entity_ids)
+        self.entity_index = {entity_id: i for i, entity_id in enumerate(self.entity_ids)}
+
+    def transfer_entity(self, source: int, target: Optional[int] = None):
+        """Moves an entity's in-flight capacity to another entity (a merger), or cancels it if target is None."""
+        source_row = self.entity_row[source]
+        if source_row < 0:
+            return
+        if target is not None:
+            target_row = self._rows(np.array([target]))[0]
+            self.ring[..., target_row, :] += self.ring[..., source_row, :]
+        self.ring[..., source_row, :] = 0.0
+
+    def _rows(self, entity_idx: np.ndarray) -> np.ndarray:
+        """Ring rows of the entities, appending rows for entities without one."""
+        missing = np.unique(entity_idx[self.entity_row[entity_idx] < 0])
+        if missing.size:
+            self.entity_row[missing] = self.row_entity.size + np.arange(missing.size)
+            self.row_entity = np.r_[self.row_entity, missing]
+            padding = [(0, 0)] * self.ring.ndim
+            padding[-2] = (0, missing.size)
+            self.ring = np.pad(self.ring, padding)
+        return self.entity_row[entity_idx]
+
+    def _grow_horizon(self, required: int):
+        new_horizon = max(required, 2 * self.horizon)
+        new_ring = np.zeros(self.batch_shape + (new_horizon,) + self.ring.shape[-2:])
+        # Re-home pending slots under the new modulus
+        for offset in range(self.horizon):
+            period = self.next_period + offset
+            new_ring[..., period % new_horizon, :, :] = self.ring[..., period % self.horizon, :, :]
+        self.ring = new_ring
+        self.horizon = new_horizon
+
+    def schedule(self, entity_idx: np.ndarray, node_idx: np.ndarray, capacity_kwpm: np.ndarray,
+                 start_period: int, lag_years: Any, ramp_profile: Sequence[float] = DEFAULT_RAMP_PROFILE,
+                 cost_billion_usd: Optional[np.ndarray] = None, batch_idx: Optional[Tuple[np.ndarray, ...]] = None):
+        """
+        Schedules a batch of projects. Project p adds capacity_kwpm[p] of node node_idx[p] to
+        entity entity_idx[p] (a position in entity_ids), ramping up from period start_period + lag_years[p] following the
+        cumulative ramp_profile. batch_idx gives each project's position on the batch axes.
+        """
+        entity_idx = np.asarray(entity_idx, dtype=np.int64).ravel()
+        node_idx = np.asarray(node_idx, dtype=np.int64).ravel()
+        capacity = np.asarray(capacity_kwpm, dtype=float).ravel()
+        if capacity.size == 0:
+            return
+        lags = np.maximum(np.broadcast_to(np.asarray(lag_years, dtype=np.int64), capacity.shape), 0)
+        increments = ramp_increments(ramp_profile)
+
+        completion = start_period + lags[:, np.newaxis] + np.arange(increments.size)[np.newaxis, :]  # (P, ramp)
+        # Capacity completing in an already released period comes online in the next open period
+        completion = np.maximum(completion, self.next_period)
+        required = int(completion.max() - self.next_period + 1)
+        if required > self.horizon:
+            self._grow_horizon(required)
+
+        slots = completion % self.horizon
+        amounts = capacity[:, np.newaxis] * increments[np.newaxis, :]
+        entity_b = np.broadcast_to(self._rows(entity_idx)[:, np.newaxis], slots.shape)
+        node_b = np.broadcast_to(node_idx[:, np.newaxis], slots.shape)
+        batch = tuple(np.broadcast_to(np.asarray(b, dtype=np.int64).ravel()[:, np.newaxis], slots.shape)
+                      for b in (batch_idx or ()))
+        np.add.at(self.ring, batch + (slots, entity_b, node_b), amounts)
+
+        if cost_billion_usd is not None:
+            np.add.at(self.committed_capex, tuple(b[:, 0] for b in batch) + (node_idx,),
+                      np.asarray(cost_billion_usd, dtype=float).ravel())
+        self.projects_scheduled += capacity.size
+
+    def release(self, period: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (entity positions, capacity) coming online in `period`, the capacity being
+        batch_shape + (n_rows, n_nodes) for the entities with a row, and clears it from the
+        buffer. Periods must be released in order; skipped periods are released cumulatively.
+        """
+        released = np.zeros(self.ring.shape[:-3] + self.ring.shape[-2:])
+        while self.next_period <= period:
+            slot = self.next_period % self.horizon
+            released += self.ring[..., slot, :, :]
+            self.ring[..., slot, :, :] = 0.0
+            self.next_period += 1
+        return self.row_entity.copy(), released
+
+    def in_flight_by_node(self) -> np.ndarray:
+        """Capacity still under construction or ramping, summed over entities: batch_shape + (n_nodes,)."""
+        return self.ring.sum(axis=(-3, -2))
+
+    def in_flight_by_entity(self) -> np.ndarray:
+        """Capacity still under construction or ramping per entity: batch_shape + (n_entities, n_nodes)."""
+        in_flight = np.zeros(self.batch_shape + (len(self.entity_ids), len(self.node_ids)))
+        in_flight[..., self.row_entity, :] = self.ring.sum(axis=-3)
+        return in_flight
+
+    def get_state(self) -> Dict[str, Any]:
+        return {'entity_ids': list(self.entity_ids), 'entity_row': self.entity_row.copy(), 'row_entity': self.row_entity.copy(),
+                'ring': self.ring.copy(), 'committed_capex': self.committed_capex.copy(),
+                'next_period': self.next_period, 'projects_scheduled': self.projects_scheduled}
+
+    def set_state(self, state: Dict[str, Any]):
+        self.entity_ids = list(state['entity_ids'])
+        self.entity_index = {entity_id: i for i, entity_id in enumerate(self.entity_ids)}
+        self.entity_row = state['entity_row'].copy()
+        self.row_entity = state['row_entity'].copy()
+        self.ring = state['ring'].copy()
+        self.horizon = self.ring.shape[-3]
+        self.committed_capex = state['committed_capex'].copy()
+        self.next_period = state['next_period']
+        self.projects_scheduled = state['projects_scheduled']
+
+
+def capacity_matrix(models: Sequence[Any], attribute_name: str, node_index: Dict[str, int]) -> np.ndarray:
+    """Reads {node_id: kwpm} dict attributes of a list of models into an (n_models, n_nodes) array."""
+    matrix = np.zeros((len(models), len(node_index)))
+    for row, model in enumerate(models):
+        capacity = model.get_attribute(attribute_name)
+        if isinstance(capacity, dict):
+            for node_id, value in capacity.items():
+                column = node_index.get(node_id)
+                if column is not None:
+                    matrix[row, column] = float(value)
+    return matrix
+
+
+def node_target_matrix(companies: Sequence[Any], node_index: Dict[str, int]) -> np.ndarray:
+    """(n_companies, n_nodes) boolean array of the nodes each company targets (see node_index.company_node_targets)."""
+    matrix = np.zeros((len(companies), len(node_index)), dtype=bool)
+    for row, company in enumerate(companies):
+        for node_id in company_node_targets(company):
+            column = node_index.get(node_id)
+            if column is not None:
+                matrix[row, column] = True
+    return matrix
+
+
+def fab_investment(capacity: np.ndarray, investing: np.ndarray, targets: np.ndarray, added_kwpm: np.ndarray) -> np.ndarray:
+    """
+    Splits the capacity to add at each node (shape batch + (n_nodes,)) between companies, returning
+    new capacity of shape batch + (n_companies, n_nodes). Investing companies share a node in
+    proportion to their existing capacity there. At a green-field node, where none of them has
+    capacity, the investing companies targeting it (`targets`, see node_target_matrix) share
+    equally; without such an entrant the node gets no new capacity.
+    """
+    weights = np.where(investing[:, np.newaxis], capacity, 0.0)
+    green_field = weights.sum(axis=-2, keepdims=True) <= 0
+    weights = np.where(green_field, (investing[:, np.newaxis] & targets).astype(float), weights)
+    totals = weights.sum(axis=-2, keepdims=True)
+    added = np.asarray(added_kwpm, dtype=float)[..., np.newaxis, :]
+    share = np.divide(added, totals, out=np.zeros(np.broadcast(added, totals).shape), where=totals > 0)
+    return weights * share
+
+
+def add_capacity_to_models(models: Sequence[Any], attribute_name: str, node_ids: List[str],
+                           added: np.ndarray, current_year: int, model_idx: Optional[np.ndarray] = None):
+    """
+    Adds an (n_rows, n_nodes) capacity array to the models' {node_id: kwpm} dict attributes;
+    row r belongs to models[model_idx[r]] (models[r] without model_idx).
+    """
+    rows, columns = np.nonzero(added)
+    for row in np.unique(rows):
+        model = models[row if model_idx is None else model_idx[row]]
+        capacity = dict(model.get_attribute(attribute_name) or {})
+        for column in columns[rows == row]:
+            node_id = node_ids[column]
+            capacity[node_id] = float(capacity.get(node_id, 0.0)) + float(added[row, column])
+        model.set_attribute(attribute_name, capacity, current_year)
@@ -0,0 +1,251 @@
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from semiconductor_simulation.engines.fab_pipeline import DEFAULT_RAMP_PROFILE
+
+TARGET_KINDS = ('region', 'company')
+# Structured eligibility conditions a program may set (as attributes or in a 'conditions' dict)
+CONDITION_KEYS = ('eligible_node_ids', 'max_feature_size_nm', 'min_feature_size_nm', 'eligible_company_types', 'require_domestic')
+
+
+def _years_active(start: Optional[int], end: Optional[int], default_duration: int) -> int:
+    if start is None:
+        return max(int(default_duration), 1)
+    return max((int(end) if end is not None else int(start) + int(default_duration) - 1) - int(start) + 1, 1)
+
+
+def incentive_programs(policies: Sequence[Any], global_params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Reads the InvestmentIncentive PolicyModels into plain program dicts (picklable, no callables):
+    - annual funding is 'annual_disbursement_billion_usd' if set, else the program total
+      ('value_impact' in USD, or 'total_funding_billion_usd') spread evenly over start_year..end_year
+      ('incentive_default_duration_years', default 5, when end_year is missing);
+    - targets come from 'target_entity_type' (REGION/COMPANY) and 'target_entity_ids', with optional
+      'target_weights' {id: weight};
+    - the node split is 'node_investment_distribution' {node_id: share} (else each target's current
+      capacity mix, or the industry-wide mix for targets without capacity);
+    - structured conditions (CONDITION_KEYS) are read from the attributes or a 'conditions' dict
+      (free-text conditions are descriptive only).
+    The legacy 'us_chips_act_simulation' global parameter is translated into one more program.
+    """
+    default_duration = int(global_params.get('incentive_default_duration_years', 5))
+    default_kwpm = float(global_params.get('incentive_kwpm_per_billion', 1.0))
+    programs = []
+    for policy in policies:
+        if policy.get_attribute('policy_type') != 'InvestmentIncentive':
+            continue
+        start, end = policy.get_attribute('start_year'), policy.get_attribute('end_year')
+        total = policy.get_attribute('value_impact')
+        total = float(total) / 1e9 if total is not None else policy.get_attribute('total_funding_billion_usd')
+        annual = policy.get_attribute('annual_disbursement_billion_usd')
+        if annual is None and total is not None:
+            annual = float(total) / _years_active(start, end, default_duration)
+        if not annual:
+            continue
+        conditions = policy.get_attribute('conditions')
+        conditions = dict(conditions) if isinstance(conditions, dict) else {}
+        for key in CONDITION_KEYS:
+            if policy.get_attribute(key) is not None:
+                conditions.setdefault(key, policy.get_attribute(key))
+        kind = str(policy.get_attribute('target_entity_type') or 'REGION').lower()
+        programs.append({
+            'program_id': policy.model_id,
+            'start_year': start,
+            'end_year': end if end is not None or start is None else int(start) + default_duration - 1,
+            'annual_funding_billion_usd': float(annual),
+            'total_funding_billion_usd': float(total) if total is not None else None,
+            'disbursed_billion_usd': float(policy.get_attribute('funding_disbursed_to_date_billion_usd') or 0.0),
+            'target_kind': kind if kind in TARGET_KINDS else 'region',
+            'target_ids': list(policy.get_attribute('target_entity_ids') or policy.get_attribute('target_entities') or []),
+            'target_weights': dict(policy.get_attribute('target_weights') or {}),
+            'node_distribution': policy.get_attribute('node_investment_distribution'),
+            'conditions': conditions,
+            'issuing_region_id': policy.get_attribute('issuing_region_id') or policy.get_attribute('enacting_region_id'),
+            'kwpm_per_billion': float(policy.get_attribute('kwpm_per_billion_invested') or default_kwpm),
+            'construction_lag_years': policy.get_attribute('construction_lag_years'),
+            'ramp_profile': policy.get_attribute('ramp_profile'),
+        })
+
+    legacy = global_params.get('us_chips_act_simulation')
+    if isinstance(legacy, dict) and legacy.get('annual_investment_billion'):
+        programs.append({
+            'program_id': 'us_chips_act_simulation',
+            'start_year': legacy.get('start_year'),
+            'end_year': legacy.get('end_year'),
+            'annual_funding_billion_usd': float(legacy['annual_investment_billion']),
+            'total_funding_billion_usd': None,
+            'disbursed_billion_usd': 0.0,
+            'target_kind': 'region',
+            'target_ids': list(legacy.get('target_region_ids', [])),
+            'target_weights': {},
+            'node_distribution': legacy.get('node_investment_distribution'),
+            'conditions': {},
+            'issuing_region_id': None,
+            'kwpm_per_billion': float(legacy.get('kwpm_per_billion_invested', default_kwpm)),
+            'construction_lag_years': legacy.get('construction_lag_years'),
+            'ramp_profile': legacy.get('ramp_profile'),
+            # Old scenarios built in Python may still pass a callable; it is honoured but not required
+            'is_active_in_year': legacy.get('is_active_in_year'),
+        })
+    return programs
+
+
+def program_active(program: Dict[str, Any], year: int) -> bool:
+    check = program.get('is_active_in_year')
+    if callable(check):
+        return bool(check(year))
+    if program['start_year'] is not None and year < int(program['start_year']):
+        return False
+    if program['end_year'] is not None and year > int(program['end_year']):
+        return False
+    total = program['total_funding_billion_usd']
+    return total is None or program['disbursed_billion_usd'] < total - 1e-12
+
+
+class InvestmentIncentiveEngine:
+    """
+    Allocates the year's funds of all active incentive programs in one pass.
+
+    Program x target pairs form the rows of a (n_pairs, n_nodes) allocation:
+        funds[t, n] = annual funding of t's program * target share of t * node split[t, n]
+    The node split is the program's node distribution (else the target's or the industry's capacity
+    mix) masked by the program's eligibility conditions and renormalized. Funding is capped by what
+    is left of the program total. Funds turn into fab capacity at the program's kwpm per billion
+    USD. Rows are then summed per entity with np.add.at, so overlapping programs on the same region
+    or company add up. Only building the program and pair tables touches Python objects; the
+    allocation itself is array arithmetic over all pairs and nodes at once.
+    """
+    def __init__(self, node_ids: Sequence[str]):
+        self.node_ids = list(node_ids)
+        self.node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+
+    def ensure_nodes(self, node_ids: Sequence[str]):
+        for node_id in node_ids:
+            if node_id not in self.node_index:
+                self.node_index[node_id] = len(self.node_ids)
+                self.node_ids.append(node_id)
+
+    def allocate(self, programs: List[Dict[str, Any]], year: int, entities: Dict[str, Dict[str, Any]],
+                 feature_sizes: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        entities maps 'region'/'company' to {'ids', 'index' ({id: row}), 'mix' ((n, n_nodes) capacity mix), 'builds'
+        ((n,) bool, whether funds build capacity), and for companies 'company_types' and
+        'region_ids'}. Returns, per kind, the funded projects (entity_idx, node_idx, capacity_kwpm,
+        cost_billion_usd, program_idx) and the funds received per entity, plus the funds disbursed
+        per program.
+        """
+        active = [p for p, program in enumerate(programs) if program_active(program, year)]
+        for p in active:
+            if isinstance(programs[p]['node_distribution'], dict):
+                self.ensure_nodes(programs[p]['node_distribution'].keys())
+        n_nodes = len(self.node_ids)
+        sizes = np.full(n_nodes, np.nan)
+        if feature_sizes is not None:
+            sizes[:len(feature_sizes)] = feature_sizes[:n_nodes]
+
+        # Per-program tables
+        n_programs = len(active)
+        funding = np.array([programs[p]['annual_funding_billion_usd'] for p in active], dtype=float)
+        remaining = np.array([np.inf if programs[p]['total_funding_billion_usd'] is None
+                              else programs[p]['total_funding_billion_usd'] - programs[p]['disbursed_billion_usd'] for p in active])
+        funding = np.minimum(funding, np.maximum(remaining, 0.0))
+        distribution = np.full((n_programs, n_nodes), np.nan)  # NaN row: use the target's capacity mix
+        node_ok = np.ones((n_programs, n_nodes), dtype=bool)
+        for row, p in enumerate(active):
+            program = programs[p]
+            if isinstance(program['node_distribution'], dict):
+                distribution[row] = 0.0
+                for node_id, share in program['node_distribution'].items():
+                    distribution[row, self.node_index[node_id]] = float(share)
+            conditions = program['conditions']
+            if conditions.get('eligible_node_ids') is not None:
+                node_ok[row] = np.isin(self.node_ids, list(conditions['eligible_node_ids']))
+            if conditions.get('max_feature_size_nm') is not None:
+                node_ok[row] &= ~(sizes > float(conditions['max_feature_size_nm']))
+            if conditions.get('min_feature_size_nm') is not None:
+                node_ok[row] &= ~(sizes < float(conditions['min_feature_size_nm']))
+
+        # Program x target pairs
+        pair_program, pair_kind, pair_entity, pair_weight = [], [], [], []
+        for row, p in enumerate(active):
+            program = programs[p]
+            kind = program['target_kind']
+            index = entities.get(kind, {}).get('index', {})
+            conditions = program['conditions']
+            for target_id in program['target_ids']:
+                entity = index.get(target_id)
+                if entity is None:
+                    continue
+                if kind == 'company':
+                    info = entities['company']
+                    if conditions.get('eligible_company_types') is not None and info['company_types'][entity] not in conditions['eligible_company_types']:
+                        continue
+                    if conditions.get('require_domestic') and info['region_ids'][entity] != program['issuing_region_id']:
+                        continue
+                pair_program.append(row)
+                pair_kind.append(TARGET_KINDS.index(kind))
+                pair_entity.append(entity)
+                pair_weight.append(float(program['target_weights'].get(target_id, 1.0)))
+        pair_program = np.array(pair_program, dtype=np.int64)
+        pair_kind = np.array(pair_kind, dtype=np.int64)
+        pair_entity = np.array(pair_entity, dtype=np.int64)
+        pair_weight = np.array(pair_weight, dtype=float)
+
+        weight_total = np.bincount(pair_program, weights=pair_weight, minlength=n_programs)
+        target_share = pair_weight / np.where(weight_total > 0, weight_total, 1.0)[pair_program] if pair_program.size else pair_weight
+
+        # Node split per pair: program distribution, else the target's capacity mix, else (targets
+        # without capacity) the industry-wide capacity mix
+        mix = np.zeros((pair_program.size, n_nodes))
+        industry_mix = np.zeros(n_nodes)
+        for k, kind in enumerate(TARGET_KINDS):
+            if kind not in entities:
+                continue
+            kind_mix = np.asarray(entities[kind]['mix'], dtype=float).reshape(len(entities[kind]['ids']), -1)
+            industry_mix[:kind_mix.shape[1]] += kind_mix.sum(axis=0)
+            rows = pair_kind == k
+            if rows.any():
+                mix[rows, :kind_mix.shape[1]] = kind_mix[pair_entity[rows]]
+        program_split = distribution[pair_program]
+        split = np.where(np.isnan(program_split), mix, program_split) * node_ok[pair_program]
+        split_total = split.sum(axis=1, keepdims=True)
+        fallback = (split_total[:, 0] <= 0) & np.isnan(program_split).all(axis=1)
+        split[fallback] = industry_mix[np.newaxis, :] * node_ok[pair_program[fallback]]
+        split_total = split.sum(axis=1, keepdims=True)
+        split = np.divide(split, split_total, out=np.zeros_like(split), where=split_total > 0)
+        funded = split_total[:, 0] > 0
+
+        funds = (funding[pair_program] * target_share)[:, np.newaxis] * split  # (n_pairs, n_nodes) billion USD
+        disbursed = np.zeros(len(programs))
+        np.add.at(disbursed, np.array(active, dtype=np.int64)[pair_program], funds.sum(axis=1))
+
+        result: Dict[str, Any] = {'disbursed_billion_usd': disbursed}
+        kwpm_per_billion = np.array([programs[p]['kwpm_per_billion'] for p in active], dtype=float)
+        for k, kind in enumerate(TARGET_KINDS):
+            info = entities.get(kind)
+            n_entities = len(info['ids']) if info else 0
+            rows = np.nonzero((pair_kind == k) & funded)[0]
+            received = np.zeros(n_entities)
+            np.add.at(received, pair_entity[rows], funds[rows].sum(axis=1))
+            builds = np.asarray(info['builds'], dtype=bool)[pair_entity[rows]] if info else np.zeros(0, dtype=bool)
+            rows = rows[builds]
+            pair_rows, node_idx = np.nonzero(funds[rows] > 0)
+            pairs = rows[pair_rows]
+            result[kind] = {
+                'received_billion_usd': received,
+                'entity_idx': pair_entity[pairs],
+                'node_idx': node_idx,
+                'cost_billion_usd': funds[pairs, node_idx],
+                'capacity_kwpm': funds[pairs, node_idx] * kwpm_per_billion[pair_program[pairs]],
+                'program_idx': np.array(active, dtype=np.int64)[pair_program[pairs]],
+            }
+        return result
+
+
+def program_schedule(program: Dict[str, Any], global_params: Dict[str, Any]) -> Tuple[int, Sequence[float]]:
+    """Construction lag and ramp profile of a program's fabs (falling back to the global fab settings)."""
+    lag = program.get('construction_lag_years')
+    ramp = program.get('ramp_profile')
+    return (int(lag if lag is not None else global_params.get('fab_construction_lag_years', 3)),
+            tuple(ramp if ramp is not None else global_params.get('fab_ramp_profile', DEFAULT_RAMP_PROFILE)))
@@ -0,0 +1,151 @@
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def wright_exponent(learning_rate: np.ndarray) -> np.ndarray:
+    """Wright's-law exponent b for a learning rate (cost drop per doubling of cumulative output): (1 - LR) = 2^-b."""
+    return -np.log2(1.0 - np.clip(np.asarray(learning_rate, dtype=float), 0.0, 0.99))
+
+
+class LearningCurveEngine:
+    """
+    Cost, yield and adoption of all technology nodes as arrays of shape batch_shape + (n_nodes,).
+
+    With Q the cumulative wafer output of a node and Q0 its output when the engine was anchored,
+    each step evaluates
+        wafer cost         cost_0 * (Q / Q0) ** -b                  (Wright's law)
+        yield              yield_0 ** ((Q / Q0) ** -b_d)            (defect density D falls as
+                                                                     (Q / Q0) ** -b_d, Poisson
+                                                                     yield exp(-A * D))
+        cost index         index_0 * (cost / cost_0) * (yield_0 / yield)   (per good wafer)
+        adoption           saturation / (1 + exp(-k * (year - commercialized - offset)))
+    A node that has no output yet is anchored at its first output. There is no per-node Python
+    loop and no state beyond the anchors, so one instance can step every Monte Carlo replica at
+    once (leading batch axes) or be rebuilt per replica cheaply.
+    """
+    _STATE = ('exponent', 'defect_exponent', 'base_yield', 'base_cost', 'base_cost_index', 'year_commercialized',
+              'adoption_midpoint_offset', 'adoption_steepness', 'adoption_saturation', 'anchor_output')
+
+    def __init__(self, learning_rate: np.ndarray, defect_learning_rate: np.ndarray, base_yield: np.ndarray,
+                 base_cost: np.ndarray, base_cost_index: np.ndarray, year_commercialized: np.ndarray,
+                 adoption_midpoint_offset: np.ndarray, adoption_steepness: np.ndarray, adoption_saturation: np.ndarray):
+        self.exponent = wright_exponent(learning_rate)
+        self.defect_exponent = wright_exponent(defect_learning_rate)
+        self.base_yield = np.clip(np.asarray(base_yield, dtype=float), 1e-6, 1.0)
+        self.base_cost = np.asarray(base_cost, dtype=float)
+        self.base_cost_index = np.asarray(base_cost_index, dtype=float)
+        self.year_commercialized = np.asarray(year_commercialized, dtype=float)  # NaN: not commercialized yet
+        self.adoption_midpoint_offset = np.asarray(adoption_midpoint_offset, dtype=float)
+        self.adoption_steepness = np.asarray(adoption_steepness, dtype=float)
+        self.adoption_saturation = np.asarray(adoption_saturation, dtype=float)
+        self.anchor_output: Optional[np.ndarray] = None
+
+    def commercialize(self, mask: np.ndarray, year: int):
+        """Records the commercialization year for nodes (mask) that have just reached it."""
+        self.year_commercialized = np.where(mask & np.isnan(self.year_commercialized), float(year), self.year_commercialized)
+
+    def step(self, year: int, cumulative_output: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Evaluates the curves for a year from cumulative output (batch_shape + (n_nodes,)). Returns
+        'cost_per_wafer', 'yield_rate', 'manufacturing_cost_index' (NaN where a node has no base
+        value) and 'adoption_rate' (NaN for nodes not commercialized).
+        """
+        output = np.maximum(np.asarray(cumulative_output, dtype=float), 0.0)
+        if self.anchor_output is None:
+            self.anchor_output = output.copy()
+        self.anchor_output = np.where(self.anchor_output > 0, self.anchor_output, output)
+        experience = np.divide(output, self.anchor_output, out=np.ones_like(output), where=self.anchor_output > 0)
+        experience = np.maximum(experience, 1.0)
+
+        cost_factor = np.power(experience, -self.exponent)
+        yield_rate = np.power(self.base_yield, np.power(experience, -self.defect_exponent))
+        logistic = 1.0 / (1.0 + np.exp(-self.adoption_steepness * (year - self.year_commercialized - self.adoption_midpoint_offset)))
+        return {
+            'cost_per_wafer': self.base_cost * cost_factor,
+            'yield_rate': yield_rate,
+            'manufacturing_cost_index': self.base_cost_index * cost_factor * self.base_yield / yield_rate,
+            'adoption_rate': self.adoption_saturation * logistic,
+        }
+
+    def advance(self, year: int, year_commercialized: np.ndarray, cumulative_output: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        commercialize and step for a year, from the nodes' year_commercialized and cumulative
+        output (NaN where a node has none recorded).
+        """
+        self.commercialize(~np.isnan(year_commercialized), year)
+        return self.step(year, np.nan_to_num(cumulative_output, nan=0.0))
+
+    def get_state(self) -> Dict[str, Any]:
+        return {name: None if getattr(self, name) is None else getattr(self, name).copy() for name in self._STATE}
+
+    def set_state(self, state: Dict[str, Any]):
+        for name, value in state.items():
+            setattr(self, name, None if value is None else value.copy())
+
+
+def _node_values(tech_nodes: Sequence[Any], attribute_name: str, default: float) -> np.ndarray:
+    values = [node.get_attribute(attribute_name) for node in tech_nodes]
+    return np.array([float(v) if v is not None else default for v in values])
+
+
+def learning_curve_inputs(tech_nodes: Sequence[Any], global_params: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """
+    Reads LearningCurveEngine arguments from technology node attributes, with global defaults:
+    'learning_rate' (default_learning_rate, 0.15), 'defect_learning_rate' (default_defect_learning_rate,
+    0.3), 'yield_rate' (default_initial_yield, 0.8), 'cost_per_wafer', 'manufacturing_cost_index' (1.0),
+    'year_commercialized', 'adoption_midpoint_offset_years' (3), 'adoption_steepness' (0.8) and
+    'adoption_saturation' (1.0).
+    """
+    return {
+        'learning_rate': _node_values(tech_nodes, 'learning_rate', float(global_params.get('default_learning_rate', 0.15))),
+        'defect_learning_rate': _node_values(tech_nodes, 'defect_learning_rate',
+                                             float(global_params.get('default_defect_learning_rate', 0.3))),
+        'base_yield': _node_values(tech_nodes, 'yield_rate', float(global_params.get('default_initial_yield', 0.8))),
+        'base_cost': _node_values(tech_nodes, 'cost_per_wafer', np.nan),
+        'base_cost_index': _node_values(tech_nodes, 'manufacturing_cost_index', 1.0),
+        'year_commercialized': _node_values(tech_nodes, 'year_commercialized', np.nan),
+        'adoption_midpoint_offset': _node_values(tech_nodes, 'adoption_midpoint_offset_years',
+                                                 float(global_params.get('adoption_midpoint_offset_years', 3.0))),
+        'adoption_steepness': _node_values(tech_nodes, 'adoption_steepness', float(global_params.get('adoption_steepness', 0.8))),
+        'adoption_saturation': _node_values(tech_nodes, 'adoption_saturation', 1.0),
+    }
+
+
+def accumulate_output(cumulative_output: np.ndarray, output: np.ndarray, year_commercialized: np.ndarray, year: int,
+                      default_history_years: Any) -> np.ndarray:
+    """
+    Cumulative wafer output after a year producing output. A node without a recorded history
+    (NaN) starts with its output times the years since commercialization (default_history_years
+    where that year is unknown).
+    """
+    unrecorded = np.isnan(cumulative_output)
+    if unrecorded.any():
+        years_in_production = np.where(np.isnan(year_commercialized), default_history_years,
+                                       np.maximum(year - np.nan_to_num(year_commercialized), 0))
+        cumulative_output = np.where(unrecorded, output * years_in_production, cumulative_output)
+    return cumulative_output + output
+
+
+def rd_trl_increase(node_spend: np.ndarray, rd_effectiveness: Any, elasticity: Any) -> np.ndarray:
+    """
+    Per-node TRL increase: rd_effectiveness * (spend / mean spend of funded nodes) ** elasticity,
+    so unfunded nodes stall. Without any funded node every node advances by rd_effectiveness.
+    rd_effectiveness and elasticity may be arrays with leading batch axes (e.g. (R, 1)).
+    """
+    funded = node_spend > 0
+    if not funded.any():
+        return rd_effectiveness * np.ones(node_spend.shape)
+    return rd_effectiveness * np.power(node_spend / node_spend[funded].mean(), elasticity)
+
+
+def advance_trl(maturity: np.ndarray, increase: np.ndarray, threshold: np.ndarray, year_commercialized: np.ndarray,
+                year: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Moves node TRLs (NaN: unknown) up by increase, capped at 9, and marks nodes reaching their
+    commercialization threshold as commercialized in year. Returns (maturity, year_commercialized).
+    """
+    advancing = np.isfinite(maturity) & (maturity < 9)
+    maturity = np.where(advancing, np.minimum(9.0, maturity + increase), maturity)
+    reached = np.isfinite(maturity) & (maturity >= threshold) & np.isnan(year_commercialized)
+    return maturity, np.where(reached, float(year), year_commercialized)
@@ -0,0 +1,194 @@
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from semiconductor_simulation.engines.node_index import company_node_targets
+
+# Global parameters (and defaults) weighting the features market-share fitness is built from
+FITNESS_WEIGHT_PARAMS = {
+    'leadership': ('share_weight_node_leadership', 1.0),
+    'capacity': ('share_weight_capacity', 2.0),
+    'price': ('share_weight_price', 1.0),
+    'resilience': ('share_weight_resilience', 1.0),
+}
+
+
+def group_sum(values: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """np.bincount over the last axis of values (with any leading batch axes): batch + (n_groups,)."""
+    if values.ndim == 1:
+        return np.bincount(groups, weights=values, minlength=n_groups)
+    flat = values.reshape(-1, values.shape[-1])
+    offsets = (np.arange(flat.shape[0]) * n_groups)[:, np.newaxis]
+    sums = np.bincount((groups[np.newaxis, :] + offsets).ravel(), weights=flat.ravel(), minlength=flat.shape[0] * n_groups)
+    return sums.reshape(values.shape[:-1] + (n_groups,))
+
+
+class MarketShareEngine:
+    """
+    Market shares of companies in every (segment, node) market, where a company's segment is its
+    company type. Only participating (company, node) pairs are stored: shares has shape
+    batch_shape + (n_pairs,), and market totals are one np.bincount over the pairs' market ids,
+    so the cost is linear in participations rather than companies x nodes.
+
+    Each step applies discrete replicator dynamics
+        s'[p] = s[p] * exp(speed * (f[p] - mean fitness of p's market)) / market total
+    Pairs that newly participate enter with entry_share of their market, split among the
+    entrants by logit choice (softmax of fitness), or all of it if the market has no incumbents.
+    Pairs that stop participating drop out. Renormalization is one division by the market totals
+    (plus the entrants' split when there are any), so every market sums to 1 for all markets and
+    replicas at once.
+    """
+    def __init__(self, speed: float = 0.5, entry_share: float = 0.05, batch_shape: Tuple[int, ...] = ()):
+        self.speed = float(speed)
+        self.entry_share = float(entry_share)
+        self.batch_shape = tuple(batch_shape)
+        self.keys = np.zeros(0, dtype=np.int64)  # company * n_nodes + node, sorted
+        self.shares = np.zeros(self.batch_shape + (0,))
+
+    def step(self, company_idx: np.ndarray, node_idx: np.ndarray, segment_of: np.ndarray, n_nodes: int,
+             fitness: np.ndarray, initial_weights: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Advances shares one year for the participating (company_idx[p], node_idx[p]) pairs.
+        segment_of maps company rows to segment numbers; fitness ((batch +) (n_pairs,)) follows the
+        given pair order, as does the result. On the first call shares start from initial_weights
+        within each market instead.
+        """
+        keys = np.asarray(company_idx, dtype=np.int64) * n_nodes + np.asarray(node_idx, dtype=np.int64)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        fitness = np.broadcast_to(np.asarray(fitness, dtype=float)[..., order], self.batch_shape + keys.shape)
+        company, node = np.divmod(keys, n_nodes)
+        market_ids, market = np.unique(np.asarray(segment_of, dtype=np.int64)[company] * n_nodes + node, return_inverse=True)
+        market = market.ravel()
+        n_markets = market_ids.size
+
+        if initial_weights is not None and self.keys.size == 0:
+            weights = np.maximum(np.broadcast_to(np.asarray(initial_weights, dtype=float)[..., order], fitness.shape), 0.0)
+            # Markets without any initial weight start out equally shared
+            weights = np.where(group_sum(weights, market, n_markets)[..., market] > 0, weights, 1.0)
+            shares = weights / group_sum(weights, market, n_markets)[..., market]
+        else:
+            # Carry last year's shares over to this year's pairs
+            if self.keys.size:
+                position = np.minimum(np.searchsorted(self.keys, keys), self.keys.size - 1)
+                previous = np.where(self.keys[position] == keys, self.shares[..., position], 0.0)
+            else:
+                previous = np.zeros(fitness.shape)
+            counts = np.bincount(market, minlength=n_markets)
+            shift = fitness - (group_sum(fitness, market, n_markets) / np.maximum(counts, 1))[..., market]
+            updated = previous * np.exp(self.speed * shift)
+            incumbent_total = group_sum(updated, market, n_markets)[..., market]
+
+            shares = np.divide(updated, incumbent_total, out=np.zeros_like(updated), where=incumbent_total > 0)
+
+            entrants = previous <= 0
+            if entrants.any():
+                logit = np.where(entrants, np.exp(shift), 0.0)
+                entrant_total = group_sum(logit, market, n_markets)[..., market]
+                entry = np.where(entrant_total > 0, np.where(incumbent_total > 0, self.entry_share, 1.0), 0.0)
+                choice = np.divide(logit, entrant_total, out=np.zeros_like(logit), where=entrant_total > 0)
+                shares = np.where(entrants, entry * choice, (1.0 - entry) * shares)
+
+        self.keys, self.shares = keys, shares
+        result = np.empty_like(shares)
+        result[..., order] = shares
+        return result
+
+    def reassign_rows(self, source: int, target: Optional[int], n_nodes: int):
+        """
+        Hands a company row's shares to another row (a merger; shares in markets both are in add
+        up) or drops them (target None, e.g. an exit). Rows are company slots, so a freed slot
+        must be cleared before it is reused.
+        """
+        company, node = np.divmod(self.keys, n_nodes)
+        moved = company == source
+        if not moved.any():
+            return
+        if target is None:
+            self.keys, self.shares = self.keys[~moved], self.shares[..., ~moved]
+            return
+        keys = np.where(moved, target * n_nodes + node, self.keys)
+        self.keys, position = np.unique(keys, return_inverse=True)
+        self.shares = group_sum(self.shares, position.ravel(), self.keys.size)
+
+    def segment_shares(self, n_companies: int, n_nodes: int, segment_of: np.ndarray, market_size: np.ndarray) -> np.ndarray:
+        """
+        Each company's share of its whole segment (batch + (n_companies,)), weighting nodes by
+        market_size (batch + (n_nodes,)) over the nodes where the segment is present.
+        """
+        segment_of = np.asarray(segment_of, dtype=np.int64)
+        company, node = np.divmod(self.keys, n_nodes)
+        size = np.asarray(market_size, dtype=float)[..., node]
+        volume = group_sum(self.shares * size, company, n_companies)
+        market_ids, first = np.unique(segment_of[company] * n_nodes + node, return_index=True)
+        n_segments = int(segment_of.max()) + 1 if segment_of.size else 0
+        segment_volume = group_sum(size[..., first], market_ids // n_nodes, n_segments)[..., segment_of]
+        return np.divide(volume, segment_volume, out=np.zeros_like(volume), where=segment_volume > 0)
+
+    def get_state(self) -> Dict[str, Any]:
+        return {'keys': self.keys.copy(), 'shares': self.shares.copy()}
+
+    def set_state(self, state: Dict[str, Any]):
+        self.keys = state['keys'].copy()
+        self.shares = state['shares'].copy()
+
+
+def market_share_inputs(companies: Sequence[Any], node_index: Dict[str, int], feature_sizes: Sequence[Optional[float]],
+                        global_params: Dict[str, Any]):
+    """
+    Builds participation pairs and fitness from company attributes. A company participates at a
+    node where it has capacity ('fab_capacity_kwpm_by_node') or that it targets ('current_node_id',
+    'node_roadmap'). Fitness is a weighted sum (FITNESS_WEIGHT_PARAMS) of
+        node leadership   -log2 of the smallest feature size the company participates at
+        capacity          the company's share of its market's capacity
+        price             -log of 'relative_price_index' (default 1.0)
+        resilience        'supply_chain_resilience' (default 0.5)
+    Returns (company_idx, node_idx, segment_of, fitness, initial_weights, segment_ids). Initial
+    weights are capacity in markets where anyone has capacity, the 'market_share' attribute elsewhere.
+    """
+    segment_ids = list(dict.fromkeys(company.get_attribute('company_type') for company in companies))
+    segment_of = np.array([segment_ids.index(company.get_attribute('company_type')) for company in companies], dtype=np.int64)
+    sizes = np.full(len(node_index), np.nan)
+    sizes[:len(feature_sizes)] = [size if size is not None else np.nan for size in feature_sizes]
+
+    company_idx: List[int] = []
+    node_idx: List[int] = []
+    capacity: List[float] = []
+    leadership = np.full(len(companies), np.nan)
+    price = np.zeros(len(companies))
+    resilience = np.zeros(len(companies))
+    base_share = np.zeros(len(companies))
+    for row, company in enumerate(companies):
+        nodes: Dict[int, float] = {}
+        fab_capacity = company.get_attribute('fab_capacity_kwpm_by_node')
+        if isinstance(fab_capacity, dict):
+            for node_id, value in fab_capacity.items():
+                if node_id in node_index and float(value) > 0:
+                    nodes[node_index[node_id]] = float(value)
+        for node_id in company_node_targets(company):
+            if node_id in node_index:
+                nodes.setdefault(node_index[node_id], 0.0)
+        company_idx.extend([row] * len(nodes))
+        node_idx.extend(nodes.keys())
+        capacity.extend(nodes.values())
+        node_sizes = sizes[list(nodes.keys())]
+        if np.isfinite(node_sizes).any():
+            leadership[row] = -np.log2(np.nanmin(node_sizes))
+        price[row] = -np.log(float(company.get_attribute('relative_price_index') or 1.0))
+        resilience[row] = float(company.get_attribute('supply_chain_resilience') or 0.5)
+        base_share[row] = float(company.get_attribute('market_share') or 0.0)
+    known = np.isfinite(leadership)
+    leadership = np.where(known, leadership, leadership[known].mean() if known.any() else 0.0)
+
+    company_idx = np.array(company_idx, dtype=np.int64)
+    node_idx = np.array(node_idx, dtype=np.int64)
+    capacity = np.array(capacity, dtype=float)
+    _, market = np.unique(segment_of[company_idx] * max(len(node_index), 1) + node_idx, return_inverse=True)
+    market_capacity = np.bincount(market.ravel(), weights=capacity)[market.ravel()]
+    capacity_share = np.divide(capacity, market_capacity, out=np.zeros_like(capacity), where=market_capacity > 0)
+
+    weight = {key: float(global_params.get(name, default)) for key, (name, default) in FITNESS_WEIGHT_PARAMS.items()}
+    fitness = (weight['leadership'] * leadership[company_idx] + weight['capacity'] * capacity_share
+               + weight['price'] * price[company_idx] + weight['resilience'] * resilience[company_idx])
+    initial_weights = np.where(market_capacity > 0, capacity, base_share[company_idx])
+    return company_idx, node_idx, segment_of, fitness, initial_weights, segment_ids
@@ -0,0 +1,103 @@
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def company_node_targets(company: Any) -> Tuple[str, ...]:
+    """Nodes a company works on: its 'current_node_id' followed by its 'node_roadmap' (duplicates dropped)."""
+    targets = [company.get_attribute('current_node_id')]
+    roadmap = company.get_attribute('node_roadmap')
+    if isinstance(roadmap, (list, tuple)):
+        targets.extend(roadmap)
+    return tuple(dict.fromkeys(node_id for node_id in targets if node_id is not None))
+
+
+def company_rd_spend(companies: Sequence[Any]) -> np.ndarray:
+    """R&D spend per company in billion USD: rd_intensity * revenue (0 where either is missing)."""
+    return np.array([float(c.get_attribute('rd_intensity') or 0.0) * float(c.get_attribute('revenue') or 0.0) / 1e9
+                     for c in companies])
+
+
+class InvertedNodeIndex:
+    """
+    Inverted index from technology nodes to the company rows that target them, stored as two
+    parallel arrays of (company row, node column) pairs. Per-node sums of any per-company quantity
+    are then one np.bincount over the pairs, i.e. linear in the number of companies rather than
+    nodes x companies. When companies migrate (their targets change) only their pairs are replaced.
+
+    Each pair carries weight 1 / (number of nodes the company targets), so a company's quantity
+    (e.g. its R&D budget) is split across its nodes rather than counted once per node.
+    """
+    def __init__(self, node_ids: Sequence[str]):
+        self.node_ids = list(node_ids)
+        self.node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.targets: List[Tuple[str, ...]] = []  # per company row, as last indexed
+        self.pair_company = np.zeros(0, dtype=np.int64)
+        self.pair_node = np.zeros(0, dtype=np.int64)
+        self.pair_weight = np.zeros(0)
+        self.rows_updated = 0
+
+    def refresh(self, companies: Sequence[Any]) -> np.ndarray:
+        """Re-indexes the companies whose targets changed since the last refresh; returns their rows."""
+        targets = [company_node_targets(company) for company in companies]
+        n_old = len(self.targets)
+        changed = [row for row in range(len(targets)) if row >= n_old or targets[row] != self.targets[row]]
+        removed = list(range(len(targets), n_old))
+        if changed or removed:
+            self.update_rows(changed + removed, [targets[row] for row in changed] + [()] * len(removed))
+            del self.targets[len(targets):]
+        return np.array(changed, dtype=np.int64)
+
+    def update_rows(self, rows: Sequence[int], targets: Sequence[Sequence[str]]):
+        """Replaces the pairs of the given company rows with pairs for their new target nodes."""
+        rows = np.asarray(rows, dtype=np.int64)
+        keep = ~np.isin(self.pair_company, rows)
+        new_company, new_node, new_weight = [], [], []
+        for row, row_targets in zip(rows, targets):
+            row_targets = tuple(row_targets)
+            while len(self.targets) <= row:
+                self.targets.append(())
+            self.targets[row] = row_targets
+            columns = [self._column(node_id) for node_id in row_targets]
+            new_company.extend([row] * len(columns))
+            new_node.extend(columns)
+            if columns:
+                new_weight.extend([1.0 / len(columns)] * len(columns))
+        self.pair_company = np.concatenate([self.pair_company[keep], np.asarray(new_company, dtype=np.int64)])
+        self.pair_node = np.concatenate([self.pair_node[keep], np.asarray(new_node, dtype=np.int64)])
+        self.pair_weight = np.concatenate([self.pair_weight[keep], np.asarray(new_weight, dtype=float)])
+        self.rows_updated += rows.size
+
+    def _column(self, node_id: str) -> int:
+        if node_id not in self.node_index:
+            self.node_index[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+        return self.node_index[node_id]
+
+    def node_sum(self, company_values: np.ndarray) -> np.ndarray:
+        """Per-node sum of a per-company quantity (shape batch + (n_companies,)), split over each company's nodes."""
+        values = np.asarray(company_values, dtype=float)
+        contributions = values[..., self.pair_company] * self.pair_weight
+        if values.ndim == 1:
+            return np.bincount(self.pair_node, weights=contributions, minlength=len(self.node_ids))
+        flat = contributions.reshape(-1, self.pair_node.size)
+        offsets = (np.arange(flat.shape[0]) * len(self.node_ids))[:, np.newaxis]
+        sums = np.bincount((self.pair_node + offsets).ravel(), weights=flat.ravel(), minlength=flat.shape[0] * len(self.node_ids))
+        return sums.reshape(values.shape[:-1] + (len(self.node_ids),))
+
+    def companies_for(self, node_id: str) -> np.ndarray:
+        """Company rows targeting a node."""
+        column = self.node_index.get(node_id)
+        return np.zeros(0, dtype=np.int64) if column is None else np.unique(self.pair_company[self.pair_node == column])
+
+    def get_state(self) -> Dict[str, Any]:
+        return {'node_ids': list(self.node_ids), 'targets': list(self.targets), 'pair_company': self.pair_company.copy(),
+                'pair_node': self.pair_node.copy(), 'pair_weight': self.pair_weight.copy()}
+
+    def set_state(self, state: Dict[str, Any]):
+        self.node_ids = list(state['node_ids'])
+        self.node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.targets = list(state['targets'])
+        self.pair_company = state['pair_company'].copy()
+        self.pair_node = state['pair_node'].copy()
+        self.pair_weight = state['pair_weight'].copy()
@@ -0,0 +1,180 @@
+from typing import List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def adjacency_by_feature_size(feature_sizes: Sequence[Optional[float]]) -> np.ndarray:
+    """
+    Symmetric 0/1 adjacency of nodes that are neighbours when ordered by feature size (nodes
+    without a feature size keep their declaration order after the sized ones). Demand
+    substitutes between adjacent nodes only, e.g. 5nm <-> 3nm, not 28nm <-> 3nm.
+    """
+    n = len(feature_sizes)
+    order = sorted(range(n), key=lambda i: (feature_sizes[i] is None, feature_sizes[i] or 0.0, i))
+    adjacency = np.zeros((n, n))
+    for a, b in zip(order[:-1], order[1:]):
+        adjacency[a, b] = adjacency[b, a] = 1.0
+    return adjacency
+
+
+class ClearingPriceSolver:
+    """
+    Finds per-node market-clearing wafer prices under elastic demand and capacity constraints.
+
+    Prices are expressed as log-ratios x = log(p / p_ref) to a reference price per node. Demand
+    for node i at prices x is
+        D_i(x) = D_ref_i * exp(-e_i * x_i + s * sum_j A_ij (x_j - x_i))
+    with own-price elasticity e_i > 0 and substitution elasticity s between adjacent nodes A
+    (e and s may carry the leading batch axes too, e.g. one value per replica).
+    The clearing condition log D_i(x) = log capacity_i is solved for all nodes (and any leading
+    batch axes, e.g. ensemble replicas) at once with a projected Newton iteration. Prices are
+    bounded to [floor, ceiling]; a node whose demand is below capacity even at the floor stays at
+    the floor, and one whose demand exceeds capacity even at the ceiling stays at the ceiling (the
+    remaining shortage is rationed by allocation). Steps that do not reduce the largest violation
+    of these conditions are bisected. Warm-started from the previous year's prices, it typically
+    converges in two or three iterations.
+    """
+    def __init__(self, elasticity: np.ndarray, adjacency: Optional[np.ndarray] = None,
+                 substitution_elasticity: Any = 0.0, tolerance: float = 1e-8, max_iterations: int = 50, max_halvings: int = 8):
+        self.elasticity = np.abs(np.asarray(elasticity, dtype=float))
+        n = self.elasticity.shape[-1]
+        self.adjacency = np.zeros((n, n)) if adjacency is None else np.asarray(adjacency, dtype=float)
+        self.substitution = np.asarray(substitution_elasticity, dtype=float)
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.max_halvings = max_halvings
+        self.last_iterations = 0
+        degree = self.adjacency.sum(axis=-1)
+        # d log D / d x: constant for this demand form
+        substitution = self.substitution[..., np.newaxis]
+        self.jacobian = substitution[..., np.newaxis] * self.adjacency \
+            - np.eye(n) * (self.elasticity + substitution * degree)[..., np.newaxis]
+
+    def log_demand(self, x: np.ndarray, log_reference_demand: np.ndarray) -> np.ndarray:
+        return log_reference_demand + np.einsum('...ij,...j->...i', self.jacobian, x)
+
+    def _kkt_residual(self, x, log_demand_ref, log_capacity, lower, upper, pinned):
+        # Excess (log) demand; decreasing in the node's own price. A node is fixed when it sits at
+        # a bound that its residual pushes against.
+        residual = self.log_demand(x, log_demand_ref) - log_capacity
+        fixed = pinned | ((x <= lower) & (residual <= 0)) | ((x >= upper) & (residual >= 0))
+        merit = np.max(np.abs(np.where(fixed, 0.0, residual)), axis=-1, initial=0.0)
+        return residual, fixed, merit
+
+    def solve(self, reference_demand: np.ndarray, capacity: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+              x0: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Returns clearing log price ratios, shape batch + (n_nodes,). reference_demand is the demand
+        at the reference prices; lower/upper bound x. x0 warm-starts the iteration (e.g. last
+        year's solution). Nodes without demand go to the floor, nodes without capacity to the ceiling.
+        """
+        demand = np.asarray(reference_demand, dtype=float)
+        capacity = np.broadcast_to(np.asarray(capacity, dtype=float), demand.shape)
+        lower = np.broadcast_to(np.asarray(lower, dtype=float), demand.shape)
+        upper = np.maximum(np.broadcast_to(np.asarray(upper, dtype=float), demand.shape), lower)
+
+        no_demand = demand <= 0
+        no_capacity = (capacity <= 0) & ~no_demand
+        log_demand_ref = np.log(np.where(no_demand, 1.0, demand))
+        log_capacity = np.log(np.where(capacity <= 0, 1.0, capacity))
+
+        x = np.zeros(demand.shape) if x0 is None else np.array(np.broadcast_to(x0, demand.shape), dtype=float)
+        x = np.where(no_demand, lower, np.where(no_capacity, upper, np.clip(x, lower, upper)))
+        pinned = no_demand | no_capacity
+
+        n = demand.shape[-1]
+        identity = np.eye(n)
+        residual, fixed, merit = self._kkt_residual(x, log_demand_ref, log_capacity, lower, upper, pinned)
+        self.last_iterations = 0
+        for iteration in range(self.max_iterations):
+            self.last_iterations = iteration
+            if np.max(merit, initial=0.0) < self.tolerance:
+                break
+            # Newton step on the free nodes: fixed rows/columns are replaced by the identity
+            free = ~fixed
+            free_pair = free[..., :, np.newaxis] & free[..., np.newaxis, :]
+            jacobian = np.where(free_pair, self.jacobian, identity)
+            step = np.linalg.solve(jacobian, -np.where(free, residual, 0.0)[..., np.newaxis])[..., 0]
+            step = np.where(np.isfinite(step), step, 0.5 * (lower + upper) - x)
+
+            # Safeguard: halve the step (bisection on the step length) wherever it does not reduce
+            # the largest KKT violation of that batch element
+            candidate = np.clip(x + step, lower, upper)
+            new_residual, new_fixed, new_merit = self._kkt_residual(candidate, log_demand_ref, log_capacity, lower, upper, pinned)
+            for _ in range(self.max_halvings):
+                worse = (new_merit >= merit) & (merit >= self.tolerance)
+                if not worse.any():
+                    break
+                step = np.where(worse[..., np.newaxis], 0.5 * step, step)
+                candidate = np.clip(x + step, lower, upper)
+                new_residual, new_fixed, new_merit = self._kkt_residual(candidate, log_demand_ref, log_capacity, lower, upper, pinned)
+            x, residual, fixed, merit = candidate, new_residual, new_fixed, new_merit
+        return x
+
+    def adjust(self, reference_demand: np.ndarray, capacity: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+               log_price_ratio: np.ndarray, speed: Any = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        One year of price adjustment: prices move from log_price_ratio towards the clearing prices
+        by the fraction speed (1.0 = clear fully). Returns the new log price ratios and the demand
+        at those prices (0 for nodes without reference demand).
+        """
+        clearing = self.solve(reference_demand, capacity, lower, upper, x0=log_price_ratio)
+        log_price_ratio = log_price_ratio + speed * (clearing - log_price_ratio)
+        demand = np.asarray(reference_demand, dtype=float)
+        demand_at_price = np.where(demand > 0, np.exp(self.log_demand(
+            log_price_ratio, np.log(np.where(demand > 0, demand, 1.0)))), 0.0)
+        return log_price_ratio, demand_at_price
+
+
+def node_reference_prices(tech_nodes: Sequence[Any]) -> np.ndarray:
+    """Reference wafer price per node: average_price_per_wafer_usd, falling back to cost_per_wafer."""
+    prices = []
+    for node in tech_nodes:
+        price = node.get_attribute('average_price_per_wafer_usd')
+        if price is None:
+            price = node.get_attribute('cost_per_wafer')
+        prices.append(float(price) if price is not None else np.nan)
+    return np.array(prices)
+
+
+def node_feature_sizes(tech_nodes: Sequence[Any]) -> List[Optional[float]]:
+    sizes = []
+    for node in tech_nodes:
+        size = node.get_attribute('feature_size_nm')
+        if size is None:
+            digits = ''.join(ch if ch.isdigit() or ch == '.' else ' ' for ch in node.model_id).split()
+            size = digits[0] if digits else None
+        try:
+            sizes.append(float(size) if size is not None else None)
+        except ValueError:
+            sizes.append(None)
+    return sizes
+
+
+def node_elasticities(tech_nodes: Sequence[Any], default: float) -> np.ndarray:
+    values = [node.get_attribute('price_elasticity_of_demand') for node in tech_nodes]
+    return np.array([abs(float(v)) if v is not None else abs(default) for v in values])
+
+
+def node_cost_floors(tech_nodes: Sequence[Any], reference_prices: np.ndarray) -> np.ndarray:
+    """
+    Each node's cost_per_wafer as a multiple of its reference price (0 where either is unknown).
+    Worked out once with the reference prices, so the price floor does not move when the
+    learning curve lowers costs or the clearing step writes prices.
+    """
+    floors = np.zeros(reference_prices.shape)
+    for i, node in enumerate(tech_nodes):
+        cost = node.get_attribute('cost_per_wafer')
+        if cost is not None and reference_prices[i] > 0:
+            floors[i] = float(cost) / reference_prices[i]
+    return floors
+
+
+def price_bounds(cost_floors: np.ndarray, floor_multiple: Any = 0.3, ceiling_multiple: Any = 5.0):
+    """
+    Log-ratio bounds: [max(floor multiple, cost floor), ceiling multiple] of the reference price.
+    The multiples may be arrays broadcasting against cost_floors (e.g. one value per replica).
+    """
+    floor = np.maximum(floor_multiple, cost_floors)
+    ceiling = np.maximum(ceiling_multiple, floor)
+    return np.log(floor), np.log(ceiling)
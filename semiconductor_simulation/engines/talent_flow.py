@@ -0,0 +1,192 @@
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from scipy import sparse
+except ImportError:  # scipy is optional; the migration product then falls back to np.bincount
+    sparse = None
+
+from semiconductor_simulation.engines.market_share import group_sum
+
+# Skill tiers (in promotion order) with their share of a region's initial engineers and yearly
+# mobility (fraction leaving an average region), attrition and promotion to the next tier.
+# Overridable per tier through the 'talent_tiers' global parameter.
+DEFAULT_TALENT_TIERS = {
+    'entry': {'share': 0.5, 'mobility': 0.04, 'attrition': 0.02, 'promotion': 0.08},
+    'experienced': {'share': 0.35, 'mobility': 0.03, 'attrition': 0.02, 'promotion': 0.04},
+    'expert': {'share': 0.15, 'mobility': 0.02, 'attrition': 0.04, 'promotion': 0.0},
+}
+
+# Global parameters (and defaults) weighting the features regional attractiveness is built from
+ATTRACTIVENESS_WEIGHT_PARAMS = {
+    'wage': ('talent_weight_wage', 1.0),
+    'stability': ('talent_weight_stability', 1.0),
+    'availability': ('talent_weight_availability', 0.5),
+    'policy': ('talent_weight_policy', 0.5),
+    'cluster': ('talent_weight_cluster', 0.5),
+}
+
+TALENT_AVAILABILITY_SCORES = {'low': 0.0, 'medium': 0.5, 'high': 1.0}
+TALENT_POLICY_TYPES = ('TalentDevelopment', 'InvestmentIncentive')
+EARTH_RADIUS_KM = 6371.0
+
+
+def talent_tiers(global_params: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """DEFAULT_TALENT_TIERS with the per-tier overrides of the 'talent_tiers' global parameter."""
+    overrides = global_params.get('talent_tiers') or {}
+    tiers = {name: dict(values, **overrides.get(name, {})) for name, values in DEFAULT_TALENT_TIERS.items()}
+    for name, values in overrides.items():
+        if name not in tiers:
+            tiers[name] = dict({'share': 0.0, 'mobility': 0.0, 'attrition': 0.0, 'promotion': 0.0}, **values)
+    return tiers
+
+
+def haversine_km(lat_a: np.ndarray, lon_a: np.ndarray, lat_b: np.ndarray, lon_b: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km between (broadcast) coordinate arrays given in degrees."""
+    lat_a, lon_a, lat_b, lon_b = (np.radians(np.asarray(x, dtype=float)) for x in (lat_a, lon_a, lat_b, lon_b))
+    h = np.sin((lat_b - lat_a) / 2) ** 2 + np.cos(lat_a) * np.cos(lat_b) * np.sin((lon_b - lon_a) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def migration_candidates(n_regions: int, latitude: Optional[np.ndarray] = None, longitude: Optional[np.ndarray] = None,
+                         n_neighbours: int = 10, hubs: Sequence[int] = (), chunk_size: int = 512) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sparsity pattern of the migration matrix: (origin, destination, distance_km) arrays. Each
+    region's destinations are its n_neighbours nearest regions plus the hubs (e.g. the largest
+    clusters), so the pattern has O(n_regions x (n_neighbours + n_hubs)) entries. Without
+    coordinates (or with few regions) every other region is a destination.
+    """
+    n = int(n_regions)
+    located = (latitude is not None and longitude is not None
+               and np.isfinite(latitude).all() and np.isfinite(longitude).all())
+    if not located or n <= n_neighbours + 1:
+        origin, destination = np.nonzero(~np.eye(n, dtype=bool))
+        if not located:
+            return origin, destination, np.zeros(origin.size)
+        return origin, destination, haversine_km(latitude[origin], longitude[origin], latitude[destination], longitude[destination])
+
+    origins, destinations = [], []
+    hubs = np.asarray(list(hubs), dtype=np.int64)
+    for start in range(0, n, chunk_size):
+        rows = np.arange(start, min(start + chunk_size, n))
+        distance = haversine_km(latitude[rows, np.newaxis], longitude[rows, np.newaxis], latitude[np.newaxis, :], longitude[np.newaxis, :])
+        distance[np.arange(rows.size), rows] = np.inf
+        nearest = np.argpartition(distance, n_neighbours - 1, axis=1)[:, :n_neighbours]
+        if hubs.size:
+            nearest = np.concatenate([nearest, np.broadcast_to(hubs, (rows.size, hubs.size))], axis=1)
+        origins.append(np.repeat(rows, nearest.shape[1]))
+        destinations.append(nearest.ravel())
+    # Drop duplicates (hubs among the neighbours) and self-loops (a hub's own row)
+    keys = np.unique(np.concatenate(origins) * n + np.concatenate(destinations))
+    origin, destination = np.divmod(keys, n)
+    keep = origin != destination
+    origin, destination = origin[keep], destination[keep]
+    return origin, destination, haversine_km(latitude[origin], longitude[origin], latitude[destination], longitude[destination])
+
+
+class TalentMigrationEngine:
+    """
+    Yearly flows of engineers between regions, per skill tier.
+
+    Engineers are held as batch_shape + (n_tiers, n_regions). Each year a transition matrix Q over
+    the sparse (origin, destination) pattern from migration_candidates() is built from regional
+    attractiveness a:
+        leaving rate of origin i   mobility[tier] * 2 * sigmoid(-(a_i - mean a))
+        choice of destination j    softmax over i's destinations of
+                                   sensitivity * a_j - distance_ij / distance_scale_km
+    and migration is one sparse product Q @ engineers for all tiers (and replicas) at once. It
+    is followed by attrition, promotion to the next tier and graduate inflow into the first tier.
+    """
+    def __init__(self, origin: np.ndarray, destination: np.ndarray, distance_km: np.ndarray, n_regions: int,
+                 mobility: Sequence[float], attrition: Sequence[float], promotion: Sequence[float],
+                 sensitivity: float = 1.0, distance_scale_km: float = 2000.0):
+        self.origin = np.asarray(origin, dtype=np.int64)
+        self.destination = np.asarray(destination, dtype=np.int64)
+        self.distance_km = np.asarray(distance_km, dtype=float)
+        self.n_regions = int(n_regions)
+        self.mobility = np.asarray(mobility, dtype=float)
+        self.attrition = np.asarray(attrition, dtype=float)
+        self.promotion = np.asarray(promotion, dtype=float)
+        self.sensitivity = float(sensitivity)
+        self.distance_scale_km = float(distance_scale_km)
+
+    def transition(self, attractiveness: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Leaving rate per region (before tier mobility) and the flow weight of every pattern entry."""
+        a = np.asarray(attractiveness, dtype=float)
+        leaving = 2.0 / (1.0 + np.exp(a - a.mean())) if a.size else a
+        utility = self.sensitivity * a[self.destination] - self.distance_km / self.distance_scale_km
+        # Softmax per origin, shifted by the origin's best utility for stability
+        best = np.full(self.n_regions, -np.inf)
+        np.maximum.at(best, self.origin, utility)
+        weight = np.exp(utility - best[self.origin])
+        total = np.bincount(self.origin, weights=weight, minlength=self.n_regions)
+        choice = weight / total[self.origin]
+        has_destinations = np.bincount(self.origin, minlength=self.n_regions) > 0
+        return np.where(has_destinations, leaving, 0.0), leaving[self.origin] * choice
+
+    def step(self, engineers: np.ndarray, attractiveness: np.ndarray, graduates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Advances engineers (batch + (n_tiers, n_regions)) one year; graduates (batch + (n_regions,))
+        join the first tier. Returns the new engineers and the net migration per tier and region.
+        """
+        engineers = np.asarray(engineers, dtype=float)
+        leaving, flow = self.transition(attractiveness)
+        movers = engineers * self.mobility[:, np.newaxis]
+        if sparse is not None:
+            q = sparse.csr_matrix((flow, (self.destination, self.origin)), shape=(self.n_regions, self.n_regions))
+            flat = movers.reshape(-1, self.n_regions)
+            inflow = (q @ flat.T).T.reshape(engineers.shape)
+        else:
+            inflow = group_sum(movers[..., self.origin] * flow, self.destination, self.n_regions)
+        net_migration = inflow - movers * leaving
+        engineers = (engineers + net_migration) * (1.0 - self.attrition[:, np.newaxis])
+
+        promoted = engineers * self.promotion[:, np.newaxis]
+        promoted[..., -1, :] = 0.0  # the top tier has nowhere to go
+        engineers = engineers - promoted
+        engineers[..., 1:, :] += promoted[..., :-1, :]
+        engineers[..., 0, :] += graduates
+        return engineers, net_migration
+
+
+def regional_attractiveness(regions: Sequence[Any], policies: Sequence[Any], current_year: int,
+                            global_params: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Attractiveness of each region to engineers, a weighted sum (ATTRACTIVENESS_WEIGHT_PARAMS) of
+        wage          log of 'labor_cost' relative to the median region
+        stability     'political_stability' (default 0.5)
+        availability  'talent_availability' (low/medium/high or a 0-1 score), a cluster effect
+        policy        number of active TALENT_POLICY_TYPES policies targeting the region
+        cluster       'cluster_strength_score' (default 0)
+    Also returns the extra graduates per region from active TalentDevelopment policies
+    ('talent_increase_per_year').
+    """
+    index = {region.model_id: i for i, region in enumerate(regions)}
+    wages = np.array([float(region.get_attribute('labor_cost') or np.nan) for region in regions])
+    known = np.isfinite(wages) & (wages > 0)
+    log_wage = np.where(known, np.log(np.where(known, wages, 1.0)), 0.0)
+    if known.any():
+        log_wage = np.where(known, log_wage - np.median(log_wage[known]), 0.0)
+    stability = np.array([float(0.5 if region.get_attribute('political_stability') is None else region.get_attribute('political_stability'))
+                          for region in regions])
+    cluster = np.array([float(region.get_attribute('cluster_strength_score') or 0.0) for region in regions])
+    availability = np.array([TALENT_AVAILABILITY_SCORES.get(value, 0.5) if isinstance(value, str) or value is None else float(value)
+                             for value in (region.get_attribute('talent_availability') for region in regions)])
+
+    policy_count = np.zeros(len(regions))
+    extra_graduates = np.zeros(len(regions))
+    for policy in policies:
+        if policy.get_attribute('policy_type') not in TALENT_POLICY_TYPES or not policy.is_policy_active(current_year):
+            continue
+        targets = policy.get_attribute('target_entity_ids') or policy.get_attribute('target_entities') or []
+        rows = [index[target] for target in targets if target in index]
+        policy_count[rows] += 1
+        if policy.get_attribute('policy_type') == 'TalentDevelopment':
+            extra_graduates[rows] += float(policy.get_attribute('talent_increase_per_year') or 0.0)
+
+    weight = {key: float(global_params.get(name, default)) for key, (name, default) in ATTRACTIVENESS_WEIGHT_PARAMS.items()}
+    attractiveness = (weight['wage'] * log_wage + weight['stability'] * stability
+                      + weight['availability'] * availability + weight['policy'] * policy_count
+                      + weight['cluster'] * cluster)
+    return attractiveness, extra_graduates
@@ -119,7 +119,7 @@ if __name__ == "__main__":
                     "end_year": 2026, # Shortened for quick test
                     "global_parameters": {
                         "talent_growth_rate": 0.02, 
-                        "price_sensitivity_to_gap": 0.005, 
+                        "node_substitution_elasticity": 0.3,
                         "rd_effectiveness_factor": 0.05,
                         "us_chips_act_simulation": {
                             "annual_investment_billion": 5,
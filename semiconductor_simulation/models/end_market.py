@@ -9,6 +9,10 @@ class EndMarketModel(BaseModel):
     annual_growth_rate_kwpm, and potentially market-specific attributes like 
     training_inference_chip_demand_ratio for AI, bev_semiconductor_content_usd_per_vehicle 
     for Automotive, etc.
+    Projection drivers (see engines.demand_projection): node_migration_rate, and the adoption
+    S-curve adoption_saturation_multiple, adoption_midpoint_year, adoption_steepness (e.g. for AI
+    accelerators or software-defined vehicles). Without base_demand_wafer_starts_kwpm, base demand
+    is total_wafer_demand_kwpm split by node_demand_split_percentage.
     """
     def __init__(self, model_id: str, name: str, **initial_attributes: Any):
         super().__init__(model_id, name, initial_attributes)
@@ -38,23 +42,11 @@ class EndMarketModel(BaseModel):
 
     def update_state(self, current_year: int, context: Dict[str, Any]):
         """
-        Update end market's state. Example: Demand grows based on projections and drivers.
-        Logic driven by CapacityDemandModule.
+        Update end market's state. Demand grows based on projections and drivers.
+        The projection itself (growth, adoption S-curve, node migration) is computed for all markets at
+        once by the demand projection engine that CapacityDemandModule publishes in the context; the
+        market pulls its slice for the year into 'demand_wafer_starts_kwpm'.
         """
-        # print(f"Updating state for End Market: {self.name} in year {current_year}")
-        # Placeholder: simple demand growth in USD
-        # current_demand_usd = self.get_attribute('total_semiconductor_demand_billion_usd')
-        # growth_rate_usd = self.get_attribute('annual_growth_rate_demand_usd')
-        # if current_demand_usd is not None and growth_rate_usd is not None:
-        #     self.set_attribute('total_semiconductor_demand_billion_usd', current_demand_usd * (1 + growth_rate_usd), current_year)
-
-        # Placeholder: simple demand growth in KWPM
-        # current_demand_kwpm = self.get_attribute('base_demand_wafer_starts_kwpm')
-        # growth_rates_kwpm = self.get_attribute('annual_growth_rate_kwpm')
-        # if isinstance(current_demand_kwpm, dict) and isinstance(growth_rates_kwpm, dict):
-        #     updated_demand_kwpm = {**current_demand_kwpm}
-        #     for node, demand in current_demand_kwpm.items():
-        #         rate = growth_rates_kwpm.get(node, 0.0)
-        #         updated_demand_kwpm[node] = demand * (1 + rate)
-        #     self.set_attribute('base_demand_wafer_starts_kwpm', updated_demand_kwpm, current_year)
-        pass # Actual logic will be complex and driven by modules 
\ No newline at end of file
+        projection = context.get('demand_projection')
+        if projection is not None and self.model_id in projection.market_index:
+            self.set_attribute('demand_wafer_starts_kwpm', projection.market_demand(self.model_id, current_year), current_year)
@@ -5,6 +5,8 @@ from .tech_evolution_module import TechEvolutionModule
 from .industry_structure_module import IndustryStructureModule
 from .consulting_market_module import ConsultingMarketModule
 from .national_ecosystem_module import NationalEcosystemModule
+from .industry_events_module import IndustryEventsModule
+from .geopolitical_shock_module import GeopoliticalShockModule
 
 __all__ = [
     'GeopoliticalModule', 
@@ -12,5 +14,7 @@ __all__ = [
     'TechEvolutionModule', 
     'IndustryStructureModule',
     'ConsultingMarketModule',
-    'NationalEcosystemModule'
+    'NationalEcosystemModule',
+    'IndustryEventsModule',
+    'GeopoliticalShockModule'
 ] 
\ No newline at end of file
@@ -1,6 +1,21 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+import numpy as np
 from semiconductor_simulation.core.base_module import BaseModule
 from semiconductor_simulation.core.base_model import BaseModel
+from semiconductor_simulation.core.context_bus import ContextBus
+from semiconductor_simulation.core.entity_store import store_changes
+from semiconductor_simulation.engines.fab_pipeline import (
+    FabPipeline, DEFAULT_RAMP_PROFILE, capacity_matrix, add_capacity_to_models, node_target_matrix, fab_investment
+)
+from semiconductor_simulation.engines.allocation import CapacityAllocator, allocation_inputs, allocation_signature
+from semiconductor_simulation.engines.demand_projection import (
+    DemandProjectionEngine, DRIVER_ATTRIBUTES, market_drivers, driver_signature
+)
+from semiconductor_simulation.engines.price_solver import (
+    ClearingPriceSolver, adjacency_by_feature_size, node_reference_prices, node_feature_sizes,
+    node_elasticities, node_cost_floors, price_bounds
+)
+from semiconductor_simulation.engines.learning_curve import accumulate_output
 # from semiconductor_simulation.models.company import CompanyModel
 # from semiconductor_simulation.models.technology_node import TechnologyNodeModel
 # from semiconductor_simulation.models.end_market import EndMarketModel
@@ -11,44 +26,103 @@ class CapacityDemandModule(BaseModule):
     It affects pricing, investment decisions, and capacity allocation.
     Operates on CompanyModels (foundries, IDMs), TechnologyNodeModels, and EndMarketModels.
     """
+    memoizable = True
+    memo_inputs = {
+        'end_markets': list(DRIVER_ATTRIBUTES) + ['allocation_priority', 'long_term_agreements',
+                                                  'allowed_supplier_regions', 'restricted_supplier_regions'],
+        'companies': ['company_type', 'region_id', 'fab_capacity_kwpm_by_node', 'capex_committed_billion_usd'],
+        'technology_nodes': ['average_price_per_wafer_usd', 'cost_per_wafer', 'price_elasticity_of_demand',
+                             'feature_size_nm', 'construction_lag_years', 'fab_cost_billion_usd_per_kwpm',
+                             'cumulative_wafer_output_kwpm_years', 'year_commercialized'],
+    }
+    memo_params = ['default_node_migration_rate', 'default_production_history_years', 'default_price_elasticity_of_demand', 'node_substitution_elasticity', 'price_adjustment_speed',
+                   'price_floor_multiple', 'price_ceiling_multiple', 'capacity_investment_response',
+                   'fab_construction_lag_years', 'fab_cost_billion_usd_per_kwpm', 'fab_ramp_profile']
+    memo_outputs = ['technology_nodes', 'companies', 'end_markets']
+    # Per technology node (labelled by node id), published every year
+    publishes = ['node_demand_kwpm', 'node_capacity_kwpm', 'node_clearing_demand_kwpm',
+                 'node_supply_demand_gap_kwpm', 'node_price_usd']
+
     def __init__(self, module_id: str, name: str = "Capacity-Demand Balancing Module"):
         super().__init__(module_id, name)
         self.companies: List[BaseModel] = []
         self.tech_nodes: List[BaseModel] = []
         self.end_markets: List[BaseModel] = []
+        self.fab_pipeline: Optional[FabPipeline] = None  # Created on the first step (needs the start year)
+        self.node_ids: List[str] = []
+        # Market-clearing prices: solver, reference prices, cost floors and last year's log price ratios (warm start)
+        self.price_solver: Optional[ClearingPriceSolver] = None
+        self.reference_prices: Optional[np.ndarray] = None
+        self.cost_floors: Optional[np.ndarray] = None
+        self.log_price_ratio: Optional[np.ndarray] = None
+        self.allocator: Optional[CapacityAllocator] = None
+        self.allocator_signature = ''  # allocation_signature() the allocator was built from
+        self.suppliers: List[BaseModel] = []
+        self.demand_engine: Optional[DemandProjectionEngine] = None
+        self.driver_signatures: List[str] = []
+        self.base_signatures: List[str] = []
+        self.entity_generation = 0  # Generation of the company store last synced with
 
     def initialize(self, models: Dict[str, List[BaseModel]], global_params: Dict[str, Any]):
         """
         Store references to relevant models.
         """
         self.companies = models.get('companies', [])
-        self.tech_nodes = models.get('tech_nodes', [])
+        # Scenario files (and SimulationManager) use 'technology_nodes'; 'tech_nodes' is kept for older configs
+        self.tech_nodes = models.get('technology_nodes', models.get('tech_nodes', []))
         self.end_markets = models.get('end_markets', [])
+        # Node axis shared by the engines: declared technology nodes plus any node holding capacity or demand
+        node_ids = [node.model_id for node in self.tech_nodes]
+        for company in self.companies:
+            fab_capacity = company.get_attribute('fab_capacity_kwpm_by_node')
+            if isinstance(fab_capacity, dict):
+                node_ids.extend(fab_capacity.keys())
+        for market in self.end_markets:
+            for attribute_name in ('base_demand_wafer_starts_kwpm', 'node_demand_split_percentage'):
+                demand = market.get_attribute(attribute_name)
+                if isinstance(demand, dict):
+                    node_ids.extend(demand.keys())
+        self.node_ids = list(dict.fromkeys(node_ids))
+        self.fab_pipeline = None
+        self.price_solver = None
+        self.reference_prices = None
+        self.cost_floors = None
+        self.log_price_ratio = None
+        self.allocator = None
+        self.allocator_signature = ''
+        self.demand_engine = None
+        self.driver_signatures = []
+        self.base_signatures = []
+        self.entity_generation = getattr(self.companies, 'generation', 0)
+        self.suppliers = [c for c in self.companies if c.get_attribute('company_type') in ["Foundry", "IDM"]]
         # print(f"{self.name} initialized with {len(self.companies)} companies, "
         #       f"{len(self.tech_nodes)} tech_nodes, {len(self.end_markets)} end_markets.")
 
     def execute_year_step(self, current_year: int, context: Dict[str, Any]):
         """
         Apply capacity-demand balancing logic for the current year.
-        1. Aggregate total demand per node from EndMarketModels.
+        1. Project end-market demand for the year and aggregate it per node.
         2. Aggregate total supply per node from CompanyModels (Foundries, IDMs).
         3. Calculate supply-demand gap per node.
-        4. Adjust prices on TechnologyNodeModels based on gap (simplified).
+        4. Set node prices to the market-clearing prices under elastic demand and capacity.
         5. Influence company investment decisions (future capacity) based on gap and profitability (simplified).
-        6. Allocate available capacity to customers/end-markets (highly complex, placeholder).
+        6. Allocate capacity by node to end markets (priorities, LTAs, regional restrictions).
         """
         print(f"Executing {self.name} for year {current_year}")
+        global_params = context.get('global_parameters', {})
+        if self.fab_pipeline is None:
+            self.fab_pipeline = FabPipeline([c.model_id for c in self.companies], self.node_ids, start_period=current_year)
+        self._sync_companies()
 
-        # --- 1. Aggregate total demand per node ---
-        total_demand_per_node_kwpm: Dict[str, float] = {}
-        for market in self.end_markets:
-            # Assume market.attributes['base_demand_wafer_starts_kwpm'] is like {'3nm': 20, '5nm': 30}
-            # Assume market.attributes['node_demand_split_percentage'] for $ demand conversion if needed
-            market_demand_kwpm = market.get_attribute('base_demand_wafer_starts_kwpm')
-            if isinstance(market_demand_kwpm, dict):
-                for node_id, demand in market_demand_kwpm.items():
-                    total_demand_per_node_kwpm[node_id] = total_demand_per_node_kwpm.get(node_id, 0) + float(demand)
-        # print(f"  {self.name}: Total demand per node (KWPM): {total_demand_per_node_kwpm}")
+        # --- 0. Bring fab projects completing this year online (one vectorized release) ---
+        builders, released_kwpm = self.fab_pipeline.release(current_year)
+        if released_kwpm.any():
+            add_capacity_to_models(self.companies, 'fab_capacity_kwpm_by_node', self.node_ids, released_kwpm, current_year, builders)
+
+        # --- 1. Project end-market demand (markets pull their slice) and aggregate per node ---
+        market_demand = self._project_demand(current_year, context)
+        node_totals = market_demand.sum(axis=0)
+        total_demand_per_node_kwpm: Dict[str, float] = {self.node_ids[n]: float(node_totals[n]) for n in np.nonzero(node_totals)[0]}
 
         # --- 2. Aggregate total supply per node ---
         total_supply_per_node_kwpm: Dict[str, float] = {}
@@ -62,44 +136,254 @@ class CapacityDemandModule(BaseModule):
                         total_supply_per_node_kwpm[node_id] = total_supply_per_node_kwpm.get(node_id, 0) + float(capacity)
         # print(f"  {self.name}: Total supply per node (KWPM): {total_supply_per_node_kwpm}")
 
-        # --- 3. Calculate supply-demand gap per node ---
-        supply_demand_gap_kwpm: Dict[str, float] = {}
-        all_nodes = set(total_demand_per_node_kwpm.keys()) | set(total_supply_per_node_kwpm.keys())
-        for node_id in all_nodes:
-            demand = total_demand_per_node_kwpm.get(node_id, 0)
-            supply = total_supply_per_node_kwpm.get(node_id, 0)
-            supply_demand_gap_kwpm[node_id] = supply - demand
-        # print(f"  {self.name}: Supply-Demand Gap per node (KWPM): {supply_demand_gap_kwpm}")
+        # --- 3./4. Clear each node's market: prices move until elastic demand meets capacity ---
+        demand_response = self._clear_prices(current_year, total_demand_per_node_kwpm, total_supply_per_node_kwpm, global_params,
+                                             context.get('bus'))
 
-        # --- 4. Adjust prices on TechnologyNodeModels (simplified) ---
-        for tech_node in self.tech_nodes:
-            gap = supply_demand_gap_kwpm.get(tech_node.model_id, 0)
-            current_price = tech_node.get_attribute('average_price_per_wafer_usd')
-            price_sensitivity = context.get('global_parameters', {}).get('price_sensitivity_to_gap', 0.01) # e.g. 1% price change per 10KWPM gap
-
-            if current_price is not None:
-                # If demand > supply (gap < 0), price increases. If supply > demand (gap > 0), price decreases.
-                price_change_factor = -gap * price_sensitivity 
-                new_price = float(current_price) * (1 + price_change_factor)
-                tech_node.set_attribute('average_price_per_wafer_usd', max(0, new_price), current_year) # Price cannot be negative
-                # print(f"    Node {tech_node.name}: Gap {gap:.2f} KWPM, Price updated from ${current_price:.2f} to ${new_price:.2f}")
-
-        # --- 5. Influence company investment decisions (highly simplified placeholder) ---
-        # For companies (Foundries, IDMs), if gap is negative (shortage) for their focused nodes, 
-        # they might increase an 'investment_inclination' attribute, which TechEvolutionModule or 
-        # IndustryStructureModule could later use to simulate actual capacity expansion (with time lags).
-        # This is a very coarse representation.
-
-        # --- 6. Allocate available capacity (placeholder) ---
-        # This is a very complex step involving customer priorities, LTAs, pricing, etc.
-        # For now, we assume demand is met if supply is sufficient, or rationed proportionally if not.
+        # --- 5. Investment decisions: shortages not already covered by the pipeline become fab projects ---
+        self._schedule_fab_projects(current_year, total_demand_per_node_kwpm, total_supply_per_node_kwpm, global_params)
+
+        # --- 6. Allocate available capacity to end markets ---
+        self._allocate_capacity(current_year, demand_response, market_demand)
 
         # Update model states that might have changed directly in this module
-        for market in self.end_markets:
-            market.update_state(current_year, context)
         for tech_node in self.tech_nodes:
             tech_node.update_state(current_year, context)
         for company in self.companies:
             company.update_state(current_year, context)
 
-        print(f"Finished {self.name} for year {current_year}") 
\ No newline at end of file
+        print(f"Finished {self.name} for year {current_year}")
+
+    def _sync_companies(self):
+        """
+        Catches up with companies added or retired since the last step (see core.entity_store):
+        a retired company's fab projects move to its acquirer (or are cancelled), new slots get
+        pipeline rows, and the supplier list and allocator are rebuilt.
+        """
+        generation, changes = store_changes(self.companies, self.entity_generation)
+        if not changes:
+            return
+        self.fab_pipeline.set_entities([c.model_id for c in self.companies])
+        for change in changes:
+            if change['kind'] == 'remove':
+                self.fab_pipeline.transfer_entity(change['slot'], change['successor_slot'])
+        self.suppliers = [c for c in self.companies if c.get_attribute('company_type') in ["Foundry", "IDM"]]
+        self.allocator = None
+        self.entity_generation = generation
+
+    def _project_demand(self, current_year: int, context: Dict[str, Any]) -> np.ndarray:
+        """
+        Keeps the demand projection tensor (market x node x year, built once for the whole run) in
+        sync with the end markets' driver attributes. A market whose drivers were changed mid-run
+        (by a shock, policy or another module) is re-anchored at this year and only its remaining
+        years are recomputed. Returns this year's demand (n_markets, n_nodes).
+        """
+        node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        default_migration = context.get('global_parameters', {}).get('default_node_migration_rate', 0.0)
+        if self.demand_engine is None:
+            self.demand_engine = self._create_demand_engine(current_year, max(int(context.get('end_year', current_year)), current_year))
+            self.demand_engine.set_drivers(np.arange(len(self.end_markets)), *market_drivers(self.end_markets, node_index, default_migration))
+            self.driver_signatures = [driver_signature(market) for market in self.end_markets]
+        else:
+            signatures = [driver_signature(market) for market in self.end_markets]
+            changed = [m for m, signature in enumerate(signatures) if signature != self.driver_signatures[m]]
+            if changed:
+                markets = [self.end_markets[m] for m in changed]
+                base, growth, migration, saturation, midpoint, steepness = market_drivers(markets, node_index, default_migration)
+                # A changed demand level re-anchors at the new level; otherwise at the projected one
+                level = self.demand_engine.demand(current_year)[changed].copy()
+                for i, m in enumerate(changed):
+                    if repr(markets[i].get_attribute('base_demand_wafer_starts_kwpm')) != self.base_signatures[m]:
+                        level[i] = base[i]
+                self.demand_engine.update_drivers(changed, current_year, growth, migration, saturation, midpoint, steepness, level=level)
+                self.driver_signatures = signatures
+        self.base_signatures = [repr(market.get_attribute('base_demand_wafer_starts_kwpm')) for market in self.end_markets]
+
+        context['demand_projection'] = self.demand_engine
+        for market in self.end_markets:
+            market.update_state(current_year, context)
+        return self.demand_engine.demand(current_year)
+
+    def _create_demand_engine(self, start_year: int, end_year: int) -> DemandProjectionEngine:
+        sizes = dict(zip([node.model_id for node in self.tech_nodes], node_feature_sizes(self.tech_nodes)))
+        return DemandProjectionEngine([market.model_id for market in self.end_markets], self.node_ids, start_year, end_year,
+                                      [sizes.get(node_id) for node_id in self.node_ids])
+
+    def _clear_prices(self, current_year: int, demand_per_node: Dict[str, float],
+                      supply_per_node: Dict[str, float], global_params: Dict[str, Any], bus: Optional[ContextBus] = None):
+        """
+        End-market demand is quoted at reference prices (each node's price in the first simulated
+        year). The clearing solver finds the prices at which demand, after own-price elasticity and
+        substitution to adjacent nodes, matches capacity; prices then move towards them at
+        'price_adjustment_speed' (1.0 = clear fully every year). Nodes get their new
+        average_price_per_wafer_usd, the demand at that price and the remaining supply-demand gap
+        (negative when demand still exceeds capacity at the price ceiling). Prices stay between
+        'price_floor_multiple' (or the node's first-year cost_per_wafer, if higher) and
+        'price_ceiling_multiple' times the reference price. The same per-node arrays are published
+        on the context bus.
+        """
+        if not self.tech_nodes:
+            return {}
+        if self.reference_prices is None:
+            self.reference_prices = node_reference_prices(self.tech_nodes)
+            self.cost_floors = node_cost_floors(self.tech_nodes, self.reference_prices)
+            self.log_price_ratio = np.zeros(len(self.tech_nodes))
+        if self.price_solver is None:
+            self.price_solver = ClearingPriceSolver(
+                node_elasticities(self.tech_nodes, global_params.get('default_price_elasticity_of_demand', 1.0)),
+                adjacency_by_feature_size(node_feature_sizes(self.tech_nodes)),
+                global_params.get('node_substitution_elasticity', 0.3),
+            )
+        demand = np.array([demand_per_node.get(node.model_id, 0.0) for node in self.tech_nodes])
+        capacity = np.array([supply_per_node.get(node.model_id, 0.0) for node in self.tech_nodes])
+        lower, upper = price_bounds(self.cost_floors, float(global_params.get('price_floor_multiple', 0.3)),
+                                    float(global_params.get('price_ceiling_multiple', 5.0)))
+
+        self.log_price_ratio, demand_at_price = self.price_solver.adjust(
+            demand, capacity, lower, upper, self.log_price_ratio, float(global_params.get('price_adjustment_speed', 1.0)))
+        prices = self.reference_prices * np.exp(self.log_price_ratio)
+
+        for i, tech_node in enumerate(self.tech_nodes):
+            if np.isfinite(prices[i]):
+                tech_node.set_attribute('average_price_per_wafer_usd', float(prices[i]), current_year)
+            tech_node.set_attribute('clearing_demand_kwpm', float(demand_at_price[i]), current_year)
+            tech_node.set_attribute('supply_demand_gap_kwpm', float(capacity[i] - demand_at_price[i]), current_year)
+        self._record_output(np.minimum(capacity, demand_at_price), current_year,
+                            float(global_params.get('default_production_history_years', 5)))
+        if bus is not None:
+            node_ids = [node.model_id for node in self.tech_nodes]
+            for name, values in (('node_demand_kwpm', demand), ('node_capacity_kwpm', capacity),
+                                 ('node_clearing_demand_kwpm', demand_at_price),
+                                 ('node_supply_demand_gap_kwpm', capacity - demand_at_price), ('node_price_usd', prices)):
+                bus.publish(name, current_year, values, node_ids)
+        # Demand at the new prices relative to the quoted demand, per node
+        response = np.divide(demand_at_price, demand, out=np.ones_like(demand), where=demand > 0)
+        return {node.model_id: float(response[i]) for i, node in enumerate(self.tech_nodes)}
+
+    def _record_output(self, output_kwpm: np.ndarray, current_year: int, default_history_years: float):
+        """
+        Sets each node's 'wafer_output_kwpm' for the year and accumulates it into
+        'cumulative_wafer_output_kwpm_years' (the experience the learning curve runs on). A node
+        without a recorded history starts with its output times the years since commercialization
+        (default_history_years if that year is unknown); see engines.learning_curve.accumulate_output.
+        """
+        node_attr = lambda name: np.array([np.nan if node.get_attribute(name) is None else float(node.get_attribute(name))
+                                           for node in self.tech_nodes])
+        cumulative = accumulate_output(node_attr('cumulative_wafer_output_kwpm_years'), output_kwpm,
+                                       node_attr('year_commercialized'), current_year, default_history_years)
+        for i, tech_node in enumerate(self.tech_nodes):
+            tech_node.set_attribute('wafer_output_kwpm', float(output_kwpm[i]), current_year)
+            tech_node.set_attribute('cumulative_wafer_output_kwpm_years', float(cumulative[i]), current_year)
+
+    def _allocate_capacity(self, current_year: int, demand_response: Dict[str, float], market_demand: np.ndarray):
+        """
+        Allocates Foundry/IDM capacity by node to end-market demand at the current prices (see
+        engines.allocation). End markets get their overall 'fulfilment_ratio' and a
+        'fulfilment_ratio_by_node'; suppliers get their 'capacity_utilization'. The allocator is
+        rebuilt whenever a supplier's region or a market's priority, supplier regions or
+        long-term agreements change (e.g. through a shock).
+        """
+        if not self.suppliers or not self.end_markets or not self.node_ids:
+            return
+        node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        signature = allocation_signature(self.suppliers, self.end_markets)
+        if self.allocator is None or signature != self.allocator_signature:
+            self.allocator = CapacityAllocator(*allocation_inputs(self.suppliers, self.end_markets, node_index))
+            self.allocator_signature = signature
+        supply = capacity_matrix(self.suppliers, 'fab_capacity_kwpm_by_node', node_index).T  # (N, C)
+        scale = np.array([demand_response.get(node_id, 1.0) for node_id in self.node_ids])
+        demand = market_demand.T * scale[:, np.newaxis]  # (N, M)
+
+        supplier_served, served = self.allocator.allocate(supply, demand)  # (N, C), (N, M)
+        total_demand = demand.sum(axis=0)
+        market_ratio = np.minimum(np.divide(served.sum(axis=0), total_demand, out=np.ones_like(total_demand), where=total_demand > 0), 1.0)
+        node_ratio = np.minimum(np.divide(served, demand, out=np.ones_like(demand), where=demand > 0), 1.0)
+        for m, market in enumerate(self.end_markets):
+            market.set_attribute('fulfilment_ratio', float(market_ratio[m]), current_year)
+            market.set_attribute('fulfilment_ratio_by_node', {self.node_ids[n]: float(node_ratio[n, m])
+                                                              for n in np.nonzero(demand[:, m] > 0)[0]}, current_year)
+        capacity = supply.sum(axis=0)
+        utilization = np.minimum(np.divide(supplier_served.sum(axis=0), capacity, out=np.zeros_like(capacity), where=capacity > 0), 1.0)
+        for c, supplier in enumerate(self.suppliers):
+            supplier.set_attribute('capacity_utilization', float(utilization[c]), current_year)
+
+    def _schedule_fab_projects(self, current_year: int, demand_per_node: Dict[str, float],
+                               supply_per_node: Dict[str, float], global_params: Dict[str, Any]):
+        """
+        Foundries and IDMs answer a share of each node's uncovered shortage with new fab projects,
+        split in proportion to their existing capacity at that node. A node none of them has
+        capacity at goes equally to those targeting it ('current_node_id' or 'node_roadmap'), and
+        stays short if none does (see engines.fab_pipeline.fab_investment).
+        Projects carry the node's construction lag and cost per KWPM and ramp up along the
+        'fab_ramp_profile' curve once complete.
+        """
+        investing = np.array([c.get_attribute('company_type') in ["Foundry", "IDM"] for c in self.companies], dtype=bool)
+        if not investing.any() or not self.node_ids:
+            return
+        demand = np.array([demand_per_node.get(node_id, 0.0) for node_id in self.node_ids])
+        supply = np.array([supply_per_node.get(node_id, 0.0) for node_id in self.node_ids])
+        shortage = np.maximum(demand - supply - self.fab_pipeline.in_flight_by_node(), 0.0)
+
+        node_params = {node.model_id: node for node in self.tech_nodes}
+        default_lag = global_params.get('fab_construction_lag_years', 3)
+        default_cost = global_params.get('fab_cost_billion_usd_per_kwpm', 0.2)
+        lags = np.array([(node_params[n].get_attribute('construction_lag_years') if n in node_params else None) or default_lag
+                         for n in self.node_ids], dtype=np.int64)
+        cost_per_kwpm = np.array([(node_params[n].get_attribute('fab_cost_billion_usd_per_kwpm') if n in node_params else None) or default_cost
+                                  for n in self.node_ids], dtype=float)
+
+        if shortage.any():
+            node_index = self.fab_pipeline.node_index
+            response = float(global_params.get('capacity_investment_response', 0.5))
+            new_capacity = fab_investment(capacity_matrix(self.companies, 'fab_capacity_kwpm_by_node', node_index), investing,
+                                          node_target_matrix(self.companies, node_index), response * shortage)
+
+            company_idx, node_idx = np.nonzero(new_capacity > 0)
+            capacity = new_capacity[company_idx, node_idx]
+            cost = capacity * cost_per_kwpm[node_idx]
+            self.fab_pipeline.schedule(company_idx, node_idx, capacity, current_year, lags[node_idx],
+                                       global_params.get('fab_ramp_profile', DEFAULT_RAMP_PROFILE), cost_billion_usd=cost)
+
+            capex_by_company = np.bincount(company_idx, weights=cost, minlength=len(self.companies))
+            for row in np.nonzero(capex_by_company)[0]:
+                company = self.companies[row]
+                committed = float(company.get_attribute('capex_committed_billion_usd') or 0.0)
+                company.set_attribute('capex_committed_billion_usd', committed + float(capex_by_company[row]), current_year)
+
+        in_flight = self.fab_pipeline.in_flight_by_node()
+        for tech_node in self.tech_nodes:
+            column = self.fab_pipeline.node_index.get(tech_node.model_id)
+            if column is not None:
+                tech_node.set_attribute('capacity_under_construction_kwpm', float(in_flight[column]), current_year)
+
+    def get_memo_state(self) -> Any:
+        if self.fab_pipeline is None:
+            return None
+        return {'fab_pipeline': self.fab_pipeline.get_state(),
+                'reference_prices': None if self.reference_prices is None else self.reference_prices.copy(),
+                'cost_floors': None if self.cost_floors is None else self.cost_floors.copy(),
+                'log_price_ratio': None if self.log_price_ratio is None else self.log_price_ratio.copy(),
+                'demand_years': (self.demand_engine.start_year, int(self.demand_engine.years[-1])),
+                'demand_engine': self.demand_engine.get_state(),
+                'driver_signatures': list(self.driver_signatures),
+                'base_signatures': list(self.base_signatures),
+                'entity_generation': self.entity_generation}
+
+    def set_memo_state(self, state: Any):
+        if state is None:
+            self.fab_pipeline = None
+            self.price_solver = None
+            self.demand_engine = None
+            return
+        if self.fab_pipeline is None:
+            self.fab_pipeline = FabPipeline([c.model_id for c in self.companies], self.node_ids)
+        self.fab_pipeline.set_state(state['fab_pipeline'])
+        self.reference_prices = state['reference_prices']
+        self.cost_floors = state['cost_floors']
+        self.log_price_ratio = state['log_price_ratio']
+        if self.demand_engine is None:
+            self.demand_engine = self._create_demand_engine(*state['demand_years'])
+        self.demand_engine.set_state(state['demand_engine'])
+        self.driver_signatures = list(state['driver_signatures'])
+        self.base_signatures = list(state['base_signatures'])
+        self.entity_generation = state['entity_generation']
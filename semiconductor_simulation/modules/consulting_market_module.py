@@ -1,6 +1,11 @@
 from typing import Dict, List, Any
+import numpy as np
 from semiconductor_simulation.core.base_module import BaseModule
 from semiconductor_simulation.core.base_model import BaseModel
+from semiconductor_simulation.core.entity_store import store_changes
+from semiconductor_simulation.engines.client_need_index import NEED_SHIFT_WEIGHT_PARAMS, ClientNeedIndex
+from semiconductor_simulation.engines.consulting_match import (CONSULTING_MARKET_PARAMS, ConsultingMatchEngine, consultancy_capabilities,
+                                                                consulting_market_params, market_outcome)
 # from semiconductor_simulation.models.company import CompanyModel # Specifically for consultancies
 # from semiconductor_simulation.models.consulting_service import ConsultingServiceModel # To be created
 
@@ -13,17 +18,39 @@ class ConsultingMarketModule(BaseModule):
     - Talent & Capability Requirements for consultancies
     Operates on CompanyModels (where company_type is 'Consultancy') and potentially a new ConsultingServiceModel.
     """
+    # Clients and consultancies are read through many attributes; node signals also look at last year's history
+    memo_inputs = {'companies': ['*'],
+                   'regions': ['political_stability'],
+                   'technology_nodes': ['adoption_rate', 'average_price_per_wafer_usd', 'clearing_demand_kwpm',
+                                        'supply_demand_gap_kwpm']}
+    memo_params = (['trade_tension_factor'] + [name for name, _ in CONSULTING_MARKET_PARAMS.values()]
+                   + [name for name, _ in NEED_SHIFT_WEIGHT_PARAMS.values()])
+    memo_outputs = ['companies']
+    subscribes = ['node_demand_kwpm', 'node_capacity_kwpm', 'node_price_usd']
     def __init__(self, module_id: str, name: str = "Consulting Market Evolution Module"):
         super().__init__(module_id, name)
         self.consultancies: List[BaseModel] = []
+        self.clients: List[BaseModel] = []  # Non-consultancy companies, the buyers of consulting
+        self.companies: List[BaseModel] = []
+        self.regions: List[BaseModel] = []
+        self.tech_nodes: List[BaseModel] = []
+        self.entity_generation = 0
+        self.engagements: Dict[str, str] = {}  # Client model_id -> consultancy model_id of this year's engagement
+        self.prices: Dict[str, float] = {}  # Consultancy model_id -> last price per consultant-year
+        self.auction_rounds = 0
         # self.consulting_services: List[BaseModel] = [] # If we add a specific model for services
 
     def initialize(self, models: Dict[str, List[BaseModel]], global_params: Dict[str, Any]):
         """
         Store references to relevant models, filtering for consultancies.
         """
-        all_companies = models.get('companies', [])
-        self.consultancies = [c for c in all_companies if c.get_attribute('company_type') == "Consultancy"]
+        self.companies = models.get('companies', [])
+        self.regions = models.get('regions', [])
+        self.tech_nodes = models.get('technology_nodes', models.get('tech_nodes', []))
+        self.entity_generation = getattr(self.companies, 'generation', 0)
+        self._split_companies()
+        self.engagements = {}
+        self.prices = {}
         # self.consulting_services = models.get('consulting_services', [])
         # print(f"{self.name} initialized with {len(self.consultancies)} consultancies.")
 
@@ -32,16 +59,24 @@ class ConsultingMarketModule(BaseModule):
         Apply consulting market evolution logic for the current year.
         """
         print(f"Executing {self.name} for year {current_year}")
+        # New boutiques and retired firms (IndustryEventsModule) change the consultancy list
+        generation, changes = store_changes(self.companies, self.entity_generation)
+        if changes:
+            self._split_companies()
+            self.entity_generation = generation
 
         # Access other models from context to understand the broader semiconductor industry state
         # regions = context.get('models', {}).get('regions', [])
         # non_consulting_companies = [c for c in context.get('models', {}).get('companies', []) if c.get_attribute('company_type') != "Consultancy"]
 
-        # --- Client Need Transformation (Placeholder) ---
-        # - Based on geopolitical risks (from GeopoliticalModule), supply chain issues (from CapacityDemand), 
-        #   client priorities might shift (e.g., increase 'supply_security_priority_score' for client companies).
-        # - This could be a global variable or an aggregated metric.
-        # Example: global_context['client_need_shift'] = {'supply_security': 0.7, 'cost_optimization': 0.3}
+        # --- Client Need Transformation ---
+        # Shortages, price rises and node transitions (CapacityDemand, TechEvo) and regional risk shift the
+        # needs of the client segments; the index is kept in the context and only re-reads changed companies
+        index = self._need_index(current_year, context)
+        context['client_need_shift'] = index.need_shift()
+
+        # --- Client-consultancy matching ---
+        self._match_clients(current_year, context, index)
 
         # --- Consulting Service Portfolio Evolution (Placeholder) ---
         for consultancy in self.consultancies:
@@ -55,7 +90,7 @@ class ConsultingMarketModule(BaseModule):
             pass
 
         # --- Competitive Landscape Reshaping (Placeholder) ---
-        # - New boutique consultancies might emerge (could be modeled by adding new CompanyModels of type Consultancy).
+        # - New boutique consultancies emerge (and firms exit or merge) through IndustryEventsModule.
         # - Existing consultancies might gain/lose market share based on their capabilities and client needs alignment.
 
         # --- Talent & Capability Requirements (Placeholder) ---
@@ -65,4 +100,60 @@ class ConsultingMarketModule(BaseModule):
         for consultancy in self.consultancies:
             consultancy.update_state(current_year, context)
 
-        print(f"Finished {self.name} for year {current_year}") 
\ No newline at end of file
+        print(f"Finished {self.name} for year {current_year}")
+
+    def _split_companies(self):
+        self.consultancies = [c for c in self.companies if c.get_attribute('company_type') == "Consultancy"]
+
+    def _need_index(self, current_year: int, context: Dict[str, Any]) -> ClientNeedIndex:
+        """The context's ClientNeedIndex (built on first use, e.g. after a fork), updated for the year."""
+        index = context.get('client_need_index')
+        if index is None or index.companies is not self.companies:
+            index = context['client_need_index'] = ClientNeedIndex(self.companies, self.regions, self.tech_nodes)
+        index.update(current_year, context.get('bus'), context.get('global_parameters', {}))
+        return index
+
+    def _match_clients(self, current_year: int, context: Dict[str, Any], index: ClientNeedIndex):
+        """
+        Matches clients to consultancies with an auction (see engines.consulting_match). Clients
+        need supply security, cost, geopolitical and technology advice (their needs and revenue
+        come from the ClientNeedIndex); each buys one engagement sized by its revenue and needs
+        from one of the consultancies that best fit those needs, which
+        sell at most 'consultant_count' consultant-years at a market-clearing price.
+        Consultancies get 'consulting_revenue_usd', 'consultant_utilization',
+        'consulting_market_share' (of consulting revenue), 'consulting_client_count' and
+        'consulting_price_usd' (per consultant-year).
+        """
+        if not self.consultancies:
+            return
+        global_params = context.get('global_parameters', {})
+        params = consulting_market_params(global_params)
+        spend_share = params.pop('spend_share')
+        price_memory = params.pop('price_memory')
+        rows = index.client_rows()
+        self.clients = [self.companies[row] for row in rows]
+        needs = index.client_needs(rows)
+        capabilities, capacity = consultancy_capabilities(self.consultancies)
+        region_codes = index.region_index
+        client_region = index.region[rows]
+        consultancy_region = np.array([region_codes.get(c.get_attribute('region_id'), -1) for c in self.consultancies], dtype=np.int64)
+
+        # Engagement size in consultant-years: spend share of revenue, scaled by the client's total need
+        revenue = index.revenue[rows]
+        size = revenue * spend_share * (needs.sum(axis=1) / (0.5 * needs.shape[1])) / params['fee']
+        engine = ConsultingMatchEngine(**params)
+        # The auction starts from (a share of) last year's prices, so it only has to follow this year's changes
+        last_prices = price_memory * np.array([self.prices.get(c.model_id, 0.0) for c in self.consultancies])
+        assignment, prices = engine.match(needs, capabilities, client_region, consultancy_region, size, capacity, last_prices)
+        self.auction_rounds = engine.rounds
+        outcome = market_outcome(assignment, prices, size, capacity)
+
+        self.engagements = {self.clients[i].model_id: self.consultancies[j].model_id
+                            for i, j in enumerate(assignment) if j >= 0}
+        self.prices = {c.model_id: float(price) for c, price in zip(self.consultancies, prices)}
+        for j, firm in enumerate(self.consultancies):
+            firm.set_attribute('consulting_revenue_usd', float(outcome['revenue'][j]), current_year)
+            firm.set_attribute('consultant_utilization', float(outcome['utilization'][j]), current_year)
+            firm.set_attribute('consulting_market_share', float(outcome['market_share'][j]), current_year)
+            firm.set_attribute('consulting_client_count', int(outcome['clients'][j]), current_year)
+            firm.set_attribute('consulting_price_usd', float(prices[j]), current_year) 
@@ -1,6 +1,11 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+import numpy as np
 from semiconductor_simulation.core.base_module import BaseModule
 from semiconductor_simulation.core.base_model import BaseModel
+from semiconductor_simulation.core.entity_store import store_changes
+from semiconductor_simulation.engines.fab_pipeline import FabPipeline, add_capacity_to_models, capacity_matrix
+from semiconductor_simulation.engines.investment_incentive import InvestmentIncentiveEngine, incentive_programs, program_schedule
+from semiconductor_simulation.engines.price_solver import node_feature_sizes
 # Import specific model types if needed for type hinting or direct instantiation, e.g.:
 # from semiconductor_simulation.models.region import RegionModel
 # from semiconductor_simulation.models.company import CompanyModel
@@ -10,11 +15,25 @@ class GeopoliticalModule(BaseModule):
     Simulates geopolitical reshoring, supply chain reconfiguration, policy impacts.
     Operates on RegionModels, CompanyModels, PolicyModels (yet to be defined).
     """
+    # State the year step reads (see BaseModule); incentive programs read most policy attributes
+    memo_inputs = {'policies': ['*'],
+                   'regions': ['capacity_by_node', 'incentives_received_billion_usd'],
+                   'companies': ['company_type', 'region_id', 'current_node_id', 'fab_capacity_kwpm_by_node',
+                                 'incentives_received_billion_usd'],
+                   'technology_nodes': ['feature_size_nm']}
+    memo_params = ['fab_construction_lag_years', 'fab_ramp_profile', 'incentive_default_duration_years',
+                   'incentive_kwpm_per_billion', 'us_chips_act_simulation']
+    memo_outputs = ['regions', 'companies', 'policies']
     def __init__(self, module_id: str, name: str = "Geopolitical Dynamics Module"):
         super().__init__(module_id, name)
         self.regions: List[BaseModel] = []
         self.companies: List[BaseModel] = []
         self.policies: List[BaseModel] = [] # Assume PolicyModel will be created
+        self.tech_nodes: List[BaseModel] = []
+        self.fab_pipeline: Optional[FabPipeline] = None # Policy-funded fabs under construction, per region
+        self.company_fab_pipeline: Optional[FabPipeline] = None # Policy-funded fabs of companies
+        self.incentives: Optional[InvestmentIncentiveEngine] = None
+        self.entity_generation = 0  # Generation of the company store the company pipeline is synced with
 
     def initialize(self, models: Dict[str, List[BaseModel]], global_params: Dict[str, Any]):
         """
@@ -23,6 +42,11 @@ class GeopoliticalModule(BaseModule):
         self.regions = models.get('regions', [])
         self.companies = models.get('companies', [])
         self.policies = models.get('policies', [])
+        self.tech_nodes = models.get('technology_nodes', [])
+        self.fab_pipeline = None
+        self.company_fab_pipeline = None
+        self.incentives = None
+        self.entity_generation = getattr(self.companies, 'generation', 0)
         # print(f"{self.name} initialized with {len(self.regions)} regions, {len(self.companies)} companies.")
 
     def execute_year_step(self, current_year: int, context: Dict[str, Any]):
@@ -34,33 +58,20 @@ class GeopoliticalModule(BaseModule):
         """
         print(f"Executing {self.name} for year {current_year}")
 
-        # --- Simulate CHIPS Act investment distribution (Example Snippet) ---
-        # This is a highly simplified example. A real implementation would be complex.
-        # It would likely iterate through active PolicyModels that represent CHIPS Acts.
-        
-        us_chips_act_details = context.get('global_parameters', {}).get('us_chips_act_simulation', {})
-        if us_chips_act_details.get('is_active_in_year', lambda y: False)(current_year):
-            total_investment_this_year = us_chips_act_details.get('annual_investment_billion', 0)
-            node_distribution = us_chips_act_details.get('node_investment_distribution', {})
-            geo_focus_ids = us_chips_act_details.get('target_region_ids', []) # e.g. ['usa_arizona', 'usa_ohio']
-
-            # print(f"  {self.name}: Simulating US CHIPS Act investment of ${total_investment_this_year}B")
+        # --- Investment incentives (CHIPS Acts and similar programs) ---
+        # All active InvestmentIncentive policies are allocated in one pass. Funded capacity goes
+        # through fab pipelines: it comes online after the construction lag and ramps up, instead
+        # of appearing in the year the money is spent.
+        global_params = context.get('global_parameters', {})
+        self._sync_companies()
+        self._apply_incentives(current_year, global_params)
 
-            for region in self.regions:
-                if region.model_id in geo_focus_ids:
-                    # print(f"    Applying CHIPS Act funds to {region.name}")
-                    current_cap_by_node = region.get_attribute('capacity_by_node')
-                    if current_cap_by_node is None: current_cap_by_node = {}
-                    
-                    for node, percentage in node_distribution.items():
-                        investment_for_node = total_investment_this_year * percentage
-                        # Simplified: Assume investment directly translates to some capacity increase
-                        # A real model needs cost_per_kwpm_for_node, construction_time_lag etc.
-                        capacity_increase_kwpm = investment_for_node * us_chips_act_details.get('kwpm_per_billion_invested', 1) 
-                        
-                        current_cap_by_node[node] = current_cap_by_node.get(node, 0) + capacity_increase_kwpm
-                        # print(f"      Increased capacity for {node} in {region.name} by {capacity_increase_kwpm:.2f} KWPM")
-                    region.set_attribute('capacity_by_node', current_cap_by_node, current_year)
+        for pipeline, models, attribute_name in ((self.fab_pipeline, self.regions, 'capacity_by_node'),
+                                                 (self.company_fab_pipeline, self.companies, 'fab_capacity_kwpm_by_node')):
+            if pipeline is not None:
+                builders, released_kwpm = pipeline.release(current_year)
+                if released_kwpm.any():
+                    add_capacity_to_models(models, attribute_name, pipeline.node_ids, released_kwpm, current_year, builders)
 
         # --- Other geopolitical effects ---
         # - Export control impacts on companies/regions
@@ -73,4 +84,97 @@ class GeopoliticalModule(BaseModule):
         for company in self.companies:
             company.update_state(current_year, context) # Company self-updates
 
-        print(f"Finished {self.name} for year {current_year}") 
\ No newline at end of file
+        print(f"Finished {self.name} for year {current_year}")
+
+    def _sync_companies(self):
+        """Moves a retired company's funded fabs to its acquirer (or cancels them); see core.entity_store."""
+        generation, changes = store_changes(self.companies, self.entity_generation)
+        if changes and self.company_fab_pipeline is not None:
+            self.company_fab_pipeline.set_entities([c.model_id for c in self.companies])
+            for change in changes:
+                if change['kind'] == 'remove':
+                    self.company_fab_pipeline.transfer_entity(change['slot'], change['successor_slot'])
+        self.entity_generation = generation
+
+    def _apply_incentives(self, current_year: int, global_params: Dict[str, Any]):
+        """
+        Allocates this year's funds of all active incentive programs (see
+        engines.investment_incentive) and schedules the funded fabs. Regions and Foundry/IDM
+        companies build capacity; other targeted companies only receive funds. Policies track
+        'funding_disbursed_billion_usd' (this year) and 'funding_disbursed_to_date_billion_usd';
+        targets accumulate 'incentives_received_billion_usd'.
+        """
+        programs = incentive_programs(self.policies, global_params)
+        if not programs:
+            return
+        if self.incentives is None:
+            node_ids = [node.model_id for node in self.tech_nodes]
+            for model, attribute_name in [(r, 'capacity_by_node') for r in self.regions] + [(c, 'fab_capacity_kwpm_by_node') for c in self.companies]:
+                capacity = model.get_attribute(attribute_name)
+                if isinstance(capacity, dict):
+                    node_ids.extend(capacity.keys())
+            self.incentives = InvestmentIncentiveEngine(list(dict.fromkeys(node_ids)))
+        engine = self.incentives
+        for program in programs:
+            if isinstance(program['node_distribution'], dict):
+                engine.ensure_nodes(program['node_distribution'].keys())
+
+        company_mix = capacity_matrix(self.companies, 'fab_capacity_kwpm_by_node', engine.node_index)
+        for row, company in enumerate(self.companies):
+            # Companies without capacity yet are funded at the node they are working on
+            if not company_mix[row].any() and company.get_attribute('current_node_id') in engine.node_index:
+                company_mix[row, engine.node_index[company.get_attribute('current_node_id')]] = 1.0
+        entities = {
+            'region': {'ids': [r.model_id for r in self.regions], 'index': {r.model_id: i for i, r in enumerate(self.regions)},
+                       'mix': capacity_matrix(self.regions, 'capacity_by_node', engine.node_index), 'builds': np.ones(len(self.regions), dtype=bool)},
+            'company': {'ids': [c.model_id for c in self.companies],
+                        'index': {c.model_id: i for i, c in enumerate(self.companies) if c.get_attribute('company_type') is not None},
+                        'mix': company_mix,
+                        'builds': np.array([c.get_attribute('company_type') in ["Foundry", "IDM"] for c in self.companies], dtype=bool),
+                        'company_types': [c.get_attribute('company_type') for c in self.companies],
+                        'region_ids': [c.get_attribute('region_id') for c in self.companies]},
+        }
+        sizes = dict(zip([node.model_id for node in self.tech_nodes], node_feature_sizes(self.tech_nodes)))
+        feature_sizes = np.array([sizes.get(node_id) if sizes.get(node_id) is not None else np.nan for node_id in engine.node_ids], dtype=float)
+        allocation = engine.allocate(programs, current_year, entities, feature_sizes)
+
+        policies = {policy.model_id: policy for policy in self.policies}
+        for p, program in enumerate(programs):
+            policy = policies.get(program['program_id'])
+            amount = float(allocation['disbursed_billion_usd'][p])
+            if policy is not None and (amount > 0 or policy.get_attribute('funding_disbursed_billion_usd')):
+                policy.set_attribute('funding_disbursed_billion_usd', amount, current_year)
+                policy.set_attribute('funding_disbursed_to_date_billion_usd', program['disbursed_billion_usd'] + amount, current_year)
+
+        for kind, models, attribute_name in (('region', self.regions, 'capacity_by_node'), ('company', self.companies, 'fab_capacity_kwpm_by_node')):
+            funded = allocation[kind]
+            for row in np.nonzero(funded['received_billion_usd'])[0]:
+                model = models[row]
+                received = float(model.get_attribute('incentives_received_billion_usd') or 0.0)
+                model.set_attribute('incentives_received_billion_usd', received + float(funded['received_billion_usd'][row]), current_year)
+            if not funded['capacity_kwpm'].size:
+                continue
+            pipeline = self._get_fab_pipeline(kind, current_year)
+            pipeline.ensure_nodes(engine.node_ids)
+            columns = np.array([pipeline.node_index[node_id] for node_id in engine.node_ids], dtype=np.int64)
+            schedules = [program_schedule(program, global_params) for program in programs]
+            for lag, ramp in dict.fromkeys(schedules):
+                projects = np.array([schedules[p] == (lag, ramp) for p in funded['program_idx']], dtype=bool)
+                pipeline.schedule(funded['entity_idx'][projects], columns[funded['node_idx'][projects]], funded['capacity_kwpm'][projects],
+                                  current_year, lag, ramp, cost_billion_usd=funded['cost_billion_usd'][projects])
+
+    def _get_fab_pipeline(self, kind: str, current_year: int) -> FabPipeline:
+        models, attribute_name = (self.regions, 'capacity_by_node') if kind == 'region' else (self.companies, 'fab_capacity_kwpm_by_node')
+        pipeline = self.fab_pipeline if kind == 'region' else self.company_fab_pipeline
+        if pipeline is None:
+            node_ids: List[str] = []
+            for model in models:
+                capacity = model.get_attribute(attribute_name)
+                if isinstance(capacity, dict):
+                    node_ids.extend(capacity.keys())
+            pipeline = FabPipeline([m.model_id for m in models], list(dict.fromkeys(node_ids)), start_period=current_year)
+            if kind == 'region':
+                self.fab_pipeline = pipeline
+            else:
+                self.company_fab_pipeline = pipeline
+        return pipeline
@@ -0,0 +1,185 @@
+import math
+from typing import Dict, List, Any, Optional, Tuple
+from semiconductor_simulation.core.base_module import BaseModule
+from semiconductor_simulation.core.base_model import BaseModel
+from semiconductor_simulation.core.entity_store import VacantSlot
+from semiconductor_simulation.core.random_streams import RandomStreams
+
+# Ways an impact changes an attribute; numbers and {key: number} dicts (e.g. capacity by node) are supported
+IMPACT_OPERATIONS = ('multiply', 'add', 'set')
+
+
+class GeopoliticalShockModule(BaseModule):
+    """
+    Discrete geopolitical shocks that strike at random, e.g. bloc decoupling or a Taiwan Strait
+    disruption, as opposed to the gradual policy effects of GeopoliticalModule.
+
+    Shocks are listed in the global parameter 'geopolitical_shocks':
+        {'shock_id', 'hazard_rate', 'start_year', 'end_year', 'max_occurrences', 'impacts': [...]}
+    A shock strikes in a year of its (optional) start_year..end_year window with probability
+    1 - exp(-hazard_rate), at most 'max_occurrences' (default 1) times. Each impact is
+        {'category', 'target_ids' and/or 'where', 'attribute', 'multiply' | 'add' | 'set',
+         'keys', 'duration_years'}
+    and changes 'attribute' of the models of 'category' listed in 'target_ids' or matching every
+    {attribute: value or [values]} of 'where' (all models of the category if neither is given).
+    For dict-valued attributes such as 'fab_capacity_kwpm_by_node' the change applies to every
+    key, or only to 'keys'. With 'duration_years' the change is undone that many years later
+    (multiply/add are reversed, set restores the previous value); otherwise it is permanent.
+
+    Outcomes are drawn from the run's RandomStreams unless they were forced for the year with
+    force_outcomes(); analysis.ScenarioTree forces them to branch on every possible outcome.
+    For importance sampling (analysis.TailRiskEstimator), set_proposal() scales the hazard rates
+    the draws use; log_likelihood_ratio then accumulates log(nominal / proposal probability) of
+    the drawn outcomes, so exp(log_likelihood_ratio) is the run's importance weight.
+    """
+    def __init__(self, module_id: str, name: str = "Geopolitical Shock Module"):
+        super().__init__(module_id, name)
+        self.models: Dict[str, List[BaseModel]] = {}
+        self.shocks: List[Dict[str, Any]] = []
+        self.occurrences: Dict[str, List[int]] = {}
+        # (year the impact is undone, category, model_id, attribute, operation, value, keys, previous value)
+        self.pending_reversals: List[Tuple[int, str, str, str, str, Any, Optional[List[str]], Any]] = []
+        self.forced_outcomes: Dict[int, Dict[str, bool]] = {}
+        self.hazard_multipliers: Dict[str, float] = {}
+        self.log_likelihood_ratio = 0.0
+
+    def initialize(self, models: Dict[str, List[BaseModel]], global_params: Dict[str, Any]):
+        """
+        Store references to the models and read the shock definitions.
+        """
+        self.models = models
+        self.shocks = [shock for shock in global_params.get('geopolitical_shocks', []) or [] if shock.get('shock_id')]
+        self.occurrences = {shock['shock_id']: [] for shock in self.shocks}
+        self.pending_reversals = []
+        self.forced_outcomes = {}
+        self.hazard_multipliers = {}
+        self.log_likelihood_ratio = 0.0
+
+    @staticmethod
+    def strike_probability(shock: Dict[str, Any]) -> float:
+        """Probability that the shock strikes in a given year of its window."""
+        return 1.0 - math.exp(-max(float(shock.get('hazard_rate', 0.0)), 0.0))
+
+    def eligible_shocks(self, year: int) -> List[Tuple[str, float]]:
+        """(shock_id, probability of striking) for the shocks that can still strike in the year."""
+        eligible = []
+        for shock in self.shocks:
+            if year < int(shock.get('start_year', year)) or year > int(shock.get('end_year', year)):
+                continue
+            if len(self.occurrences[shock['shock_id']]) >= int(shock.get('max_occurrences', 1)):
+                continue
+            probability = self.strike_probability(shock)
+            if probability > 0:
+                eligible.append((shock['shock_id'], probability))
+        return eligible
+
+    def set_proposal(self, hazard_multipliers: Dict[str, Any]):
+        """
+        Draws strikes with hazard rates scaled by {shock_id: multiplier} (importance sampling). A
+        multiplier may also be {year: multiplier} (1.0 for the years not listed), to make strikes
+        more likely when they matter most.
+        """
+        self.hazard_multipliers = dict(hazard_multipliers)
+
+    def force_outcomes(self, year: int, outcomes: Dict[str, bool]):
+        """Decides whether each listed shock strikes in the year instead of drawing it."""
+        self.forced_outcomes[year] = dict(outcomes)
+
+    def execute_year_step(self, current_year: int, context: Dict[str, Any]):
+        """
+        Undo impacts that expire this year, then decide which shocks strike and apply their impacts.
+        """
+        print(f"Executing {self.name} for year {current_year}")
+        self._reverse_expired(current_year)
+        eligible = self.eligible_shocks(current_year)
+        if eligible:
+            forced = self.forced_outcomes.pop(current_year, {})
+            streams = context.get('random_streams') or RandomStreams()
+            draws = streams.uniform(self.module_id, [shock_id for shock_id, _ in eligible], current_year)[:, 0]
+            by_id = {shock['shock_id']: shock for shock in self.shocks}
+            for (shock_id, probability), draw in zip(eligible, draws):
+                if shock_id in forced:
+                    strikes = forced[shock_id]
+                elif shock_id in self.hazard_multipliers:
+                    multiplier = self.hazard_multipliers[shock_id]
+                    if isinstance(multiplier, dict):
+                        multiplier = multiplier.get(current_year, 1.0)
+                    hazard = float(by_id[shock_id].get('hazard_rate', 0.0)) * float(multiplier)
+                    proposal = 1.0 - math.exp(-max(hazard, 0.0))
+                    strikes = bool(draw < proposal)
+                    self.log_likelihood_ratio += (math.log(probability / proposal) if strikes
+                                                  else math.log1p(-probability) - math.log1p(-proposal))
+                else:
+                    strikes = bool(draw < probability)
+                if strikes:
+                    self._strike(by_id[shock_id], current_year)
+        print(f"Finished {self.name} for year {current_year}")
+
+    def _strike(self, shock: Dict[str, Any], current_year: int):
+        self.occurrences[shock['shock_id']].append(current_year)
+        affected = 0
+        for impact in shock.get('impacts', []) or []:
+            operation = next((op for op in IMPACT_OPERATIONS if op in impact), None)
+            attribute_name = impact.get('attribute')
+            if operation is None or not attribute_name:
+                continue
+            value = impact[operation]
+            keys = impact.get('keys')
+            duration = impact.get('duration_years')
+            for model in self._targets(impact):
+                previous = model.get_attribute(attribute_name)
+                model.set_attribute(attribute_name, _changed(previous, operation, value, keys), current_year)
+                affected += 1
+                if duration is not None:
+                    self.pending_reversals.append((current_year + int(duration), impact['category'], model.model_id,
+                                                   attribute_name, operation, value, keys, previous))
+        print(f"  {self.name}: shock '{shock['shock_id']}' struck in {current_year} ({affected} attribute changes)")
+
+    def _targets(self, impact: Dict[str, Any]) -> List[BaseModel]:
+        target_ids = impact.get('target_ids')
+        where = impact.get('where') or {}
+        targets = []
+        for model in self.models.get(impact.get('category'), []):
+            if isinstance(model, VacantSlot):
+                continue
+            if target_ids is not None and model.model_id not in target_ids:
+                continue
+            if all(_matches(model.get_attribute(name), wanted) for name, wanted in where.items()):
+                targets.append(model)
+        return targets
+
+    def _reverse_expired(self, current_year: int):
+        still_pending = []
+        for reversal in self.pending_reversals:
+            year, category, model_id, attribute_name, operation, value, keys, previous = reversal
+            if year > current_year:
+                still_pending.append(reversal)
+                continue
+            model = next((m for m in self.models.get(category, []) if m.model_id == model_id), None)
+            if model is None:
+                continue  # The entity was retired in the meantime
+            current = model.get_attribute(attribute_name)
+            if operation == 'set' or (operation == 'multiply' and not value):
+                restored = previous
+            elif operation == 'multiply':
+                restored = _changed(current, 'multiply', 1.0 / float(value), keys)
+            else:
+                restored = _changed(current, 'add', -float(value), keys)
+            model.set_attribute(attribute_name, restored, current_year)
+        self.pending_reversals = still_pending
+
+
+def _matches(actual: Any, wanted: Any) -> bool:
+    return actual in wanted if isinstance(wanted, (list, tuple, set)) else actual == wanted
+
+
+def _changed(current: Any, operation: str, value: Any, keys: Optional[List[str]] = None) -> Any:
+    """The attribute value after the operation; dicts are changed per key (only 'keys', if given)."""
+    if isinstance(current, dict):
+        return {key: (_changed(item, operation, value) if keys is None or key in keys else item)
+                for key, item in current.items()}
+    if operation == 'set':
+        return value
+    if operation == 'multiply':
+        return float(current or 0.0) * float(value)
+    return float(current or 0.0) + float(value)
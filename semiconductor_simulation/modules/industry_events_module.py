@@ -0,0 +1,191 @@
+import copy
+from typing import Dict, List, Any, Optional
+import numpy as np
+from semiconductor_simulation.core.base_module import BaseModule
+from semiconductor_simulation.core.base_model import BaseModel
+from semiconductor_simulation.core.entity_store import EntityStore
+from semiconductor_simulation.core.random_streams import RandomStreams
+from semiconductor_simulation.models.company import CompanyModel
+
+# Company attributes that add up when two companies merge ('market_share' only within a company type)
+ADDITIVE_ATTRIBUTES = ('revenue', 'capex', 'consultant_count', 'capex_committed_billion_usd')
+# Company attributes scaled down for a new entrant cloned from an incumbent
+SIZE_ATTRIBUTES = ('revenue', 'capex', 'market_share', 'consultant_count')
+
+
+class IndustryEventsModule(BaseModule):
+    """
+    Industry consolidation and renewal: mergers and acquisitions, entry of new companies (e.g.
+    boutique consultancies, fabless start-ups) and exits. Companies are added to and retired from
+    the company EntityStore mid-run; other modules pick the changes up from the store (see
+    core.entity_store). Results only list a company for the years it exists; retired companies
+    keep their history and carry 'year_exited' (and 'acquired_by' after a merger), entrants
+    carry 'year_entered'.
+
+    Events come from two sources:
+    - scripted: global parameter 'industry_events', a list of
+      {'year', 'type': 'merger', 'acquirer', 'target'}, {'year', 'type': 'exit', 'company'} or
+      {'year', 'type': 'entry', 'company': {'model_id', 'name', 'initial_attributes'}};
+    - stochastic (all rates default to 0): per company type each year, incumbents below
+      'exit_share_threshold' market share exit with probability 'exit_rate', companies are
+      acquired by the largest company of their type with probability 'merger_rate', and
+      Poisson('entry_rate' x number of companies) entrants appear, cloned from a random incumbent
+      at 'entrant_size_factor' of its size. Draws come from the run's RandomStreams (keyed by
+      this module, the year and the company or company type), so runs are reproducible and a
+      company's draws do not depend on which other companies exist.
+    """
+    # Entrants clone every attribute of an incumbent
+    memo_inputs = {'companies': ['*']}
+    memo_params = ['industry_events', 'entry_rate', 'exit_rate', 'merger_rate', 'exit_share_threshold',
+                   'entrant_size_factor', 'random_seed', 'random_replica']
+    memo_outputs = ['companies']
+    def __init__(self, module_id: str, name: str = "Industry Events Module"):
+        super().__init__(module_id, name)
+        self.companies: List[BaseModel] = []
+        self.entrants_created = 0
+
+    def initialize(self, models: Dict[str, List[BaseModel]], global_params: Dict[str, Any]):
+        """
+        Store references to relevant models.
+        """
+        self.companies = models.get('companies', [])
+        self.entrants_created = 0
+        if not isinstance(self.companies, EntityStore):
+            # Other modules already hold the plain list, so companies cannot be added or removed
+            print(f"Warning: {self.name} needs companies in an EntityStore (see SimulationManager); industry events are disabled.")
+
+    def execute_year_step(self, current_year: int, context: Dict[str, Any]):
+        """
+        Apply this year's scripted events, then the stochastic exits, mergers and entries.
+        """
+        print(f"Executing {self.name} for year {current_year}")
+        if not isinstance(self.companies, EntityStore):
+            return
+        global_params = context.get('global_parameters', {})
+        counts = {'merger': 0, 'exit': 0, 'entry': 0}
+
+        for event in global_params.get('industry_events', []) or []:
+            if int(event.get('year', -1)) != current_year:
+                continue
+            event_type = event.get('type')
+            if event_type == 'merger' and self._active(event.get('acquirer')) and self._active(event.get('target')):
+                self.merge(event['acquirer'], event['target'], current_year)
+            elif event_type == 'exit' and self._active(event.get('company')):
+                self.retire(event['company'], current_year)
+            elif event_type == 'entry' and isinstance(event.get('company'), dict):
+                spec = event['company']
+                self.spawn(CompanyModel(spec['model_id'], spec.get('name', spec['model_id']),
+                                        **copy.deepcopy(spec.get('initial_attributes', {}))), current_year)
+            else:
+                continue
+            counts[event_type] += 1
+
+        streams = context.get('random_streams') or RandomStreams(int(global_params.get('random_seed', 0)),
+                                                                 int(global_params.get('random_replica', 0)))
+        self._stochastic_events(current_year, global_params, streams, counts)
+        if any(counts.values()):
+            print(f"  {self.name}: {counts['merger']} mergers, {counts['exit']} exits, {counts['entry']} entries in {current_year}")
+        print(f"Finished {self.name} for year {current_year}")
+
+    def _active(self, model_id: Optional[str]) -> bool:
+        return model_id is not None and model_id in self.companies.slot_of
+
+    def _stochastic_events(self, current_year: int, global_params: Dict[str, Any], streams: RandomStreams,
+                           counts: Dict[str, int]):
+        exit_rate = float(global_params.get('exit_rate', 0.0))
+        merger_rate = float(global_params.get('merger_rate', 0.0))
+        entry_rate = float(global_params.get('entry_rate', 0.0))
+        if exit_rate <= 0 and merger_rate <= 0 and entry_rate <= 0:
+            return
+        threshold = float(global_params.get('exit_share_threshold', 0.01))
+
+        by_type: Dict[Any, List[BaseModel]] = {}
+        for _, company in self.companies.active():
+            by_type.setdefault(company.get_attribute('company_type'), []).append(company)
+        for company_type, members in by_type.items():
+            shares = np.array([float(c.get_attribute('market_share') or 0.0) for c in members])
+            revenue = np.array([float(c.get_attribute('revenue') or 0.0) for c in members])
+            draws = streams.uniform(self.module_id, [c.model_id for c in members], current_year, size=2).T
+            # The largest company of the type acquires; it neither exits nor is acquired itself
+            acquirer = int(np.argmax(revenue))
+            exiting = (draws[0] < exit_rate) & (shares < threshold)
+            acquired = (draws[1] < merger_rate) & ~exiting
+            exiting[acquirer] = acquired[acquirer] = False
+            for i in np.nonzero(exiting)[0]:
+                self.retire(members[i].model_id, current_year)
+                counts['exit'] += 1
+            for i in np.nonzero(acquired)[0]:
+                self.merge(members[acquirer].model_id, members[i].model_id, current_year)
+                counts['merger'] += 1
+
+            rng = streams.generator(self.module_id, company_type, current_year)
+            n_entrants = rng.poisson(entry_rate * len(members)) if entry_rate > 0 else 0
+            templates = [members[i] for i in range(len(members)) if not exiting[i] and not acquired[i]]
+            for template_idx in (rng.integers(0, len(templates), n_entrants) if templates else []):
+                self.spawn(self._entrant_from(templates[template_idx], current_year, global_params), current_year)
+                counts['entry'] += 1
+
+    def _entrant_from(self, template: BaseModel, current_year: int, global_params: Dict[str, Any]) -> BaseModel:
+        factor = float(global_params.get('entrant_size_factor', 0.2))
+        attributes = copy.deepcopy(template.attributes)
+        for name in SIZE_ATTRIBUTES:
+            if isinstance(attributes.get(name), (int, float)):
+                attributes[name] = type(attributes[name])(attributes[name] * factor)
+        if isinstance(attributes.get('fab_capacity_kwpm_by_node'), dict):
+            attributes['fab_capacity_kwpm_by_node'] = {node: float(value) * factor
+                                                       for node, value in attributes['fab_capacity_kwpm_by_node'].items()}
+        for name in ('capex_committed_billion_usd', 'market_share_by_node', 'capacity_utilization', 'year_entered'):
+            attributes.pop(name, None)
+        self.entrants_created += 1
+        model_id = f"{template.model_id}-E{current_year}-{self.entrants_created}"
+        return CompanyModel(model_id, f"{template.name} spin-off {current_year}", **attributes)
+
+    def spawn(self, company: BaseModel, current_year: int) -> int:
+        """Adds a new company (reusing a free slot if there is one) and returns its slot."""
+        slot = self.companies.add(company, current_year)
+        company.set_attribute('year_entered', current_year, current_year)
+        return slot
+
+    def retire(self, company_id: str, current_year: int, successor_id: Optional[str] = None) -> BaseModel:
+        company = self.companies[self.companies.slot_of[company_id]]
+        company.set_attribute('year_exited', current_year, current_year)
+        return self.companies.remove(company_id, current_year, successor_id=successor_id)
+
+    def merge(self, acquirer_id: str, target_id: str, current_year: int):
+        """
+        The acquirer absorbs the target: fab capacity per node and additive attributes
+        (ADDITIVE_ATTRIBUTES, plus market share within the same company type) are summed, R&D intensity becomes revenue-weighted, and the target's
+        nodes join the acquirer's 'node_roadmap'. The target is retired with the acquirer as
+        successor, so its fab projects and market shares move to the acquirer as well.
+        """
+        acquirer = self.companies[self.companies.slot_of[acquirer_id]]
+        target = self.companies[self.companies.slot_of[target_id]]
+        revenue_a = float(acquirer.get_attribute('revenue') or 0.0)
+        revenue_t = float(target.get_attribute('revenue') or 0.0)
+        if revenue_a + revenue_t > 0:
+            rd = (float(acquirer.get_attribute('rd_intensity') or 0.0) * revenue_a
+                  + float(target.get_attribute('rd_intensity') or 0.0) * revenue_t) / (revenue_a + revenue_t)
+            acquirer.set_attribute('rd_intensity', rd, current_year)
+        additive = ADDITIVE_ATTRIBUTES
+        if acquirer.get_attribute('company_type') == target.get_attribute('company_type'):
+            additive += ('market_share',)
+        for name in additive:
+            if target.get_attribute(name) is not None:
+                acquirer.set_attribute(name, float(acquirer.get_attribute(name) or 0.0) + float(target.get_attribute(name)), current_year)
+
+        capacity_t = target.get_attribute('fab_capacity_kwpm_by_node')
+        if isinstance(capacity_t, dict) and capacity_t:
+            capacity = dict(acquirer.get_attribute('fab_capacity_kwpm_by_node') or {})
+            for node_id, value in capacity_t.items():
+                capacity[node_id] = float(capacity.get(node_id, 0.0)) + float(value)
+            acquirer.set_attribute('fab_capacity_kwpm_by_node', capacity, current_year)
+
+        roadmap = list(acquirer.get_attribute('node_roadmap') or [])
+        for node_id in [target.get_attribute('current_node_id')] + list(target.get_attribute('node_roadmap') or []):
+            if node_id is not None and node_id != acquirer.get_attribute('current_node_id') and node_id not in roadmap:
+                roadmap.append(node_id)
+        if roadmap:
+            acquirer.set_attribute('node_roadmap', roadmap, current_year)
+
+        target.set_attribute('acquired_by', acquirer_id, current_year)
+        self.retire(target_id, current_year, successor_id=acquirer_id)
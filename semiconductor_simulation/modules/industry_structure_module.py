@@ -1,6 +1,12 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+import numpy as np
 from semiconductor_simulation.core.base_module import BaseModule
 from semiconductor_simulation.core.base_model import BaseModel
+from semiconductor_simulation.core.context_bus import ContextBus
+from semiconductor_simulation.core.entity_store import store_changes
+from semiconductor_simulation.engines.market_share import FITNESS_WEIGHT_PARAMS, MarketShareEngine, market_share_inputs
+from semiconductor_simulation.engines.node_index import company_node_targets
+from semiconductor_simulation.engines.price_solver import node_feature_sizes
 # from semiconductor_simulation.models.company import CompanyModel, CompanyType
 # from semiconductor_simulation.models.region import RegionModel
 
@@ -12,10 +18,20 @@ class IndustryStructureModule(BaseModule):
     - Downstream Value Chain Reconfiguration (OSATs, Distribution, Assembly)
     Operates primarily on CompanyModels and can be influenced by RegionModels and policies.
     """
+    memo_inputs = {'companies': ['company_type', 'fab_capacity_kwpm_by_node', 'current_node_id', 'node_roadmap',
+                                 'relative_price_index', 'supply_chain_resilience', 'market_share'],
+                   'technology_nodes': ['feature_size_nm', 'clearing_demand_kwpm']}
+    memo_params = ['market_share_adjustment_speed', 'market_entry_share'] + [name for name, _ in FITNESS_WEIGHT_PARAMS.values()]
+    memo_outputs = ['companies']
+    subscribes = ['node_clearing_demand_kwpm']
     def __init__(self, module_id: str, name: str = "Industry Structure Module"):
         super().__init__(module_id, name)
         self.companies: List[BaseModel] = []
         self.regions: List[BaseModel] = []
+        self.tech_nodes: List[BaseModel] = []
+        self.node_ids: List[str] = []
+        self.market_shares: Optional[MarketShareEngine] = None  # Created on the first step
+        self.entity_generation = 0  # Generation of the company store last synced with
 
     def initialize(self, models: Dict[str, List[BaseModel]], global_params: Dict[str, Any]):
         """
@@ -23,6 +39,17 @@ class IndustryStructureModule(BaseModule):
         """
         self.companies = models.get('companies', [])
         self.regions = models.get('regions', [])
+        self.tech_nodes = models.get('technology_nodes', models.get('tech_nodes', []))
+        # Market nodes: declared technology nodes plus any node companies hold capacity at or target
+        node_ids = [node.model_id for node in self.tech_nodes]
+        for company in self.companies:
+            fab_capacity = company.get_attribute('fab_capacity_kwpm_by_node')
+            if isinstance(fab_capacity, dict):
+                node_ids.extend(fab_capacity.keys())
+            node_ids.extend(company_node_targets(company))
+        self.node_ids = list(dict.fromkeys(node_ids))
+        self.market_shares = None
+        self.entity_generation = getattr(self.companies, 'generation', 0)
         # print(f"{self.name} initialized.")
 
     def execute_year_step(self, current_year: int, context: Dict[str, Any]):
@@ -30,6 +57,10 @@ class IndustryStructureModule(BaseModule):
         Apply industry structure evolution logic for the current year.
         """
         print(f"Executing {self.name} for year {current_year}")
+        global_params = context.get('global_parameters', {})
+
+        # --- Market-share dynamics per (segment, node) market (all companies at once) ---
+        self._update_market_shares(current_year, global_params, context.get('bus'))
 
         # --- Foundry-Fabless Ecosystem Evolution (Placeholder) ---
         # - Model leading-edge foundry oligopoly entrenchment (e.g., market share changes).
@@ -53,15 +84,58 @@ class IndustryStructureModule(BaseModule):
         # - Track PCB and system assembly reconfiguration (e.g., near-shoring trends based on regional costs/incentives).
 
         for company in self.companies:
-            # Example: Update a company's market share based on competitive dynamics
-            # company_type = company.get_attribute('company_type')
-            # if company_type == "Foundry":
-            #    current_market_share = company.get_attribute('market_share_percentage')
-            #    # ... complex logic to adjust market share ...
-            #    # company.set_attribute('market_share_percentage', new_market_share, current_year)
             company.update_state(current_year, context)
         
         for region in self.regions:
             region.update_state(current_year, context)
 
-        print(f"Finished {self.name} for year {current_year}") 
\ No newline at end of file
+        print(f"Finished {self.name} for year {current_year}")
+
+    def _update_market_shares(self, current_year: int, global_params: Dict[str, Any], bus: Optional[ContextBus] = None):
+        """
+        Evolves company shares in each (company type, node) market with replicator dynamics driven
+        by node leadership, capacity, price and supply chain resilience (see engines.market_share).
+        Companies get 'market_share_by_node' and 'market_share', their share of the whole segment
+        with nodes weighted by this year's clearing demand (the 'node_clearing_demand_kwpm' bus
+        channel, or the nodes' 'clearing_demand_kwpm' without one).
+        """
+        if not self.companies:
+            return
+        generation, changes = store_changes(self.companies, self.entity_generation)
+        if self.market_shares is not None:
+            # Retired companies hand their shares to their acquirer (or drop out) before slots are reused
+            for change in changes:
+                if change['kind'] == 'remove':
+                    self.market_shares.reassign_rows(change['slot'], change['successor_slot'], len(self.node_ids))
+        self.entity_generation = generation
+
+        node_index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        company_idx, node_idx, segment_of, fitness, initial_weights, _ = market_share_inputs(
+            self.companies, node_index, node_feature_sizes(self.tech_nodes), global_params)
+        if self.market_shares is None:
+            self.market_shares = MarketShareEngine(float(global_params.get('market_share_adjustment_speed', 0.5)),
+                                                   float(global_params.get('market_entry_share', 0.05)))
+            shares = self.market_shares.step(company_idx, node_idx, segment_of, len(self.node_ids), fitness, initial_weights)
+        else:
+            shares = self.market_shares.step(company_idx, node_idx, segment_of, len(self.node_ids), fitness)
+
+        market_size = np.zeros(len(self.node_ids))
+        clearing_demand = bus.get('node_clearing_demand_kwpm', current_year) if bus is not None else None
+        if clearing_demand is not None:
+            for j, node_id in enumerate(bus.labels('node_clearing_demand_kwpm')):
+                if node_id in node_index:
+                    market_size[node_index[node_id]] = clearing_demand[j]
+        else:
+            for i, node in enumerate(self.tech_nodes):
+                market_size[i] = float(node.get_attribute('clearing_demand_kwpm') or 0.0)
+        if not market_size.any():
+            market_size[:] = 1.0
+        segment_share = self.market_shares.segment_shares(len(self.companies), len(self.node_ids), segment_of, market_size)
+
+        order = np.argsort(company_idx, kind='stable')
+        bounds = np.searchsorted(company_idx[order], np.arange(len(self.companies) + 1))
+        for row in np.nonzero(np.diff(bounds))[0]:
+            pairs = order[bounds[row]:bounds[row + 1]]
+            company = self.companies[row]
+            company.set_attribute('market_share_by_node', {self.node_ids[node_idx[p]]: float(shares[p]) for p in pairs}, current_year)
+            company.set_attribute('market_share', float(segment_share[row]), current_year) 
\ No newline at end of file
@@ -1,6 +1,11 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+import numpy as np
 from semiconductor_simulation.core.base_module import BaseModule
 from semiconductor_simulation.core.base_model import BaseModel
+from semiconductor_simulation.engines.cluster_score import ClusterScoreEngine, CLUSTER_FEATURES, CLUSTER_WEIGHT_PARAMS
+from semiconductor_simulation.engines.talent_flow import (
+    ATTRACTIVENESS_WEIGHT_PARAMS, TalentMigrationEngine, migration_candidates, regional_attractiveness, talent_tiers
+)
 # from semiconductor_simulation.models.region import RegionModel
 # from semiconductor_simulation.models.company import CompanyModel
 
@@ -14,10 +19,25 @@ class NationalEcosystemModule(BaseModule):
     - Supply chain localization depth by region.
     Operates primarily on RegionModels, influenced by CompanyModels and policies.
     """
+    memo_inputs = {'regions': ['latitude', 'longitude', 'capacity_by_node', 'semiconductor_engineer_count',
+                               'annual_semiconductor_graduates', 'labor_cost', 'political_stability',
+                               'talent_availability', 'cluster_strength_score'],
+                   'companies': ['company_type', 'latitude', 'longitude', 'region_id', 'rd_intensity', 'revenue',
+                                 'fab_capacity_kwpm_by_node', 'facilities'],
+                   'policies': ['*']}
+    memo_params = (['cluster_radius_km', 'cluster_decay_km', 'talent_tiers', 'talent_growth_rate', 'talent_migration_hubs',
+                    'talent_migration_neighbours', 'talent_migration_sensitivity', 'talent_distance_scale_km']
+                   + [name for name, _ in CLUSTER_WEIGHT_PARAMS.values()] + [name for name, _ in ATTRACTIVENESS_WEIGHT_PARAMS.values()])
+    memo_outputs = ['regions']
     def __init__(self, module_id: str, name: str = "National Ecosystem Development Module"):
         super().__init__(module_id, name)
         self.regions: List[BaseModel] = []
         self.companies: List[BaseModel] = [] # For talent, R&D presence
+        self.policies: List[BaseModel] = []
+        self.talent_migration: Optional[TalentMigrationEngine] = None  # Created on the first step
+        self.tier_names: List[str] = []
+        self.engineers: Optional[np.ndarray] = None  # (n_tiers, n_regions)
+        self.cluster_scores: Optional[ClusterScoreEngine] = None  # Created on the first step
 
     def initialize(self, models: Dict[str, List[BaseModel]], global_params: Dict[str, Any]):
         """
@@ -25,6 +45,10 @@ class NationalEcosystemModule(BaseModule):
         """
         self.regions = models.get('regions', [])
         self.companies = models.get('companies', [])
+        self.policies = models.get('policies', [])
+        self.talent_migration = None
+        self.engineers = None
+        self.cluster_scores = None
         # print(f"{self.name} initialized with {len(self.regions)} regions.")
 
     def execute_year_step(self, current_year: int, context: Dict[str, Any]):
@@ -33,20 +57,19 @@ class NationalEcosystemModule(BaseModule):
         """
         print(f"Executing {self.name} for year {current_year}")
 
+        global_params = context.get('global_parameters', {})
+        self._update_clusters(current_year, global_params)
+        self._update_talent(current_year, global_params)
+
         for region in self.regions:
-            # --- Cluster Evolution & Emerging Hubs (Placeholder) ---
-            # - Update region's 'cluster_strength_score' based on company presence, R&D, capacity.
+            # --- Cluster Evolution & Emerging Hubs ---
+            # - 'cluster_strength_score' (company presence, R&D, capacity nearby) is set in _update_clusters.
             # - If a region is an 'emerging_hub', its growth trajectory might be influenced by specific incentives.
             #   (e.g. region.get_attribute('is_emerging_hub') == True)
 
-            # --- Talent Development & Migration (Placeholder) ---
-            # - Update 'talent_pool_skilled_engineers' based on university output, migration factors.
-            # - Migration could be influenced by 'knowledge_transfer_limitations_score' or 'geopolitical_tensions' from context.
-            # current_talent = region.get_attribute('talent_pool_skilled_engineers')
-            # uni_graduates = region.get_attribute('annual_semiconductor_graduates', 0)
-            # net_migration = region.get_attribute('net_talent_inflow_skilled_engineers_annual', 0)
-            # if current_talent is not None:
-            #    region.set_attribute('talent_pool_skilled_engineers', current_talent + uni_graduates + net_migration, current_year)
+            # --- Talent Development & Migration ---
+            # - Handled for all regions at once in _update_talent (graduates, migration, attrition, promotion).
+            # - Migration could also be influenced by 'knowledge_transfer_limitations_score' or 'geopolitical_tensions' from context.
 
             # --- Research Infrastructure Investment (Placeholder) ---
             # - Update 'research_infrastructure_investment_billion_usd_annual' based on national policies.
@@ -63,4 +86,130 @@ class NationalEcosystemModule(BaseModule):
         for company in self.companies:
             company.update_state(current_year, context)
             
-        print(f"Finished {self.name} for year {current_year}") 
\ No newline at end of file
+        print(f"Finished {self.name} for year {current_year}")
+
+    def _cluster_sites(self, region_location: Dict[str, tuple]):
+        """
+        Sites feeding the agglomeration scores, as (ids, latitude, longitude, weights). Companies sit
+        at their own 'latitude'/'longitude' or else at their region's. A company's 'facilities'
+        ([{'latitude', 'longitude', 'capacity_kwpm'}]) are sites of their own; otherwise its
+        'fab_capacity_kwpm_by_node' counts at the company's location. Regions add their
+        'capacity_by_node' (e.g. policy-funded fabs) at the region centre.
+        """
+        site_ids: List[str] = []
+        latitude: List[float] = []
+        longitude: List[float] = []
+        weights: List[List[float]] = []
+        def add(site_id, location, presence, rd, capacity):
+            if location is None or location[0] is None or location[1] is None:
+                return
+            site_ids.append(site_id)
+            latitude.append(float(location[0]))
+            longitude.append(float(location[1]))
+            weights.append([presence, rd, capacity])
+
+        for company in self.companies:
+            if company.get_attribute('company_type') is None:
+                continue  # vacant slot
+            location = (company.get_attribute('latitude'), company.get_attribute('longitude'))
+            if location[0] is None or location[1] is None:
+                location = region_location.get(company.get_attribute('region_id'))
+            rd = float(company.get_attribute('rd_intensity') or 0.0) * float(company.get_attribute('revenue') or 0.0) / 1e9
+            fab_capacity = company.get_attribute('fab_capacity_kwpm_by_node')
+            capacity = sum(float(v) for v in fab_capacity.values()) if isinstance(fab_capacity, dict) else 0.0
+            facilities = company.get_attribute('facilities') or []
+            if facilities:
+                capacity = 0.0
+                for i, facility in enumerate(facilities):
+                    add(f"{company.model_id}#{i}", (facility.get('latitude'), facility.get('longitude')),
+                        0.0, 0.0, float(facility.get('capacity_kwpm') or 0.0))
+            add(company.model_id, location, 1.0, rd, capacity)
+        for region in self.regions:
+            capacity = region.get_attribute('capacity_by_node')
+            if isinstance(capacity, dict):
+                add(f"region:{region.model_id}", region_location.get(region.model_id), 0.0, 0.0, sum(float(v) for v in capacity.values()))
+        return site_ids, latitude, longitude, np.array(weights, dtype=float).reshape(len(site_ids), len(CLUSTER_FEATURES))
+
+    def _update_clusters(self, current_year: int, global_params: Dict[str, Any]):
+        """
+        Sets each located region's 'cluster_strength_score' (0-1) and 'cluster_agglomeration': company
+        presence, R&D spend (billion USD) and fab capacity within 'cluster_radius_km' (default 500),
+        decayed with distance over 'cluster_decay_km' (default 200). Only sites that changed since
+        last year are re-scored (see ClusterScoreEngine).
+        """
+        located = [region for region in self.regions
+                   if region.get_attribute('latitude') is not None and region.get_attribute('longitude') is not None]
+        if not located:
+            return
+        region_location = {region.model_id: (region.get_attribute('latitude'), region.get_attribute('longitude')) for region in located}
+        if self.cluster_scores is None:
+            self.cluster_scores = ClusterScoreEngine(
+                [location[0] for location in region_location.values()], [location[1] for location in region_location.values()],
+                radius_km=float(global_params.get('cluster_radius_km', 500.0)),
+                decay_km=float(global_params.get('cluster_decay_km', 200.0)))
+        agglomeration = self.cluster_scores.update(*self._cluster_sites(region_location))
+        scores = self.cluster_scores.scores([float(global_params.get(name, default)) for name, default in
+                                             (CLUSTER_WEIGHT_PARAMS[feature] for feature in CLUSTER_FEATURES)])
+        for row, region in enumerate(located):
+            region.set_attribute('cluster_strength_score', float(scores[row]), current_year)
+            region.set_attribute('cluster_agglomeration', {feature: float(agglomeration[row, f]) for f, feature in enumerate(CLUSTER_FEATURES)}, current_year)
+
+    def _create_talent_migration(self, global_params: Dict[str, Any]):
+        tiers = talent_tiers(global_params)
+        self.tier_names = list(tiers)
+        counts = np.array([float(region.get_attribute('semiconductor_engineer_count') or 0.0) for region in self.regions])
+        shares = np.array([tiers[name]['share'] for name in self.tier_names], dtype=float)
+        shares = shares / shares.sum() if shares.sum() > 0 else np.full(len(shares), 1.0 / len(shares))
+        self.engineers = shares[:, np.newaxis] * counts[np.newaxis, :]
+
+        coordinates = [(region.get_attribute('latitude'), region.get_attribute('longitude')) for region in self.regions]
+        latitude = longitude = None
+        if all(lat is not None and lon is not None for lat, lon in coordinates):
+            latitude, longitude = (np.array(values, dtype=float) for values in zip(*coordinates))
+        n_hubs = min(int(global_params.get('talent_migration_hubs', 5)), len(self.regions))
+        hubs = np.argsort(-counts, kind='stable')[:n_hubs]
+        origin, destination, distance = migration_candidates(
+            len(self.regions), latitude, longitude, int(global_params.get('talent_migration_neighbours', 10)), hubs)
+        self.talent_migration = TalentMigrationEngine(
+            origin, destination, distance, len(self.regions),
+            [tiers[name]['mobility'] for name in self.tier_names],
+            [tiers[name]['attrition'] for name in self.tier_names],
+            [tiers[name]['promotion'] for name in self.tier_names],
+            sensitivity=float(global_params.get('talent_migration_sensitivity', 1.0)),
+            distance_scale_km=float(global_params.get('talent_distance_scale_km', 2000.0)),
+        )
+
+    def _update_talent(self, current_year: int, global_params: Dict[str, Any]):
+        """
+        One year of talent flows for all regions and skill tiers: migration driven by regional
+        attractiveness, attrition, promotion, and graduates joining the entry tier. Graduates are
+        'annual_semiconductor_graduates' where set, else 'talent_growth_rate' (default 0.02) of the
+        region's engineers, plus 'talent_increase_per_year' of active TalentDevelopment policies.
+        """
+        if not self.regions:
+            return
+        if self.talent_migration is None:
+            self._create_talent_migration(global_params)
+
+        # Engineer counts changed outside this module (scenario edits, other modules) rescale the tiers
+        counts = np.array([float(region.get_attribute('semiconductor_engineer_count') or 0.0) for region in self.regions])
+        totals = self.engineers.sum(axis=0)
+        changed = np.abs(counts - np.round(self.engineers).sum(axis=0)) > 0.5  # counts are written as rounded tiers
+        if changed.any():
+            mix = np.divide(self.engineers, totals, out=np.full_like(self.engineers, 1.0 / len(self.tier_names)), where=totals > 0)
+            self.engineers[:, changed] = mix[:, changed] * counts[changed]
+
+        attractiveness, policy_graduates = regional_attractiveness(self.regions, self.policies, current_year, global_params)
+        growth_rate = float(global_params.get('talent_growth_rate', 0.02))
+        graduates = np.array([float(region.get_attribute('annual_semiconductor_graduates'))
+                              if region.get_attribute('annual_semiconductor_graduates') is not None else growth_rate * count
+                              for region, count in zip(self.regions, counts)]) + policy_graduates
+        self.engineers, net_migration = self.talent_migration.step(self.engineers, attractiveness, graduates)
+
+        for row, region in enumerate(self.regions):
+            by_tier = {name: int(round(self.engineers[t, row])) for t, name in enumerate(self.tier_names)}
+            region.set_attribute('engineers_by_tier', by_tier, current_year)
+            region.set_attribute('semiconductor_engineer_count', sum(by_tier.values()), current_year)
+            region.set_attribute('talent_pool_skilled_engineers', sum(by_tier.values()) - by_tier[self.tier_names[0]], current_year)
+            region.set_attribute('net_talent_inflow_skilled_engineers_annual', int(round(net_migration[:, row].sum())), current_year)
+            region.set_attribute('talent_attractiveness', float(attractiveness[row]), current_year) 
\ No newline at end of file
@@ -1,6 +1,11 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+import numpy as np
 from semiconductor_simulation.core.base_module import BaseModule
 from semiconductor_simulation.core.base_model import BaseModel
+from semiconductor_simulation.engines.learning_curve import (
+    LearningCurveEngine, learning_curve_inputs, rd_trl_increase, advance_trl
+)
+from semiconductor_simulation.engines.node_index import InvertedNodeIndex, company_rd_spend
 # from semiconductor_simulation.models.technology_node import TechnologyNodeModel
 # from semiconductor_simulation.models.company import CompanyModel # For R&D spending
 # from semiconductor_simulation.models.region import RegionModel # For R&D environment
@@ -10,19 +15,34 @@ class TechEvolutionModule(BaseModule):
     Simulates technology evolution, innovation pathways, and R&D progress.
     Operates on TechnologyNodeModels, and influences/is influenced by CompanyModels and RegionModels.
     """
+    memoizable = True
+    memo_inputs = {'companies': ['current_node_id', 'node_roadmap', 'rd_intensity', 'revenue'],
+                   'technology_nodes': ['maturity_trl', 'commercialization_trl_threshold', 'year_commercialized',
+                                        'cumulative_wafer_output_kwpm_years', 'learning_rate', 'defect_learning_rate',
+                                        'yield_rate', 'cost_per_wafer', 'manufacturing_cost_index',
+                                        'adoption_midpoint_offset_years', 'adoption_steepness', 'adoption_saturation']}
+    memo_params = ['rd_effectiveness_factor', 'rd_trl_elasticity', 'commercialization_trl_threshold', 'default_learning_rate',
+                   'default_defect_learning_rate', 'default_initial_yield', 'adoption_midpoint_offset_years', 'adoption_steepness']
+    memo_outputs = ['technology_nodes']
+
     def __init__(self, module_id: str, name: str = "Technology Evolution Module"):
         super().__init__(module_id, name)
         self.tech_nodes: List[BaseModel] = []
         self.companies: List[BaseModel] = []
         self.regions: List[BaseModel] = []
+        self.learning_curve: Optional[LearningCurveEngine] = None  # Created on the first step
+        self.node_company_index: Optional[InvertedNodeIndex] = None
 
     def initialize(self, models: Dict[str, List[BaseModel]], global_params: Dict[str, Any]):
         """
         Store references to relevant models.
         """
-        self.tech_nodes = models.get('tech_nodes', [])
+        # Scenario files (and SimulationManager) use 'technology_nodes'; 'tech_nodes' is kept for older configs
+        self.tech_nodes = models.get('technology_nodes', models.get('tech_nodes', []))
         self.companies = models.get('companies', [])
         self.regions = models.get('regions', [])
+        self.learning_curve = None
+        self.node_company_index = None
         # print(f"{self.name} initialized.")
 
     def execute_year_step(self, current_year: int, context: Dict[str, Any]):
@@ -33,25 +53,26 @@ class TechEvolutionModule(BaseModule):
         3. Track manufacturing technology divergence (e.g., EUV access impacts).
         4. Project memory technology roadmap evolution.
         5. Simulate packaging innovation acceleration.
+        6. Move node cost, yield and adoption along their learning and adoption curves.
         """
         print(f"Executing {self.name} for year {current_year}")
+        global_params = context.get('global_parameters', {})
+        trl_increase = self._rd_weighted_trl_increase(current_year, global_params)
 
-        for tech_node in self.tech_nodes:
-            # --- 1. Architecture Evolution & Node Maturity (simplified) ---
-            # Example: If a node is 'GAA' type, its TRL might increase based on global R&D focus or specific company investments.
-            maturity = tech_node.get_attribute('maturity_trl')
-            if maturity is not None and maturity < 9: # Max TRL is 9
-                # R&D effectiveness could be a global parameter or derived from company R&D spending in context
-                rd_effectiveness = context.get('global_parameters', {}).get('rd_effectiveness_factor', 0.1)
-                # Simulate TRL increase, potentially weighted by R&D in companies focused on this node.
-                # This is a very simplified placeholder.
-                # A more complex model would look at R&D spend from companies targeting this node architecture.
-                potential_trl_increase = rd_effectiveness 
-                tech_node.set_attribute('maturity_trl', min(9, float(maturity) + potential_trl_increase), current_year)
-                # if float(maturity) + potential_trl_increase >= tech_node.get_attribute('commercialization_trl_threshold', 7) and \ 
-                #    tech_node.get_attribute('year_commercialized') is None:
-                #    tech_node.set_attribute('year_commercialized', current_year, current_year)
-                #    print(f"    Node {tech_node.name} reached commercialization TRL in {current_year}!")
+        # --- 1. Architecture Evolution & Node Maturity (simplified) ---
+        # TRLs rise with the R&D spend of the companies targeting each node (max TRL is 9); a node
+        # reaching its commercialization TRL starts down its adoption curve
+        node_attr = lambda name: np.array([np.nan if node.get_attribute(name) is None else float(node.get_attribute(name))
+                                           for node in self.tech_nodes])
+        maturity, commercialized = node_attr('maturity_trl'), node_attr('year_commercialized')
+        threshold = np.array([float(node.get_attribute('commercialization_trl_threshold')
+                                    or global_params.get('commercialization_trl_threshold', 8)) for node in self.tech_nodes])
+        new_maturity, new_commercialized = advance_trl(maturity, trl_increase, threshold, commercialized, current_year)
+        for i, tech_node in enumerate(self.tech_nodes):
+            if maturity[i] < 9:
+                tech_node.set_attribute('maturity_trl', float(new_maturity[i]), current_year)
+            if np.isnan(commercialized[i]) and not np.isnan(new_commercialized[i]):
+                tech_node.set_attribute('year_commercialized', current_year, current_year)
 
             # --- 2. Design Tool Ecosystem (Placeholder) ---
             # Could update a global attribute or attributes on RegionModels related to EDA tool availability/sophistication.
@@ -68,6 +89,10 @@ class TechEvolutionModule(BaseModule):
             # --- 5. Packaging Innovation (Placeholder) ---
             # Advanced packaging nodes (2.5D, 3D) could also be modeled like TechnologyNodeModels or as attributes on companies.
 
+        # --- 6. Learning and adoption curves (all nodes at once) ---
+        self._apply_learning_curves(current_year, global_params)
+
+        for tech_node in self.tech_nodes:
             tech_node.update_state(current_year, context) # Allow node to self-update if it has internal logic
 
         # Update other models if they are affected by general tech trends
@@ -76,4 +101,61 @@ class TechEvolutionModule(BaseModule):
         for region in self.regions:
             region.update_state(current_year, context)
             
-        print(f"Finished {self.name} for year {current_year}") 
\ No newline at end of file
+        print(f"Finished {self.name} for year {current_year}")
+
+    def _rd_weighted_trl_increase(self, current_year: int, global_params: Dict[str, Any]) -> np.ndarray:
+        """
+        Per-node TRL increase for the year. R&D spend (rd_intensity * revenue) of each company is
+        split over the nodes it targets ('current_node_id' and 'node_roadmap') through the inverted
+        node -> company index and summed per node ('rd_spend_billion_usd'). A node's increase is
+        rd_effectiveness_factor * (spend / mean spend of funded nodes) ** rd_trl_elasticity, so
+        unfunded nodes stall. Without any company R&D data every node advances by
+        rd_effectiveness_factor.
+        """
+        if self.node_company_index is None:
+            self.node_company_index = InvertedNodeIndex([node.model_id for node in self.tech_nodes])
+        self.node_company_index.refresh(self.companies)  # only migrated companies are re-indexed
+
+        spend = company_rd_spend(self.companies)
+        node_spend = self.node_company_index.node_sum(spend)[:len(self.tech_nodes)] if spend.size else np.zeros(len(self.tech_nodes))
+        for i in np.nonzero(node_spend > 0)[0]:
+            self.tech_nodes[i].set_attribute('rd_spend_billion_usd', float(node_spend[i]), current_year)
+        return rd_trl_increase(node_spend, float(global_params.get('rd_effectiveness_factor', 0.1)),
+                               float(global_params.get('rd_trl_elasticity', 0.5)))
+
+    def _apply_learning_curves(self, current_year: int, global_params: Dict[str, Any]):
+        """
+        Updates 'cost_per_wafer', 'yield_rate', 'manufacturing_cost_index' and (for commercialized
+        nodes) 'adoption_rate' from the cumulative wafer output that CapacityDemandModule records
+        on each node (see engines.learning_curve).
+        """
+        if not self.tech_nodes:
+            return
+        if self.learning_curve is None:
+            self.learning_curve = LearningCurveEngine(**learning_curve_inputs(self.tech_nodes, global_params))
+        commercialized = np.array([np.nan if node.get_attribute('year_commercialized') is None else float(node.get_attribute('year_commercialized'))
+                                   for node in self.tech_nodes])
+        cumulative = np.array([float(node.get_attribute('cumulative_wafer_output_kwpm_years') or 0.0) for node in self.tech_nodes])
+
+        curves = self.learning_curve.advance(current_year, commercialized, cumulative)
+        for name, values in curves.items():
+            for i in np.nonzero(np.isfinite(values))[0]:
+                self.tech_nodes[i].set_attribute(name, float(values[i]), current_year)
+
+    def get_memo_state(self) -> Any:
+        return {'learning_curve': None if self.learning_curve is None else self.learning_curve.get_state(),
+                'node_company_index': None if self.node_company_index is None else self.node_company_index.get_state()}
+
+    def set_memo_state(self, state: Any):
+        if state['learning_curve'] is None:
+            self.learning_curve = None
+        else:
+            if self.learning_curve is None:
+                self.learning_curve = LearningCurveEngine(**learning_curve_inputs(self.tech_nodes, {}))
+            self.learning_curve.set_state(state['learning_curve'])
+        if state['node_company_index'] is None:
+            self.node_company_index = None
+        else:
+            if self.node_company_index is None:
+                self.node_company_index = InvertedNodeIndex([])
+            self.node_company_index.set_state(state['node_company_index']) 
\ No newline at end of file
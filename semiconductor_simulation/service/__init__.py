@@ -0,0 +1,5 @@
+# Local simulation service (asyncio HTTP server with a process pool and result cache)
+from .cache import ResultCache, scenario_hash, code_version, result_cache_key
+from .server import SimulationService
+
+__all__ = ['ResultCache', 'scenario_hash', 'code_version', 'result_cache_key', 'SimulationService']
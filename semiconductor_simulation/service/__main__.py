@@ -0,0 +1,19 @@
+import argparse
+import asyncio
+
+from semiconductor_simulation.service.server import SimulationService
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the local semiconductor simulation service.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to bind (default: localhost only).")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count).")
+    parser.add_argument("--config", type=str, default="config", help="Config directory containing scenarios/.")
+    parser.add_argument("--cache-entries", type=int, default=256, help="Maximum number of cached run results.")
+    args = parser.parse_args()
+
+    service = SimulationService(config_base_path=args.config, workers=args.workers, cache_entries=args.cache_entries)
+    try:
+        asyncio.run(service.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Simulation service stopped.")
@@ -0,0 +1,50 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from semiconductor_simulation.utils.versioning import code_version  # noqa: F401 (re-exported)
+
+
+def _canonical_json(data: Any) -> str:
+    return json.dumps(data, sort_keys=True, default=str, separators=(",", ":"))
+
+
+def scenario_hash(scenario_data: Dict[str, Any]) -> str:
+    """Stable content hash of a parsed scenario (independent of key order in the YAML file)."""
+    return hashlib.sha256(_canonical_json(scenario_data).encode("utf-8")).hexdigest()
+
+
+def result_cache_key(scenario_digest: str, overrides: Optional[Dict[str, Any]], version: str) -> str:
+    """Cache key for one run: (scenario hash, parameter overrides, code version)."""
+    payload = _canonical_json({"scenario": scenario_digest, "overrides": overrides or {}, "code": version})
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """In-memory LRU cache of simulation results, bounded by number of entries."""
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key]
+
+    def put(self, key: str, value: Any):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
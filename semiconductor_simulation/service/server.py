@@ -0,0 +1,330 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+
+from semiconductor_simulation.analysis.runner import run_scenario, extract_trajectory
+from semiconductor_simulation.service.cache import ResultCache, scenario_hash, code_version, result_cache_key
+from semiconductor_simulation.utils.data_loader import load_yaml_data
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+HTTP_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+def _warm_worker():
+    """Process pool initializer: imports the engine once per worker instead of once per run."""
+    import semiconductor_simulation.analysis.runner  # noqa: F401
+    import semiconductor_simulation.modules  # noqa: F401
+
+
+def _execute_run(scenario_data: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+    return run_scenario(scenario_data, overrides)
+
+
+class Job:
+    """A single simulation run (or a sweep grouping several runs) tracked by the service."""
+    def __init__(self, job_id: str, kind: str, priority: int, scenario: str,
+                 overrides: Optional[Dict[str, Any]] = None, cache_key: Optional[str] = None):
+        self.job_id = job_id
+        self.kind = kind
+        self.priority = priority
+        self.scenario = scenario
+        self.overrides = overrides or {}
+        self.cache_key = cache_key
+        self.status = JOB_QUEUED
+        self.cached = False
+        self.result: Optional[Dict[int, Dict[str, Any]]] = None
+        self.error: Optional[str] = None
+        self.children: List[str] = []
+        self.owners = 1  # Requesters and sweeps sharing this run; it is only cancelled when the last one cancels
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.done_event = asyncio.Event()
+
+    def finish(self, status: str, result: Any = None, error: Optional[str] = None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished = time.time()
+        self.done_event.set()
+
+
+class SimulationService:
+    """
+    Long-running local simulation service. Scenarios are parsed once and kept in memory, worker
+    processes stay warm, and runs are scheduled by priority on a process pool. Results are cached
+    by (scenario hash, parameter overrides, code version), so repeat queries return immediately.
+
+    HTTP API (JSON bodies and responses):
+        GET    /health              service status, queue length and cache statistics
+        GET    /scenarios           scenario names available under config/scenarios
+        POST   /run                 {"scenario", "overrides", "metrics", "priority", "wait"}
+        POST   /sweep               {"scenario", "override_sets", "metrics", "priority", "wait"}
+        GET    /jobs/<id>           job status and, when finished, its result
+        DELETE /jobs/<id>           cancels a queued job (a running job's result is discarded)
+
+    Identical runs submitted while one is queued or running share that job, so a job can have
+    several owners (direct requests and sweeps). Cancelling releases one ownership; the run is
+    only cancelled when no owner is left.
+    """
+    def __init__(self, config_base_path: str = "config", workers: Optional[int] = None,
+                 cache_entries: int = 256, max_finished_jobs: int = 1000):
+        self.scenarios_path = os.path.join(config_base_path, "scenarios")
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = ResultCache(cache_entries)
+        self.code_version = code_version()
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs: Dict[str, Job] = {}
+        self._inflight: Dict[str, str] = {}  # cache_key -> job_id, so identical concurrent requests share one run
+        self._scenarios: Dict[str, Tuple[float, Dict[str, Any], str]] = {}  # name -> (mtime, data, hash)
+        self._sequence = itertools.count()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._dispatchers: List[asyncio.Task] = []
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    # --- Scenario handling ---
+    def get_scenario(self, name: str) -> Tuple[Dict[str, Any], str]:
+        """Returns (scenario_data, scenario_hash), re-parsing the YAML only when the file changed."""
+        path = os.path.join(self.scenarios_path, f"{name}.yaml")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Scenario '{name}' not found at {path}")
+        mtime = os.path.getmtime(path)
+        cached = self._scenarios.get(name)
+        if cached is None or cached[0] != mtime:
+            data = load_yaml_data(path)
+            cached = (mtime, data, scenario_hash(data))
+            self._scenarios[name] = cached
+        return cached[1], cached[2]
+
+    def list_scenarios(self) -> List[str]:
+        if not os.path.isdir(self.scenarios_path):
+            return []
+        return sorted(f[:-5] for f in os.listdir(self.scenarios_path) if f.endswith(".yaml"))
+
+    # --- Job scheduling ---
+    def submit_run(self, scenario: str, overrides: Optional[Dict[str, Any]] = None, priority: int = 0) -> Job:
+        scenario_data, digest = self.get_scenario(scenario)
+        key = result_cache_key(digest, overrides, self.code_version)
+        cached = self.cache.get(key)
+        if cached is not None:
+            job = self._new_job("run", priority, scenario, overrides, key)
+            job.cached = True
+            job.finish(JOB_DONE, cached)
+            return job
+        if key in self._inflight:
+            job = self.jobs[self._inflight[key]]
+            job.owners += 1
+            return job
+        job = self._new_job("run", priority, scenario, overrides, key)
+        self._inflight[key] = job.job_id
+        # Higher priority values run first; the sequence number keeps FIFO order within a priority.
+        self._queue.put_nowait((-priority, next(self._sequence), job.job_id, scenario_data))
+        return job
+
+    def submit_sweep(self, scenario: str, override_sets: List[Dict[str, Any]], priority: int = 0) -> Job:
+        self.get_scenario(scenario)  # An unknown scenario raises before the sweep job exists
+        sweep = self._new_job("sweep", priority, scenario)
+        children = [self.submit_run(scenario, overrides, priority) for overrides in override_sets]
+        sweep.children = [child.job_id for child in children]
+        asyncio.get_running_loop().create_task(self._complete_sweep(sweep, children))
+        return sweep
+
+    async def _complete_sweep(self, sweep: Job, children: List[Job]):
+        for child in children:
+            await child.done_event.wait()
+        if sweep.status == JOB_CANCELLED:
+            return
+        failed = [child.job_id for child in children if child.status != JOB_DONE]
+        sweep.finish(JOB_FAILED if failed else JOB_DONE, error=f"{len(failed)} runs did not complete" if failed else None)
+
+    def cancel(self, job_id: str) -> Job:
+        """
+        Cancels a sweep (releasing its runs) or releases one ownership of a run; a run shared
+        with other requesters or sweeps keeps going until its last owner cancels.
+        """
+        job = self.jobs[job_id]
+        if job.status in FINISHED_STATES:
+            return job
+        if job.kind == "sweep":
+            for child_id in job.children:
+                if child_id in self.jobs:
+                    self._release(self.jobs[child_id])
+            job.finish(JOB_CANCELLED)
+        else:
+            self._release(job)
+        return job
+
+    def _release(self, job: Job):
+        if job.status in FINISHED_STATES:
+            return
+        job.owners -= 1
+        if job.owners > 0:
+            return
+        self._clear_inflight(job)
+        job.finish(JOB_CANCELLED)
+
+    def _clear_inflight(self, job: Job):
+        # An identical request submitted after this job was cancelled has its own entry, which stays
+        if job.cache_key is not None and self._inflight.get(job.cache_key) == job.job_id:
+            del self._inflight[job.cache_key]
+
+    def _new_job(self, kind: str, priority: int, scenario: str,
+                 overrides: Optional[Dict[str, Any]] = None, cache_key: Optional[str] = None) -> Job:
+        job = Job(uuid.uuid4().hex[:12], kind, priority, scenario, overrides, cache_key)
+        self.jobs[job.job_id] = job
+        self._prune_jobs()
+        return job
+
+    def _prune_jobs(self):
+        # Runs of sweeps still in progress are kept, since the sweep reports on them when it finishes
+        pinned = {child_id for job in self.jobs.values() if job.children and job.status not in FINISHED_STATES
+                  for child_id in job.children}
+        finished = [job for job in self.jobs.values() if job.status in FINISHED_STATES and job.job_id not in pinned]
+        for job in sorted(finished, key=lambda j: j.finished or 0)[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job.job_id]
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job_id, scenario_data = await self._queue.get()
+            job = self.jobs.get(job_id)
+            try:
+                if job is None or job.status != JOB_QUEUED:
+                    continue  # cancelled (or pruned) while waiting in the queue
+                job.status = JOB_RUNNING
+                try:
+                    result = await loop.run_in_executor(self._pool, _execute_run, scenario_data, job.overrides)
+                except Exception as e:
+                    self._clear_inflight(job)
+                    if job.status == JOB_RUNNING:
+                        job.finish(JOB_FAILED, error=f"{type(e).__name__}: {e}")
+                    continue
+                # A finished run is valid even if its requester cancelled it, so it is cached either way.
+                self.cache.put(job.cache_key, result)
+                self._clear_inflight(job)
+                if job.status == JOB_RUNNING:
+                    job.finish(JOB_DONE, result)
+            finally:
+                self._queue.task_done()
+
+    # --- Serialization ---
+    def job_payload(self, job: Job, metrics: Optional[List[str]] = None, include_result: bool = True) -> Dict[str, Any]:
+        payload = {
+            "job_id": job.job_id, "kind": job.kind, "status": job.status, "scenario": job.scenario,
+            "priority": job.priority, "cached": job.cached, "error": job.error,
+        }
+        if job.kind == "run":
+            payload["overrides"] = job.overrides
+            if include_result and job.status == JOB_DONE:
+                payload["result"] = self._format_result(job.result, metrics)
+        else:
+            children = [self.jobs[child_id] for child_id in job.children if child_id in self.jobs]
+            payload["progress"] = {"done": sum(c.status == JOB_DONE for c in children), "total": len(job.children)}
+            if include_result and job.status in FINISHED_STATES:
+                payload["runs"] = [self.job_payload(c, metrics, include_result) for c in children]
+        return payload
+
+    @staticmethod
+    def _format_result(results: Dict[int, Dict[str, Any]], metrics: Optional[List[str]]) -> Dict[str, Any]:
+        if metrics:
+            return {"years": sorted(results.keys()),
+                    "trajectories": {m: extract_trajectory(results, m).tolist() for m in metrics}}
+        return {str(year): data for year, data in results.items()}
+
+    # --- HTTP layer ---
+    async def _handle_request(self, method: str, path: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        if method == "GET" and parts == ["health"]:
+            return 200, {"status": "ok", "code_version": self.code_version, "workers": self.workers,
+                         "queued": self._queue.qsize(), "jobs": len(self.jobs), "cache": self.cache.stats()}
+        if method == "GET" and parts == ["scenarios"]:
+            return 200, {"scenarios": self.list_scenarios()}
+        if method == "POST" and parts in (["run"], ["sweep"]):
+            scenario = body.get("scenario", "test_scenario")
+            priority = int(body.get("priority", 0))
+            if parts == ["run"]:
+                job = self.submit_run(scenario, body.get("overrides") or {}, priority)
+            else:
+                job = self.submit_sweep(scenario, body.get("override_sets") or [], priority)
+            if body.get("wait", True):
+                await job.done_event.wait()
+            status = 200 if job.status in FINISHED_STATES else 202
+            return status, self.job_payload(job, body.get("metrics"))
+        if len(parts) == 2 and parts[0] == "jobs":
+            if parts[1] not in self.jobs:
+                return 404, {"error": f"Unknown job '{parts[1]}'"}
+            if method == "GET":
+                return 200, self.job_payload(self.jobs[parts[1]], body.get("metrics"))
+            if method == "DELETE":
+                return 200, self.job_payload(self.cancel(parts[1]), include_result=False)
+            return 405, {"error": f"Method {method} not allowed on {path}"}
+        return 404, {"error": f"No route for {method} {path}"}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            if not request_line:
+                return
+            method, path, _ = request_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            raw_body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+            try:
+                body = json.loads(raw_body) if raw_body else {}
+                status, payload = await self._handle_request(method.upper(), path, body)
+            except (json.JSONDecodeError, ValueError, KeyError) as e:
+                status, payload = 400, {"error": str(e)}
+            except FileNotFoundError as e:
+                status, payload = 404, {"error": str(e)}
+            except Exception as e:
+                status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+            data = json.dumps(payload, default=str).encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("latin-1") + data
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # --- Lifecycle ---
+    async def start(self, host: str = "127.0.0.1", port: int = 8765):
+        self._queue = asyncio.PriorityQueue()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker)
+        self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f"Simulation service listening on http://{host}:{port} with {self.workers} workers (code version {self.code_version})")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._dispatchers:
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8765):
+        await self.start(host, port)
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
@@ -0,0 +1,21 @@
+import hashlib
+import os
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def code_version(package_root: str = PACKAGE_ROOT) -> str:
+    """
+    Hash of every .py file in the simulation package. Any code change invalidates cached results,
+    without relying on git being available at runtime.
+    """
+    digest = hashlib.sha256()
+    for directory, subdirectories, filenames in os.walk(package_root):
+        subdirectories[:] = sorted(d for d in subdirectories if d != "__pycache__")
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                path = os.path.join(directory, filename)
+                digest.update(os.path.relpath(path, package_root).encode("utf-8"))
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()[:16]
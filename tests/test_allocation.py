@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from semiconductor_simulation.engines.allocation import proportional_allocation
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_proportional_allocation_conserves_totals(seed):
+    """Suppliers never ship more than their capacity, markets never get more than their demand,
+    and per node the volume shipped by suppliers equals the volume received by markets."""
+    rng = np.random.default_rng(seed)
+    n_nodes, n_suppliers, n_markets = 4, 6, 9
+    supply = rng.uniform(0.0, 100.0, (n_nodes, n_suppliers)) * (rng.random((n_nodes, n_suppliers)) < 0.7)
+    demand = rng.uniform(0.0, 150.0, (n_nodes, n_markets)) * (rng.random((n_nodes, n_markets)) < 0.8)
+    allowed = (rng.random((n_suppliers, n_markets)) < 0.6).astype(float)
+
+    served_supplier, served_market = proportional_allocation(supply, demand, allowed)
+
+    assert served_supplier.shape == supply.shape and served_market.shape == demand.shape
+    assert np.all(served_supplier >= 0.0) and np.all(served_market >= 0.0)
+    assert np.all(served_supplier <= supply + 1e-12)
+    assert np.all(served_market <= demand + 1e-12)
+    np.testing.assert_allclose(served_supplier.sum(axis=1), served_market.sum(axis=1), rtol=0.0, atol=1e-12 * demand.sum())
+
+
+def test_proportional_allocation_serves_all_demand_without_overbooking():
+    supply = np.array([[60.0, 40.0]])
+    demand = np.array([[30.0, 20.0]])
+    allowed = np.ones((2, 2))
+    served_supplier, served_market = proportional_allocation(supply, demand, allowed)
+    np.testing.assert_allclose(served_market, demand)
+    np.testing.assert_allclose(served_supplier, [[30.0, 20.0]])
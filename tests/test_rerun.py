@@ -0,0 +1,72 @@
+import contextlib
+import copy
+import io
+import os
+
+import pytest
+
+from semiconductor_simulation.core.simulation_manager import SimulationManager
+from semiconductor_simulation.analysis.runner import apply_overrides, default_modules
+from semiconductor_simulation.utils.data_loader import load_yaml_data
+
+SCENARIO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'config', 'scenarios', 'test_scenario.yaml')
+
+
+def _manager(scenario_data, checkpoints=False):
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager = SimulationManager(scenario_name="rerun_test")
+        manager.load_scenario_from_dict(copy.deepcopy(scenario_data))
+        for module in default_modules():
+            manager.register_module(module)
+        manager.initialize_modules()
+        if checkpoints:
+            manager.enable_checkpoints()
+        manager.run_simulation()
+    return manager
+
+
+@pytest.fixture(scope='module')
+def scenario():
+    return load_yaml_data(SCENARIO_PATH)
+
+
+@pytest.mark.parametrize('edits', [
+    {'global_parameters.node_substitution_elasticity': 0.8},
+    {'models_initial_state.policies.PolicyEU1.initial_attributes.value_impact': 2.5e10},
+    {'models_initial_state.policies.PolicyUSA1.initial_attributes.start_year': 2030},
+    {'models_initial_state.regions.USA.initial_attributes.political_stability': 0.2},
+])
+def test_rerun_matches_fresh_run(scenario, edits):
+    """rerun() of an edit gives the same results as simulating the edited scenario from scratch."""
+    manager = _manager(scenario, checkpoints=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        rerun_results = manager.rerun(edits)
+    fresh_results = _manager(apply_overrides(scenario, edits)).results
+    assert rerun_results == fresh_results
+
+
+def test_rerun_resumes_from_checkpoint(scenario):
+    """An edit first acting mid-run resumes from that year's checkpoint and keeps the years before it."""
+    base = apply_overrides(scenario, {'models_initial_state.policies.PolicyEU1.initial_attributes.start_year': 2030})
+    edits = {'models_initial_state.policies.PolicyEU1.initial_attributes.value_impact': 2.5e10}
+    manager = _manager(base, checkpoints=True)
+    original = copy.deepcopy(manager.results)
+    assert manager.first_affected_year(*next(iter(edits.items()))) == 2030
+    with contextlib.redirect_stdout(io.StringIO()):
+        rerun_results = manager.rerun(edits)
+    assert min(manager.rerun_plan) == 2030
+    assert rerun_results != original
+    assert rerun_results == _manager(apply_overrides(base, edits)).results
+
+
+def test_repeated_reruns_match_fresh_run(scenario):
+    """Successive reruns on one manager accumulate their edits like a single fresh run."""
+    first = {'models_initial_state.policies.PolicyEU1.initial_attributes.value_impact': 2.5e10}
+    second = {'global_parameters.trade_tension_factor': 0.4}
+    manager = _manager(scenario, checkpoints=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager.rerun(first)
+        rerun_results = manager.rerun(second)
+    fresh_results = _manager(apply_overrides(scenario, {**first, **second})).results
+    assert rerun_results == fresh_results